@@ -1,11 +1,27 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from . import alocacao, energia, grade, referencia, validacao, virada
+from .forms import DisponibilidadeForm, HorarioTurmaFormSet, ImportacaoHorariosForm, ViradaSemestreForm
+from .importacao import ErroImportacao, importar_horarios, ler_planilha
 from .models import (
-    HorarioTurma, Professor, Semestre, Professor, Sala, Disciplina, Turma
+    HorarioTurma, Professor, Semestre, Professor, Sala, Disciplina, Turma, Dispositivo, AlertaConsumo,
+    ExecucaoAnomalias, Feriado, CancelamentoAula, ReservaExtra, ComandoDispositivo, Predio, TrabalhadorAgendador,
+    CurvaResfriamento, DesligamentoAusencia,
 )
 
 
+LIMITE_PREVIA_ALOCACAO = 500
+
+
 # Inline para mostrar Professor junto com User
 class ProfessorInline(admin.StackedInline):
     model = Professor
@@ -21,11 +37,19 @@ class ProfessorInline(admin.StackedInline):
     list_display = ['username', 'email', 'first_name', 'last_name', 'get_tipo', 'is_staff']
     list_filter = ['is_staff', 'is_superuser', 'is_active', 'perfil__tipo']'''
 
+# Filtro de professor que já traz o usuário (Professor.__str__ usa o nome do User)
+class ProfessorListFilter(admin.RelatedFieldListFilter):
+    def field_choices(self, field, request, model_admin):
+        professores = Professor.objects.select_related('user').order_by('user__first_name', 'user__last_name')
+        return [(professor.pk, str(professor)) for professor in professores]
+
+
 # Customiza o Admin do Professor
 @admin.register(Professor)
 class ProfessorAdmin(admin.ModelAdmin):
     list_display = ['get_nome_completo', 'matricula', 'departamento', 'telefone', 'get_email']
     list_filter = ['departamento', 'user__is_active']
+    list_select_related = ['user']
     search_fields = ['user__first_name', 'user__last_name', 'matricula', 'departamento']
     ordering = ['user__first_name', 'user__last_name']
     
@@ -64,6 +88,8 @@ class SemestreAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ['criada_em', 'atualizada_em']
+    actions = ['verificar_conflitos', 'copiar_para_outro_semestre']
+    change_form_template = 'admin/core/semestre/change_form.html'
     
     def get_periodo(self, obj):
         return obj.get_semestre_display()
@@ -76,6 +102,122 @@ class SemestreAdmin(admin.ModelAdmin):
             Semestre.objects.filter(ativo=True).exclude(pk=obj.pk).update(ativo=False)
         super().save_model(request, obj, form, change)
 
+    @admin.action(description='Verificar conflitos de horário')
+    def verificar_conflitos(self, request, queryset):
+        relatorio = [(semestre, validacao.verificar_semestre(semestre)) for semestre in queryset]
+        return TemplateResponse(request, 'admin/core/semestre/conflitos.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Conflitos de horário',
+            'opts': self.model._meta,
+            'relatorio': relatorio,
+        })
+
+    @admin.action(description='Copiar turmas e horários para outro semestre')
+    def copiar_para_outro_semestre(self, request, queryset):
+        if queryset.count() != 1:
+            messages.error(request, 'Selecione um único semestre de origem.')
+            return None
+        return redirect('admin:core_semestre_virada', queryset.get().pk)
+    
+    def get_urls(self):
+        urls = [
+            path('<path:object_id>/virada/', self.admin_site.admin_view(self.virada_view),
+                 name='core_semestre_virada'),
+            path('<path:object_id>/energia/', self.admin_site.admin_view(self.energia_view),
+                 name='core_semestre_energia'),
+            path('<path:object_id>/alocacao/', self.admin_site.admin_view(self.alocacao_view),
+                 name='core_semestre_alocacao'),
+        ]
+        return urls + super().get_urls()
+    
+    def energia_view(self, request, object_id):
+        """Painel com a estimativa de economia de energia do semestre"""
+        semestre = self.get_object(request, object_id)
+        if semestre is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, object_id)
+        return TemplateResponse(request, 'admin/core/semestre/energia.html', {
+            **self.admin_site.each_context(request),
+            'title': f'Economia de energia - {semestre}',
+            'opts': self.model._meta,
+            'original': semestre,
+            'relatorio': energia.simular_semestre(semestre),
+        })
+    
+    def virada_view(self, request, object_id):
+        """Copia as turmas e horários do semestre para outro (com trocas de professor/sala)"""
+        semestre = self.get_object(request, object_id)
+        if semestre is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, object_id)
+        if request.method == 'POST' and not self.has_change_permission(request, semestre):
+            raise PermissionDenied
+        resultado = None
+        form = ViradaSemestreForm(request.POST or None, origem=semestre)
+        if request.method == 'POST' and form.is_valid():
+            professores, salas = form.cleaned_data['trocas']
+            try:
+                resultado = virada.virar_semestre(
+                    semestre, form.cleaned_data['destino'], professores, salas,
+                    simular=form.cleaned_data['simular'],
+                    ignorar_conflitos=form.cleaned_data['ignorar_conflitos'],
+                )
+            except virada.ErroVirada as erro:
+                messages.error(request, str(erro))
+            else:
+                if resultado.gravado:
+                    messages.success(request, f'Cópia gravada: {resultado}')
+                else:
+                    messages.warning(request, f'Nada foi gravado: {resultado}')
+        return TemplateResponse(request, 'admin/core/semestre/virada.html', {
+            **self.admin_site.each_context(request),
+            'title': f'Copiar turmas e horários - {semestre}',
+            'opts': self.model._meta,
+            'original': semestre,
+            'form': form,
+            'resultado': resultado,
+        })
+    
+    def alocacao_view(self, request, object_id):
+        """Prévia da alocação automática de salas; o POST grava a proposta exibida"""
+        semestre = self.get_object(request, object_id)
+        if semestre is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, object_id)
+        if request.method == 'POST':
+            if not self.has_change_permission(request, semestre):
+                raise PermissionDenied
+            try:
+                with transaction.atomic():
+                    proposta = alocacao.carregar(semestre, request.POST.get('proposta', ''))
+                    alterados = alocacao.aplicar(proposta)
+            except alocacao.ErroAlocacao as erro:
+                messages.error(request, str(erro))
+                return redirect('admin:core_semestre_alocacao', semestre.pk)
+            messages.success(request, f'{alterados} horário(s) mudaram de sala. {proposta}')
+            return redirect('admin:core_semestre_change', semestre.pk)
+
+        proposta = alocacao.propor(semestre)
+
+        # Nomes só das mudanças exibidas
+        mudancas = proposta.mudancas[:LIMITE_PREVIA_ALOCACAO]
+        horarios = HorarioTurma.objects.select_related(
+            'turma__disciplina', 'turma__professor__user').in_bulk([pk for pk, _, _ in mudancas])
+        salas = Sala.objects.in_bulk({sala_id for _, origem, destino in mudancas for sala_id in (origem, destino)})
+        return TemplateResponse(request, 'admin/core/semestre/alocacao.html', {
+            **self.admin_site.each_context(request),
+            'title': f'Otimizar salas - {semestre}',
+            'opts': self.model._meta,
+            'original': semestre,
+            'proposta': proposta,
+            'total_mudancas': len(proposta.mudancas),
+            'assinatura': alocacao.assinar(proposta),
+            'mudancas': [(horarios[pk], salas.get(origem), salas.get(destino)) for pk, origem, destino in mudancas],
+        })
+
+
+class DispositivoInline(admin.TabularInline):
+    model = Dispositivo
+    extra = 0
+    fields = ['tipo', 'identificador', 'controlador', 'ativo']
+
 
 @admin.register(Sala)
 class SalaAdmin(admin.ModelAdmin):
@@ -88,13 +230,14 @@ class SalaAdmin(admin.ModelAdmin):
     ]
     search_fields = ['nome', 'localizacao']
     ordering = ['andar', 'nome']
+    inlines = [DispositivoInline]
     
     fieldsets = (
         ('Informações da Sala', {
             'fields': ('nome', 'tipo', 'capacidade', 'andar', 'localizacao', 'ativa')
         }),
         ('Metadados', {
-            'fields': ('criada_em', 'atualizada_em'),
+            'fields': ('predio', 'criada_em', 'atualizada_em'),
             'classes': ('collapse',)
         }),
     )
@@ -104,12 +247,103 @@ class SalaAdmin(admin.ModelAdmin):
     get_andar_display.short_description = 'Andar'
     get_andar_display.admin_order_field = 'andar'
     
-    readonly_fields = ['criada_em', 'atualizada_em']
+    readonly_fields = ['predio', 'criada_em', 'atualizada_em']
     
     def get_tipo_display(self, obj):
         return obj.get_tipo_display()
     get_tipo_display.short_description = 'Tipo (legível)'
 
+    change_list_template = 'admin/core/sala/change_list.html'
+    change_form_template = 'admin/core/sala/change_form.html'
+
+    def get_urls(self):
+        urls = [
+            path('grade/', self.admin_site.admin_view(self.grade_view), name='core_sala_grade'),
+            path('painel/', self.admin_site.admin_view(self.painel_view), name='core_sala_painel'),
+            path('disponibilidade/', self.admin_site.admin_view(self.disponibilidade_view),
+                 name='core_sala_disponibilidade'),
+            path('<path:object_id>/grade/', self.admin_site.admin_view(self.grade_sala_view),
+                 name='core_sala_grade_sala'),
+        ]
+        return urls + super().get_urls()
+
+    def _semestre_da_grade(self, request):
+        semestres = list(Semestre.objects.all())
+        escolhido = request.GET.get('semestre')
+        semestre = next((s for s in semestres if str(s.pk) == escolhido), None)
+        return semestre or next((s for s in semestres if s.ativo), semestres[0] if semestres else None), semestres
+
+    def _grade(self, request, titulo, salas, **contexto):
+        semestre, semestres = self._semestre_da_grade(request)
+        fragmentos = grade.fragmentos(salas, semestre) if semestre is not None and salas else {}
+        andares = {}
+        for sala in salas:
+            andares.setdefault(sala['andar'], []).append(fragmentos.get(sala['pk'], ''))
+        return TemplateResponse(request, 'admin/core/sala/grade.html', {
+            **self.admin_site.each_context(request),
+            'title': titulo,
+            'opts': self.model._meta,
+            'semestre': semestre,
+            'semestres': semestres,
+            'andares': sorted(andares.items()),
+            **contexto,
+        })
+
+    def grade_view(self, request):
+        """Grade semanal de um prédio (ou de um andar dele); sem prédio, a lista de prédios"""
+        predio = request.GET.get('predio')
+        andar = request.GET.get('andar')
+        andar = int(andar) if andar and andar.lstrip('-').isdigit() else None
+        if not predio:
+            locais = {}
+            for localizacao, numero, salas in Sala.objects.filter(ativa=True).values_list(
+                    'localizacao', 'andar').annotate(salas=Count('pk')).order_by('localizacao', 'andar'):
+                locais.setdefault(localizacao, []).append((numero, salas))
+            return self._grade(request, 'Grade semanal', [], locais=sorted(locais.items()))
+        titulo = f'Grade semanal - {predio}' + (f', andar {andar}' if andar is not None else '')
+        return self._grade(request, titulo, grade.salas_do_local(predio, andar), predio=predio, andar=andar)
+
+    def grade_sala_view(self, request, object_id):
+        """Grade semanal de uma sala"""
+        sala = self.get_object(request, object_id)
+        if sala is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, object_id)
+        return self._grade(request, f'Grade semanal - {sala.nome}', grade.salas_do_local(sala_id=sala.pk),
+                           original=sala)
+
+    def painel_view(self, request):
+        """Estado ao vivo das salas; os estados chegam por SSE (``core:api_painel_eventos``)"""
+        predios = {}
+        for sala_id, nome, localizacao, andar in Sala.objects.filter(ativa=True).order_by(
+                'localizacao', 'andar', 'nome').values_list('pk', 'nome', 'localizacao', 'andar'):
+            predios.setdefault(localizacao, {}).setdefault(andar, []).append((sala_id, nome))
+        return TemplateResponse(request, 'admin/core/sala/painel.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Painel das salas',
+            'opts': self.model._meta,
+            'predios': [(predio, sorted(andares.items())) for predio, andares in predios.items()],
+        })
+
+    def disponibilidade_view(self, request):
+        """Salas livres em um dia e horário, das que menos aumentam o consumo para as que mais"""
+        form = DisponibilidadeForm(request.GET or None)
+        livres = form.buscar() if form.is_valid() else None
+        return TemplateResponse(request, 'admin/core/sala/disponibilidade.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Salas livres',
+            'opts': self.model._meta,
+            'form': form,
+            'livres': livres,
+        })
+
+
+@admin.register(Dispositivo)
+class DispositivoAdmin(admin.ModelAdmin):
+    list_display = ['identificador', 'sala', 'tipo', 'controlador', 'ativo']
+    list_filter = ['tipo', 'ativo', 'sala__localizacao']
+    search_fields = ['identificador', 'sala__nome', 'controlador']
+    list_select_related = ['sala']
+
 
 @admin.register(Disciplina)
 class DisciplinaAdmin(admin.ModelAdmin):
@@ -137,6 +371,7 @@ class DisciplinaAdmin(admin.ModelAdmin):
 
 class HorarioTurmaInline(admin.TabularInline):
     model = HorarioTurma
+    formset = HorarioTurmaFormSet  # valida sobreposições, professor e capacidade
     extra = 2
     fields = ['sala', 'dia_semana', 'hora_inicio', 'hora_fim']
 
@@ -144,31 +379,227 @@ class HorarioTurmaInline(admin.TabularInline):
 @admin.register(Turma)
 class TurmaAdmin(admin.ModelAdmin):
     list_display = ['__str__', 'disciplina', 'professor', 'semestre', 'numero_alunos', 'ativo']
-    list_filter = ['semestre', 'disciplina', 'professor', 'ativo']
+    list_filter = ['semestre', 'disciplina', ('professor', ProfessorListFilter), 'ativo']
     search_fields = ['disciplina__codigo', 'disciplina__nome', 'codigo_turma']
     inlines = [HorarioTurmaInline]  # ← Edita horários inline!
+    change_list_template = 'admin/core/turma/change_list.html'
     
     fieldsets = (
         ('Informações da Turma', {
             'fields': ('semestre', 'disciplina', 'professor', 'codigo_turma', 'numero_alunos', 'ativo')
         }),
     )
+    
+    def get_queryset(self, request):
+        # Joins da listagem e do formulário: Turma.__str__ usa disciplina e
+        # professor.user. (A listagem ignora list_select_related quando o
+        # queryset já tem select_related, por isso tudo é declarado aqui.)
+        return super().get_queryset(request).select_related('disciplina', 'professor__user', 'semestre')
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'professor':
+            kwargs['queryset'] = Professor.objects.select_related('user')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def get_urls(self):
+        urls = [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='core_turma_importar'),
+        ]
+        return urls + super().get_urls()
+    
+    def importar_view(self, request):
+        """Importação em massa da planilha de horários do semestre"""
+        resultado = None
+        form = ImportacaoHorariosForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            try:
+                resultado = importar_horarios(
+                    ler_planilha(arquivo.file, arquivo.name),
+                    form.cleaned_data['semestre'],
+                    simular=form.cleaned_data['simular'],
+                    ignorar_conflitos=form.cleaned_data['ignorar_conflitos'],
+                )
+            except ErroImportacao as erro:
+                messages.error(request, str(erro))
+            else:
+                if resultado.gravado:
+                    messages.success(request, f'Importação gravada: {resultado}')
+                else:
+                    messages.warning(request, f'Nada foi gravado: {resultado}')
+        return TemplateResponse(request, 'admin/core/turma/importar.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Importar horários',
+            'opts': self.model._meta,
+            'form': form,
+            'resultado': resultado,
+        })
 
 
 @admin.register(HorarioTurma)
 class HorarioTurmaAdmin(admin.ModelAdmin):
     list_display = ['turma', 'get_professor', 'sala', 'get_dia_semana', 'hora_inicio', 'hora_fim']
-    list_filter = ['turma__semestre', 'dia_semana', 'sala', 'turma__professor', 'hora_inicio', 'hora_fim']
+    list_filter = ['turma__semestre', 'dia_semana', 'sala', ('turma__professor', ProfessorListFilter), 'hora_inicio', 'hora_fim']
     search_fields = ['turma__disciplina__codigo', 'turma__disciplina__nome', 'turma__professor__user__first_name', 'turma__professor__user__last_name']
     
     def get_professor(self, obj):
-        return obj.turma.professor
+        return referencia.professor(obj.turma.professor_id) or obj.turma.professor
     get_professor.short_description = 'Professor'
     get_professor.admin_order_field = 'turma__professor__user__first_name'
     
     def get_dia_semana(self, obj):
         return obj.get_dia_semana_display()
     get_dia_semana.short_description = 'Dia'
+    
+    def get_queryset(self, request):
+        # HorarioTurma.__str__ passa por Turma.__str__, que (como
+        # get_professor) lê disciplina e professor de ``referencia``
+        return super().get_queryset(request).select_related('turma', 'sala')
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'turma':
+            kwargs['queryset'] = Turma.objects.all()   # Turma.__str__ não consulta (``referencia``)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(Feriado)
+class FeriadoAdmin(admin.ModelAdmin):
+    list_display = ['descricao', 'tipo', 'data_inicio', 'data_fim']
+    list_filter = ['tipo', 'data_inicio']
+    search_fields = ['descricao']
+    date_hierarchy = 'data_inicio'
+
+
+@admin.register(CancelamentoAula)
+class CancelamentoAulaAdmin(admin.ModelAdmin):
+    list_display = ['horario', 'data', 'motivo']
+    list_filter = ['data']
+    search_fields = ['horario__turma__disciplina__codigo', 'horario__sala__nome', 'motivo']
+    raw_id_fields = ['horario']
+    date_hierarchy = 'data'
+
+    def get_queryset(self, request):
+        # CancelamentoAula.__str__ passa por HorarioTurma.__str__ e Turma.__str__
+        return super().get_queryset(request).select_related('horario__turma')
+
+
+@admin.register(ReservaExtra)
+class ReservaExtraAdmin(admin.ModelAdmin):
+    list_display = ['sala', 'data', 'hora_inicio', 'hora_fim', 'descricao', 'responsavel']
+    list_filter = ['data', 'sala__localizacao']
+    search_fields = ['sala__nome', 'descricao']
+    list_select_related = ['sala', 'responsavel']
+    date_hierarchy = 'data'
+
+
+@admin.register(AlertaConsumo)
+class AlertaConsumoAdmin(admin.ModelAdmin):
+    list_display = ['sala', 'inicio', 'fim', 'minutos', 'kwh', 'resolvido']
+    list_filter = ['resolvido', 'sala__localizacao', 'inicio']
+    search_fields = ['sala__nome', 'sala__localizacao']
+    list_select_related = ['sala']
+    readonly_fields = ['sala', 'inicio', 'fim', 'minutos', 'kwh', 'criado_em']
+    actions = ['marcar_resolvido']
+
+    def get_queryset(self, request):
+        # Episódios ainda abaixo do mínimo de minutos não são alertas
+        return super().get_queryset(request).filter(confirmado=True)
+
+    @admin.action(description='Marcar como resolvido')
+    def marcar_resolvido(self, request, queryset):
+        atualizados = queryset.update(resolvido=True)
+        messages.success(request, f'{atualizados} alerta(s) marcado(s) como resolvido(s).')
+
+
+@admin.register(ExecucaoAnomalias)
+class ExecucaoAnomaliasAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'leituras', 'alertas', 'duracao', 'executada_em']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ComandoDispositivo)
+class ComandoDispositivoAdmin(admin.ModelAdmin):
+    list_display = ['agendado_para', 'sala', 'dispositivo', 'acao', 'origem', 'status', 'tentativas', 'confirmado_em']
+    list_filter = ['status', 'origem', 'dispositivo', 'acao', 'agendado_para']
+    search_fields = ['sala__nome', 'sala__localizacao']
+    list_select_related = ['sala']
+    readonly_fields = [campo.name for campo in ComandoDispositivo._meta.fields]
+    actions = ['reenfileirar']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Reenfileirar (tentativas zeradas)')
+    def reenfileirar(self, request, queryset):
+        atualizados = queryset.filter(status=ComandoDispositivo.FALHOU).update(
+            status=ComandoDispositivo.PENDENTE, tentativas=0, proxima_tentativa=timezone.now(), reserva=None)
+        messages.success(request, f'{atualizados} comando(s) de volta à fila.')
+
+
+@admin.register(Predio)
+class PredioAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'salas', 'trabalhador', 'arrendado_ate']
+    search_fields = ['nome']
+    readonly_fields = ['criado_em']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('arrendamento').annotate(total_salas=Count('salas'))
+
+    @admin.display(description='Salas', ordering='total_salas')
+    def salas(self, obj):
+        return obj.total_salas
+
+    def _arrendamento(self, obj):
+        try:
+            return obj.arrendamento
+        except Predio.arrendamento.RelatedObjectDoesNotExist:
+            return None
+
+    @admin.display(description='Trabalhador')
+    def trabalhador(self, obj):
+        arrendamento = self._arrendamento(obj)
+        return arrendamento.trabalhador if arrendamento and arrendamento.trabalhador else '-'
+
+    @admin.display(description='Arrendado até')
+    def arrendado_ate(self, obj):
+        arrendamento = self._arrendamento(obj)
+        return arrendamento.expira_em if arrendamento else None
+
+
+@admin.register(TrabalhadorAgendador)
+class TrabalhadorAgendadorAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'iniciado_em', 'visto_em']
+    readonly_fields = ['nome', 'iniciado_em', 'visto_em']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CurvaResfriamento)
+class CurvaResfriamentoAdmin(admin.ModelAdmin):
+    list_display = ['sala', 'minutos_base', 'minutos_por_grau', 'episodios', 'amostras', 'processado_ate']
+    list_filter = ['sala__localizacao']
+    search_fields = ['sala__nome']
+    list_select_related = ['sala']
+    readonly_fields = [campo.name for campo in CurvaResfriamento._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DesligamentoAusencia)
+class DesligamentoAusenciaAdmin(admin.ModelAdmin):
+    list_display = ['inicio', 'sala', 'fim', 'minutos', 'kwh']
+    list_filter = ['sala__localizacao', 'inicio']
+    search_fields = ['sala__nome']
+    list_select_related = ['sala']
+    date_hierarchy = 'inicio'
+    readonly_fields = [campo.name for campo in DesligamentoAusencia._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
 
 
 # Customização do site admin
@@ -0,0 +1,220 @@
+"""
+Agendador de comandos das salas.
+
+Um único processo acompanha todas as salas ativas: para cada par
+(sala, dispositivo) guardamos apenas a próxima transição em um heap e o laço
+dorme até a mais próxima. Transições que vencem juntas são gravadas de uma
+vez na fila de comandos (``despacho``), de onde os despachantes as entregam.
+Ao iniciar, o último estado de cada par vem da própria fila: um reinício
+não reenvia o que já foi decidido.
+
+Com ``predios`` definido (``particionamento``), o agendador só acompanha as
+salas desses prédios e recompila quando o conjunto muda.
+
+A antecedência do ar é por sala (``preresfriamento``), recalculada a cada
+recompilação com a temperatura atual; com o ar já ligado ela é mantida, para
+a janela não encolher e desligar o ar antes da aula.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import calendario, despacho, metricas, preresfriamento, referencia
+from .dispositivos import AR, DESLIGAR, DISPOSITIVOS, LIGAR, LUZ, Comando
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class Agendador:
+    """Calcula as transições liga/desliga e as grava na fila de comandos."""
+
+    def __init__(self, antecedencia_ar=None, tolerancia=None, intervalo_recompilacao=None, ao_registrar=None,
+                 predios=None):
+        self.ao_registrar = ao_registrar   # ex.: acordar o despachante do mesmo processo
+        self.predios = predios             # ids de Predio; None = todas as salas
+        self.antecedencia_ar = antecedencia_ar if antecedencia_ar is not None else _config('LUMINOFF_ANTECEDENCIA_AR', 15)
+        self.tolerancia = tolerancia if tolerancia is not None else _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+        self.intervalo_recompilacao = (
+            intervalo_recompilacao if intervalo_recompilacao is not None
+            else _config('LUMINOFF_INTERVALO_RECOMPILACAO', 300)
+        )
+
+        self._linhas_tempo = {}   # dispositivo -> IndiceOcupacao com as margens aplicadas
+        self._antecedencias = {}  # sala_id -> minutos de pré-climatização em uso
+        self._salas = frozenset()
+        self._heap = []           # (quando, sala_id, dispositivo)
+        self._estado = {}         # (sala_id, dispositivo) -> último estado enviado
+        self._parar = asyncio.Event()
+        self._acordar = asyncio.Event()
+        self._predios_mudaram = False
+
+    # -- montagem -----------------------------------------------------------
+
+    def carregar(self, indice, salas_ativas, antecedencias=None):
+        """Aplica as margens de cada dispositivo ao índice de ocupação.
+
+        ``antecedencias`` (``{sala_id: minutos}``) substitui a antecedência
+        fixa do ar nas salas informadas.
+        """
+        self._salas = frozenset(salas_ativas)
+        antecedencia_ar = self.antecedencia_ar
+        if antecedencias:
+            antecedencia_ar = {sala_id: antecedencias.get(sala_id, self.antecedencia_ar) for sala_id in self._salas}
+        self._linhas_tempo = {
+            LUZ: indice.com_margens(0, self.tolerancia),
+            AR: indice.com_margens(antecedencia_ar, self.tolerancia),
+        }
+
+    def _carregar_do_banco(self):
+        # Datas concretas da próxima semana: feriados, cancelamentos e
+        # reservas já aplicados (a recompilação periódica cobre a virada do dia)
+        salas = [sala.pk for sala in referencia.salas_ativas(self.predios)]
+        antecedencias = None
+        if _config('LUMINOFF_PRE_RESFRIAMENTO_ADAPTATIVO', True):
+            antecedencias = preresfriamento.antecedencias(salas, self.antecedencia_ar)
+            for sala_id, anterior in self._antecedencias.items():
+                if self._estado.get((sala_id, AR)) and sala_id in antecedencias:
+                    antecedencias[sala_id] = anterior
+            self._antecedencias = antecedencias
+        self.carregar(calendario.indice_semana(timezone.localdate()), salas, antecedencias)
+
+    def sincronizar(self, agora):
+        """Refaz o heap e devolve os comandos cujo estado difere do último enviado."""
+        comandos = []
+        self._heap = []
+        for sala_id in self._salas:
+            for dispositivo in DISPOSITIVOS:
+                linha = self._linhas_tempo[dispositivo]
+                ligado = linha.ocupada(sala_id, agora)
+                if self._estado.get((sala_id, dispositivo)) != ligado:
+                    comandos.append(self._comando(sala_id, dispositivo, ligado, agora))
+                self._agendar(sala_id, dispositivo, agora)
+        heapq.heapify(self._heap)
+        # Salas que saíram do conjunto ativo não são mais acompanhadas
+        self._estado = {chave: estado for chave, estado in self._estado.items() if chave[0] in self._salas}
+        return comandos
+
+    def _agendar(self, sala_id, dispositivo, depois_de, empilhar=False):
+        transicao = self._linhas_tempo[dispositivo].proxima_transicao(sala_id, depois_de)
+        if transicao is None:
+            return
+        item = (transicao[0], sala_id, dispositivo)
+        if empilhar:
+            heapq.heappush(self._heap, item)
+        else:
+            self._heap.append(item)
+
+    def _comando(self, sala_id, dispositivo, ligado, quando):
+        self._estado[(sala_id, dispositivo)] = ligado
+        return Comando(sala_id, dispositivo, LIGAR if ligado else DESLIGAR, quando)
+
+    # -- laço principal -----------------------------------------------------
+
+    def proximo_vencimento(self):
+        return self._heap[0][0] if self._heap else None
+
+    def vencidos(self, agora):
+        """Retira do heap as transições até ``agora`` e reagenda as seguintes."""
+        comandos = []
+        while self._heap and self._heap[0][0] <= agora:
+            quando, sala_id, dispositivo = heapq.heappop(self._heap)
+            ligado = self._linhas_tempo[dispositivo].ocupada(sala_id, quando)
+            if self._estado.get((sala_id, dispositivo)) != ligado:
+                comandos.append(self._comando(sala_id, dispositivo, ligado, quando))
+            self._agendar(sala_id, dispositivo, quando, empilhar=True)
+        return comandos
+
+    async def _enviar(self, comandos):
+        try:
+            await sync_to_async(despacho.registrar)(comandos)
+        except Exception:
+            # O estado é esquecido para que a próxima sincronização regrave
+            logger.exception("Falha ao gravar %d comandos na fila", len(comandos))
+            for comando in comandos:
+                self._estado.pop((comando.sala_id, comando.dispositivo), None)
+            return
+        agora = timezone.now()
+        for rotulos, quantidade in Counter((comando.dispositivo, comando.acao) for comando in comandos).items():
+            metricas.TRANSICOES.inc(quantidade, rotulos)
+        metricas.ATRASO_TRANSICAO.observar_varios([
+            max((agora - comando.quando).total_seconds(), 0) for comando in comandos])
+        if self.ao_registrar is not None:
+            self.ao_registrar()
+
+    async def recompilar(self):
+        inicio = time.perf_counter()
+        await sync_to_async(self._carregar_do_banco)()
+        comandos = self.sincronizar(timezone.localtime())
+        metricas.RECOMPILACAO.observar(time.perf_counter() - inicio)
+        metricas.SALAS_AGENDADAS.definir(len(self._salas))
+        logger.info("Agenda recompilada: %d salas, %d comandos de sincronização",
+                    len(self._salas), len(comandos))
+        await self._enviar(comandos)
+
+    async def executar(self):
+        loop = asyncio.get_running_loop()
+        self._estado = await sync_to_async(despacho.ultimo_estado)()
+        await self.recompilar()
+        proxima_recompilacao = loop.time() + self.intervalo_recompilacao
+
+        while not self._parar.is_set():
+            if self._predios_mudaram:
+                # Prédios assumidos de outro trabalhador: o estado deles está na fila
+                self._predios_mudaram = False
+                self._estado = await sync_to_async(despacho.ultimo_estado)()
+                await self.recompilar()
+                proxima_recompilacao = loop.time() + self.intervalo_recompilacao
+
+            agora = timezone.localtime()
+            comandos = self.vencidos(agora)
+            if comandos:
+                await self._enviar(comandos)
+
+            if loop.time() >= proxima_recompilacao:
+                await self.recompilar()
+                proxima_recompilacao = loop.time() + self.intervalo_recompilacao
+
+            espera = proxima_recompilacao - loop.time()
+            vencimento = self.proximo_vencimento()
+            if vencimento is not None:
+                espera = min(espera, (vencimento - timezone.localtime()).total_seconds())
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=max(espera, 0))
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+
+    def definir_predios(self, predios):
+        """Troca o conjunto de prédios acompanhados (chamado pelo ``Coordenador``)."""
+        self.predios = predios
+        self._predios_mudaram = True
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def previsao(self, agora, horas=24):
+        """Lista as transições das próximas ``horas`` sem alterar o estado."""
+        limite = agora + timedelta(hours=horas)
+        eventos = []
+        for sala_id in self._salas:
+            for dispositivo in DISPOSITIVOS:
+                momento = agora
+                linha = self._linhas_tempo[dispositivo]
+                while (transicao := linha.proxima_transicao(sala_id, momento)) and transicao[0] <= limite:
+                    momento, ligado = transicao
+                    eventos.append(Comando(sala_id, dispositivo, LIGAR if ligado else DESLIGAR, momento))
+        eventos.sort(key=lambda comando: (comando.quando, comando.sala_id))
+        return eventos
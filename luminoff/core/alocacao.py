@@ -0,0 +1,387 @@
+"""
+Alocação automática de salas.
+
+Reatribui as salas dos HorarioTurma de um semestre para concentrar as aulas
+em poucos andares e prédios ao mesmo tempo. O número de salas ligadas
+simultaneamente é o número de aulas simultâneas, então o que a alocação
+consegue reduzir é quanto tempo cada andar (``Sala.andar``) e cada prédio
+(``Sala.localizacao``) fica energizado.
+
+1. Guloso (coloração de grafo de intervalos): por dia, as aulas são
+   processadas em ordem de início; cada uma vai para a sala livre, do tipo
+   certo e com capacidade suficiente, no andar/prédio que menos minutos
+   energizados acrescenta. Como todas as aulas já alocadas começam antes, a
+   cobertura de um andar a partir do início da aula é contígua e o custo
+   sai em O(1) por andar.
+2. Busca local: aulas que são as únicas a manter um andar ligado em algum
+   minuto são movidas para salas livres em andares que já estão ligados
+   durante toda a aula.
+
+Restrições: ``Sala.ativa``, ``Sala.capacidade`` >= ``numero_alunos``, o
+mesmo ``Sala.tipo`` da sala atual e o ``unique_together`` (semestre, sala,
+dia, início) com os horários das turmas inativas do semestre.
+
+A prévia do admin não é recalculada na confirmação: as mudanças exibidas vão
+assinadas no formulário (``assinar``) e ``carregar`` as confere contra o
+banco antes de ``aplicar``. Se a grade mudou desde a prévia, nada é gravado.
+"""
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F
+
+from . import alteracoes, calendario, ocupacao, validacao, versao
+from .models import HorarioTurma, Sala
+
+PESO_ANDAR = 1
+PESO_PREDIO = 3
+_NUNCA = -10 ** 9
+_SALT = 'core.alocacao.proposta'
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class ErroAlocacao(Exception):
+    """Proposta assinada inválida ou que não vale mais para a grade atual."""
+
+
+class Proposta:
+    """Resultado da otimização: mudanças propostas e métricas antes/depois."""
+
+    def __init__(self, semestre):
+        self.semestre = semestre
+        self.atribuicao = {}   # horario_id -> sala_id proposta
+        self.atual = {}        # horario_id -> sala_id atual
+        self.sem_sala = []     # horario_id sem sala compatível livre (mantém a atual)
+        self.antes = {}
+        self.depois = {}
+        self.movimentos_busca_local = 0
+        self.duracao = 0.0
+
+    @property
+    def mudancas(self):
+        return [(pk, self.atual[pk], sala_id) for pk, sala_id in self.atribuicao.items() if self.atual[pk] != sala_id]
+
+    def __str__(self):
+        return (f"{len(self.mudancas)} de {len(self.atribuicao)} horários mudam de sala; "
+                f"andar-minutos {self.antes.get('andar_minutos', 0)} -> {self.depois.get('andar_minutos', 0)}, "
+                f"prédio-minutos {self.antes.get('predio_minutos', 0)} -> {self.depois.get('predio_minutos', 0)}")
+
+
+class _Campus:
+    """Salas ativas indexadas por andar e tipo, em ordem de capacidade."""
+
+    def __init__(self):
+        linhas = list(Sala.objects.filter(ativa=True).order_by('capacidade', 'pk').values_list(
+            'pk', 'tipo', 'capacidade', 'localizacao', 'andar'))
+        self.ids = [linha[0] for linha in linhas]
+        self.posicao = {pk: i for i, pk in enumerate(self.ids)}
+        self.capacidade = [linha[2] for linha in linhas]
+        andares, predios = {}, {}
+        self.andar = [andares.setdefault((linha[3], linha[4]), len(andares)) for linha in linhas]
+        self.predio = [predios.setdefault(linha[3], len(predios)) for linha in linhas]
+        self.predio_do_andar = [predios[predio] for predio, _ in andares]
+        self.n_andares, self.n_predios = len(andares), len(predios)
+        # (andar, tipo) -> salas em ordem crescente de capacidade
+        self.grupos = defaultdict(list)
+        self.andares_do_tipo = defaultdict(list)
+        for i, linha in enumerate(linhas):
+            if (self.andar[i], linha[1]) not in self.grupos:
+                self.andares_do_tipo[linha[1]].append(self.andar[i])
+            self.grupos[(self.andar[i], linha[1])].append(i)
+        self.capacidades_grupo = {chave: [self.capacidade[i] for i in salas] for chave, salas in self.grupos.items()}
+
+
+def _medir(campus, horarios, atribuicao, tolerancia):
+    """Minutos energizados somados por andar e por prédio, e salas usadas."""
+    andares = np.zeros((ocupacao.DIAS_SEMANA, campus.n_andares, ocupacao.MINUTOS_DIA + tolerancia), dtype=bool)
+    predios = np.zeros((ocupacao.DIAS_SEMANA, campus.n_predios, ocupacao.MINUTOS_DIA + tolerancia), dtype=bool)
+    usadas = set()
+    for h in horarios:
+        sala = campus.posicao.get(atribuicao[h[0]])
+        if sala is None:
+            continue
+        usadas.add(sala)
+        andares[h[3], campus.andar[sala], h[4]:h[5] + tolerancia] = True
+        predios[h[3], campus.predio[sala], h[4]:h[5] + tolerancia] = True
+    return {'andar_minutos': int(andares.sum()), 'predio_minutos': int(predios.sum()), 'salas_usadas': len(usadas)}
+
+
+class _Otimizador:
+    def __init__(self, campus, horarios, proibidos, tolerancia):
+        self.campus = campus
+        self.horarios = horarios
+        self.proibidos = proibidos
+        self.tolerancia = tolerancia
+
+    def _disponivel(self, sala, dia, inicio, fim, livre_em, reservas):
+        if livre_em[sala] > inicio or (self.campus.ids[sala], dia, inicio) in self.proibidos:
+            return False
+        return not any(a < fim and inicio < b for a, b in reservas.get(sala, ()))
+
+    def _sala_no_andar(self, andar, tipo, alunos, dia, inicio, fim, livre_em, reservas, atual):
+        salas = self.campus.grupos.get((andar, tipo))
+        if not salas:
+            return None
+        # Prefere manter a sala atual; senão, a menor que comporta a turma
+        if atual is not None and self.campus.andar[atual] == andar and self.campus.capacidade[atual] >= alunos \
+                and self._disponivel(atual, dia, inicio, fim, livre_em, reservas):
+            return atual
+        for sala in salas[bisect_left(self.campus.capacidades_grupo[(andar, tipo)], alunos):]:
+            if self._disponivel(sala, dia, inicio, fim, livre_em, reservas):
+                return sala
+        return None
+
+    def guloso(self, atribuicao, sem_sala, fixos):
+        """Uma varredura por dia. Horários em ``fixos`` ficam na sala atual e
+        reservam esse intervalo dela para os demais."""
+        campus = self.campus
+        por_dia = defaultdict(list)
+        for h in self.horarios:
+            por_dia[h[3]].append(h)
+        for dia, itens in por_dia.items():
+            # Empates no início: turmas maiores primeiro (best fit decreasing)
+            itens.sort(key=lambda h: (h[4], -h[6], -h[5]))
+            reservas = defaultdict(list)
+            for pk, sala_atual, _, _, inicio, fim, _ in itens:
+                if pk in fixos and sala_atual in campus.posicao:
+                    reservas[campus.posicao[sala_atual]].append((inicio, fim))
+            livre_em = [_NUNCA] * len(campus.ids)
+            andar_ate = [_NUNCA] * campus.n_andares
+            predio_ate = [_NUNCA] * campus.n_predios
+            for pk, sala_atual, tipo, _, inicio, fim, alunos in itens:
+                fim_energia = fim + self.tolerancia
+
+                def custo(andar):
+                    predio = campus.predio_do_andar[andar]
+                    return (PESO_ANDAR * (fim_energia - max(inicio, min(fim_energia, andar_ate[andar])))
+                            + PESO_PREDIO * (fim_energia - max(inicio, min(fim_energia, predio_ate[predio]))))
+
+                atual = campus.posicao.get(sala_atual)
+                if pk in fixos:
+                    atribuicao[pk] = sala_atual
+                    if atual is None:
+                        continue
+                    escolhida = atual
+                else:
+                    andar_atual = campus.andar[atual] if atual is not None else None
+                    escolhida = None
+                    # Em caso de empate, o andar da sala atual vem primeiro
+                    # (evita mudanças sem ganho)
+                    for andar in sorted(campus.andares_do_tipo.get(tipo, ()),
+                                        key=lambda andar: (custo(andar), andar != andar_atual)):
+                        escolhida = self._sala_no_andar(
+                            andar, tipo, alunos, dia, inicio, fim, livre_em, reservas, atual)
+                        if escolhida is not None:
+                            break
+                    if escolhida is None:
+                        sem_sala.append(pk)
+                        atribuicao[pk] = sala_atual
+                        continue
+                atribuicao[pk] = campus.ids[escolhida]
+                livre_em[escolhida] = max(livre_em[escolhida], fim)
+                andar = campus.andar[escolhida]
+                andar_ate[andar] = max(andar_ate[andar], fim_energia)
+                predio_ate[campus.predio[escolhida]] = max(predio_ate[campus.predio[escolhida]], fim_energia)
+
+    def busca_local(self, atribuicao, tempo_maximo):
+        """Move aulas que mantêm um andar ligado sozinhas para andares já ligados."""
+        campus, tolerancia = self.campus, self.tolerancia
+        largura = ocupacao.MINUTOS_DIA + tolerancia
+        andares = np.zeros((ocupacao.DIAS_SEMANA, campus.n_andares, largura), dtype=np.int16)
+        predios = np.zeros((ocupacao.DIAS_SEMANA, campus.n_predios, largura), dtype=np.int16)
+        agenda_sala = defaultdict(list)   # (sala, dia) -> [(inicio, fim)] ordenado
+        alocados = []
+        for h in self.horarios:
+            sala = campus.posicao.get(atribuicao[h[0]])
+            if sala is None:
+                continue
+            alocados.append(h)
+            andares[h[3], campus.andar[sala], h[4]:h[5] + tolerancia] += 1
+            predios[h[3], campus.predio[sala], h[4]:h[5] + tolerancia] += 1
+            agenda_sala[(sala, h[3])].append((h[4], h[5]))
+        for intervalos in agenda_sala.values():
+            intervalos.sort()
+
+        def livre(sala, dia, inicio, fim):
+            intervalos = agenda_sala.get((sala, dia), ())
+            i = bisect_right(intervalos, (inicio, ocupacao.MINUTOS_DIA + 1))
+            antes_ok = i == 0 or intervalos[i - 1][1] <= inicio
+            depois_ok = i == len(intervalos) or intervalos[i][0] >= fim
+            return antes_ok and depois_ok and (campus.ids[sala], dia, inicio) not in self.proibidos
+
+        limite = time.perf_counter() + tempo_maximo
+        movimentos = 0
+        for pk, _, tipo, dia, inicio, fim, alunos in alocados:
+            if time.perf_counter() > limite:
+                break
+            origem = campus.posicao[atribuicao[pk]]
+            andar_origem = campus.andar[origem]
+            trecho = slice(inicio, fim + tolerancia)
+            exclusivos = int((andares[dia, andar_origem, trecho] == 1).sum())
+            if not exclusivos:
+                continue
+            # Andares que já ficam ligados durante toda a aula (sem contar ela)
+            cobertos = np.flatnonzero((andares[dia, :, trecho] > 0).all(axis=1))
+            for andar in cobertos:
+                if andar == andar_origem:
+                    continue
+                salas = campus.grupos.get((andar, tipo), ())
+                inicio_busca = bisect_left(campus.capacidades_grupo.get((andar, tipo), ()), alunos)
+                destino = next((sala for sala in salas[inicio_busca:] if livre(sala, dia, inicio, fim)), None)
+                if destino is None:
+                    continue
+                andares[dia, andar_origem, trecho] -= 1
+                predios[dia, campus.predio[origem], trecho] -= 1
+                andares[dia, andar, trecho] += 1
+                predios[dia, campus.predio[destino], trecho] += 1
+                agenda_sala[(origem, dia)].remove((inicio, fim))
+                intervalos = agenda_sala[(destino, dia)]
+                intervalos.insert(bisect_left(intervalos, (inicio, fim)), (inicio, fim))
+                atribuicao[pk] = campus.ids[destino]
+                movimentos += 1
+                break
+        return movimentos
+
+
+def propor(semestre, tempo_maximo=None):
+    """Calcula (sem gravar) uma nova atribuição de salas para o semestre."""
+    inicio_execucao = time.perf_counter()
+    tolerancia = _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+    proposta = Proposta(semestre)
+    campus = _Campus()
+
+    # (pk, sala atual, tipo exigido, dia, início, fim, alunos)
+    horarios = [
+        (pk, sala_id, tipo, dia, ocupacao.minutos(inicio), ocupacao.minutos(fim), alunos or 0)
+        for pk, sala_id, tipo, dia, inicio, fim, alunos in HorarioTurma.objects.filter(
+            turma__semestre=semestre, turma__ativo=True,
+        ).order_by().values_list('pk', 'sala_id', 'sala__tipo', 'dia_semana', 'hora_inicio', 'hora_fim',
+                                 'turma__numero_alunos').iterator(chunk_size=5000)
+    ]
+    proibidos = {
+        (sala_id, dia, ocupacao.minutos(inicio))
+        for sala_id, dia, inicio in HorarioTurma.objects.filter(
+            semestre=semestre, turma__ativo=False,
+        ).order_by().values_list('sala_id', 'dia_semana', 'hora_inicio').iterator(chunk_size=5000)
+    }
+    proposta.atual = {h[0]: h[1] for h in horarios}
+    proposta.antes = _medir(campus, horarios, proposta.atual, tolerancia)
+
+    otimizador = _Otimizador(campus, horarios, proibidos, tolerancia)
+    # Quem não couber em lugar nenhum fica na sala atual; como outra aula pode
+    # ter ocupado essa sala antes, a varredura é refeita com esses horários
+    # fixos até não sobrar nenhum novo (no limite, é a alocação atual).
+    fixos = set()
+    while True:
+        proposta.atribuicao, proposta.sem_sala = {}, []
+        otimizador.guloso(proposta.atribuicao, proposta.sem_sala, fixos)
+        novos = set(proposta.sem_sala) - fixos
+        if not novos:
+            break
+        fixos |= novos
+    proposta.movimentos_busca_local = otimizador.busca_local(
+        proposta.atribuicao, tempo_maximo if tempo_maximo is not None else _config('LUMINOFF_ALOCACAO_TEMPO_BUSCA', 10))
+    proposta.depois = _medir(campus, horarios, proposta.atribuicao, tolerancia)
+    proposta.duracao = time.perf_counter() - inicio_execucao
+    return proposta
+
+
+def aplicar(proposta):
+    """Grava a atribuição proposta em lote. Retorna quantos horários mudaram."""
+    mudancas = proposta.mudancas
+    if not mudancas:
+        return 0
+    por_sala = defaultdict(list)
+    for pk, _, sala_id in mudancas:
+        por_sala[sala_id].append(pk)
+    with transaction.atomic():
+        # Trocas de sala entre horários com o mesmo início violariam o
+        # unique_together no meio da atualização: primeiro os horários vão
+        # para um dia fora da semana, depois para a sala e o dia definitivos.
+        # Um UPDATE por sala de destino (sem CASE linha a linha).
+        HorarioTurma.objects.filter(pk__in=[pk for pk, _, _ in mudancas]).update(
+            dia_semana=F('dia_semana') + ocupacao.DIAS_SEMANA)
+        for sala_id, pks in por_sala.items():
+            HorarioTurma.objects.filter(pk__in=pks).update(
+                sala_id=sala_id, dia_semana=F('dia_semana') - ocupacao.DIAS_SEMANA)
+        # bulk_update não dispara sinais: as estruturas derivadas são refeitas
+        transaction.on_commit(ocupacao.invalidar)
+        transaction.on_commit(calendario.invalidar_tudo)
+        transaction.on_commit(versao.incrementar_salas)
+        transaction.on_commit(alteracoes.publicar)
+    return len(mudancas)
+
+
+def assinar(proposta):
+    """Mudanças da proposta assinadas, para o formulário de confirmação."""
+    return signing.dumps({'semestre': proposta.semestre.pk, 'mudancas': proposta.mudancas,
+                          'antes': proposta.antes, 'depois': proposta.depois}, salt=_SALT, compress=True)
+
+
+def carregar(semestre, assinatura):
+    """Proposta com exatamente as mudanças assinadas, conferidas contra o banco.
+
+    Levanta ``ErroAlocacao`` se a assinatura não confere ou se algum horário
+    saiu da sala de origem, a sala de destino deixou de servir ou ficou
+    ocupada desde a prévia.
+    """
+    try:
+        dados = signing.loads(assinatura, salt=_SALT)
+    except signing.BadSignature:
+        raise ErroAlocacao("Proposta inválida; gere a prévia de novo.")
+    if dados['semestre'] != semestre.pk:
+        raise ErroAlocacao("A proposta é de outro semestre.")
+    proposta = Proposta(semestre)
+    proposta.antes, proposta.depois = dados['antes'], dados['depois']
+    for pk, origem, destino in dados['mudancas']:
+        proposta.atual[pk] = origem
+        proposta.atribuicao[pk] = destino
+    if proposta.mudancas:
+        _conferir(proposta)
+    return proposta
+
+
+def _conferir(proposta):
+    desatualizada = ErroAlocacao("A grade mudou desde a prévia; gere a proposta de novo.")
+    horarios = {
+        horario.id: horario for horario in validacao.horarios_do_banco(HorarioTurma.objects.filter(
+            turma__semestre=proposta.semestre, turma__ativo=True))
+    }
+    salas = Sala.objects.filter(ativa=True).in_bulk(
+        set(proposta.atribuicao.values()) | set(proposta.atual.values()))
+    movidos = []
+    for pk, origem, destino in proposta.mudancas:
+        horario = horarios.get(pk)
+        if horario is None or horario.sala_id != origem or destino not in salas:
+            raise desatualizada
+        sala = salas[destino]
+        if origem in salas and salas[origem].tipo != sala.tipo:
+            raise desatualizada
+        horarios[pk] = horario._replace(sala_id=destino, capacidade=sala.capacidade, sala=sala.nome)
+        movidos.append(horarios[pk])
+
+    ids = {horario.id for horario in movidos}
+    conflitos = [
+        conflito for conflito in validacao.verificar_horarios(horarios.values())
+        if conflito.tipo in (validacao.SALA, validacao.CAPACIDADE)
+        and any(horario.id in ids for horario in conflito.horarios)
+    ]
+    # Horários de turmas inativas não colidem, mas ocupam o unique_together
+    reservados = {
+        (sala_id, dia, ocupacao.minutos(inicio))
+        for sala_id, dia, inicio in HorarioTurma.objects.filter(
+            semestre=proposta.semestre, turma__ativo=False, sala_id__in={h.sala_id for h in movidos},
+        ).values_list('sala_id', 'dia_semana', 'hora_inicio')
+    }
+    if any((h.sala_id, h.dia_semana, h.inicio) in reservados for h in movidos):
+        raise desatualizada
+    if conflitos:
+        raise ErroAlocacao("; ".join(conflito.mensagem for conflito in conflitos))
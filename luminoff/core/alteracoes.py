@@ -0,0 +1,187 @@
+"""
+Feed de alterações da grade semanal, para os controladores dos prédios.
+
+Em vez de baixar a agenda inteira a cada mudança, o controlador guarda a
+grade semanal das suas salas e pede só o que mudou desde a versão que tem
+(``/api/agenda/alteracoes/?desde=V``). Um intervalo é ``[dia_semana, inicio,
+fim]``, com os horários em minutos desde 00:00 e as aulas da sala já
+mescladas, sem as margens do agendador (vão na resposta, em ``margens``).
+
+- ``AgendaPublicada`` é o retrato do que já foi publicado;
+- ``publicar(salas)`` compara a grade atual dessas salas (semestre ativo,
+  turmas e salas ativas) com o retrato e grava cada diferença em
+  ``AlteracaoAgenda``, cujo id é a versão. Os sinais de HorarioTurma,
+  Turma, Sala e Semestre chamam após o commit; escritas em massa
+  (importação, virada, alocação) publicam tudo;
+- ``alteracoes_desde(V)`` junta as alterações posteriores a V em um delta
+  líquido por sala (``adicionados``/``removidos``): um intervalo incluído e
+  depois retirado não aparece. Custa uma consulta pelo estado e, se houver
+  novidade, uma pelas alterações, independente do tamanho da grade;
+- ``compactar`` apaga as alterações mais antigas que
+  ``LUMINOFF_ALTERACOES_RETENCAO`` dias; quem pedir uma versão anterior ao
+  ponto compactado (ou nenhuma) recebe o retrato inteiro (``completo``).
+
+Quem publica trava a linha de ``EstadoAlteracoes``: as versões ficam
+visíveis em ordem e um leitor nunca pula uma alteração. O retrato completo
+lê a versão antes dos intervalos; alterações gravadas entre as duas leituras
+voltam no pedido seguinte e, aplicadas como operações de conjunto, não mudam
+o resultado.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import ocupacao, referencia
+from .models import AgendaPublicada, AlteracaoAgenda, EstadoAlteracoes
+
+LOTE = 500   # ids por DELETE ... IN
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _lotes(itens, tamanho=LOTE):
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+
+def _travar():
+    estado, _ = EstadoAlteracoes.objects.select_for_update().get_or_create(pk=1)
+    return estado
+
+
+def _estado():
+    estado = EstadoAlteracoes.objects.filter(pk=1).first()
+    return estado if estado is not None else EstadoAlteracoes(pk=1)
+
+
+def _grade(sala_ids=None):
+    """``{(sala, prédio, dia, inicio, fim)}`` da grade atual das salas (todas, se ``None``)."""
+    horarios = ocupacao.horarios_ativos()
+    if sala_ids is not None:
+        horarios = horarios.filter(sala_id__in=sala_ids)
+    intervalos = set()
+    for sala_id, agenda in ocupacao.compilar(ocupacao.linhas(horarios).iterator(chunk_size=5000)).items():
+        dados = referencia.sala(sala_id)
+        predio = dados.predio_id if dados is not None else None
+        for dia, pontos in enumerate(agenda):
+            for inicio, fim in zip(pontos[0::2], pontos[1::2]):
+                intervalos.add((sala_id, predio, dia, inicio, fim))
+    return intervalos
+
+
+def publicar(sala_ids=None):
+    """Registra as diferenças entre a grade das salas (todas, se ``None``) e a publicada.
+
+    Retorna o número de alterações gravadas.
+    """
+    if sala_ids is not None:
+        sala_ids = {sala_id for sala_id in sala_ids if sala_id is not None}
+        if not sala_ids:
+            return 0
+    with transaction.atomic():
+        estado = _travar()
+        atual = _grade(sala_ids)
+        publicadas = AgendaPublicada.objects.all()
+        if sala_ids is not None:
+            publicadas = publicadas.filter(sala__in=sala_ids)
+        publicado = {
+            (sala, predio, dia, inicio, fim): pk
+            for pk, sala, predio, dia, inicio, fim in publicadas.order_by().values_list(
+                'pk', 'sala', 'predio', 'dia_semana', 'inicio', 'fim')
+        }
+        removidos = sorted(chave for chave in publicado if chave not in atual)
+        adicionados = sorted(atual.difference(publicado))
+        if not removidos and not adicionados:
+            return 0
+
+        AlteracaoAgenda.objects.bulk_create([
+            AlteracaoAgenda(sala=sala, predio=predio, dia_semana=dia, inicio=inicio, fim=fim, adicionado=adicionado)
+            for adicionado, chaves in ((False, removidos), (True, adicionados))
+            for sala, predio, dia, inicio, fim in chaves
+        ], batch_size=1000)
+        for lote in _lotes([publicado[chave] for chave in removidos]):
+            AgendaPublicada.objects.filter(pk__in=lote).delete()
+        AgendaPublicada.objects.bulk_create([
+            AgendaPublicada(sala=sala, predio=predio, dia_semana=dia, inicio=inicio, fim=fim)
+            for sala, predio, dia, inicio, fim in adicionados
+        ], batch_size=1000)
+        estado.ultima = AlteracaoAgenda.objects.aggregate(ultima=Max('id'))['ultima']
+        estado.save(update_fields=['ultima'])
+    return len(removidos) + len(adicionados)
+
+
+def _completo(estado, predio):
+    publicadas = AgendaPublicada.objects.order_by('sala', 'dia_semana', 'inicio')
+    if predio is not None:
+        publicadas = publicadas.filter(predio=predio)
+    salas = defaultdict(lambda: {'intervalos': []})
+    for sala, dia, inicio, fim in publicadas.values_list('sala', 'dia_semana', 'inicio', 'fim'):
+        salas[sala]['intervalos'].append([dia, inicio, fim])
+    return {'versao': estado.ultima, 'completo': True, 'mais': False, 'salas': dict(salas)}
+
+
+def alteracoes_desde(desde=None, predio=None, limite=None):
+    """Delta líquido por sala das alterações posteriores à versão ``desde``.
+
+    ``predio`` (id) restringe às salas do prédio. Sem ``desde``, com uma
+    versão já compactada ou desconhecida, devolve o retrato completo. Com
+    mais de ``limite`` alterações, devolve as primeiras e ``mais``
+    verdadeiro: o controlador pede de novo a partir da ``versao`` recebida.
+    """
+    limite = limite or _config('LUMINOFF_ALTERACOES_LOTE', 5000)
+    estado = _estado()
+    if desde is None or desde < estado.compactado_ate or desde > estado.ultima:
+        return _completo(estado, predio)
+    resultado = {'versao': desde, 'completo': False, 'mais': False, 'salas': {}}
+    if desde == estado.ultima:
+        return resultado
+
+    alteracoes = AlteracaoAgenda.objects.filter(id__gt=desde, id__lte=estado.ultima)
+    if predio is not None:
+        alteracoes = alteracoes.filter(predio=predio)
+    linhas = list(alteracoes.order_by('id').values_list(
+        'id', 'sala', 'dia_semana', 'inicio', 'fim', 'adicionado')[:limite])
+    resultado['mais'] = len(linhas) == limite
+    # Sem "mais", a versão é a do estado: alterações de outros prédios também ficam para trás
+    resultado['versao'] = linhas[-1][0] if resultado['mais'] else estado.ultima
+
+    # Primeira e última operação de cada intervalo: se são iguais, o estado
+    # mudou (incluído depois de ausente, ou retirado depois de presente)
+    operacoes = {}
+    for _, sala, dia, inicio, fim, adicionado in linhas:
+        chave = (sala, dia, inicio, fim)
+        primeira = operacoes[chave][0] if chave in operacoes else adicionado
+        operacoes[chave] = (primeira, adicionado)
+    salas = resultado['salas']
+    for (sala, dia, inicio, fim), (primeira, ultima) in sorted(operacoes.items()):
+        if primeira == ultima:
+            delta = salas.setdefault(sala, {'adicionados': [], 'removidos': []})
+            delta['adicionados' if ultima else 'removidos'].append([dia, inicio, fim])
+    return resultado
+
+
+def compactar(dias=None, agora=None):
+    """Apaga as alterações mais antigas que ``dias``; retorna quantas foram apagadas.
+
+    O retrato (``AgendaPublicada``) já contém o efeito delas; só os
+    controladores parados desde antes do corte precisarão baixá-lo inteiro.
+    """
+    dias = dias if dias is not None else _config('LUMINOFF_ALTERACOES_RETENCAO', 7)
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        estado = _travar()
+        corte = AlteracaoAgenda.objects.filter(criada_em__lt=agora - timedelta(days=dias)).aggregate(
+            corte=Max('id'))['corte']
+        if corte is None:
+            return 0
+        apagadas, _ = AlteracaoAgenda.objects.filter(id__lte=corte).delete()
+        estado.compactado_ate = corte
+        estado.compactado_em = agora
+        estado.save(update_fields=['compactado_ate', 'compactado_em'])
+    return apagadas
@@ -0,0 +1,251 @@
+"""
+Detecção de salas consumindo energia fora dos horários de aula.
+
+Cruza a telemetria por minuto com a agenda compilada do semestre ativo:
+
+- a agenda vira a máscara ``salas x 7 x 1440`` de ``energia.mascara_semanal``,
+  com a antecedência do ar, a tolerância e uma carência extra;
+- as leituras "ligado" (corrente média acima do mínimo) de um bloco de salas
+  são lidas de uma vez em arrays NumPy e cada uma é classificada por
+  indexação direta na máscara;
+- kWh e minutos fora da agenda são somados por sala com ``np.bincount``.
+
+Cada execução processa só a janela nova desde a última (``ExecucaoAnomalias``)
+e soma o desperdício da sala ao episódio aberto dela, em vez de criar um
+alerta a cada rodada. O mínimo de minutos vale para o episódio, não para a
+janela: com o cron a cada 15 minutos, um desperdício contínuo aparece quando
+o episódio soma ``LUMINOFF_ALERTA_MINUTOS_MINIMOS``. Reprocessar a partir de
+``desde`` primeiro desconta dos alertas e execuções o que já tinha sido
+contado dali em diante, então rodar de novo não soma duas vezes.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Func, IntegerField
+from django.utils import timezone
+
+from . import calendario, energia, ocupacao
+from .models import AlertaConsumo, ExecucaoAnomalias, Sala, TelemetriaMinuto
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class MinutoEpoch(Func):
+    """Minutos desde a época (UTC) de um DateTimeField, calculado no banco.
+
+    Evita que milhões de datetimes sejam convertidos em objetos Python só
+    para virarem inteiros de novo.
+    """
+    output_field = IntegerField()
+    template = 'FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / 60)'
+
+    def as_sqlite(self, compiler, connection, **extra):
+        # julianday evita o "%" do strftime, que colide com os parâmetros
+        return self.as_sql(compiler, connection, template=(
+            'CAST((julianday(%(expressions)s) - 2440587.5) * 1440 + 0.5 AS INTEGER)'), **extra)
+
+    def as_mysql(self, compiler, connection, **extra):
+        return self.as_sql(compiler, connection, template='FLOOR(UNIX_TIMESTAMP(%(expressions)s) / 60)', **extra)
+
+
+def _leituras_ligadas(sala_ids, inicio, fim, corrente_minima):
+    """Arrays ``(sala_id, minuto epoch, corrente média)`` das leituras com a
+    sala ligada na janela. Lidas pelo cursor, sem instanciar nada no ORM."""
+    queryset = TelemetriaMinuto.objects.filter(
+        sala_id__in=sala_ids, inicio__gte=inicio, inicio__lt=fim,
+        corrente_n__gt=0, corrente_soma__gte=F('corrente_n') * corrente_minima,
+    ).order_by().annotate(
+        minuto=MinutoEpoch('inicio'),
+        media=ExpressionWrapper(F('corrente_soma') / F('corrente_n'), output_field=FloatField()),
+    ).values_list('sala_id', 'minuto', 'media')
+    sql, parametros = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        dados = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 3)
+    return dados[:, 0].astype(np.int64), dados[:, 1].astype(np.int64), dados[:, 2]
+
+
+def _dia_e_minuto_locais(minutos):
+    """Dia da semana e minuto do dia (fuso local) de cada minuto epoch."""
+    unicos, inverso = np.unique(minutos, return_inverse=True)
+    dias = np.empty(len(unicos), dtype=np.intp)
+    minutos_dia = np.empty(len(unicos), dtype=np.intp)
+    # Uma conversão por minuto distinto (no máximo 1440 por dia), não por leitura
+    for i, minuto in enumerate(unicos.tolist()):
+        local = timezone.localtime(datetime.fromtimestamp(minuto * 60, tz=dt_timezone.utc))
+        dias[i], minutos_dia[i] = local.weekday(), local.hour * 60 + local.minute
+    return dias[inverso], minutos_dia[inverso]
+
+
+class Desperdicio:
+    """Consumo fora da agenda de uma sala na janela processada."""
+
+    __slots__ = ('sala_id', 'minutos', 'kwh', 'inicio', 'fim')
+
+    def __init__(self, sala_id, minutos, kwh, inicio, fim):
+        self.sala_id = sala_id
+        self.minutos = minutos
+        self.kwh = kwh
+        self.inicio = inicio
+        self.fim = fim
+
+
+def calcular_desperdicio(inicio, fim, indice=None, sala_ids=None):
+    """Desperdício por sala entre ``inicio`` e ``fim``, do maior para o menor.
+
+    ``sala_ids`` restringe às salas informadas (padrão: todas as ativas).
+
+    Retorna ``(lista de Desperdicio, número de leituras "ligado" analisadas)``.
+    """
+    carencia = _config('LUMINOFF_CARENCIA_ANOMALIA', 5)
+    tolerancia = _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+    antecedencia = _config('LUMINOFF_ANTECEDENCIA_AR', 15)
+    corrente_minima = _config('LUMINOFF_CORRENTE_MINIMA', 0.5)
+    kw_por_ampere = _config('LUMINOFF_TENSAO', 220) / 1000
+
+    if indice is None:
+        # Até uma semana, a agenda vem do calendário (feriados, cancelamentos
+        # e reservas); janelas maiores usam a grade semanal do semestre
+        if fim - inicio <= timedelta(days=calendario.DIAS_INDICE - 1):
+            indice = calendario.indice_semana(timezone.localtime(inicio).date())
+        else:
+            indice = ocupacao.compilar_indice()
+    agenda = indice.com_margens(antecedencia + carencia, tolerancia + carencia)
+    salas_ativas = Sala.objects.filter(ativa=True)
+    if sala_ids is not None:
+        salas_ativas = salas_ativas.filter(pk__in=sala_ids)
+    sala_ids = list(salas_ativas.order_by('pk').values_list('pk', flat=True))
+
+    resultado, analisadas = [], 0
+    for i in range(0, len(sala_ids), energia.BLOCO_SALAS):
+        bloco = sala_ids[i:i + energia.BLOCO_SALAS]
+        salas, minutos, corrente = _leituras_ligadas(bloco, inicio, fim, corrente_minima)
+        analisadas += len(salas)
+        if not len(salas):
+            continue
+        linhas = np.searchsorted(np.array(bloco), salas)
+        dias, minutos_dia = _dia_e_minuto_locais(minutos)
+        fora = ~energia.mascara_semanal(agenda, bloco)[linhas, dias, minutos_dia]
+        if not fora.any():
+            continue
+
+        linhas, minutos, kwh = linhas[fora], minutos[fora], corrente[fora] * kw_por_ampere / 60
+        total_kwh = np.bincount(linhas, weights=kwh, minlength=len(bloco))
+        total_minutos = np.bincount(linhas, minlength=len(bloco))
+        primeiro = np.full(len(bloco), np.iinfo(np.int64).max)
+        ultimo = np.full(len(bloco), -1, dtype=np.int64)
+        np.minimum.at(primeiro, linhas, minutos)
+        np.maximum.at(ultimo, linhas, minutos)
+        for linha in np.flatnonzero(total_minutos):
+            resultado.append(Desperdicio(
+                bloco[linha], int(total_minutos[linha]), float(total_kwh[linha]),
+                datetime.fromtimestamp(int(primeiro[linha]) * 60, tz=dt_timezone.utc),
+                datetime.fromtimestamp(int(ultimo[linha]) * 60, tz=dt_timezone.utc),
+            ))
+    resultado.sort(key=lambda item: item.kwh, reverse=True)
+    return resultado, analisadas
+
+
+def _continuidade():
+    return timedelta(minutes=_config('LUMINOFF_ALERTA_INTERVALO_CONTINUIDADE', 30))
+
+
+def _registrar_alertas(desperdicios):
+    """Soma o desperdício da janela ao episódio de cada sala.
+
+    O episódio aberto continua se terminou até ``LUMINOFF_ALERTA_INTERVALO_
+    CONTINUIDADE`` minutos antes do primeiro minuto desperdiçado da sala na
+    janela; senão, começa outro. Episódios abaixo do mínimo ficam guardados
+    sem confirmação até somarem o mínimo. Retorna os alertas confirmados
+    (novos ou estendidos).
+    """
+    if not desperdicios:
+        return []
+    minimo = _config('LUMINOFF_ALERTA_MINUTOS_MINIMOS', 15)
+    continuidade = _continuidade()
+    por_sala = {item.sala_id: item for item in desperdicios}
+    abertos = {}
+    for alerta in AlertaConsumo.objects.filter(
+            sala_id__in=por_sala, resolvido=False,
+            fim__gte=min(item.inicio for item in desperdicios) - continuidade).order_by('fim'):
+        abertos[alerta.sala_id] = alerta   # o mais recente de cada sala
+
+    novos, estendidos, confirmados = [], [], []
+    for sala_id, item in por_sala.items():
+        alerta = abertos.get(sala_id)
+        if alerta is not None and alerta.fim >= item.inicio - continuidade:
+            alerta.fim = max(alerta.fim, item.fim)
+            alerta.minutos += item.minutos
+            alerta.kwh += item.kwh
+            estendidos.append(alerta)
+        else:
+            alerta = AlertaConsumo(sala_id=sala_id, inicio=item.inicio, fim=item.fim,
+                                   minutos=item.minutos, kwh=item.kwh, confirmado=False)
+            novos.append(alerta)
+        if alerta.minutos >= minimo:
+            alerta.confirmado = True
+            confirmados.append(alerta)
+    AlertaConsumo.objects.bulk_update(estendidos, ['fim', 'minutos', 'kwh', 'confirmado'], batch_size=500)
+    AlertaConsumo.objects.bulk_create(novos, batch_size=500)
+    return confirmados
+
+
+def _descontar_desde(desde):
+    """Tira das execuções e dos alertas o que foi contado a partir de ``desde``.
+
+    Alertas que começaram antes são recontados só até ``desde`` (a parte
+    reprocessada volta a ser somada em seguida); os que começaram depois
+    são apagados e refeitos.
+    """
+    minimo = _config('LUMINOFF_ALERTA_MINUTOS_MINIMOS', 15)
+    ExecucaoAnomalias.objects.filter(inicio__gte=desde).delete()
+    ExecucaoAnomalias.objects.filter(fim__gt=desde).update(fim=desde)
+    AlertaConsumo.objects.filter(inicio__gte=desde).delete()
+    for alerta in AlertaConsumo.objects.filter(fim__gte=desde):
+        antes, _ = calcular_desperdicio(alerta.inicio, desde, sala_ids=[alerta.sala_id])
+        if not antes:
+            alerta.delete()
+            continue
+        alerta.fim, alerta.minutos, alerta.kwh = antes[0].fim, antes[0].minutos, antes[0].kwh
+        alerta.confirmado = alerta.minutos >= minimo
+        alerta.save(update_fields=['fim', 'minutos', 'kwh', 'confirmado'])
+
+
+def detectar(agora=None, desde=None):
+    """Processa a telemetria nova desde a última execução e gera alertas.
+
+    A janela termina alguns minutos antes de ``agora`` para dar tempo ao
+    buffer da telemetria de ser gravado. Retorna ``(execução, desperdícios)``.
+    """
+    inicio_execucao = time.perf_counter()
+    agora = (agora or timezone.now()).replace(second=0, microsecond=0)
+    fim = agora - timedelta(minutes=_config('LUMINOFF_ATRASO_ANOMALIA', 5))
+    ultima = ExecucaoAnomalias.objects.order_by('-fim').first()
+    if desde is None:
+        desde = ultima.fim if ultima is not None else fim - timedelta(days=1)
+    if desde >= fim:
+        return None, []
+
+    desperdicios, leituras = calcular_desperdicio(desde, fim)
+    with transaction.atomic():
+        if ultima is not None and desde < ultima.fim:
+            _descontar_desde(desde)
+        alertas = _registrar_alertas(desperdicios)
+        # Episódios abaixo do mínimo que não podem mais continuar
+        AlertaConsumo.objects.filter(confirmado=False, fim__lt=fim - _continuidade()).delete()
+        execucao = ExecucaoAnomalias.objects.create(
+            inicio=desde, fim=fim, leituras=leituras, alertas=len(alertas),
+            duracao=time.perf_counter() - inicio_execucao,
+        )
+    for alerta in alertas:
+        logger.warning("Consumo fora da agenda: sala %s, %d min, %.2f kWh desde %s",
+                       alerta.sala_id, alerta.minutos, alerta.kwh, timezone.localtime(alerta.inicio))
+    return execucao, desperdicios
@@ -0,0 +1,232 @@
+"""
+API de leitura para os controladores dos prédios.
+
+Cada controlador pergunta "o que a sala deve fazer agora e nas próximas 24h".
+As respostas são montadas uma vez por (versão da agenda, hora) e guardadas
+prontas (JSON já serializado) no cache; o ETag é a própria versão + hora, então
+um ``If-None-Match`` válido é respondido com 304 consultando só o cache.
+
+Formato de cada sala::
+
+    {"id": 12, "nome": "Sala 101", "predio": "CEGOE", "andar": 1,
+     "dispositivos": {"luz": [["2025-08-04T07:00:00-03:00", "2025-08-04T09:10:00-03:00"]],
+                      "ar":  [["2025-08-04T06:45:00-03:00", "2025-08-04T09:10:00-03:00"]]}}
+
+Os intervalos (ligado) já têm as margens do agendador e são recortados à
+janela ``[início da hora atual, +24h)``.
+
+Controladores que guardam a grade semanal podem, em vez disso, sincronizar
+pelo feed de alterações (``/api/agenda/alteracoes/?desde=V``, ver
+``alteracoes``): só o que mudou desde a versão que já têm.
+
+Também aqui, para a coordenação: ``/api/salas/livres/``, a busca de salas
+livres (``disponibilidade``), sem cache de resposta.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import alteracoes, calendario, painel, referencia, telemetria, versao
+from .dispositivos import AR, LUZ
+from .forms import DisponibilidadeForm
+
+JANELA = timedelta(hours=24)
+
+# Dados do campus da última (versão, hora) montada neste processo
+_memoria = (None, None)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _inicio_janela():
+    return timezone.localtime().replace(minute=0, second=0, microsecond=0)
+
+
+def _intervalos(linha, sala_id, inicio, fim):
+    """Intervalos ligados da sala entre ``inicio`` e ``fim`` (datetimes)."""
+    resultado = []
+    meia_noite = inicio.replace(hour=0)
+    for deslocamento in range((fim - meia_noite).days + 1):
+        dia = meia_noite + timedelta(days=deslocamento)
+        for a, b in linha.intervalos(sala_id, dia.weekday()):
+            de, ate = max(dia + timedelta(minutes=a), inicio), min(dia + timedelta(minutes=b), fim)
+            if de >= ate:
+                continue
+            # Aula que atravessa a meia-noite vira um intervalo só
+            if resultado and resultado[-1][1] == de:
+                resultado[-1][1] = ate
+            else:
+                resultado.append([de, ate])
+    return [[de.isoformat(), ate.isoformat()] for de, ate in resultado]
+
+
+def _montar_campus(inicio):
+    """Payload de todas as salas ativas (salas da cópia em memória + o índice)."""
+    # Datas concretas (feriados, cancelamentos, reservas) lidas do banco, e não
+    # do índice do processo: com vários processos, só o que recebeu a escrita
+    # teria o índice em dia.
+    indice = calendario.indice_semana(inicio.date())
+    tolerancia = _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+    linhas = {
+        LUZ: indice.com_margens(0, tolerancia),
+        AR: indice.com_margens(_config('LUMINOFF_ANTECEDENCIA_AR', 15), tolerancia),
+    }
+    fim = inicio + JANELA
+    salas = sorted(referencia.salas_ativas(), key=lambda sala: (sala.localizacao, sala.andar, sala.nome))
+    return {
+        sala.pk: {
+            'id': sala.pk, 'nome': sala.nome, 'predio': sala.localizacao, 'andar': sala.andar,
+            'dispositivos': {
+                dispositivo: _intervalos(linha, sala.pk, inicio, fim) for dispositivo, linha in linhas.items()
+            },
+        }
+        for sala in salas
+    }
+
+
+def _campus(prefixo, inicio):
+    global _memoria
+    chave, dados = _memoria
+    if chave == prefixo:
+        return dados
+    dados = cache.get(f'{prefixo}:campus')
+    if dados is None:
+        dados = _montar_campus(inicio)
+        cache.set(f'{prefixo}:campus', dados, _config('LUMINOFF_API_CACHE_TIMEOUT', 7200))
+    _memoria = (prefixo, dados)
+    return dados
+
+
+def _etag_confere(request, etag):
+    pedidos = request.headers.get('If-None-Match', '')
+    return pedidos.strip() == '*' or etag in (pedido.strip().removeprefix('W/') for pedido in pedidos.split(','))
+
+
+def _autorizado(request, escrita=False):
+    """Leitura fica aberta sem ``LUMINOFF_API_TOKEN``; escrita exige o token configurado."""
+    token = _config('LUMINOFF_API_TOKEN', None)
+    if not token:
+        return not escrita
+    return request.headers.get('Authorization') == f'Bearer {token}'
+
+
+def _responder(request, escopo, selecionar):
+    """Resposta em cache para ``escopo``; ``selecionar(salas)`` monta o corpo
+    a partir das salas do campus (ou devolve ``None`` para 404)."""
+    if not _autorizado(request):
+        return JsonResponse({'erro': 'não autorizado'}, status=401)
+
+    atual = versao.atual()
+    inicio = _inicio_janela()
+    etag = f'"{atual}-{inicio:%Y%m%d%H}"'
+    if _etag_confere(request, etag):
+        resposta = HttpResponseNotModified()
+    else:
+        prefixo = f'luminoff:api:{atual}:{inicio:%Y%m%d%H}'
+        # Nomes de prédio podem ter espaços/acentos: a chave usa um hash
+        chave = f'{prefixo}:{hashlib.md5(escopo.encode()).hexdigest()}'
+        corpo = cache.get(chave)
+        if corpo is None:
+            dados = selecionar(_campus(prefixo, inicio))
+            if dados is None:
+                raise Http404('Escopo não encontrado')
+            dados = {
+                'versao': atual,
+                'janela': [inicio.isoformat(), (inicio + JANELA).isoformat()],
+                **dados,
+            }
+            corpo = json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode()
+            cache.set(chave, corpo, _config('LUMINOFF_API_CACHE_TIMEOUT', 7200))
+        resposta = HttpResponse(corpo, content_type='application/json')
+    resposta['ETag'] = etag
+    # O cliente sempre revalida; o 304 sai sem tocar no banco
+    resposta['Cache-Control'] = 'no-cache'
+    return resposta
+
+
+@require_GET
+def agenda_sala(request, sala_id):
+    def selecionar(salas):
+        sala = salas.get(sala_id)
+        return {'sala': sala} if sala is not None else None
+    return _responder(request, f'sala:{sala_id}', selecionar)
+
+
+@require_GET
+def agenda_predio(request, predio, andar=None):
+    def selecionar(salas):
+        itens = [sala for sala in salas.values()
+                 if sala['predio'] == predio and (andar is None or sala['andar'] == andar)]
+        return {'predio': predio, 'andar': andar, 'salas': itens} if itens else None
+    return _responder(request, f'predio:{predio}:{andar}', selecionar)
+
+
+@require_GET
+def agenda_campus(request):
+    return _responder(request, 'campus', lambda salas: {'salas': list(salas.values())})
+
+
+@require_GET
+def alteracoes_agenda(request):
+    """Alterações da grade semanal desde a versão ``desde`` (ou o retrato completo), opcionalmente de um ``predio``."""
+    if not _autorizado(request):
+        return JsonResponse({'erro': 'não autorizado'}, status=401)
+    try:
+        desde = int(request.GET['desde']) if request.GET.get('desde') else None
+    except ValueError:
+        return JsonResponse({'erro': 'desde deve ser um número de versão'}, status=400)
+    predio = request.GET.get('predio')
+    predio_id = None
+    if predio:
+        predio_id = next((sala.predio_id for sala in referencia.salas() if sala.localizacao == predio), None)
+        if predio_id is None:
+            raise Http404('Prédio não encontrado')
+    tolerancia = _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+    return JsonResponse({
+        'desde': desde,
+        **alteracoes.alteracoes_desde(desde, predio_id),
+        'margens': {LUZ: [0, tolerancia], AR: [_config('LUMINOFF_ANTECEDENCIA_AR', 15), tolerancia]},
+    }, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+@require_GET
+def salas_livres(request):
+    """Salas livres no intervalo, das que menos aumentam o consumo para as que mais (``disponibilidade``)."""
+    if not _autorizado(request):
+        return JsonResponse({'erro': 'não autorizado'}, status=401)
+    form = DisponibilidadeForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'erro': form.errors}, status=400)
+    dados = form.cleaned_data
+    return JsonResponse({
+        'versao': versao.atual(),
+        'data': dados['data'].isoformat() if dados['data'] else None,
+        'dia_semana': dados['data'].weekday() if dados['data'] else dados['dia_semana'],
+        'inicio': dados['inicio'].strftime('%H:%M'),
+        'fim': dados['fim'].strftime('%H:%M'),
+        'salas': [livre.como_dict() for livre in form.buscar()],
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@csrf_exempt
+@require_POST
+def receber_telemetria(request):
+    """Recebe um lote de leituras (NDJSON ou, com ``Content-Type: text/csv``, CSV)."""
+    # Leituras falsas desligariam salas ocupadas (presença) e gerariam alertas
+    if not _autorizado(request, escrita=True):
+        return JsonResponse({'erro': 'não autorizado'}, status=401)
+    # O corpo é lido linha a linha, sem carregar tudo em memória
+    leitor = telemetria.ler_csv if request.content_type == 'text/csv' else telemetria.ler_ndjson
+    resultado = telemetria.ingerir(leitor(request))
+    if resultado.gravadas:
+        painel.hub.acordar()   # o painel não espera o próximo ciclo para mostrar consumo fora da agenda
+    return JsonResponse(resultado.como_dict(), status=200 if not resultado.rejeitadas else 207)
@@ -0,0 +1,177 @@
+"""
+Suíte de benchmark das operações centrais em campi sintéticos de várias escalas.
+
+Para cada escala, um campus é semeado (``semeadura``) dentro de uma transação
+que é desfeita no final, então o banco configurado não é alterado. Cada
+operação roda algumas vezes e registra mediana, mínimo, máximo e o número de
+consultas SQL. O resultado é um dicionário serializável em JSON; ``comparar``
+aponta as operações que ficaram mais lentas que um arquivo anterior.
+"""
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import api, calendario, disponibilidade, importacao, ocupacao, referencia, semeadura, versao
+from .models import Disciplina, HorarioTurma, Professor, Sala, Semestre, Turma
+
+PREFIXO = 'BENCH'
+
+
+class _Operacao:
+    __slots__ = ('nome', 'executar', 'preparar')
+
+    def __init__(self, nome, executar, preparar=None):
+        self.nome = nome
+        self.executar = executar
+        self.preparar = preparar
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _linhas_importacao(semestre):
+    """A grade do semestre no formato da planilha (reimportação = só validação)."""
+    return [
+        {'disciplina': disciplina, 'turma': turma, 'professor': professor, 'alunos': str(alunos),
+         'sala': sala, 'dia': str(dia), 'inicio': f'{inicio:%H:%M}', 'fim': f'{fim:%H:%M}'}
+        for disciplina, turma, professor, alunos, sala, dia, inicio, fim in HorarioTurma.objects.filter(
+            turma__semestre=semestre).order_by().values_list(
+            'turma__disciplina__codigo', 'turma__codigo_turma', 'turma__professor__matricula',
+            'turma__numero_alunos', 'sala__nome', 'dia_semana', 'hora_inicio', 'hora_fim')
+    ]
+
+
+def _operacoes(semestre, cliente):
+    # Uma segunda-feira dentro do semestre, às 10:30
+    segunda = semestre.data_inicio + timedelta(days=(7 - semestre.data_inicio.weekday()) % 7)
+    momento = timezone.make_aware(datetime.combine(segunda, datetime.min.time()) + timedelta(hours=10, minutes=30))
+    sala_ids = list(Sala.objects.filter(ativa=True).values_list('pk', flat=True))
+    indice = ocupacao.compilar_indice()
+    linhas = _linhas_importacao(semestre)
+
+    def api_sem_cache():
+        versao.incrementar()
+        api._memoria = (None, None)
+
+    def pagina(url):
+        def executar():
+            resposta = cliente.get(url)
+            if resposta.status_code != 200:
+                raise RuntimeError(f"{url}: HTTP {resposta.status_code}")
+        return executar
+
+    return [
+        _Operacao('admin: salas', pagina(reverse('admin:core_sala_changelist'))),
+        _Operacao('admin: turmas', pagina(reverse('admin:core_turma_changelist'))),
+        _Operacao('admin: horários', pagina(reverse('admin:core_horarioturma_changelist'))),
+        _Operacao('admin: horários (busca)', pagina(reverse('admin:core_horarioturma_changelist') + '?q=T00')),
+        _Operacao('agenda: compilar índice', ocupacao.compilar_indice),
+        _Operacao('agenda: semana do calendário', lambda: calendario.indice_semana(segunda),
+                  preparar=calendario.invalidar_tudo),
+        _Operacao('agenda: semana já materializada', lambda: calendario.indice_semana(segunda)),
+        _Operacao('api: agenda do campus', pagina(reverse('core:api_agenda_campus')), preparar=api_sem_cache),
+        _Operacao('ocupação: salas ocupadas (banco)', lambda: ocupacao.salas_ocupadas_no_banco(
+            timezone.localtime(momento))),
+        _Operacao('ocupação: todas as salas (índice)', lambda: [
+            indice.ocupada(sala_id, momento) for sala_id in sala_ids]),
+        _Operacao('disponibilidade: salas livres (mapa pronto)', lambda: disponibilidade.buscar(
+            momento.time(), (momento + timedelta(hours=2)).time(), data=segunda, alunos=30)),
+        _Operacao('importação: simulação da grade', lambda: importacao.importar_horarios(
+            linhas, semestre, simular=True)),
+    ]
+
+
+def _medir(operacao, repeticoes):
+    tempos, consultas = [], 0
+    for _ in range(repeticoes):
+        if operacao.preparar is not None:
+            operacao.preparar()
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            operacao.executar()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        consultas = len(capturadas)
+    return {
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'min_ms': round(min(tempos), 3),
+        'max_ms': round(max(tempos), 3),
+        'consultas': consultas,
+        'repeticoes': repeticoes,
+    }
+
+
+def medir_escala(escala, repeticoes=5, progresso=None):
+    """Semeia o campus da escala, mede as operações e desfaz tudo."""
+    with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        inicio = time.perf_counter()
+        semestre = semeadura.semear_campus(**semeadura.dimensoes(escala), prefixo=PREFIXO)
+        semeadura_s = time.perf_counter() - inicio
+        cliente = Client()
+        cliente.force_login(User.objects.create_superuser(f'{PREFIXO.lower()}admin', '', None))
+        resultado = {
+            'escala': escala,
+            'semeadura_s': round(semeadura_s, 3),
+            'contagens': {
+                'salas': Sala.objects.count(), 'professores': Professor.objects.count(),
+                'disciplinas': Disciplina.objects.count(), 'turmas': Turma.objects.count(),
+                'horarios': HorarioTurma.objects.count(), 'semestres': Semestre.objects.count(),
+            },
+            'operacoes': {},
+        }
+        for operacao in _operacoes(semestre, cliente):
+            if progresso is not None:
+                progresso(escala, operacao.nome)
+            resultado['operacoes'][operacao.nome] = _medir(operacao, repeticoes)
+        transaction.set_rollback(True)
+    # O que ficou em memória/cache se refere ao campus desfeito
+    ocupacao.invalidar()
+    referencia.invalidar()
+    versao.incrementar_salas()
+    api._memoria = (None, None)
+    return resultado
+
+
+def executar(escalas=(1, 10, 100), repeticoes=5, progresso=None):
+    return {
+        'gerado_em': timezone.now().isoformat(),
+        'commit': _commit_atual(),
+        'banco': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'escalas': [medir_escala(escala, repeticoes, progresso) for escala in escalas],
+    }
+
+
+def comparar(atual, anterior, tolerancia=0.25, folga_ms=5):
+    """``(escala, operação, mediana anterior, mediana atual, razão)`` das
+    operações mais lentas que ``anterior`` além da tolerância (0.25 = 25%).
+
+    Diferenças abaixo de ``folga_ms`` são ruído de medição e não contam.
+    """
+    antes = {
+        (item['escala'], nome): medida['mediana_ms']
+        for item in anterior.get('escalas', []) for nome, medida in item['operacoes'].items()
+    }
+    regressoes = []
+    for item in atual['escalas']:
+        for nome, medida in item['operacoes'].items():
+            base = antes.get((item['escala'], nome))
+            if base and medida['mediana_ms'] > max(base * (1 + tolerancia), base + folga_ms):
+                regressoes.append((item['escala'], nome, base, medida['mediana_ms'], medida['mediana_ms'] / base))
+    return regressoes
@@ -0,0 +1,201 @@
+"""
+Calendário: a grade semanal expandida em datas concretas.
+
+``HorarioTurma`` só descreve a semana típica. Aqui ela é cruzada com o período
+do semestre ativo, os feriados/recessos, os cancelamentos de aula e as
+reservas extras, e o resultado (intervalos já mesclados por sala e data) fica
+em ``OcupacaoDiaria``. Consultar um dia vira uma consulta por intervalo de
+datas no índice ``(data, sala)``.
+
+A materialização é preguiçosa e incremental:
+
+- uma data só é expandida quando alguém a consulta (``garantir``) e passa a
+  constar em ``DiaMaterializado``;
+- uma alteração pontual (horário, sala, cancelamento, reserva) marca apenas os
+  pares (sala, data) afetados em ``PendenciaOcupacao``; feriados e troca de
+  semestre descartam as datas inteiras. A próxima consulta refaz só isso.
+"""
+from collections import defaultdict
+from datetime import time, timedelta
+
+from django.db import transaction
+
+from . import ocupacao, referencia
+from .models import (
+    CancelamentoAula, DiaMaterializado, Feriado, OcupacaoDiaria, PendenciaOcupacao, ReservaExtra, Sala,
+)
+
+DIAS_INDICE = ocupacao.DIAS_SEMANA
+
+
+def _hora(minuto):
+    return time(minuto // 60, minuto % 60) if minuto < ocupacao.MINUTOS_DIA else time(23, 59)
+
+
+def periodo(inicio, fim):
+    """Datas de ``inicio`` a ``fim``, inclusive."""
+    return [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+
+
+def dias_sem_aula(inicio, fim):
+    """Conjunto das datas entre ``inicio`` e ``fim`` cobertas por feriados."""
+    dias = set()
+    for comeco, termino in Feriado.objects.filter(data_inicio__lte=fim, data_fim__gte=inicio).values_list(
+            'data_inicio', 'data_fim'):
+        dias.update(periodo(max(comeco, inicio), min(termino, fim)))
+    return dias
+
+
+def _expandir(datas, sala_ids=None):
+    """``OcupacaoDiaria`` (não gravadas) das salas nas datas informadas.
+
+    Quatro consultas, independente do número de salas e datas.
+    """
+    datas = sorted(set(datas))
+    if not datas:
+        return []
+    semestre = referencia.semestre_ativo()
+    feriados = dias_sem_aula(datas[0], datas[-1])
+    letivas = [
+        data for data in datas
+        if semestre is not None and semestre.data_inicio <= data <= semestre.data_fim and data not in feriados
+    ]
+    por_dia_semana = defaultdict(list)
+    for data in letivas:
+        por_dia_semana[data.weekday()].append(data)
+
+    intervalos = defaultdict(list)   # (sala_id, data) -> [(inicio, fim)] em minutos
+    if letivas:
+        horarios = ocupacao.horarios_ativos().filter(dia_semana__in=por_dia_semana)
+        cancelamentos = CancelamentoAula.objects.filter(data__in=letivas)
+        if sala_ids is not None:
+            horarios = horarios.filter(sala_id__in=sala_ids)
+            cancelamentos = cancelamentos.filter(horario__sala_id__in=sala_ids)
+        cancelados = set(cancelamentos.values_list('horario_id', 'data'))
+        for pk, sala_id, dia, inicio, fim in horarios.values_list(
+                'pk', 'sala_id', 'dia_semana', 'hora_inicio', 'hora_fim').iterator(chunk_size=5000):
+            for data in por_dia_semana[dia]:
+                if (pk, data) not in cancelados:
+                    intervalos[(sala_id, data)].append((ocupacao.minutos(inicio), ocupacao.minutos(fim)))
+
+    # Reservas valem mesmo fora do semestre e em feriados
+    reservas = ReservaExtra.objects.filter(data__in=datas, sala__ativa=True)
+    if sala_ids is not None:
+        reservas = reservas.filter(sala_id__in=sala_ids)
+    for sala_id, data, inicio, fim in reservas.values_list('sala_id', 'data', 'hora_inicio', 'hora_fim'):
+        intervalos[(sala_id, data)].append((ocupacao.minutos(inicio), ocupacao.minutos(fim)))
+
+    return [
+        OcupacaoDiaria(sala_id=sala_id, data=data, hora_inicio=_hora(inicio), hora_fim=_hora(fim))
+        for (sala_id, data), itens in intervalos.items()
+        for inicio, fim in ocupacao.pares(ocupacao.mesclar_intervalos(itens))
+    ]
+
+
+def garantir(datas):
+    """Materializa as datas ainda não expandidas e refaz as pendências delas.
+
+    Duas consultas concorrentes podem ver a mesma data faltando: cada data é
+    reservada com ``get_or_create`` travado (a segunda espera o commit da
+    primeira e a encontra pronta) e as pendências são lidas de novo com a
+    trava, então nenhuma ocupação é gravada duas vezes.
+    """
+    datas = set(datas)
+    feitas = set(DiaMaterializado.objects.filter(data__in=datas).values_list('data', flat=True))
+    if datas == feitas and not PendenciaOcupacao.objects.filter(data__in=datas).exists():
+        return
+
+    with transaction.atomic():
+        # Em ordem, para duas materializações não se travarem mutuamente
+        faltando = set()
+        for data in sorted(datas - feitas):
+            _, criado = DiaMaterializado.objects.select_for_update().get_or_create(data=data)
+            if criado:
+                faltando.add(data)
+        if faltando:
+            OcupacaoDiaria.objects.filter(data__in=faltando).delete()
+            OcupacaoDiaria.objects.bulk_create(_expandir(faltando), batch_size=1000)
+
+        # Pendências já refeitas por outra consulta somem da leitura travada
+        pendencias = list(PendenciaOcupacao.objects.select_for_update().filter(data__in=datas).values_list(
+            'pk', 'sala_id', 'data'))
+        # Datas recém-expandidas já estão em dia; o resto é refeito por sala
+        refazer = defaultdict(set)   # data -> salas
+        for _, sala_id, data in pendencias:
+            if data not in faltando:
+                refazer[data].add(sala_id)
+        if refazer:
+            salas = set().union(*refazer.values())
+            OcupacaoDiaria.objects.filter(sala_id__in=salas, data__in=refazer).delete()
+            OcupacaoDiaria.objects.bulk_create(_expandir(refazer, salas), batch_size=1000)
+        # Só as pendências lidas: as criadas durante a expansão ficam para a próxima
+        PendenciaOcupacao.objects.filter(pk__in=[pk for pk, _, _ in pendencias]).delete()
+
+
+# ---------------------------------------------------------------------------
+# Consultas
+# ---------------------------------------------------------------------------
+
+def ocupacao_periodo(inicio, fim, sala_ids=None):
+    """Linhas ``(sala_id, data, hora_inicio, hora_fim)`` entre as datas."""
+    garantir(periodo(inicio, fim))
+    queryset = OcupacaoDiaria.objects.filter(data__range=(inicio, fim))
+    if sala_ids is not None:
+        queryset = queryset.filter(sala_id__in=sala_ids)
+    return queryset.order_by().values_list('sala_id', 'data', 'hora_inicio', 'hora_fim')
+
+
+def ocupacao_do_dia(data, sala_ids=None):
+    return ocupacao_periodo(data, data, sala_ids)
+
+
+def indice_semana(inicio):
+    """``IndiceOcupacao`` com as datas concretas de ``inicio`` até 6 dias depois.
+
+    Cada data ocupa a posição do seu dia da semana, então o índice responde
+    pela semana que começa em ``inicio`` já com feriados, cancelamentos e
+    reservas aplicados.
+    """
+    linhas = ocupacao_periodo(inicio, inicio + timedelta(days=DIAS_INDICE - 1))
+    return ocupacao.IndiceOcupacao.de_linhas(
+        (sala_id, data.weekday(), hora_inicio, hora_fim)
+        for sala_id, data, hora_inicio, hora_fim in linhas.iterator(chunk_size=5000)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Invalidação (chamada pelos sinais, após o commit)
+# ---------------------------------------------------------------------------
+
+def invalidar_tudo():
+    """Descarta todas as datas materializadas (ex.: troca de semestre ativo)."""
+    DiaMaterializado.objects.all().delete()
+    PendenciaOcupacao.objects.all().delete()
+
+
+def invalidar_datas(datas):
+    """Descarta datas inteiras (ex.: feriado criado ou alterado)."""
+    DiaMaterializado.objects.filter(data__in=set(datas)).delete()
+
+
+def marcar_salas(sala_ids, dias_semana=None, datas=None):
+    """Marca as salas como pendentes nas datas já materializadas afetadas.
+
+    ``dias_semana`` e ``datas`` restringem as datas; sem eles, todas as
+    datas materializadas da sala são refeitas.
+    """
+    # Salas excluídas no mesmo commit já levaram suas ocupações junto
+    sala_ids = set(Sala.objects.filter(pk__in={pk for pk in sala_ids if pk is not None}).values_list('pk', flat=True))
+    if not sala_ids:
+        return
+    materializadas = DiaMaterializado.objects.all()
+    if datas is not None:
+        materializadas = materializadas.filter(data__in=set(datas))
+    afetadas = [
+        data for data in materializadas.values_list('data', flat=True)
+        if dias_semana is None or data.weekday() in dias_semana
+    ]
+    PendenciaOcupacao.objects.bulk_create(
+        [PendenciaOcupacao(sala_id=sala_id, data=data) for sala_id in sala_ids for data in afetadas],
+        ignore_conflicts=True, batch_size=1000,
+    )
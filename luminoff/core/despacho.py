@@ -0,0 +1,242 @@
+"""
+Fila durável dos comandos das salas (outbox) e o despachante que a esvazia.
+
+O agendador não fala mais com os controladores: ``registrar`` grava as
+transições calculadas em ``ComandoDispositivo`` em uma transação. Um ou mais
+``Despachante`` (no mesmo processo ou em outros) reservam lotes de linhas
+pendentes, entregam ao driver e marcam como confirmadas:
+
+- a reserva usa ``select_for_update(skip_locked=True)``: despachantes em
+  paralelo pegam linhas diferentes sem esperar uns pelos outros. A linha
+  recebe um token de reserva e um prazo; quem confirma precisa do token;
+- se o processo cair com um lote reservado, o prazo vence e a linha volta
+  a ser reservável. A entrega é "pelo menos uma vez": o ID de cada comando
+  no gateway é determinístico, então o controlador ignora a repetição;
+- falhas voltam para a fila com backoff exponencial até
+  ``LUMINOFF_DESPACHO_TENTATIVAS``; depois, "falhou" (e o log registra);
+- um comando confirmado torna obsoletos os mais antigos do mesmo
+  (sala, dispositivo) que ainda não saíram: eles nunca são enviados depois;
+  na reserva, um pendente com outro mais novo do mesmo par também vira
+  "substituído", e um par com comando em envio (reserva válida) espera:
+  cada par fica com um despachante por vez e os comandos chegam em ordem.
+  Confirmar e adiar só mexem em linhas ainda "enviando" com o token, então
+  um comando substituído durante o envio não volta para a fila;
+- com ``predios`` definido (``particionamento``), o despachante só reserva
+  comandos das salas desses prédios;
+- cada linha guarda a origem (agenda ou sensor de presença, ``presenca``);
+  o agendador retoma o estado só dos seus próprios comandos.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import metricas
+from .dispositivos import LIGAR, Comando
+from .models import ComandoDispositivo
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def registrar(comandos, agora=None, origem=ComandoDispositivo.AGENDA):
+    """Grava os comandos na fila. Regravar a mesma transição não duplica."""
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        ComandoDispositivo.objects.bulk_create([
+            ComandoDispositivo(sala_id=comando.sala_id, dispositivo=comando.dispositivo, acao=comando.acao,
+                               agendado_para=comando.quando, proxima_tentativa=agora, origem=origem)
+            for comando in comandos
+        ], batch_size=1000, ignore_conflicts=True)
+
+
+def ultimo_estado(desde=None, origem=ComandoDispositivo.AGENDA):
+    """``{(sala_id, dispositivo): ligado}`` do último comando de cada par que
+    não falhou, para o agendador retomar de onde parou sem reenviar tudo.
+
+    Os desligamentos por ausência ficam de fora: para a agenda, a sala
+    continua ligada até o fim da janela.
+    """
+    desde = desde or timezone.now() - timedelta(days=2)
+    estado = {}
+    for sala_id, dispositivo, acao in ComandoDispositivo.objects.filter(
+            agendado_para__gte=desde, origem=origem).exclude(
+            status=ComandoDispositivo.FALHOU).order_by('agendado_para').values_list('sala_id', 'dispositivo', 'acao'):
+        estado[(sala_id, dispositivo)] = acao == LIGAR
+    return estado
+
+
+def _reservaveis(agora):
+    return ComandoDispositivo.objects.filter(
+        Q(status=ComandoDispositivo.PENDENTE, proxima_tentativa__lte=agora)
+        | Q(status=ComandoDispositivo.ENVIANDO, reservado_ate__lt=agora)   # reserva de um processo que caiu
+    )
+
+
+def _mesmo_par():
+    return ComandoDispositivo.objects.filter(sala_id=OuterRef('sala_id'), dispositivo=OuterRef('dispositivo'))
+
+
+def reservar(limite=None, duracao=None, agora=None, predios=None):
+    """Reserva até ``limite`` comandos, os mais antigos primeiro.
+
+    Retorna ``(token, [ComandoDispositivo])``, no máximo um por (sala,
+    dispositivo). O ``update`` repete o filtro de reserváveis, então mesmo
+    bancos sem ``skip_locked`` (SQLite) nunca entregam a mesma linha a dois
+    despachantes.
+    """
+    limite = limite or _config('LUMINOFF_TAMANHO_LOTE', 500)
+    duracao = duracao or _config('LUMINOFF_DESPACHO_RESERVA', 60)
+    agora = agora or timezone.now()
+    token = uuid.uuid4()
+    reservaveis = _reservaveis(agora)
+    if predios is not None:
+        reservaveis = reservaveis.filter(sala__predio_id__in=predios)
+    mais_novo = _mesmo_par().filter(
+        agendado_para__gt=OuterRef('agendado_para'),
+        status__in=[ComandoDispositivo.PENDENTE, ComandoDispositivo.ENVIANDO, ComandoDispositivo.CONFIRMADO],
+    )
+    em_envio = _mesmo_par().filter(status=ComandoDispositivo.ENVIANDO, reservado_ate__gte=agora).exclude(
+        pk=OuterRef('pk'))
+    with transaction.atomic():
+        # Só o mais novo de cada par ainda precisa sair
+        reservaveis.filter(Exists(mais_novo)).update(status=ComandoDispositivo.SUBSTITUIDO)
+        ids = list(reservaveis.exclude(Exists(em_envio)).select_for_update(skip_locked=True, of=('self',)).order_by(
+            'agendado_para').values_list('pk', flat=True)[:limite])
+        if not ids:
+            return token, []
+        _reservaveis(agora).filter(pk__in=ids).update(
+            status=ComandoDispositivo.ENVIANDO, reserva=token, reservado_ate=agora + timedelta(seconds=duracao),
+            tentativas=F('tentativas') + 1,
+        )
+    return token, list(ComandoDispositivo.objects.filter(reserva=token).order_by('agendado_para'))
+
+
+def confirmar(token, comandos, agora=None):
+    """Marca o lote como entregue e descarta os comandos mais antigos dos mesmos pares."""
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        ComandoDispositivo.objects.filter(pk__in=[comando.pk for comando in comandos], reserva=token,
+                                          status=ComandoDispositivo.ENVIANDO).update(
+            status=ComandoDispositivo.CONFIRMADO, confirmado_em=agora, reservado_ate=None, erro='')
+        anteriores = [
+            Q(sala_id=comando.sala_id, dispositivo=comando.dispositivo, agendado_para__lt=comando.agendado_para)
+            for comando in comandos
+        ]
+        if anteriores:
+            ComandoDispositivo.objects.filter(
+                reduce(or_, anteriores),
+                status__in=[ComandoDispositivo.PENDENTE, ComandoDispositivo.ENVIANDO],
+            ).update(status=ComandoDispositivo.SUBSTITUIDO)
+
+
+def adiar(token, comandos, erro, agora=None):
+    """Devolve o lote à fila com backoff; esgotadas as tentativas, marca como falho."""
+    agora = agora or timezone.now()
+    maximo = _config('LUMINOFF_DESPACHO_TENTATIVAS', 8)
+    base = _config('LUMINOFF_DESPACHO_BACKOFF', 5)
+    por_tentativas = {}
+    for comando in comandos:
+        por_tentativas.setdefault(comando.tentativas, []).append(comando.pk)
+    falhos = 0
+    for tentativas, ids in por_tentativas.items():
+        reservados = ComandoDispositivo.objects.filter(pk__in=ids, reserva=token, status=ComandoDispositivo.ENVIANDO)
+        if tentativas >= maximo:
+            falhos += reservados.update(status=ComandoDispositivo.FALHOU, reservado_ate=None, erro=erro)
+        else:
+            espera = min(base * 2 ** (tentativas - 1), 3600)
+            reservados.update(status=ComandoDispositivo.PENDENTE, reservado_ate=None, erro=erro,
+                              proxima_tentativa=agora + timedelta(seconds=espera))
+    if falhos:
+        logger.error("%d comandos desistidos após %d tentativas: %s", falhos, maximo, erro)
+
+
+def limpar(dias=None, agora=None):
+    """Apaga comandos encerrados (confirmados/substituídos) mais antigos que ``dias``."""
+    dias = dias if dias is not None else _config('LUMINOFF_RETENCAO_COMANDOS', 30)
+    agora = agora or timezone.now()
+    apagados, _ = ComandoDispositivo.objects.filter(
+        status__in=[ComandoDispositivo.CONFIRMADO, ComandoDispositivo.SUBSTITUIDO],
+        agendado_para__lt=agora - timedelta(days=dias),
+    ).delete()
+    return apagados
+
+
+class Despachante:
+    """Esvazia a fila: reserva um lote, entrega ao driver, confirma ou adia."""
+
+    def __init__(self, driver, tamanho_lote=None, intervalo=None, predios=None):
+        self.driver = driver
+        self.predios = predios   # ids de Predio; None = todas as salas
+        self.tamanho_lote = tamanho_lote or _config('LUMINOFF_TAMANHO_LOTE', 500)
+        self.intervalo = intervalo if intervalo is not None else _config('LUMINOFF_DESPACHO_INTERVALO', 1)
+        self._parar = asyncio.Event()
+        self._acordar = asyncio.Event()
+
+    async def processar_lote(self):
+        """Entrega um lote; retorna quantos comandos foram reservados."""
+        if self.predios is not None and not self.predios:
+            return 0
+        token, reservados = await sync_to_async(reservar)(self.tamanho_lote, predios=self.predios)
+        if not reservados:
+            return 0
+        inicio = time.perf_counter()
+        try:
+            await self.driver.enviar([
+                Comando(comando.sala_id, comando.dispositivo, comando.acao,
+                        timezone.localtime(comando.agendado_para))
+                for comando in reservados
+            ])
+        except Exception as erro:
+            metricas.ENVIO_LOTE.observar(time.perf_counter() - inicio)
+            logger.exception("Falha ao entregar lote de %d comandos", len(reservados))
+            await sync_to_async(adiar)(token, reservados, str(erro)[:500])
+            metricas.COMANDOS.inc(len(reservados), ('adiado',))
+        else:
+            metricas.ENVIO_LOTE.observar(time.perf_counter() - inicio)
+            await sync_to_async(confirmar)(token, reservados)
+            agora = timezone.now()
+            metricas.COMANDOS.inc(len(reservados), ('entregue',))
+            metricas.LATENCIA_COMANDO.observar_varios([
+                max((agora - comando.agendado_para).total_seconds(), 0) for comando in reservados])
+        return len(reservados)
+
+    def definir_predios(self, predios):
+        self.predios = predios
+        self._acordar.set()
+
+    def acordar(self):
+        """Avisa que há comandos novos (o agendador no mesmo processo)."""
+        self._acordar.set()
+
+    async def executar(self):
+        while not self._parar.is_set():
+            try:
+                processados = await self.processar_lote()
+            except Exception:
+                logger.exception("Falha ao reservar comandos")
+                processados = 0
+            if processados:
+                continue   # ainda pode haver fila
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+        await self.driver.fechar()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
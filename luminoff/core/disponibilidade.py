@@ -0,0 +1,132 @@
+"""
+Busca de salas livres: "uma sala para N alunos no dia D, das H1 às H2".
+
+A ocupação de cada sala em um dia vira um inteiro de 288 bits, um por faixa
+de 5 minutos (``FAIXA``); uma aula que pega parte de uma faixa ocupa a faixa
+inteira. O mapa de um dia (``{sala_id: bits}``) é montado uma vez, a partir
+de uma data concreta (``calendario``: feriados, cancelamentos e reservas já
+aplicados) ou de um dia da semana típico (horários do semestre ativo), e fica
+em memória com a versão da agenda na chave. Uma busca é um ``&`` do mapa de
+cada sala com a máscara do intervalo pedido, sem banco; filtros de
+capacidade, tipo, andar e prédio vêm de ``referencia``.
+
+As salas livres são ordenadas pelo impacto na energia: primeiro as de um
+andar que já estará ligado no intervalo (outra sala dele em aula), depois as
+de um prédio já ligado e por fim as que ligariam um prédio apagado. No mesmo
+nível, vence o andar mais ocupado e, depois, a menor sala que comporta a
+turma.
+"""
+import threading
+from collections import Counter
+
+from . import calendario, ocupacao, referencia, versao
+
+FAIXA = 5                                   # minutos por bit
+FAIXAS_DIA = ocupacao.MINUTOS_DIA // FAIXA
+
+# Impacto de usar a sala, do menor para o maior
+ANDAR_LIGADO = 'andar_ligado'
+PREDIO_LIGADO = 'predio_ligado'
+PREDIO_DESLIGADO = 'predio_desligado'
+IMPACTOS = (ANDAR_LIGADO, PREDIO_LIGADO, PREDIO_DESLIGADO)
+
+MAPAS_EM_MEMORIA = 32
+
+_lock = threading.Lock()
+_mapas = {}   # (versão da agenda, 'data'|'dia', valor) -> {sala_id: bits}
+
+
+def mascara(inicio, fim):
+    """Bits das faixas de 5 minutos que o intervalo ``[inicio, fim)`` (em minutos) toca."""
+    primeira = max(inicio, 0) // FAIXA
+    ultima = min(-(-fim // FAIXA), FAIXAS_DIA)   # arredonda para cima
+    if ultima <= primeira:
+        return 0
+    return (1 << ultima) - (1 << primeira)
+
+
+def _montar(linhas):
+    """``{sala_id: bits}`` a partir de ``(sala_id, hora_inicio, hora_fim)``."""
+    mapa = {}
+    for sala_id, hora_inicio, hora_fim in linhas:
+        mapa[sala_id] = mapa.get(sala_id, 0) | mascara(ocupacao.minutos(hora_inicio), ocupacao.minutos(hora_fim))
+    return mapa
+
+
+def _montar_do_dia(dia_semana):
+    # Do banco, e não do índice do processo, que só está em dia no processo que recebeu a escrita
+    return _montar(ocupacao.horarios_ativos().filter(dia_semana=dia_semana).order_by().values_list(
+        'sala_id', 'hora_inicio', 'hora_fim'))
+
+
+def _montar_da_data(data):
+    return _montar((sala_id, hora_inicio, hora_fim)
+                   for sala_id, _, hora_inicio, hora_fim in calendario.ocupacao_do_dia(data))
+
+
+def mapa(data=None, dia_semana=None):
+    """``{sala_id: bits}`` da ocupação na ``data`` (ou no ``dia_semana`` típico).
+
+    Uma consulta na primeira vez (mais a materialização da data, se preciso);
+    depois, da memória até a agenda mudar. Salas sem aula não aparecem.
+    """
+    if data is not None:
+        chave = (versao.atual(), 'data', data)
+    else:
+        chave = (versao.atual(), 'dia', dia_semana)
+    resultado = _mapas.get(chave)
+    if resultado is None:
+        resultado = _montar_da_data(data) if data is not None else _montar_do_dia(dia_semana)
+        with _lock:
+            if len(_mapas) >= MAPAS_EM_MEMORIA:
+                _mapas.pop(next(iter(_mapas)))   # o mais antigo
+            _mapas[chave] = resultado
+    return resultado
+
+
+class SalaLivre:
+    __slots__ = ('sala', 'impacto', 'ocupadas_no_andar')
+
+    def __init__(self, sala, impacto, ocupadas_no_andar):
+        self.sala = sala                            # referencia.DadosSala
+        self.impacto = impacto
+        self.ocupadas_no_andar = ocupadas_no_andar
+
+    def como_dict(self):
+        return {
+            'id': self.sala.pk, 'nome': self.sala.nome, 'tipo': self.sala.tipo, 'capacidade': self.sala.capacidade,
+            'predio': self.sala.localizacao, 'andar': self.sala.andar, 'impacto': self.impacto,
+            'ocupadas_no_andar': self.ocupadas_no_andar,
+        }
+
+
+def buscar(inicio, fim, data=None, dia_semana=None, alunos=0, tipo=None, andar=None, predio=None, limite=None):
+    """Salas ativas livres de ``inicio`` a ``fim`` (``time``) na data ou dia da semana.
+
+    ``predio`` é o nome do prédio (``Sala.localizacao``). Retorna uma lista
+    de ``SalaLivre`` na ordem de preferência.
+    """
+    if data is not None:
+        dia_semana = data.weekday()
+    bits = mapa(data, dia_semana)
+    pedido = mascara(ocupacao.minutos(inicio), ocupacao.minutos(fim))
+
+    # Andares e prédios ligados no intervalo: alguma sala deles em aula
+    salas = referencia.salas_ativas()
+    andares, predios = Counter(), set()
+    for sala in salas:
+        if bits.get(sala.pk, 0) & pedido:
+            andares[(sala.localizacao, sala.andar)] += 1
+            predios.add(sala.localizacao)
+
+    livres = []
+    for sala in salas:
+        if (sala.capacidade < alunos or (tipo and sala.tipo != tipo) or (andar is not None and sala.andar != andar)
+                or (predio and sala.localizacao != predio) or bits.get(sala.pk, 0) & pedido):
+            continue
+        ocupadas = andares.get((sala.localizacao, sala.andar), 0)
+        impacto = ANDAR_LIGADO if ocupadas else PREDIO_LIGADO if sala.localizacao in predios else PREDIO_DESLIGADO
+        livres.append(SalaLivre(sala, impacto, ocupadas))
+    livres.sort(key=lambda livre: (IMPACTOS.index(livre.impacto), -livre.ocupadas_no_andar,
+                                   livre.sala.capacidade, livre.sala.nome))
+    return livres[:limite] if limite else livres
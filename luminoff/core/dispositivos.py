@@ -0,0 +1,55 @@
+"""
+Comandos para os equipamentos das salas (luzes e ar-condicionado) e a
+interface dos drivers que efetivamente os enviam.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+LUZ = 'luz'
+AR = 'ar'
+DISPOSITIVOS = (LUZ, AR)
+
+LIGAR = 'ligar'
+DESLIGAR = 'desligar'
+
+
+@dataclass(frozen=True)
+class Comando:
+    """Ordem de ligar/desligar um tipo de equipamento de uma sala."""
+    sala_id: int
+    dispositivo: str
+    acao: str
+    quando: datetime
+
+    def __str__(self):
+        return f"{self.acao} {self.dispositivo} (sala {self.sala_id}) @ {self.quando:%d/%m %H:%M}"
+
+
+class DriverDispositivo:
+    """Interface dos drivers. ``enviar`` recebe um lote de comandos."""
+
+    async def enviar(self, comandos):
+        raise NotImplementedError
+
+    async def fechar(self):
+        pass
+
+
+class DriverLog(DriverDispositivo):
+    """Driver que apenas registra os comandos no log (útil em desenvolvimento)."""
+
+    async def enviar(self, comandos):
+        for comando in comandos:
+            logger.info("Comando: %s", comando)
+
+
+def carregar_driver(caminho=None):
+    """Instancia o driver configurado em ``LUMINOFF_DRIVER_DISPOSITIVOS``."""
+    caminho = caminho or getattr(settings, 'LUMINOFF_DRIVER_DISPOSITIVOS', 'core.dispositivos.DriverLog')
+    return import_string(caminho)()
@@ -0,0 +1,165 @@
+"""
+Estimativa de consumo e economia de energia do semestre.
+
+Simula, em resolução de minuto, o estado (ligado/desligado) de luzes e
+ar-condicionado de todas as salas e compara a operação pela agenda (mesmas
+margens do agendador) com o cenário "tudo ligado durante o expediente do
+prédio". Tudo é feito com arrays NumPy:
+
+- a agenda semanal vira uma matriz booleana ``salas x 7 dias x 1440 minutos``;
+- os minutos ligados por dia da semana são multiplicados pela quantidade de
+  cada dia da semana no semestre;
+- os totais são agregados por sala, andar e prédio com ``np.bincount``.
+"""
+import numpy as np
+from django.conf import settings
+
+from . import calendario, ocupacao
+from .dispositivos import AR, LUZ
+from .models import Sala
+
+BLOCO_SALAS = 1024
+
+PERFIS_PADRAO = {
+    # kW por tipo de sala
+    'LAB': {LUZ: 0.8, AR: 3.5},
+    'SAL': {LUZ: 0.6, AR: 2.6},
+    'AUD': {LUZ: 2.0, AR: 10.5},
+    'OUT': {LUZ: 0.4, AR: 1.8},
+}
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def dias_por_semana(inicio, fim, excluir=()):
+    """Quantas vezes cada dia da semana (0=segunda) ocorre entre as datas."""
+    total = (fim - inicio).days + 1
+    if total <= 0:
+        return np.zeros(7, dtype=np.int64)
+    dias = (inicio.weekday() + np.arange(total)) % 7
+    contagem = np.bincount(dias, minlength=7)
+    for data in excluir:
+        if inicio <= data <= fim:
+            contagem[data.weekday()] -= 1
+    return contagem
+
+
+def mascara_semanal(indice, sala_ids):
+    """Matriz booleana ``(salas, 7, 1440)`` com os minutos ocupados."""
+    # Os intervalos do índice já estão mesclados, então int8 basta
+    diferencas = np.zeros((len(sala_ids), 7, ocupacao.MINUTOS_DIA + 1), dtype=np.int8)
+    linhas, dias, inicios, fins = [], [], [], []
+    for linha, sala_id in enumerate(sala_ids):
+        for dia, pontos in enumerate(indice.agenda(sala_id)):
+            if pontos:
+                quantidade = len(pontos) // 2
+                linhas.extend([linha] * quantidade)
+                dias.extend([dia] * quantidade)
+                inicios.extend(pontos[0::2])
+                fins.extend(pontos[1::2])
+    # +1 no início e -1 no fim de cada intervalo; a soma acumulada dá o
+    # estado. Intervalos mesclados nunca compartilham pontos, então a
+    # atribuição direta (sem np.add.at) é segura.
+    diferencas[linhas, dias, inicios] = 1
+    diferencas[linhas, dias, fins] = -1
+    return np.cumsum(diferencas, axis=2, dtype=np.int8)[:, :, :ocupacao.MINUTOS_DIA] > 0
+
+
+def mascara_expediente():
+    """Vetor ``(7, 1440)`` com o horário de funcionamento dos prédios."""
+    abertura, fechamento = _config('LUMINOFF_EXPEDIENTE_PREDIO', ('07:00', '22:00'))
+    dias = _config('LUMINOFF_DIAS_EXPEDIENTE', (0, 1, 2, 3, 4, 5))
+    inicio = int(abertura[:2]) * 60 + int(abertura[3:5])
+    fim = int(fechamento[:2]) * 60 + int(fechamento[3:5])
+    mascara = np.zeros((7, ocupacao.MINUTOS_DIA), dtype=bool)
+    mascara[list(dias), inicio:fim] = True
+    return mascara
+
+
+def _agrupar(chaves, valores):
+    """Soma as linhas de ``valores`` por chave; devolve (chaves únicas, somas)."""
+    grupos = {}
+    posicoes = np.fromiter((grupos.setdefault(chave, len(grupos)) for chave in chaves),
+                           dtype=np.intp, count=len(chaves))
+    somas = np.zeros((len(grupos), valores.shape[1]))
+    for coluna in range(valores.shape[1]):
+        somas[:, coluna] = np.bincount(posicoes, weights=valores[:, coluna], minlength=len(grupos))
+    return list(grupos), somas
+
+
+class RelatorioEnergia:
+    """Resultado da simulação: kWh e custo com agenda x sempre ligado."""
+
+    COLUNAS = ('kwh_agenda', 'kwh_sempre_ligado', 'kwh_economia', 'custo_economia')
+
+    def __init__(self, semestre, salas, valores, tarifa, dias):
+        self.semestre = semestre
+        self.tarifa = tarifa
+        self.dias = dias
+        self.salas = [dict(sala, **self._linha(linha)) for sala, linha in zip(salas, valores)]
+
+        predios, somas = _agrupar([sala['localizacao'] for sala in salas], valores)
+        self.predios = [dict(localizacao=predio, **self._linha(linha)) for predio, linha in zip(predios, somas)]
+
+        andares, somas = _agrupar([(sala['localizacao'], sala['andar']) for sala in salas], valores)
+        self.andares = [dict(localizacao=predio, andar=andar, **self._linha(linha))
+                        for (predio, andar), linha in zip(andares, somas)]
+
+        self.total = self._linha(valores.sum(axis=0) if len(valores) else np.zeros(4))
+
+    def _linha(self, linha):
+        return {coluna: round(float(valor), 2) for coluna, valor in zip(self.COLUNAS, linha)}
+
+    def como_dict(self):
+        return {
+            'semestre': str(self.semestre),
+            'tarifa_kwh': self.tarifa,
+            'total': self.total,
+            'predios': self.predios,
+            'andares': self.andares,
+            'salas': self.salas,
+        }
+
+
+def simular_semestre(semestre, indice=None, feriados=None):
+    """Simula o semestre inteiro e devolve um ``RelatorioEnergia``.
+
+    ``feriados`` (datas sem aula) vem por padrão dos ``Feriado`` cadastrados.
+    """
+    perfis = _config('LUMINOFF_PERFIS_POTENCIA', PERFIS_PADRAO)
+    tarifa = _config('LUMINOFF_TARIFA_KWH', 0.85)
+    antecedencia_ar = _config('LUMINOFF_ANTECEDENCIA_AR', 15)
+    tolerancia = _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+
+    salas = list(Sala.objects.filter(ativa=True).order_by('localizacao', 'andar', 'nome').values(
+        'id', 'nome', 'tipo', 'andar', 'localizacao'))
+    sala_ids = [sala['id'] for sala in salas]
+    if indice is None:
+        # O semestre ativo já tem o índice compilado em memória
+        indice = ocupacao.obter_indice() if semestre.ativo else ocupacao.compilar_indice(semestre)
+
+    if feriados is None:
+        feriados = calendario.dias_sem_aula(semestre.data_inicio, semestre.data_fim)
+    dias = dias_por_semana(semestre.data_inicio, semestre.data_fim, feriados)
+    kw_luz = np.array([perfis.get(sala['tipo'], PERFIS_PADRAO['OUT'])[LUZ] for sala in salas])
+    kw_ar = np.array([perfis.get(sala['tipo'], PERFIS_PADRAO['OUT'])[AR] for sala in salas])
+
+    # Minutos ligados por sala e dia da semana, ponderados pelos dias do
+    # semestre; as salas são processadas em blocos para limitar a memória
+    linha_luz = indice.com_margens(0, tolerancia)
+    linha_ar = indice.com_margens(antecedencia_ar, tolerancia)
+    minutos_luz = np.zeros(len(salas))
+    minutos_ar = np.zeros(len(salas))
+    for i in range(0, len(salas), BLOCO_SALAS):
+        bloco = sala_ids[i:i + BLOCO_SALAS]
+        minutos_luz[i:i + BLOCO_SALAS] = mascara_semanal(linha_luz, bloco).sum(axis=2) @ dias
+        minutos_ar[i:i + BLOCO_SALAS] = mascara_semanal(linha_ar, bloco).sum(axis=2) @ dias
+    minutos_expediente = mascara_expediente().sum(axis=1) @ dias
+
+    kwh_agenda = (minutos_luz * kw_luz + minutos_ar * kw_ar) / 60
+    kwh_sempre = minutos_expediente * (kw_luz + kw_ar) / 60
+    economia = kwh_sempre - kwh_agenda
+    valores = np.column_stack([kwh_agenda, kwh_sempre, economia, economia * tarifa]) if salas else np.zeros((0, 4))
+    return RelatorioEnergia(semestre, salas, valores, tarifa, dias)
@@ -1,7 +1,11 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Professor
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from . import disponibilidade, validacao, virada
+from .models import HorarioTurma, Professor, Semestre, TipoSala
+from .ocupacao import minutos
 
 class ProfessorForm(UserCreationForm):
     matricula = forms.CharField(max_length=20)
@@ -22,4 +26,131 @@ class ProfessorForm(UserCreationForm):
                 departamento=self.cleaned_data['departamento'],
                 telefone=self.cleaned_data['telefone']
             )
-        return user
\ No newline at end of file
+        return user
+
+class HorarioTurmaFormSet(BaseInlineFormSet):
+    """Valida os horários da turma entre si e contra os demais horários do semestre"""
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # Cada formulário do inline consultaria a lista de salas de novo;
+        # avaliamos as opções uma vez e compartilhamos entre todos
+        campo = form.fields.get('sala')
+        if campo is not None:
+            if not hasattr(self, '_opcoes_sala'):
+                self._opcoes_sala = list(campo.choices)
+            campo.choices = self._opcoes_sala
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        # O formset só preenche turma_id; reaproveita a turma já carregada
+        # para que HorarioTurma.__str__ não a busque de novo em cada linha
+        if self.instance.pk is not None:
+            form.instance.turma = self.instance
+        return form
+
+    def clean(self):
+        super().clean()
+        turma = self.instance
+        # Com o formulário da turma inválido, o admin entrega aqui a turma só
+        # com os campos válidos: sem disciplina, semestre ou professor não há o
+        # que comparar, e o erro já aparece no formulário principal
+        if (any(self.errors) or not turma.ativo or not turma.semestre_id or not turma.professor_id
+                or not turma.disciplina_id):
+            return
+
+        professor = str(turma.professor)
+        rotulo = f"{turma.disciplina.codigo} - {turma.codigo_turma}"
+        novos = []
+        for form in self.forms:
+            dados = getattr(form, 'cleaned_data', None)
+            if not dados or (self.can_delete and self._should_delete_form(form)):
+                continue
+            sala = dados['sala']
+            novos.append(validacao.Horario(
+                form.instance.pk, turma.pk, sala.pk, turma.professor_id, dados['dia_semana'],
+                minutos(dados['hora_inicio']), minutos(dados['hora_fim']), turma.numero_alunos,
+                sala.capacidade, rotulo, sala.nome, professor,
+            ))
+        if not novos:
+            return
+
+        # Só interessam os horários do semestre nos mesmos dias, salas ou professor
+        existentes = HorarioTurma.objects.filter(
+            turma__semestre_id=turma.semestre_id,
+            turma__ativo=True,
+            dia_semana__in={h.dia_semana for h in novos},
+        ).filter(
+            Q(sala_id__in={h.sala_id for h in novos}) | Q(turma__professor_id=turma.professor_id)
+        )
+        if turma.pk:
+            existentes = existentes.exclude(turma_id=turma.pk)
+
+        indice = validacao.IndiceConflitos(validacao.horarios_do_banco(existentes))
+        conflitos = [conflito for horario in novos for conflito in indice.conflitos_de(horario)]
+        conflitos += validacao.verificar_horarios(novos, individuais=False)
+        if conflitos:
+            raise forms.ValidationError([conflito.mensagem for conflito in conflitos])
+
+
+class ImportacaoHorariosForm(forms.Form):
+    arquivo = forms.FileField(help_text="Planilha .csv ou .xlsx com as colunas: "
+                                        "disciplina, turma, professor, alunos, sala, dia, inicio, fim")
+    semestre = forms.ModelChoiceField(queryset=Semestre.objects.all())
+    simular = forms.BooleanField(required=False, initial=True,
+                                 help_text="Apenas valida e relata conflitos, sem gravar")
+    ignorar_conflitos = forms.BooleanField(required=False)
+
+
+class ViradaSemestreForm(forms.Form):
+    destino = forms.ModelChoiceField(queryset=Semestre.objects.all(), label="Semestre de destino")
+    trocas = forms.CharField(
+        required=False, widget=forms.Textarea(attrs={'rows': 6, 'cols': 60}),
+        help_text="Uma troca por linha: tipo,de,para (ex.: professor,2019001,2023042 ou sala,Sala 101,Sala 204)")
+    simular = forms.BooleanField(required=False, initial=True,
+                                 help_text="Apenas valida e relata conflitos, sem gravar")
+    ignorar_conflitos = forms.BooleanField(required=False)
+
+    def __init__(self, *args, origem=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if origem is not None:
+            self.fields['destino'].queryset = Semestre.objects.exclude(pk=origem.pk)
+
+    def clean_trocas(self):
+        try:
+            return virada.ler_trocas(self.cleaned_data['trocas'].splitlines())
+        except virada.ErroVirada as erro:
+            raise forms.ValidationError(str(erro))
+
+
+class DisponibilidadeForm(forms.Form):
+    """Filtros da busca de salas livres (admin e ``/api/salas/livres/``)."""
+    data = forms.DateField(required=False, help_text="Data concreta (feriados, cancelamentos e reservas contam)")
+    dia_semana = forms.TypedChoiceField(choices=[('', '---------'), *HorarioTurma.DIA_SEMANA], coerce=int,
+                                        empty_value=None, required=False, label="Dia da semana",
+                                        help_text="Ou um dia da semana típico do semestre ativo")
+    inicio = forms.TimeField(label="Das")
+    fim = forms.TimeField(label="Às")
+    alunos = forms.IntegerField(min_value=0, required=False, label="Alunos (capacidade mínima)")
+    tipo = forms.ChoiceField(choices=[('', 'Qualquer'), *TipoSala.choices], required=False)
+    andar = forms.IntegerField(required=False)
+    predio = forms.CharField(required=False, label="Prédio")
+    limite = forms.IntegerField(min_value=1, required=False, initial=50, label="Máximo de salas")
+
+    def clean(self):
+        dados = super().clean()
+        if (dados.get('data') is None) == (dados.get('dia_semana') is None):
+            raise forms.ValidationError("Informe a data ou o dia da semana (um dos dois).")
+        inicio, fim = dados.get('inicio'), dados.get('fim')
+        if inicio and fim and minutos(fim) <= minutos(inicio):
+            raise forms.ValidationError("O fim deve ser depois do início.")
+        return dados
+
+    def buscar(self):
+        """``disponibilidade.buscar`` com os filtros validados."""
+        dados = self.cleaned_data
+        return disponibilidade.buscar(
+            dados['inicio'], dados['fim'], data=dados['data'], dia_semana=dados['dia_semana'],
+            alunos=dados['alunos'] or 0, tipo=dados['tipo'] or None, andar=dados['andar'],
+            predio=dados['predio'].strip() or None, limite=dados['limite'],
+        )
@@ -0,0 +1,345 @@
+"""
+Gateway assíncrono para os controladores dos prédios.
+
+Os comandos do agendador são traduzidos para os dispositivos cadastrados de
+cada sala, agrupados por controlador e enviados em requisições HTTP/1.1 com
+conexões reaproveitadas (keep-alive). A concorrência total é limitada por um
+semáforo, cada prédio tem seu próprio limite de comandos por segundo e falhas
+são repetidas com backoff exponencial com jitter. Cada comando leva um ID
+determinístico, então repetições são idempotentes no controlador.
+
+``ControladorFalso`` implementa o mesmo protocolo em processo, para testes de
+carga locais.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import referencia
+from .dispositivos import Comando, DriverDispositivo
+from .models import Dispositivo
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_COMANDOS = uuid.UUID('6f1c1b8e-4a8e-4d0b-9a57-2f5b6a1f0c11')
+CAMINHO_COMANDOS = '/comandos'
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def id_comando(comando, identificador):
+    """ID idempotente: o mesmo comando para o mesmo relé gera sempre o mesmo ID."""
+    chave = f"{comando.sala_id}:{identificador}:{comando.acao}:{comando.quando.isoformat()}"
+    return str(uuid.uuid5(NAMESPACE_COMANDOS, chave))
+
+
+def _separar_endereco(endereco):
+    host, _, porta = endereco.rpartition(':')
+    return host, int(porta)
+
+
+class ErroControlador(Exception):
+    """Falha de comunicação ou resposta de erro de um controlador."""
+
+
+# ---------------------------------------------------------------------------
+# HTTP mínimo sobre asyncio streams
+# ---------------------------------------------------------------------------
+
+async def _ler_mensagem(reader):
+    """Lê linha inicial, cabeçalhos e corpo (Content-Length) de uma mensagem HTTP."""
+    linha = await reader.readline()
+    if not linha:
+        raise ConnectionError("Conexão encerrada")
+    cabecalhos = {}
+    while True:
+        cabecalho = await reader.readline()
+        if cabecalho in (b'\r\n', b'\n', b''):
+            break
+        nome, _, valor = cabecalho.decode('latin-1').partition(':')
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    tamanho = int(cabecalhos.get('content-length', 0))
+    corpo = await reader.readexactly(tamanho) if tamanho else b''
+    return linha.decode('latin-1').strip(), cabecalhos, corpo
+
+
+class PoolConexoes:
+    """Conexões keep-alive reaproveitáveis para um controlador."""
+
+    def __init__(self, host, porta, maximo, timeout):
+        self.host = host
+        self.porta = porta
+        self.timeout = timeout
+        self._livres = []
+        self._vagas = asyncio.Semaphore(maximo)
+
+    async def requisitar(self, caminho, dados):
+        corpo = json.dumps(dados).encode()
+        requisicao = (
+            f"POST {caminho} HTTP/1.1\r\n"
+            f"Host: {self.host}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(corpo)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode() + corpo
+
+        async with self._vagas:
+            conexao = self._livres.pop() if self._livres else None
+            try:
+                if conexao is None:
+                    conexao = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.porta), self.timeout)
+                reader, writer = conexao
+                writer.write(requisicao)
+                await writer.drain()
+                status, _, resposta = await asyncio.wait_for(_ler_mensagem(reader), self.timeout)
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as erro:
+                if conexao is not None:
+                    conexao[1].close()
+                raise ErroControlador(f"{self.host}:{self.porta}: {erro!r}") from erro
+            self._livres.append(conexao)
+
+        codigo = int(status.split()[1])
+        if codigo >= 400:
+            raise ErroControlador(f"{self.host}:{self.porta} respondeu {status}")
+        return json.loads(resposta) if resposta else {}
+
+    async def fechar(self):
+        while self._livres:
+            _, writer = self._livres.pop()
+            writer.close()
+            await writer.wait_closed()
+
+
+class LimitadorTaxa:
+    """Token bucket: até ``taxa`` comandos por segundo, com rajada de ``taxa``."""
+
+    def __init__(self, taxa):
+        self.taxa = taxa
+        self._tokens = float(taxa)
+        self._atualizado = time.monotonic()
+
+    async def consumir(self, quantidade):
+        """Espera até pagar ``quantidade`` tokens; lotes maiores que ``taxa`` pagam em parcelas."""
+        while quantidade > 0:
+            parcela = min(quantidade, self.taxa)
+            # Sem await entre repor e descontar os tokens: no event loop isso
+            # já é atômico, e quem espera não segura os outros lotes do prédio
+            agora = time.monotonic()
+            self._tokens = min(self.taxa, self._tokens + (agora - self._atualizado) * self.taxa)
+            self._atualizado = agora
+            if self._tokens >= parcela:
+                self._tokens -= parcela
+                quantidade -= parcela
+                continue
+            await asyncio.sleep((parcela - self._tokens) / self.taxa)
+
+
+# ---------------------------------------------------------------------------
+# Gateway
+# ---------------------------------------------------------------------------
+
+class GatewayDispositivos(DriverDispositivo):
+    """Driver que entrega os comandos aos controladores dos prédios."""
+
+    def __init__(self, controlador_padrao=None, conexoes=None, concorrencia=None,
+                 taxa_predio=None, tentativas=None, timeout=None, validade_mapa=None):
+        self.controlador_padrao = controlador_padrao or _config('LUMINOFF_CONTROLADOR_PADRAO', '127.0.0.1:8765')
+        self.conexoes = conexoes or _config('LUMINOFF_GATEWAY_CONEXOES', 4)
+        self.taxa_predio = taxa_predio or _config('LUMINOFF_GATEWAY_TAXA_PREDIO', 200)
+        self.tentativas = tentativas or _config('LUMINOFF_GATEWAY_TENTATIVAS', 4)
+        self.timeout = timeout or _config('LUMINOFF_GATEWAY_TIMEOUT', 5)
+        self.validade_mapa = validade_mapa if validade_mapa is not None else _config('LUMINOFF_INTERVALO_RECOMPILACAO', 300)
+        self.tamanho_lote = _config('LUMINOFF_TAMANHO_LOTE', 500)
+        self._concorrencia = asyncio.Semaphore(concorrencia or _config('LUMINOFF_GATEWAY_CONCORRENCIA', 32))
+        self._pools = {}
+        self._limitadores = {}
+        self._mapa = None
+        self._mapa_carregado_em = 0.0
+
+    # -- mapeamento sala -> dispositivos ------------------------------------
+
+    def _carregar_mapa(self):
+        """``{(sala_id, tipo): [(identificador, controlador)]}`` e ``{sala_id: prédio}``."""
+        dispositivos = defaultdict(list)
+        for sala_id, tipo, identificador, controlador in Dispositivo.objects.filter(
+                ativo=True).values_list('sala_id', 'tipo', 'identificador', 'controlador'):
+            dispositivos[(sala_id, tipo)].append((identificador, controlador or self.controlador_padrao))
+        predios = {sala.pk: sala.localizacao for sala in referencia.salas()}
+        return dispositivos, predios
+
+    def definir_mapa(self, dispositivos, predios):
+        """Usa um mapeamento fixo em vez de consultar o banco (testes de carga)."""
+        self._mapa = (dispositivos, predios)
+        self._mapa_carregado_em = float('inf')
+
+    async def _mapa_atual(self):
+        if self._mapa is None or time.monotonic() - self._mapa_carregado_em > self.validade_mapa:
+            self._mapa = await sync_to_async(self._carregar_mapa)()
+            self._mapa_carregado_em = time.monotonic()
+        return self._mapa
+
+    def _destinos(self, comando, dispositivos):
+        # Salas sem dispositivos cadastrados usam um relé por tipo no controlador padrão
+        return dispositivos.get((comando.sala_id, comando.dispositivo)) or [
+            (f"sala-{comando.sala_id}-{comando.dispositivo}", self.controlador_padrao)
+        ]
+
+    # -- envio --------------------------------------------------------------
+
+    def _pool(self, controlador):
+        if controlador not in self._pools:
+            host, porta = _separar_endereco(controlador)
+            self._pools[controlador] = PoolConexoes(host, porta, self.conexoes, self.timeout)
+        return self._pools[controlador]
+
+    def _limitador(self, predio):
+        if predio not in self._limitadores:
+            self._limitadores[predio] = LimitadorTaxa(self.taxa_predio)
+        return self._limitadores[predio]
+
+    async def enviar(self, comandos):
+        dispositivos, predios = await self._mapa_atual()
+
+        # Agrupa por (controlador, prédio) para um POST por grupo
+        grupos = defaultdict(list)
+        for comando in comandos:
+            predio = predios.get(comando.sala_id, '')
+            for identificador, controlador in self._destinos(comando, dispositivos):
+                grupos[(controlador, predio)].append({
+                    'id': id_comando(comando, identificador),
+                    'sala': comando.sala_id,
+                    'dispositivo': identificador,
+                    'tipo': comando.dispositivo,
+                    'acao': comando.acao,
+                    'quando': comando.quando.isoformat(),
+                })
+
+        tarefas = []
+        for (controlador, predio), itens in grupos.items():
+            for i in range(0, len(itens), self.tamanho_lote):
+                tarefas.append(self._entregar(controlador, predio, itens[i:i + self.tamanho_lote]))
+        resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+
+        falhas = [erro for erro in resultados if isinstance(erro, Exception)]
+        if falhas:
+            raise ErroControlador(f"{len(falhas)} de {len(tarefas)} lotes falharam: {falhas[0]}")
+        return sum(resultados)
+
+    async def _entregar(self, controlador, predio, itens):
+        pool = self._pool(controlador)
+        for tentativa in range(self.tentativas):
+            await self._limitador(predio).consumir(len(itens))
+            try:
+                async with self._concorrencia:
+                    await pool.requisitar(CAMINHO_COMANDOS, {'comandos': itens})
+                return len(itens)
+            except ErroControlador:
+                if tentativa == self.tentativas - 1:
+                    raise
+                # Backoff exponencial com jitter completo
+                espera = random.uniform(0, 0.1 * 2 ** tentativa)
+                logger.warning("Falha ao enviar %d comandos para %s; nova tentativa em %.2fs",
+                               len(itens), controlador, espera)
+                await asyncio.sleep(espera)
+
+    async def enviar_para_predio(self, localizacao, dispositivo, acao, quando):
+        """Envia o mesmo comando para todas as salas ativas de um prédio."""
+        salas = await sync_to_async(referencia.salas_ativas)()
+        sala_ids = [sala.pk for sala in salas if sala.localizacao == localizacao]
+        return await self.enviar([Comando(sala_id, dispositivo, acao, quando) for sala_id in sala_ids])
+
+    async def fechar(self):
+        for pool in self._pools.values():
+            await pool.fechar()
+        self._pools.clear()
+
+
+# ---------------------------------------------------------------------------
+# Controlador falso
+# ---------------------------------------------------------------------------
+
+class ControladorFalso:
+    """Controlador em processo que fala o mesmo protocolo do gateway.
+
+    Guarda o último estado de cada relé e ignora IDs repetidos. ``latencia`` e
+    ``taxa_falhas`` simulam um controlador lento ou instável.
+    """
+
+    def __init__(self, host='127.0.0.1', porta=0, latencia=0.0, taxa_falhas=0.0):
+        self.host = host
+        self.porta = porta
+        self.latencia = latencia
+        self.taxa_falhas = taxa_falhas
+        self.estados = {}
+        self.ids_recebidos = set()
+        self.requisicoes = 0
+        self.duplicados = 0
+        self._servidor = None
+        self._conexoes = {}
+
+    @property
+    def endereco(self):
+        return f"{self.host}:{self.porta}"
+
+    async def iniciar(self):
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        return self
+
+    async def parar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            for writer in self._conexoes.values():
+                writer.close()
+            await asyncio.gather(*self._conexoes, return_exceptions=True)
+            await self._servidor.wait_closed()
+
+    async def __aenter__(self):
+        return await self.iniciar()
+
+    async def __aexit__(self, *exc):
+        await self.parar()
+
+    async def _atender(self, reader, writer):
+        tarefa = asyncio.current_task()
+        self._conexoes[tarefa] = writer
+        try:
+            while True:
+                try:
+                    _, _, corpo = await _ler_mensagem(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                self.requisicoes += 1
+                if self.latencia:
+                    await asyncio.sleep(self.latencia)
+                if random.random() < self.taxa_falhas:
+                    writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                else:
+                    resposta = json.dumps({'aceitos': self._aplicar(json.loads(corpo))}).encode()
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                                 + f"Content-Length: {len(resposta)}\r\n\r\n".encode() + resposta)
+                await writer.drain()
+        finally:
+            self._conexoes.pop(tarefa, None)
+            writer.close()
+
+    def _aplicar(self, dados):
+        aceitos = 0
+        for item in dados.get('comandos', []):
+            if item['id'] in self.ids_recebidos:
+                self.duplicados += 1
+                continue
+            self.ids_recebidos.add(item['id'])
+            self.estados[item['dispositivo']] = item['acao']
+            aceitos += 1
+        return aceitos
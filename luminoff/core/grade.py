@@ -0,0 +1,148 @@
+"""
+Grade semanal (dias x faixas de horário) por sala, andar e prédio.
+
+Cada sala vira um fragmento HTML guardado no cache com a versão da sala na
+chave (``versao.das_salas``): alterar um horário só invalida a grade da sala
+dele. Uma página pede todos os fragmentos em um ``get_many``; as salas que
+faltarem são montadas juntas, com uma consulta para os horários de todas, e
+gravadas em um ``set_many``.
+
+O HTML é montado em Python, e não com o motor de templates: um prédio com
+cem salas são dezenas de milhares de células, e o template levaria centenas
+de milissegundos só para renderizá-las.
+"""
+from collections import defaultdict
+from datetime import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import ocupacao, versao
+from .models import HorarioTurma, Sala, TipoSala
+
+NOMES_DIAS = ('Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom')
+DIAS_UTEIS = range(6)   # domingo só aparece na sala que tem aula no domingo
+TIPOS = dict(TipoSala.choices)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def faixas():
+    """Início (em minutos) de cada linha da grade."""
+    inicio = ocupacao.minutos(time.fromisoformat(_config('LUMINOFF_GRADE_INICIO', '07:00')))
+    fim = ocupacao.minutos(time.fromisoformat(_config('LUMINOFF_GRADE_FIM', '23:00')))
+    return list(range(inicio, fim, _config('LUMINOFF_GRADE_FAIXA', 30)))
+
+
+def _blocos(aulas, linhas, passo):
+    """``{linha inicial: (linhas ocupadas, [rótulos])}`` de um dia.
+
+    Aulas sobrepostas (não deveria haver, mas a grade não esconde) dividem a
+    mesma célula.
+    """
+    primeiro, ultimo = linhas[0], linhas[-1] + passo
+    blocos = []
+    for inicio, fim, rotulo in sorted(aulas):
+        inicio, fim = max(inicio, primeiro), min(fim, ultimo)
+        if fim <= inicio:
+            continue
+        de = (inicio - primeiro) // passo
+        ate = -(-(fim - primeiro) // passo)
+        if blocos and de < blocos[-1][1]:
+            blocos[-1][1] = max(blocos[-1][1], ate)
+            blocos[-1][2].append(rotulo)
+        else:
+            blocos.append([de, ate, [rotulo]])
+    return {de: (ate - de, rotulos) for de, ate, rotulos in blocos}
+
+
+def renderizar_sala(sala, aulas, linhas):
+    """Fragmento HTML da grade de uma sala.
+
+    ``sala`` é um dict com ``nome``, ``tipo``, ``capacidade``; ``aulas`` é
+    ``{dia: [(inicio, fim, rótulo)]}`` em minutos.
+    """
+    dias = [*DIAS_UTEIS, 6] if aulas.get(6) else list(DIAS_UTEIS)
+    passo = linhas[1] - linhas[0] if len(linhas) > 1 else 60
+    blocos = {dia: _blocos(aulas.get(dia, ()), linhas, passo) for dia in dias}
+    partes = [
+        f'<div class="grade-sala"><h3>{escape(sala["nome"])} '
+        f'<small>{escape(sala["tipo"])}, {sala["capacidade"]} lugares</small></h3>'
+        '<table class="grade"><thead><tr><th></th>',
+        *(f'<th>{NOMES_DIAS[dia]}</th>' for dia in dias),
+        '</tr></thead><tbody>',
+    ]
+    restantes = dict.fromkeys(dias, 0)   # linhas ainda cobertas por um rowspan
+    for indice, minuto in enumerate(linhas):
+        partes.append(f'<tr><th>{minuto // 60:02d}:{minuto % 60:02d}</th>')
+        for dia in dias:
+            if restantes[dia]:
+                restantes[dia] -= 1
+                continue
+            bloco = blocos[dia].get(indice)
+            if bloco is None:
+                partes.append('<td></td>')
+                continue
+            altura, rotulos = bloco
+            restantes[dia] = altura - 1
+            partes.append(f'<td class="aula" rowspan="{altura}">{"<hr>".join(rotulos)}</td>')
+        partes.append('</tr>')
+    partes.append('</tbody></table></div>')
+    return ''.join(partes)
+
+
+def _rotulo(disciplina, turma, nome, sobrenome):
+    return f'{escape(disciplina)} {escape(turma)}<br><small>{escape(f"{nome} {sobrenome}".strip())}</small>'
+
+
+def _montar(salas, semestre, linhas):
+    """Fragmentos das salas informadas, com uma consulta para todos os horários."""
+    aulas = defaultdict(lambda: defaultdict(list))   # sala -> dia -> [(inicio, fim, rótulo)]
+    horarios = HorarioTurma.objects.filter(
+        turma__semestre=semestre, turma__ativo=True, sala_id__in=[sala['pk'] for sala in salas],
+    ).order_by().values_list(
+        'sala_id', 'dia_semana', 'hora_inicio', 'hora_fim', 'turma__disciplina__codigo', 'turma__codigo_turma',
+        'turma__professor__user__first_name', 'turma__professor__user__last_name',
+    )
+    for sala_id, dia, inicio, fim, *rotulo in horarios:
+        aulas[sala_id][dia].append((ocupacao.minutos(inicio), ocupacao.minutos(fim), _rotulo(*rotulo)))
+    return {sala['pk']: renderizar_sala(sala, aulas[sala['pk']], linhas) for sala in salas}
+
+
+def fragmentos(salas, semestre):
+    """``{sala_id: HTML}`` das salas (dicts de ``salas_do_local``), do cache
+    sempre que a versão da sala não mudou."""
+    linhas = faixas()
+    formato = f'{linhas[0]}+{len(linhas)}' if linhas else '0'   # grade configurada de outro jeito = outra chave
+    versoes = versao.das_salas([sala['pk'] for sala in salas])
+    chaves = {
+        sala['pk']: f'luminoff:grade:{semestre.pk}:{formato}:{sala["pk"]}:{versoes[sala["pk"]]}' for sala in salas
+    }
+    guardados = cache.get_many(chaves.values())
+    resultado = {sala_id: guardados[chave] for sala_id, chave in chaves.items() if chave in guardados}
+    faltando = [sala for sala in salas if sala['pk'] not in resultado]
+    if faltando:
+        novos = _montar(faltando, semestre, linhas)
+        cache.set_many({chaves[sala_id]: html for sala_id, html in novos.items()},
+                       _config('LUMINOFF_GRADE_CACHE_TIMEOUT', 86400))
+        resultado.update(novos)
+    return {sala_id: mark_safe(html) for sala_id, html in resultado.items()}
+
+
+def salas_do_local(predio=None, andar=None, sala_id=None):
+    """Salas ativas (dicts) de um prédio/andar ou uma sala, em ordem de andar e nome."""
+    queryset = Sala.objects.filter(ativa=True)
+    if sala_id is not None:
+        queryset = Sala.objects.filter(pk=sala_id)
+    if predio is not None:
+        queryset = queryset.filter(localizacao=predio)
+    if andar is not None:
+        queryset = queryset.filter(andar=andar)
+    return [
+        {**sala, 'tipo': TIPOS.get(sala['tipo'], sala['tipo'])}
+        for sala in queryset.order_by('andar', 'nome').values('pk', 'nome', 'tipo', 'capacidade', 'andar')
+    ]
@@ -0,0 +1,286 @@
+"""
+Importação em massa dos horários do semestre (planilha da secretaria).
+
+A planilha é lida em fluxo e processada em lotes. Disciplinas, professores,
+salas e turmas são resolvidos por chave natural em dicionários carregados uma
+única vez, e a escrita usa ``bulk_create``/``bulk_update``: o número de
+consultas por lote é constante, independente do número de linhas.
+
+Colunas esperadas (cabeçalho na primeira linha):
+``disciplina, turma, professor, alunos, sala, dia, inicio, fim``
+- disciplina: código da disciplina
+- turma: código da turma (ex.: T01)
+- professor: matrícula do professor
+- alunos: número de alunos (opcional)
+- sala: nome da sala
+- dia: 0-6 ou nome do dia (Seg, Terça-feira, ...)
+- inicio/fim: HH:MM
+"""
+import csv
+import io
+import unicodedata
+from datetime import datetime, time
+from itertools import islice
+
+from django.db import transaction
+
+from . import alteracoes, calendario, ocupacao, validacao, versao
+from .models import Disciplina, HorarioTurma, Professor, Sala, Turma
+
+OBRIGATORIAS = ('disciplina', 'turma', 'professor', 'sala', 'dia', 'inicio', 'fim')
+DIAS = {'seg': 0, 'ter': 1, 'qua': 2, 'qui': 3, 'sex': 4, 'sab': 5, 'dom': 6}
+
+
+class ErroImportacao(Exception):
+    """Arquivo ilegível ou fora do formato esperado."""
+
+
+class _Desfazer(Exception):
+    """Usada internamente para desfazer a transação (simulação ou conflitos)."""
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.linhas = 0
+        self.turmas_criadas = 0
+        self.turmas_atualizadas = 0
+        self.horarios_criados = 0
+        self.horarios_existentes = 0
+        self.erros = []       # (número da linha, mensagem)
+        self.conflitos = []   # validacao.Conflito
+        self.gravado = False
+
+    def __str__(self):
+        return (
+            f"{self.linhas} linhas: {self.turmas_criadas} turmas criadas, "
+            f"{self.turmas_atualizadas} atualizadas, {self.horarios_criados} horários criados, "
+            f"{self.horarios_existentes} já existentes, {len(self.erros)} erros, "
+            f"{len(self.conflitos)} conflitos"
+        )
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return texto.strip().lower()
+
+
+def _linhas_normalizadas(cabecalho, linhas):
+    colunas = [_normalizar(coluna) for coluna in cabecalho]
+    faltando = [coluna for coluna in OBRIGATORIAS if coluna not in colunas]
+    if faltando:
+        raise ErroImportacao(f"Colunas ausentes: {', '.join(faltando)}")
+    for valores in linhas:
+        if any(valor not in (None, '') for valor in valores):
+            yield dict(zip(colunas, valores))
+
+
+def _erro_codificacao():
+    return ErroImportacao("O arquivo não está em UTF-8: salve a planilha como \"CSV UTF-8\" e envie de novo")
+
+
+def _ler(leitor):
+    # A decodificação é preguiçosa: um byte inválido pode aparecer em qualquer linha
+    try:
+        yield from leitor
+    except UnicodeDecodeError:
+        raise _erro_codificacao() from None
+    except csv.Error as erro:
+        raise ErroImportacao(f"CSV inválido na linha {leitor.line_num}: {erro}") from None
+
+
+def ler_csv(arquivo):
+    """Lê um CSV (texto ou binário, UTF-8) linha a linha."""
+    if not isinstance(arquivo, io.TextIOBase):
+        arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        amostra = arquivo.read(4096)
+        arquivo.seek(0)
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t') if amostra else csv.excel
+    except UnicodeDecodeError:
+        raise _erro_codificacao() from None
+    except csv.Error:
+        raise ErroImportacao("Não foi possível identificar o separador das colunas "
+                             "(use vírgula, ponto e vírgula ou tabulação)") from None
+    linhas = _ler(csv.reader(arquivo, dialeto))
+    return _linhas_normalizadas(next(linhas, []), linhas)
+
+
+def ler_xlsx(arquivo):
+    """Lê a primeira aba de um .xlsx em modo somente leitura (streaming)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ErroImportacao("Instale o pacote openpyxl para importar planilhas .xlsx")
+    planilha = load_workbook(arquivo, read_only=True, data_only=True).active
+    linhas = planilha.iter_rows(values_only=True)
+    return _linhas_normalizadas(next(linhas, ()), linhas)
+
+
+def ler_planilha(arquivo, nome):
+    return ler_xlsx(arquivo) if str(nome).lower().endswith('.xlsx') else ler_csv(arquivo)
+
+
+def _dia(valor):
+    if isinstance(valor, (int, float)) or str(valor).strip().isdigit():
+        dia = int(valor)
+    else:
+        dia = DIAS.get(_normalizar(valor)[:3])
+    if dia is None or not 0 <= dia <= 6:
+        raise ValueError(f"dia inválido: {valor!r}")
+    return dia
+
+
+def _hora(valor):
+    if isinstance(valor, datetime):
+        return valor.time().replace(second=0, microsecond=0)
+    if isinstance(valor, time):
+        return valor.replace(second=0, microsecond=0)
+    texto = str(valor).strip().lower().replace('h', ':')
+    partes = texto.split(':')
+    try:
+        return time(int(partes[0]), int(partes[1] or 0) if len(partes) > 1 else 0)
+    except (ValueError, IndexError):
+        raise ValueError(f"horário inválido: {valor!r}")
+
+
+def _texto(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip() if valor is not None else ''
+
+
+# ---------------------------------------------------------------------------
+# Importação
+# ---------------------------------------------------------------------------
+
+class _Importador:
+    def __init__(self, semestre, resultado):
+        self.semestre = semestre
+        self.resultado = resultado
+        # Dicionários de referência: uma consulta cada, no início
+        self.disciplinas = dict(Disciplina.objects.values_list('codigo', 'pk'))
+        self.professores = dict(Professor.objects.values_list('matricula', 'pk'))
+        self.salas = dict(Sala.objects.values_list('nome', 'pk'))
+        self.turmas = {
+            (disciplina_id, codigo): [pk, professor_id, alunos]
+            for pk, disciplina_id, codigo, professor_id, alunos in Turma.objects.filter(
+                semestre=semestre).values_list('pk', 'disciplina_id', 'codigo_turma', 'professor_id', 'numero_alunos')
+        }
+        self.horarios = set(HorarioTurma.objects.filter(turma__semestre=semestre).values_list(
+            'turma_id', 'sala_id', 'dia_semana', 'hora_inicio', 'hora_fim'))
+        # unique_together de HorarioTurma: (semestre, sala, dia_semana, hora_inicio)
+        self.inicios_ocupados = set(HorarioTurma.objects.filter(semestre=semestre).values_list(
+            'sala_id', 'dia_semana', 'hora_inicio'))
+
+    def _interpretar(self, linha):
+        disciplina_id = self.disciplinas.get(_texto(linha.get('disciplina')))
+        professor_id = self.professores.get(_texto(linha.get('professor')))
+        sala_id = self.salas.get(_texto(linha.get('sala')))
+        if disciplina_id is None:
+            raise ValueError(f"disciplina {linha.get('disciplina')!r} não cadastrada")
+        if professor_id is None:
+            raise ValueError(f"professor {linha.get('professor')!r} não cadastrado")
+        if sala_id is None:
+            raise ValueError(f"sala {linha.get('sala')!r} não cadastrada")
+        codigo_turma = _texto(linha.get('turma'))
+        if not codigo_turma:
+            raise ValueError("código da turma vazio")
+        alunos = linha.get('alunos')
+        alunos = int(float(alunos)) if alunos not in (None, '') else None
+        inicio, fim = _hora(linha.get('inicio')), _hora(linha.get('fim'))
+        if fim <= inicio:
+            raise ValueError("o fim deve ser depois do início")
+        return (disciplina_id, codigo_turma), professor_id, alunos, sala_id, _dia(linha.get('dia')), inicio, fim
+
+    def processar_lote(self, lote):
+        validas = []
+        for numero, linha in lote:
+            try:
+                validas.append((numero, *self._interpretar(linha)))
+            except (ValueError, TypeError) as erro:
+                self.resultado.erros.append((numero, str(erro)))
+
+        # Turmas novas e alteradas (professor/número de alunos)
+        novas, alteradas = {}, set()
+        for _, chave, professor_id, alunos, *_ in validas:
+            if chave in self.turmas:
+                turma = self.turmas[chave]
+                if turma[1] != professor_id or (alunos is not None and turma[2] != alunos):
+                    turma[1] = professor_id
+                    turma[2] = alunos if alunos is not None else turma[2]
+                    alteradas.add(chave)
+            elif chave in novas:
+                if alunos is not None:
+                    novas[chave].numero_alunos = alunos
+                novas[chave].professor_id = professor_id
+            else:
+                novas[chave] = Turma(
+                    semestre=self.semestre, disciplina_id=chave[0], codigo_turma=chave[1],
+                    professor_id=professor_id, numero_alunos=alunos or 0,
+                )
+        if novas:
+            Turma.objects.bulk_create(novas.values())
+            for chave, turma in novas.items():
+                self.turmas[chave] = [turma.pk, turma.professor_id, turma.numero_alunos]
+            self.resultado.turmas_criadas += len(novas)
+        if alteradas:
+            Turma.objects.bulk_update(
+                [Turma(pk=self.turmas[chave][0], professor_id=self.turmas[chave][1],
+                       numero_alunos=self.turmas[chave][2]) for chave in alteradas],
+                ['professor', 'numero_alunos'],
+            )
+            self.resultado.turmas_atualizadas += len(alteradas)
+
+        horarios = []
+        for numero, chave, _, _, sala_id, dia, inicio, fim in validas:
+            registro = (self.turmas[chave][0], sala_id, dia, inicio, fim)
+            if registro in self.horarios:
+                self.resultado.horarios_existentes += 1
+                continue
+            if (sala_id, dia, inicio) in self.inicios_ocupados:
+                self.resultado.erros.append((numero, "já existe outro horário nessa sala, dia e início"))
+                continue
+            self.horarios.add(registro)
+            self.inicios_ocupados.add((sala_id, dia, inicio))
+            horarios.append(HorarioTurma(turma_id=registro[0], semestre=self.semestre, sala_id=sala_id, dia_semana=dia,
+                                         hora_inicio=inicio, hora_fim=fim))
+        HorarioTurma.objects.bulk_create(horarios)
+        self.resultado.horarios_criados += len(horarios)
+
+
+def _lotes(linhas, tamanho):
+    numeradas = enumerate(linhas, start=2)  # linha 1 é o cabeçalho
+    while lote := list(islice(numeradas, tamanho)):
+        yield lote
+
+
+def importar_horarios(linhas, semestre, simular=False, ignorar_conflitos=False, tamanho_lote=2000):
+    """Importa as linhas (dicionários) para o semestre em uma única transação.
+
+    Ao final o semestre inteiro é validado; em simulação, ou se houver
+    conflitos e ``ignorar_conflitos`` for falso, a transação é desfeita.
+    """
+    resultado = ResultadoImportacao()
+    try:
+        with transaction.atomic():
+            importador = _Importador(semestre, resultado)
+            for lote in _lotes(linhas, tamanho_lote):
+                resultado.linhas += len(lote)
+                importador.processar_lote(lote)
+
+            resultado.conflitos = validacao.verificar_semestre(semestre)
+            if simular or (resultado.conflitos and not ignorar_conflitos):
+                raise _Desfazer
+            # bulk_create não dispara sinais: o índice de ocupação é refeito
+            transaction.on_commit(ocupacao.invalidar)
+            transaction.on_commit(calendario.invalidar_tudo)
+            transaction.on_commit(versao.incrementar_salas)
+            transaction.on_commit(alteracoes.publicar)
+            resultado.gravado = True
+    except _Desfazer:
+        pass
+    return resultado
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import preresfriamento
+
+
+class Command(BaseCommand):
+    help = ("Aprende, a partir da telemetria de temperatura, quanto tempo o ar de cada sala leva para esfriá-la "
+            "(rodar toda noite; só processa as partidas do ar desde o último ajuste)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Reprocessa a partir deste momento (ISO 8601) em vez do último ajuste")
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = datetime.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError(f"Data inválida: {options['desde']}")
+            if timezone.is_naive(desde):
+                desde = timezone.make_aware(desde)
+
+        salas, episodios, duracao = preresfriamento.ajustar(desde=desde)
+        self.stdout.write(self.style.SUCCESS(
+            f"{episodios} partidas do ar analisadas, {salas} curvas atualizadas em {duracao:.2f}s"))
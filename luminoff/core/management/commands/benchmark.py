@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Mede as operações centrais (admin, agenda, ocupação, importação) em campi sintéticos de várias "
+            "escalas e grava os resultados em JSON. Nada fica gravado no banco")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10, 100])
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--saida', default='benchmark.json', help="Arquivo JSON de resultados ('-' = stdout)")
+        parser.add_argument('--comparar', metavar='ARQUIVO', help="JSON de uma execução anterior")
+        parser.add_argument('--tolerancia', type=float, default=0.25,
+                            help="Aumento aceito na mediana antes de acusar regressão (0.25 = 25%%)")
+        parser.add_argument('--folga-ms', type=float, default=5, help="Diferença mínima, em ms, para acusar regressão")
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as arquivo:
+                    anterior = json.load(arquivo)
+            except (OSError, ValueError) as erro:
+                raise CommandError(f"Não foi possível ler {options['comparar']}: {erro}")
+
+        def progresso(escala, operacao):
+            self.stderr.write(f"[{escala}x] {operacao}")
+
+        resultado = benchmark.executar(options['escalas'], max(options['repeticoes'], 1), progresso)
+        texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+        if options['saida'] == '-':
+            self.stdout.write(texto)
+        else:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto + '\n')
+            for item in resultado['escalas']:
+                self.stdout.write(f"\n{item['escala']}x: {item['contagens']['salas']} salas, "
+                                  f"{item['contagens']['horarios']} horários (semeadura {item['semeadura_s']:.1f}s)")
+                for nome, medida in item['operacoes'].items():
+                    self.stdout.write(f"  {nome:<36}{medida['mediana_ms']:>10.1f} ms{medida['consultas']:>6} consultas")
+            self.stdout.write(self.style.SUCCESS(f"\nResultados em {options['saida']}"))
+
+        if anterior is not None:
+            regressoes = benchmark.comparar(resultado, anterior, options['tolerancia'], options['folga_ms'])
+            for escala, nome, antes, depois, razao in regressoes:
+                self.stderr.write(f"Regressão [{escala}x] {nome}: {antes:.1f} -> {depois:.1f} ms ({razao:.2f}x)")
+            if regressoes:
+                raise CommandError(f"{len(regressoes)} operação(ões) mais lenta(s) que {options['comparar']}")
+            self.stdout.write(f"Sem regressões em relação a {options['comparar']}.")
@@ -0,0 +1,95 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import ocupacao, semeadura
+from core.models import HorarioTurma, Semestre, Turma
+
+# Índices da migração 0009, medidos com e sem
+INDICES = [
+    (HorarioTurma, 'horario_dia_faixa_idx'),
+    (Turma, 'turma_semestre_ativo_idx'),
+    (Semestre, 'semestre_ativo_idx'),
+]
+
+
+def _indice(modelo, nome):
+    return next(indice for indice in modelo._meta.indexes if indice.name == nome)
+
+
+def _analisar():
+    # Estatísticas em dia para o planejador escolher entre os índices
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+class Command(BaseCommand):
+    help = ("Mede as consultas da agenda com e sem os índices compostos. Tudo roda em uma transação "
+            "desfeita no final (no PostgreSQL, os DROP INDEX travam as tabelas: use um banco de homologação)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semear', type=int, default=0, metavar='TURMAS',
+                            help="Semeia um campus sintético com esse número de turmas antes de medir")
+        parser.add_argument('--repeticoes', type=int, default=30)
+        parser.add_argument('--plano', action='store_true', help="Mostra o plano de execução de cada consulta")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['semear']:
+                turmas = options['semear']
+                salas_por_andar = max(turmas // 60, 4)
+                semeadura.semear_campus(predios=6, andares=4, salas_por_andar=salas_por_andar,
+                                        turmas=turmas, prefixo='BENCH')
+            self.stdout.write(f"{HorarioTurma.objects.count()} horários, {Turma.objects.count()} turmas")
+
+            consultas = self._consultas()
+            with connection.cursor() as cursor:
+                for _, nome in INDICES:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(nome)}')
+            _analisar()
+            sem = self._medir(consultas, options)
+            editor = connection.schema_editor()
+            with connection.cursor() as cursor:
+                for modelo, nome in INDICES:
+                    cursor.execute(str(_indice(modelo, nome).create_sql(modelo, editor)))
+            _analisar()
+            com = self._medir(consultas, options)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"\n{'consulta':<28}{'sem índices':>14}{'com índices':>14}{'ganho':>8}")
+        for nome in consultas:
+            self.stdout.write(f"{nome:<28}{sem[nome]:>11.3f} ms{com[nome]:>11.3f} ms{sem[nome] / com[nome]:>7.1f}x")
+
+    def _consultas(self):
+        # Segunda a sábado, de hora em hora: o "quais salas estão ocupadas agora"
+        segunda = datetime(2025, 8, 4)
+        momentos = [segunda + timedelta(days=dia, hours=hora, minutes=30) for dia in range(6) for hora in range(7, 22)]
+        return {
+            'salas ocupadas agora': lambda i: ocupacao.salas_ocupadas_no_banco(momentos[i % len(momentos)]),
+            'horários do semestre ativo': lambda i: list(ocupacao.linhas(ocupacao.horarios_ativos())),
+        }
+
+    def _medir(self, consultas, options):
+        medianas = {}
+        for nome, consulta in consultas.items():
+            consulta(0)   # aquece o cache de páginas do banco
+            tempos = []
+            for i in range(options['repeticoes']):
+                inicio = time.perf_counter()
+                consulta(i)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            medianas[nome] = statistics.median(tempos)
+            if options['plano']:
+                self._plano(nome)
+        return medianas
+
+    def _plano(self, nome):
+        querysets = {
+            'salas ocupadas agora': ocupacao.horarios_ativos().filter(
+                dia_semana=0, hora_inicio__lte='10:30', hora_fim__gt='10:30').order_by().values('sala_id').distinct(),
+            'horários do semestre ativo': ocupacao.linhas(ocupacao.horarios_ativos()),
+        }
+        self.stdout.write(f"-- {nome}\n{querysets[nome].explain()}")
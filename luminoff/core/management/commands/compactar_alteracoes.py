@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import alteracoes
+
+
+class Command(BaseCommand):
+    help = ("Apaga do feed de alterações da agenda as entradas mais antigas que LUMINOFF_ALTERACOES_RETENCAO; "
+            "controladores parados desde antes disso recebem o retrato completo")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help="Dias de alterações mantidos (padrão: LUMINOFF_ALTERACOES_RETENCAO)")
+        parser.add_argument('--publicar', action='store_true',
+                            help="Antes, compara a grade inteira com a publicada (ex.: após escritas direto no banco)")
+
+    def handle(self, *args, **options):
+        if options['publicar']:
+            self.stdout.write(f"{alteracoes.publicar()} alterações publicadas")
+        self.stdout.write(f"{alteracoes.compactar(options['dias'])} alterações antigas apagadas")
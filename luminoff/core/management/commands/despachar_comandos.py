@@ -0,0 +1,36 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core import despacho, metricas
+from core.dispositivos import carregar_driver
+
+
+class Command(BaseCommand):
+    help = ("Entrega aos controladores os comandos gravados pelo agendador. Vários processos podem rodar "
+            "em paralelo: cada um reserva lotes diferentes da fila")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', help="Caminho do driver (padrão: LUMINOFF_DRIVER_DISPOSITIVOS)")
+        parser.add_argument('--lote', type=int, help="Comandos reservados por vez (padrão: LUMINOFF_TAMANHO_LOTE)")
+        parser.add_argument('--limpar', action='store_true',
+                            help="Apaga os comandos encerrados mais antigos que LUMINOFF_RETENCAO_COMANDOS e sai")
+        parser.add_argument('--metricas-porta', type=int, metavar='PORTA',
+                            help="Expõe as métricas do processo (Prometheus) em http://127.0.0.1:PORTA/")
+
+    def handle(self, *args, **options):
+        if options['limpar']:
+            self.stdout.write(f"{despacho.limpar()} comandos antigos apagados")
+            return
+        if options['metricas_porta']:
+            metricas.servir(options['metricas_porta'])
+        asyncio.run(self._executar(despacho.Despachante(carregar_driver(options['driver']), options['lote'])))
+
+    async def _executar(self, despachante):
+        loop = asyncio.get_running_loop()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sinal, despachante.parar)
+        self.stdout.write("Despachante iniciado. Ctrl+C para encerrar.")
+        await despachante.executar()
+        self.stdout.write(self.style.SUCCESS("Despachante encerrado."))
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import anomalias
+from core.models import Sala
+
+
+class Command(BaseCommand):
+    help = "Procura salas consumindo energia fora dos horários de aula (rodar periodicamente, ex.: cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Reprocessa a partir deste momento (ISO 8601) em vez da última execução")
+        parser.add_argument('--top', type=int, default=20, help="Quantas salas listar no ranking")
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = datetime.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError(f"Data inválida: {options['desde']}")
+            if timezone.is_naive(desde):
+                desde = timezone.make_aware(desde)
+
+        execucao, desperdicios = anomalias.detectar(desde=desde)
+        if execucao is None:
+            self.stdout.write("Nada novo para processar.")
+            return
+
+        nomes = dict(Sala.objects.filter(pk__in=[item.sala_id for item in desperdicios[:options['top']]])
+                     .values_list('pk', 'nome'))
+        for item in desperdicios[:options['top']]:
+            self.stdout.write(f"{nomes.get(item.sala_id, item.sala_id)}: {item.kwh:.2f} kWh, {item.minutos} min "
+                              f"({timezone.localtime(item.inicio):%d/%m %H:%M} - {timezone.localtime(item.fim):%H:%M})")
+        self.stdout.write(self.style.SUCCESS(
+            f"Janela {execucao}: {execucao.leituras} leituras com consumo, "
+            f"{len(desperdicios)} salas fora da agenda, {execucao.alertas} alertas em {execucao.duracao:.2f}s"
+        ))
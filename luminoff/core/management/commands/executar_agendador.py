@@ -0,0 +1,76 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import metricas
+from core.agendador import Agendador
+from core.despacho import Despachante
+from core.dispositivos import carregar_driver
+from core.particionamento import Coordenador
+from core.presenca import MonitorPresenca
+
+
+class Command(BaseCommand):
+    help = "Executa o agendador que liga/desliga luzes e ar-condicionado das salas conforme os horários"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', help="Caminho do driver (padrão: LUMINOFF_DRIVER_DISPOSITIVOS)")
+        parser.add_argument('--antecedencia-ar', type=int, help="Minutos para ligar o ar antes da aula")
+        parser.add_argument('--tolerancia', type=int, help="Minutos para desligar após o fim da aula")
+        parser.add_argument('--sem-despacho', action='store_true',
+                            help="Só grava os comandos na fila; a entrega fica com o despachar_comandos")
+        parser.add_argument('--sem-presenca', action='store_true',
+                            help="Não desliga salas vazias antes do fim do horário (sensores de presença)")
+        parser.add_argument('--particionado', action='store_true',
+                            help="Divide os prédios com os outros processos iniciados assim (arrendamentos no banco)")
+        parser.add_argument('--metricas-porta', type=int, metavar='PORTA',
+                            help="Expõe as métricas do processo (Prometheus) em http://127.0.0.1:PORTA/")
+        parser.add_argument('--previsao', type=int, metavar='HORAS',
+                            help="Apenas lista as transições das próximas HORAS e sai")
+
+    def handle(self, *args, **options):
+        despachante = None if options['sem_despacho'] else Despachante(carregar_driver(options['driver']))
+        agendador = Agendador(
+            antecedencia_ar=options['antecedencia_ar'],
+            tolerancia=options['tolerancia'],
+            ao_registrar=despachante.acordar if despachante else None,
+        )
+        presenca = None
+        if not options['sem_presenca'] and getattr(settings, 'LUMINOFF_PRESENCA_ATIVA', True):
+            presenca = MonitorPresenca(ao_registrar=agendador.ao_registrar)
+        coordenador = None
+        if options['particionado'] and not options['previsao']:
+            # Nada é agendado até o primeiro batimento definir os prédios deste processo
+            servicos = [servico for servico in (agendador, despachante, presenca) if servico is not None]
+            for servico in servicos:
+                servico.predios = frozenset()
+            coordenador = Coordenador(ao_mudar=[servico.definir_predios for servico in servicos])
+
+        if options['previsao']:
+            agendador._carregar_do_banco()
+            for comando in agendador.previsao(timezone.localtime(), options['previsao']):
+                self.stdout.write(str(comando))
+            return
+
+        if options['metricas_porta']:
+            metricas.servir(options['metricas_porta'])
+        asyncio.run(self._executar(agendador, despachante, presenca, coordenador))
+
+    async def _executar(self, agendador, despachante, presenca, coordenador):
+        loop = asyncio.get_running_loop()
+        servicos = [servico for servico in (coordenador, agendador, despachante, presenca) if servico is not None]
+
+        def parar():
+            for servico in servicos:
+                servico.parar()
+
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sinal, parar)
+        if coordenador is not None:
+            self.stdout.write(f"Trabalhador {coordenador.nome}")
+        self.stdout.write("Agendador iniciado. Ctrl+C para encerrar.")
+        await asyncio.gather(*(servico.executar() for servico in servicos))
+        self.stdout.write(self.style.SUCCESS("Agendador encerrado."))
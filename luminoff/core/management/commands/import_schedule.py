@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import ErroImportacao, importar_horarios, ler_planilha
+from core.models import Semestre
+
+
+class Command(BaseCommand):
+    help = "Importa turmas e horários de uma planilha CSV/XLSX para um semestre"
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Planilha .csv ou .xlsx")
+        parser.add_argument('--semestre', required=True, help="Semestre de destino, ex.: 2025.2")
+        parser.add_argument('--simular', '--dry-run', action='store_true', dest='simular',
+                            help="Valida e relata conflitos sem gravar nada")
+        parser.add_argument('--ignorar-conflitos', action='store_true',
+                            help="Grava mesmo que o semestre fique com conflitos")
+        parser.add_argument('--lote', type=int, default=2000, help="Linhas por lote")
+
+    def handle(self, *args, **options):
+        try:
+            ano, periodo = (int(parte) for parte in options['semestre'].split('.'))
+            semestre = Semestre.objects.get(ano=ano, semestre=periodo)
+        except (ValueError, Semestre.DoesNotExist):
+            raise CommandError(f"Semestre {options['semestre']} não encontrado")
+
+        caminho = options['arquivo']
+        try:
+            if caminho.lower().endswith('.xlsx'):
+                arquivo = open(caminho, 'rb')
+            else:
+                arquivo = open(caminho, encoding='utf-8-sig', newline='')
+            with arquivo:
+                resultado = importar_horarios(
+                    ler_planilha(arquivo, caminho), semestre,
+                    simular=options['simular'],
+                    ignorar_conflitos=options['ignorar_conflitos'],
+                    tamanho_lote=options['lote'],
+                )
+        except (OSError, ErroImportacao) as erro:
+            raise CommandError(str(erro))
+
+        for numero, mensagem in resultado.erros:
+            self.stderr.write(f"Linha {numero}: {mensagem}")
+        for conflito in resultado.conflitos:
+            self.stderr.write(f"Conflito: {conflito.mensagem}")
+
+        self.stdout.write(str(resultado))
+        if resultado.gravado:
+            self.stdout.write(self.style.SUCCESS("Importação gravada."))
+        elif options['simular']:
+            self.stdout.write("Simulação: nada foi gravado.")
+        else:
+            raise CommandError("Importação desfeita por conflitos (use --ignorar-conflitos para gravar assim mesmo)")
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import telemetria
+
+
+class Command(BaseCommand):
+    help = "Ingere leituras dos sensores (NDJSON ou CSV) e aplica a retenção da telemetria"
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', nargs='?', help="Arquivo .ndjson/.csv ou '-' para a entrada padrão")
+        parser.add_argument('--formato', choices=['ndjson', 'csv'],
+                            help="Formato das linhas (padrão: pela extensão; entrada padrão = ndjson)")
+        parser.add_argument('--lote', type=int, help="Leituras acumuladas antes de cada gravação")
+        parser.add_argument('--retencao', action='store_true',
+                            help="Apaga os agregados mais antigos que LUMINOFF_RETENCAO_TELEMETRIA")
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        if not caminho and not options['retencao']:
+            raise CommandError("Informe um arquivo (ou '-') e/ou --retencao")
+
+        if caminho:
+            formato = options['formato'] or ('csv' if caminho.lower().endswith('.csv') else 'ndjson')
+            leitor = telemetria.ler_csv if formato == 'csv' else telemetria.ler_ndjson
+            try:
+                arquivo = sys.stdin if caminho == '-' else open(caminho, encoding='utf-8-sig', newline='')
+                with arquivo:
+                    resultado = telemetria.ingerir(leitor(arquivo), options['lote'])
+            except OSError as erro:
+                raise CommandError(str(erro))
+            for numero, mensagem in resultado.erros:
+                self.stderr.write(f"Linha {numero}: {mensagem}")
+            self.stdout.write(str(resultado))
+
+        if options['retencao']:
+            for tabela, apagadas in telemetria.aplicar_retencao().items():
+                self.stdout.write(f"Retenção ({tabela}): {apagadas} linhas apagadas")
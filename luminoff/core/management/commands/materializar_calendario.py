@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import calendario
+
+
+class Command(BaseCommand):
+    help = "Expande a grade semanal em ocupações por data (feriados, cancelamentos e reservas aplicados)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Primeira data (AAAA-MM-DD); padrão: hoje")
+        parser.add_argument('--dias', type=int, default=14, help="Quantos dias materializar")
+        parser.add_argument('--refazer', action='store_true', help="Descarta tudo e expande de novo")
+
+    def handle(self, *args, **options):
+        try:
+            inicio = date.fromisoformat(options['desde']) if options['desde'] else timezone.localdate()
+        except ValueError:
+            raise CommandError(f"Data inválida: {options['desde']}")
+        if options['refazer']:
+            calendario.invalidar_tudo()
+        fim = inicio + timedelta(days=max(options['dias'], 1) - 1)
+        calendario.garantir(calendario.periodo(inicio, fim))
+        total = calendario.ocupacao_periodo(inicio, fim).count()
+        self.stdout.write(self.style.SUCCESS(f"{inicio:%d/%m/%Y} a {fim:%d/%m/%Y}: {total} intervalos de ocupação"))
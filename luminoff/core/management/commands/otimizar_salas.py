@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import alocacao
+from core.models import Semestre
+
+
+class Command(BaseCommand):
+    help = "Propõe (e opcionalmente grava) uma alocação de salas que concentra as aulas em menos andares e prédios"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semestre', help="Semestre, ex.: 2025.2 (padrão: o ativo)")
+        parser.add_argument('--aplicar', action='store_true', help="Grava a proposta")
+        parser.add_argument('--tempo-busca', type=float, help="Segundos máximos da busca local")
+
+    def handle(self, *args, **options):
+        try:
+            if options['semestre']:
+                ano, periodo = (int(parte) for parte in options['semestre'].split('.'))
+                semestre = Semestre.objects.get(ano=ano, semestre=periodo)
+            else:
+                semestre = Semestre.objects.get(ativo=True)
+        except (ValueError, Semestre.DoesNotExist, Semestre.MultipleObjectsReturned):
+            raise CommandError("Semestre não encontrado (informe --semestre ANO.PERIODO)")
+
+        proposta = alocacao.propor(semestre, options['tempo_busca'])
+        self.stdout.write(f"{proposta} (salas usadas {proposta.antes['salas_usadas']} -> "
+                          f"{proposta.depois['salas_usadas']}, {proposta.duracao:.1f}s)")
+        if proposta.sem_sala:
+            self.stderr.write(f"{len(proposta.sem_sala)} horário(s) sem sala compatível livre (mantidos)")
+        if options['aplicar']:
+            self.stdout.write(self.style.SUCCESS(f"{alocacao.aplicar(proposta)} horário(s) gravados."))
+        else:
+            self.stdout.write("Prévia: use --aplicar para gravar.")
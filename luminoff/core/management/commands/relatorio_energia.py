@@ -0,0 +1,45 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.energia import simular_semestre
+from core.models import Semestre
+
+
+class Command(BaseCommand):
+    help = "Estima consumo e economia de energia do semestre (agenda x sempre ligado)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semestre', help="Ex.: 2025.2 (padrão: semestre ativo)")
+        parser.add_argument('--json', action='store_true', help="Saída completa em JSON")
+
+    def handle(self, *args, **options):
+        try:
+            if options['semestre']:
+                ano, periodo = (int(parte) for parte in options['semestre'].split('.'))
+                semestre = Semestre.objects.get(ano=ano, semestre=periodo)
+            else:
+                semestre = Semestre.objects.get(ativo=True)
+        except (ValueError, Semestre.DoesNotExist, Semestre.MultipleObjectsReturned):
+            raise CommandError("Semestre não encontrado (informe --semestre ANO.PERIODO)")
+
+        inicio = time.perf_counter()
+        relatorio = simular_semestre(semestre)
+        duracao = time.perf_counter() - inicio
+
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio.como_dict(), ensure_ascii=False, indent=2))
+            return
+
+        total = relatorio.total
+        self.stdout.write(f"Semestre {semestre}: {len(relatorio.salas)} salas, simulado em {duracao:.3f}s")
+        for predio in relatorio.predios:
+            self.stdout.write(
+                f"  {predio['localizacao']}: {predio['kwh_agenda']:.0f} kWh pela agenda, "
+                f"{predio['kwh_sempre_ligado']:.0f} kWh sempre ligado, economia de "
+                f"{predio['kwh_economia']:.0f} kWh (R$ {predio['custo_economia']:.2f})"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: economia de {total['kwh_economia']:.0f} kWh (R$ {total['custo_economia']:.2f})"
+        ))
@@ -0,0 +1,55 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import alteracoes, calendario, ocupacao, semeadura, versao
+from core.models import HorarioTurma, Sala, Turma
+
+
+class Command(BaseCommand):
+    help = "Gera um campus sintético (prédios, salas, professores, turmas e grade) com inserções em lote"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=int, default=1,
+                            help="Multiplica prédios e turmas (1 = 30 salas e 150 turmas)")
+        parser.add_argument('--predios', type=int)
+        parser.add_argument('--andares', type=int)
+        parser.add_argument('--salas-por-andar', type=int)
+        parser.add_argument('--turmas', type=int)
+        parser.add_argument('--horarios-por-turma', type=int, default=2)
+        parser.add_argument('--semestre', default='2025.2', help="Semestre de destino (passa a ser o ativo)")
+        parser.add_argument('--prefixo', default='S', help="Prefixo dos nomes de salas, disciplinas e usuários")
+        parser.add_argument('--semente', type=int, default=0, help="Semente do sorteio (mesma semente, mesmo campus)")
+
+    def handle(self, *args, **options):
+        try:
+            ano, periodo = (int(parte) for parte in options['semestre'].split('.'))
+        except ValueError:
+            raise CommandError("Semestre inválido (use ANO.PERIODO)")
+        prefixo = options['prefixo']
+        do_prefixo = Sala.objects.filter(nome__regex=rf'^{re.escape(prefixo)}\d{{2}}-')
+        if do_prefixo.exists():
+            raise CommandError(f"Já existe um campus com o prefixo {prefixo!r} (use outro --prefixo)")
+
+        parametros = semeadura.dimensoes(options['escala'])
+        for nome in parametros:
+            if options[nome] is not None:
+                parametros[nome] = options[nome]
+        inicio = time.perf_counter()
+        semestre = semeadura.semear_campus(
+            **parametros, horarios_por_turma=options['horarios_por_turma'],
+            ano=ano, periodo=periodo, prefixo=prefixo, semente=options['semente'],
+        )
+        # bulk_create não dispara sinais: derrubados à mão, como na importação
+        ocupacao.invalidar()
+        calendario.invalidar_tudo()
+        versao.incrementar_salas()
+        alteracoes.publicar()
+
+        salas = do_prefixo.count()
+        turmas = Turma.objects.filter(semestre=semestre).count()
+        horarios = HorarioTurma.objects.filter(turma__semestre=semestre).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Semestre {semestre}: {salas} salas, {turmas} turmas, {horarios} horários "
+            f"em {time.perf_counter() - inicio:.1f}s"))
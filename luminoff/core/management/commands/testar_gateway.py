@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.dispositivos import DESLIGAR, DISPOSITIVOS, Comando
+from core.gateway import ControladorFalso, ErroControlador, GatewayDispositivos
+
+
+class Command(BaseCommand):
+    help = "Teste de carga do gateway contra um controlador falso em processo"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salas', type=int, default=300)
+        parser.add_argument('--predios', type=int, default=10)
+        parser.add_argument('--latencia', type=float, default=0.02, help="Latência simulada por requisição (s)")
+        parser.add_argument('--falhas', type=float, default=0.0, help="Fração de requisições que falham")
+        parser.add_argument('--lote', type=int, default=25, help="Comandos por requisição")
+        parser.add_argument('--tentativas', type=int, default=None)
+
+    def handle(self, *args, **options):
+        asyncio.run(self._executar(**options))
+
+    async def _executar(self, salas, predios, latencia, falhas, lote, tentativas, **options):
+        async with ControladorFalso(latencia=latencia, taxa_falhas=falhas) as controlador:
+            gateway = GatewayDispositivos(controlador_padrao=controlador.endereco, tentativas=tentativas)
+            gateway.tamanho_lote = lote
+            gateway.definir_mapa({}, {sala_id: f"Prédio {sala_id % predios}" for sala_id in range(salas)})
+
+            agora = timezone.localtime()
+            comandos = [Comando(sala_id, dispositivo, DESLIGAR, agora)
+                        for sala_id in range(salas) for dispositivo in DISPOSITIVOS]
+
+            inicio = time.perf_counter()
+            try:
+                await gateway.enviar(comandos)
+            except ErroControlador as erro:
+                self.stderr.write(str(erro))
+            duracao = time.perf_counter() - inicio
+            enviados = len(controlador.ids_recebidos)
+
+            # Reenvio: os IDs já aceitos devem ser reconhecidos como duplicados
+            try:
+                await gateway.enviar(comandos)
+            except ErroControlador as erro:
+                self.stderr.write(str(erro))
+            await gateway.fechar()
+
+        self.stdout.write(
+            f"{enviados} comandos em {duracao:.3f}s ({enviados / duracao:.0f}/s), "
+            f"{controlador.requisicoes} requisições, {controlador.duplicados} duplicados ignorados no reenvio"
+        )
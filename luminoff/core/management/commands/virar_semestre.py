@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Semestre
+from core.virada import ErroVirada, ler_trocas, virar_semestre
+
+
+def _semestre(valor):
+    try:
+        ano, periodo = (int(parte) for parte in valor.split('.'))
+        return Semestre.objects.get(ano=ano, semestre=periodo)
+    except (ValueError, Semestre.DoesNotExist):
+        raise CommandError(f"Semestre {valor} não encontrado")
+
+
+class Command(BaseCommand):
+    help = "Copia as turmas ativas e os horários de um semestre para outro"
+
+    def add_arguments(self, parser):
+        parser.add_argument('origem', help="Semestre de origem, ex.: 2025.1")
+        parser.add_argument('destino', help="Semestre de destino, ex.: 2025.2")
+        parser.add_argument('--trocas', help="CSV tipo,de,para (professor por matrícula, sala por nome)")
+        parser.add_argument('--simular', '--dry-run', action='store_true', dest='simular',
+                            help="Valida e relata conflitos sem gravar nada")
+        parser.add_argument('--ignorar-conflitos', action='store_true',
+                            help="Grava mesmo que o semestre destino fique com conflitos")
+
+    def handle(self, *args, **options):
+        origem, destino = _semestre(options['origem']), _semestre(options['destino'])
+        try:
+            professores, salas = {}, {}
+            if options['trocas']:
+                with open(options['trocas'], encoding='utf-8-sig', newline='') as arquivo:
+                    professores, salas = ler_trocas(arquivo)
+            resultado = virar_semestre(origem, destino, professores, salas, simular=options['simular'],
+                                       ignorar_conflitos=options['ignorar_conflitos'])
+        except (OSError, ErroVirada) as erro:
+            raise CommandError(str(erro))
+
+        for conflito in resultado.conflitos:
+            self.stderr.write(f"Conflito: {conflito.mensagem}")
+        self.stdout.write(str(resultado))
+        if resultado.gravado:
+            self.stdout.write(self.style.SUCCESS("Cópia gravada."))
+        elif options['simular']:
+            self.stdout.write("Simulação: nada foi gravado.")
+        else:
+            raise CommandError("Cópia cancelada por conflitos (use --ignorar-conflitos para gravar assim mesmo)")
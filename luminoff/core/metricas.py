@@ -0,0 +1,246 @@
+"""
+Métricas do processo no formato texto do Prometheus.
+
+Contadores, medidores e histogramas ficam em memória, um registro por
+processo: registrar uma observação é uma soma sob um lock, sem E/S, e pode
+ficar ligado em produção. ``exportar`` gera o texto servido em
+``/metricas/`` (só para ``LUMINOFF_METRICAS_IPS`` ou com o token da API).
+
+Cada processo expõe as suas: o web pela URL, o agendador e os despachantes
+pela porta de ``--metricas-porta`` (``servir``). O Prometheus coleta cada um
+e agrega.
+
+O que é medido:
+
+- requisições: latência por view e status, consultas ao banco e tempo de
+  banco por requisição, consultas lentas (``middleware``);
+- agendador: transições gravadas, atraso entre o horário da transição e a
+  gravação, duração da recompilação, salas acompanhadas;
+- despacho: comandos entregues/adiados, duração do envio ao driver e latência
+  entre o horário agendado e a confirmação.
+"""
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registro = {}   # nome -> métrica, na ordem de criação
+_lock_registro = threading.Lock()
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _formatar(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}   # valores dos rótulos -> estado
+        self._lock = threading.Lock()
+
+    def _rotulos(self, valores, extra=()):
+        pares = [*zip(self.rotulos, valores), *extra]
+        if not pares:
+            return ''
+        return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+    def linhas(self):
+        yield f'# HELP {self.nome} {self.ajuda}'
+        yield f'# TYPE {self.nome} {self.tipo}'
+        with self._lock:
+            valores = [(rotulos, self._copia(estado)) for rotulos, estado in self._valores.items()]
+        for rotulos, estado in sorted(valores):
+            yield from self._amostras(rotulos, estado)
+
+    def _copia(self, estado):
+        return estado
+
+    def _amostras(self, rotulos, valor):
+        yield f'{self.nome}{self._rotulos(rotulos)} {_formatar(valor)}'
+
+    def limpar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, rotulos=()):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def valor(self, rotulos=()):
+        return self._valores.get(rotulos, 0)
+
+
+class Medidor(_Metrica):
+    tipo = 'gauge'
+
+    def definir(self, valor, rotulos=()):
+        with self._lock:
+            self._valores[rotulos] = valor
+
+    def valor(self, rotulos=()):
+        return self._valores.get(rotulos, 0)
+
+
+class Histograma(_Metrica):
+    """Histograma de limites fixos (``le``); guarda contagens por faixa, soma e total."""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor, rotulos=()):
+        faixa = bisect_left(self.limites, valor)
+        with self._lock:
+            estado = self._valores.get(rotulos)
+            if estado is None:
+                estado = self._valores[rotulos] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            estado[0][faixa] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def observar_varios(self, valores, rotulos=()):
+        """Várias observações com uma só aquisição do lock (ex.: um lote de comandos)."""
+        faixas = [bisect_left(self.limites, valor) for valor in valores]
+        with self._lock:
+            estado = self._valores.get(rotulos)
+            if estado is None:
+                estado = self._valores[rotulos] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            for faixa in faixas:
+                estado[0][faixa] += 1
+            estado[1] += sum(valores)
+            estado[2] += len(faixas)
+
+    def total(self, rotulos=()):
+        estado = self._valores.get(rotulos)
+        return estado[2] if estado else 0
+
+    def _copia(self, estado):
+        return list(estado[0]), estado[1], estado[2]
+
+    def _amostras(self, rotulos, estado):
+        contagens, soma, total = estado
+        acumulado = 0
+        for limite, contagem in zip((*self.limites, float('inf')), contagens):
+            acumulado += contagem
+            yield f'{self.nome}_bucket{self._rotulos(rotulos, [("le", _formatar(limite))])} {acumulado}'
+        yield f'{self.nome}_sum{self._rotulos(rotulos)} {_formatar(soma)}'
+        yield f'{self.nome}_count{self._rotulos(rotulos)} {total}'
+
+
+def _registrar(classe, nome, *args, **kwargs):
+    with _lock_registro:
+        if nome not in _registro:
+            _registro[nome] = classe(nome, *args, **kwargs)
+        return _registro[nome]
+
+
+def contador(nome, ajuda, rotulos=()):
+    return _registrar(Contador, nome, ajuda, rotulos)
+
+
+def medidor(nome, ajuda, rotulos=()):
+    return _registrar(Medidor, nome, ajuda, rotulos)
+
+
+def histograma(nome, ajuda, rotulos=(), limites=SEGUNDOS):
+    return _registrar(Histograma, nome, ajuda, rotulos, limites)
+
+
+def exportar():
+    """Todas as métricas do processo no formato texto do Prometheus."""
+    with _lock_registro:
+        metricas = list(_registro.values())
+    return ''.join(f'{linha}\n' for metrica in metricas for linha in metrica.linhas())
+
+
+def limpar():
+    """Zera as observações (testes)."""
+    for metrica in list(_registro.values()):
+        metrica.limpar()
+
+
+# -- métricas da aplicação ---------------------------------------------------
+
+REQUISICOES = histograma('luminoff_http_requisicao_segundos', "Duração das requisições por view",
+                         ('view', 'metodo', 'status'))
+CONSULTAS = histograma('luminoff_db_consultas_por_requisicao', "Consultas ao banco por requisição", ('view',),
+                       limites=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+TEMPO_BANCO = contador('luminoff_db_segundos_total', "Tempo gasto em consultas ao banco", ('view',))
+CONSULTAS_LENTAS = contador('luminoff_db_consultas_lentas_total',
+                            "Consultas acima de LUMINOFF_METRICAS_CONSULTA_LENTA", ('view',))
+
+TRANSICOES = contador('luminoff_agendador_transicoes_total', "Transições gravadas na fila pelo agendador",
+                      ('dispositivo', 'acao'))
+ATRASO_TRANSICAO = histograma('luminoff_agendador_atraso_segundos',
+                              "Atraso entre o horário da transição e a gravação na fila")
+RECOMPILACAO = histograma('luminoff_agendador_recompilacao_segundos', "Duração da recompilação da agenda")
+SALAS_AGENDADAS = medidor('luminoff_agendador_salas', "Salas acompanhadas pelo agendador")
+
+COMANDOS = contador('luminoff_comandos_total', "Comandos processados pelos despachantes", ('resultado',))
+ENVIO_LOTE = histograma('luminoff_despacho_envio_segundos', "Duração da entrega de um lote ao driver")
+LATENCIA_COMANDO = histograma('luminoff_comando_latencia_segundos',
+                              "Do horário agendado do comando à confirmação da entrega")
+
+
+# -- exposição ----------------------------------------------------------------
+
+def _autorizado(request):
+    token = _config('LUMINOFF_API_TOKEN', None)
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    return request.META.get('REMOTE_ADDR') in _config('LUMINOFF_METRICAS_IPS', ('127.0.0.1', '::1'))
+
+
+def expor(request):
+    """``GET /metricas/``: as métricas deste processo."""
+    if not _autorizado(request):
+        return HttpResponseForbidden()
+    return HttpResponse(exportar(), content_type=CONTENT_TYPE)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        corpo = exportar().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def servir(porta, endereco='127.0.0.1'):
+    """Serve ``exportar`` em HTTP numa thread (processos sem servidor web).
+
+    Retorna o servidor; ``shutdown()`` encerra.
+    """
+    servidor = ThreadingHTTPServer((endereco, porta), _Handler)
+    threading.Thread(target=servidor.serve_forever, name='metricas', daemon=True).start()
+    return servidor
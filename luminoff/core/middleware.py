@@ -0,0 +1,108 @@
+"""
+Middleware de instrumentação das requisições (``metricas``).
+
+Mede a latência de cada requisição, rotulada pelo nome da view (rotas não
+resolvidas viram "-", para não multiplicar séries com URLs arbitrárias). Um
+``connection.execute_wrapper`` conta as consultas e o tempo de banco;
+consultas acima de ``LUMINOFF_METRICAS_CONSULTA_LENTA`` milissegundos são
+registradas no log com a view que as fez.
+
+Sob ASGI a conexão é da thread em que as views síncronas e o ORM assíncrono
+rodam (``sync_to_async`` com ``thread_sensitive``), não da do event loop: o
+wrapper é instalado e retirado nessa thread. O ``ASGIHandler`` dá uma thread
+dessas a cada requisição, então as contagens não se misturam.
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _view(request):
+    rota = getattr(request, 'resolver_match', None)
+    return rota.view_name if rota is not None else '-'
+
+
+class _Consultas:
+    """``execute_wrapper`` que conta as consultas e o tempo de banco da requisição."""
+
+    __slots__ = ('request', 'lenta', 'quantidade', 'segundos')
+
+    def __init__(self, request, lenta):
+        self.request = request
+        self.lenta = lenta
+        self.quantidade = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.quantidade += 1
+            self.segundos += duracao
+            if duracao >= self.lenta:
+                view = _view(self.request)
+                metricas.CONSULTAS_LENTAS.inc(rotulos=(view,))
+                logger.warning("Consulta lenta (%.0f ms) em %s: %s", duracao * 1000, view, sql[:1000])
+
+
+def _instalar(consultas):
+    connection.execute_wrappers.append(consultas)
+
+
+def _retirar(consultas):
+    connection.execute_wrappers.remove(consultas)
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ativo = _config('LUMINOFF_METRICAS_ATIVAS', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.ativo:
+            return self.get_response(request)
+        consultas = _Consultas(request, _config('LUMINOFF_METRICAS_CONSULTA_LENTA', 500) / 1000)
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(consultas):
+            response = self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio, consultas)
+        return response
+
+    async def __acall__(self, request):
+        if not self.ativo:
+            return await self.get_response(request)
+        consultas = _Consultas(request, _config('LUMINOFF_METRICAS_CONSULTA_LENTA', 500) / 1000)
+        inicio = time.perf_counter()
+        await sync_to_async(_instalar)(consultas)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_retirar)(consultas)
+        self._registrar(request, response, time.perf_counter() - inicio, consultas)
+        return response
+
+    def _registrar(self, request, response, duracao, consultas):
+        view = _view(request)
+        metricas.REQUISICOES.observar(duracao, (view, request.method, f'{response.status_code // 100}xx'))
+        metricas.CONSULTAS.observar(consultas.quantidade, (view,))
+        metricas.TEMPO_BANCO.inc(consultas.segundos, (view,))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_sala_andar_alter_sala_localizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dispositivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('luz', 'Iluminação'), ('ar', 'Ar-condicionado')], max_length=3)),
+                ('identificador', models.CharField(help_text='ID do relé no controlador', max_length=50)),
+                ('controlador', models.CharField(blank=True, help_text='host:porta do controlador do prédio (vazio = controlador padrão)', max_length=200)),
+                ('ativo', models.BooleanField(default=True)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dispositivos', to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Dispositivo',
+                'verbose_name_plural': 'Dispositivos',
+                'ordering': ['sala', 'tipo', 'identificador'],
+                'unique_together': {('sala', 'tipo', 'identificador')},
+            },
+        ),
+    ]
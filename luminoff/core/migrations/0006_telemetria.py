@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_dispositivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetriaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(help_text='Início do intervalo')),
+                ('ocupacao_soma', models.FloatField(default=0)),
+                ('ocupacao_n', models.IntegerField(default=0)),
+                ('corrente_soma', models.FloatField(default=0, help_text='Ampères')),
+                ('corrente_n', models.IntegerField(default=0)),
+                ('corrente_max', models.FloatField(blank=True, null=True)),
+                ('temperatura_soma', models.FloatField(default=0, help_text='°C')),
+                ('temperatura_n', models.IntegerField(default=0)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Telemetria por dia',
+                'verbose_name_plural': 'Telemetria por dia',
+                'ordering': ['sala', 'inicio'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['inicio'], name='core_teleme_inicio_469b30_idx')],
+                'unique_together': {('sala', 'inicio')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetriaHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(help_text='Início do intervalo')),
+                ('ocupacao_soma', models.FloatField(default=0)),
+                ('ocupacao_n', models.IntegerField(default=0)),
+                ('corrente_soma', models.FloatField(default=0, help_text='Ampères')),
+                ('corrente_n', models.IntegerField(default=0)),
+                ('corrente_max', models.FloatField(blank=True, null=True)),
+                ('temperatura_soma', models.FloatField(default=0, help_text='°C')),
+                ('temperatura_n', models.IntegerField(default=0)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Telemetria por hora',
+                'verbose_name_plural': 'Telemetria por hora',
+                'ordering': ['sala', 'inicio'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['inicio'], name='core_teleme_inicio_897cdd_idx')],
+                'unique_together': {('sala', 'inicio')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetriaMinuto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(help_text='Início do intervalo')),
+                ('ocupacao_soma', models.FloatField(default=0)),
+                ('ocupacao_n', models.IntegerField(default=0)),
+                ('corrente_soma', models.FloatField(default=0, help_text='Ampères')),
+                ('corrente_n', models.IntegerField(default=0)),
+                ('corrente_max', models.FloatField(blank=True, null=True)),
+                ('temperatura_soma', models.FloatField(default=0, help_text='°C')),
+                ('temperatura_n', models.IntegerField(default=0)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Telemetria por minuto',
+                'verbose_name_plural': 'Telemetria por minuto',
+                'ordering': ['sala', 'inicio'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['inicio'], name='core_teleme_inicio_ddc6f2_idx')],
+                'unique_together': {('sala', 'inicio')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_telemetria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoAnomalias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField()),
+                ('leituras', models.IntegerField(default=0)),
+                ('alertas', models.IntegerField(default=0)),
+                ('duracao', models.FloatField(default=0, help_text='Segundos')),
+                ('executada_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Execução da detecção de anomalias',
+                'verbose_name_plural': 'Execuções da detecção de anomalias',
+                'ordering': ['-fim'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlertaConsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(help_text='Primeiro minuto com consumo fora da agenda')),
+                ('fim', models.DateTimeField(help_text='Último minuto com consumo fora da agenda')),
+                ('minutos', models.IntegerField(default=0)),
+                ('kwh', models.FloatField(default=0, help_text='Energia estimada fora da agenda')),
+                ('resolvido', models.BooleanField(default=False)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas_consumo', to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Alerta de consumo',
+                'verbose_name_plural': 'Alertas de consumo',
+                'ordering': ['resolvido', '-kwh'],
+                'indexes': [models.Index(fields=['sala', 'resolvido', 'fim'], name='core_alerta_sala_id_a2e049_idx')],
+            },
+        ),
+    ]
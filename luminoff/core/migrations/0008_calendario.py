@@ -0,0 +1,103 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alertas_consumo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaMaterializado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True)),
+                ('materializado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Dia materializado',
+                'verbose_name_plural': 'Dias materializados',
+            },
+        ),
+        migrations.CreateModel(
+            name='Feriado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(max_length=200)),
+                ('tipo', models.CharField(choices=[('feriado', 'Feriado'), ('recesso', 'Recesso'), ('provas', 'Semana de provas')], default='feriado', max_length=10)),
+                ('data_inicio', models.DateField()),
+                ('data_fim', models.DateField(help_text='Igual ao início para um único dia')),
+            ],
+            options={
+                'verbose_name': 'Feriado',
+                'verbose_name_plural': 'Feriados',
+                'ordering': ['data_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReservaExtra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fim', models.TimeField()),
+                ('descricao', models.CharField(max_length=200)),
+                ('responsavel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas', to=settings.AUTH_USER_MODEL)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Reserva extra',
+                'verbose_name_plural': 'Reservas extras',
+                'ordering': ['data', 'hora_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CancelamentoAula',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+                ('horario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cancelamentos', to='core.horarioturma')),
+            ],
+            options={
+                'verbose_name': 'Cancelamento de aula',
+                'verbose_name_plural': 'Cancelamentos de aula',
+                'ordering': ['data'],
+                'unique_together': {('horario', 'data')},
+            },
+        ),
+        migrations.CreateModel(
+            name='OcupacaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fim', models.TimeField()),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacoes', to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Ocupação diária',
+                'verbose_name_plural': 'Ocupações diárias',
+                'ordering': ['data', 'sala', 'hora_inicio'],
+                'indexes': [models.Index(fields=['data', 'sala'], name='core_ocupac_data_6708cc_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PendenciaOcupacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.sala')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['data'], name='core_penden_data_ccc8e5_idx')],
+                'unique_together': {('sala', 'data')},
+            },
+        ),
+    ]
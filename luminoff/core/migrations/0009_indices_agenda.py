@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_calendario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='horarioturma',
+            index=models.Index(fields=['dia_semana', 'hora_inicio', 'hora_fim', 'sala'], name='horario_dia_faixa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='semestre',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['ativo'], name='semestre_ativo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='turma',
+            index=models.Index(fields=['semestre', 'ativo'], name='turma_semestre_ativo_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_agenda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComandoDispositivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dispositivo', models.CharField(choices=[('luz', 'Iluminação'), ('ar', 'Ar-condicionado')], max_length=3)),
+                ('acao', models.CharField(choices=[('ligar', 'Ligar'), ('desligar', 'Desligar')], max_length=8)),
+                ('agendado_para', models.DateTimeField(help_text='Momento da transição calculada pelo agendador')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('enviando', 'Enviando'), ('confirmado', 'Confirmado'), ('substituido', 'Substituído por um comando mais novo'), ('falhou', 'Falhou (tentativas esgotadas)')], default='pendente', max_length=11)),
+                ('tentativas', models.IntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(help_text='Não é reservado antes disso (backoff)')),
+                ('reserva', models.UUIDField(blank=True, help_text='Lote do despachante que está enviando', null=True)),
+                ('reservado_ate', models.DateTimeField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('confirmado_em', models.DateTimeField(blank=True, null=True)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comandos', to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Comando de dispositivo',
+                'verbose_name_plural': 'Comandos de dispositivos',
+                'ordering': ['-agendado_para'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='comando_fila_idx'), models.Index(fields=['sala', 'dispositivo', 'agendado_para'], name='comando_sala_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sala', 'dispositivo', 'acao', 'agendado_para'), name='comando_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def criar_predios(apps, schema_editor):
+    """Um prédio por localização distinta das salas já cadastradas"""
+    Predio = apps.get_model('core', 'Predio')
+    Sala = apps.get_model('core', 'Sala')
+    nomes = {localizacao.strip() for localizacao in Sala.objects.values_list('localizacao', flat=True)} - {''}
+    Predio.objects.bulk_create([Predio(nome=nome) for nome in sorted(nomes)])
+    for predio in Predio.objects.all():
+        Sala.objects.filter(localizacao=predio.nome).update(predio=predio)
+    # Localizações com espaços sobrando
+    for sala in Sala.objects.filter(predio__isnull=True).exclude(localizacao=''):
+        sala.predio = Predio.objects.get(nome=sala.localizacao.strip())
+        sala.save(update_fields=['predio'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_fila_comandos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Predio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=200, unique=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Prédio',
+                'verbose_name_plural': 'Prédios',
+                'ordering': ['nome'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrabalhadorAgendador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=200, unique=True)),
+                ('iniciado_em', models.DateTimeField(auto_now_add=True)),
+                ('visto_em', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Trabalhador do agendador',
+                'verbose_name_plural': 'Trabalhadores do agendador',
+                'ordering': ['nome'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sala',
+            name='predio',
+            field=models.ForeignKey(blank=True, help_text='Preenchido a partir da localização', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='salas', to='core.predio'),
+        ),
+        migrations.CreateModel(
+            name='ArrendamentoPredio',
+            fields=[
+                ('predio', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='arrendamento', serialize=False, to='core.predio')),
+                ('trabalhador', models.CharField(blank=True, max_length=200)),
+                ('expira_em', models.DateTimeField(blank=True, help_text='Vencido = livre para outro trabalhador', null=True)),
+            ],
+            options={
+                'verbose_name': 'Arrendamento de prédio',
+                'verbose_name_plural': 'Arrendamentos de prédios',
+                'ordering': ['predio'],
+                'indexes': [models.Index(fields=['trabalhador'], name='core_arrend_trabalh_12d5ee_idx')],
+            },
+        ),
+        migrations.RunPython(criar_predios, migrations.RunPython.noop),
+    ]
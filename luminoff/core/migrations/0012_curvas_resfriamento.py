@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_predios_e_arrendamentos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurvaResfriamento',
+            fields=[
+                ('sala', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='curva_resfriamento', serialize=False, to='core.sala')),
+                ('amostras', models.FloatField(default=0, help_text='Peso acumulado (amostras antigas pesam menos)')),
+                ('soma_x', models.FloatField(default=0)),
+                ('soma_y', models.FloatField(default=0)),
+                ('soma_xx', models.FloatField(default=0)),
+                ('soma_xy', models.FloatField(default=0)),
+                ('minutos_base', models.FloatField(default=0)),
+                ('minutos_por_grau', models.FloatField(default=0)),
+                ('episodios', models.IntegerField(default=0, help_text='Partidas do ar usadas no ajuste')),
+                ('processado_ate', models.DateTimeField(help_text='Fim da janela do último ajuste')),
+                ('atualizada_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Curva de resfriamento',
+                'verbose_name_plural': 'Curvas de resfriamento',
+                'ordering': ['sala'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_curvas_resfriamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comandodispositivo',
+            name='origem',
+            field=models.CharField(choices=[('agenda', 'Agenda'), ('presenca', 'Sensor de presença')], default='agenda', max_length=8),
+        ),
+        migrations.CreateModel(
+            name='DesligamentoAusencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField(blank=True, help_text='Religada ou fim da janela da agenda', null=True)),
+                ('minutos', models.FloatField(default=0)),
+                ('kwh', models.FloatField(default=0, help_text='Energia economizada em relação à agenda')),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='desligamentos_ausencia', to='core.sala')),
+            ],
+            options={
+                'verbose_name': 'Desligamento por ausência',
+                'verbose_name_plural': 'Desligamentos por ausência',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['fim', 'sala'], name='desligamento_aberto_idx')],
+            },
+        ),
+    ]
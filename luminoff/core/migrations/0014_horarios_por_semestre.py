@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copiar_semestre(apps, schema_editor):
+    """Preenche o semestre dos horários existentes a partir da turma"""
+    HorarioTurma = apps.get_model('core', 'HorarioTurma')
+    Turma = apps.get_model('core', 'Turma')
+    HorarioTurma.objects.update(
+        semestre_id=Subquery(Turma.objects.filter(pk=OuterRef('turma_id')).values('semestre_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_desligamento_por_ausencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horarioturma',
+            name='semestre',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='horarios', to='core.semestre'),
+        ),
+        migrations.RunPython(copiar_semestre, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='horarioturma',
+            name='semestre',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='horarios', to='core.semestre'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='horarioturma',
+            unique_together={('semestre', 'sala', 'dia_semana', 'hora_inicio')},
+        ),
+    ]
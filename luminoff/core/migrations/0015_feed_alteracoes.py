@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_horarios_por_semestre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoAlteracoes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultima', models.BigIntegerField(default=0)),
+                ('compactado_ate', models.BigIntegerField(default=0, help_text='Alterações até esta versão já foram apagadas')),
+                ('compactado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Estado do feed de alterações',
+                'verbose_name_plural': 'Estado do feed de alterações',
+            },
+        ),
+        migrations.CreateModel(
+            name='AgendaPublicada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sala', models.IntegerField()),
+                ('predio', models.IntegerField(null=True)),
+                ('dia_semana', models.SmallIntegerField()),
+                ('inicio', models.SmallIntegerField(help_text='Minutos desde 00:00')),
+                ('fim', models.SmallIntegerField(help_text='Minutos desde 00:00')),
+            ],
+            options={
+                'verbose_name': 'Intervalo publicado',
+                'verbose_name_plural': 'Agenda publicada',
+                'ordering': ['sala', 'dia_semana', 'inicio'],
+                'indexes': [models.Index(fields=['sala'], name='agenda_publicada_sala_idx'), models.Index(fields=['predio'], name='agenda_publicada_predio_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlteracaoAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sala', models.IntegerField()),
+                ('predio', models.IntegerField(null=True)),
+                ('dia_semana', models.SmallIntegerField()),
+                ('inicio', models.SmallIntegerField(help_text='Minutos desde 00:00')),
+                ('fim', models.SmallIntegerField(help_text='Minutos desde 00:00')),
+                ('adicionado', models.BooleanField(help_text='Falso para intervalo removido')),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Alteração da agenda',
+                'verbose_name_plural': 'Alterações da agenda',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['predio', 'id'], name='alteracao_predio_idx'), models.Index(fields=['criada_em'], name='alteracao_criada_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_feed_alteracoes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertaconsumo',
+            name='confirmado',
+            field=models.BooleanField(default=True, help_text='Falso enquanto o episódio não soma LUMINOFF_ALERTA_MINUTOS_MINIMOS minutos'),
+        ),
+    ]
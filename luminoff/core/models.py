@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 
@@ -15,7 +15,9 @@ class Professor(models.Model):
         verbose_name_plural = "Professores"
     
     def __str__(self):
-        return f"{self.user.get_full_name()}"
+        from . import referencia   # referencia importa os modelos
+        dados = referencia.professor(self.pk)
+        return dados.nome if dados is not None else f"{self.user.get_full_name()}"
 
 
 class Semestre(models.Model):
@@ -38,6 +40,10 @@ class Semestre(models.Model):
     class Meta:
         unique_together = ('ano', 'semestre')
         ordering = ['-ano', '-semestre']
+        indexes = [
+            # Quase toda consulta da agenda parte de "o semestre ativo"
+            models.Index(fields=['ativo'], condition=models.Q(ativo=True), name='semestre_ativo_idx'),
+        ]
         verbose_name = "Semestre"
         verbose_name_plural = "Semestres"
     
@@ -53,12 +59,28 @@ class TipoSala(models.TextChoices):
     OUTROS = 'OUT', 'Outros'
 
 
+class Predio(models.Model):
+    """Prédio do campus; é a unidade que os agendadores dividem entre si"""
+    nome = models.CharField(max_length=200, unique=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Prédio"
+        verbose_name_plural = "Prédios"
+        ordering = ['nome']
+
+    def __str__(self):
+        return self.nome
+
+
 class Sala(models.Model):
     """Modelo para cadastro de salas (RF001)"""
     nome = models.CharField(max_length=100, unique=True)
     tipo = models.CharField(max_length=3, choices=TipoSala.choices)
     capacidade = models.IntegerField(help_text="Número máximo de alunos")
     localizacao = models.CharField(max_length=200, help_text="Prédio/Número")
+    predio = models.ForeignKey(Predio, on_delete=models.PROTECT, null=True, blank=True, related_name='salas',
+                               help_text="Preenchido a partir da localização")
     andar = models.IntegerField(help_text="Use 0 para térreo/pilotis", default=0)
     ativa = models.BooleanField(default=True)
     criada_em = models.DateField(auto_now_add=True)
@@ -72,6 +94,13 @@ class Sala(models.Model):
     def __str__(self):
         return f"{self.nome} ({self.get_tipo_display()})"
 
+    def save(self, *args, **kwargs):
+        # O prédio acompanha a localização digitada
+        nome_predio = self.localizacao.strip()
+        if nome_predio and (self.predio_id is None or self.predio.nome != nome_predio):
+            self.predio, _ = Predio.objects.get_or_create(nome=nome_predio)
+        super().save(*args, **kwargs)
+
 
 class Disciplina(models.Model):
     """Disciplinas ofertadas"""
@@ -107,9 +136,23 @@ class Turma(models.Model):
         verbose_name_plural = "Turmas"
         unique_together = ['semestre', 'disciplina', 'codigo_turma']
         ordering = ['disciplina', 'codigo_turma']
+        indexes = [models.Index(fields=['semestre', 'ativo'], name='turma_semestre_ativo_idx')]
     
     def __str__(self):
-        return f"{self.disciplina.codigo} - {self.codigo_turma} ({self.professor.user.get_full_name()})"
+        # Disciplina e professor vêm da cópia em memória, sem consulta; fora
+        # dela (ex.: criados com bulk_create), pelas relações
+        from . import referencia
+        disciplina, professor = referencia.disciplina(self.disciplina_id), referencia.professor(self.professor_id)
+        codigo = disciplina.codigo if disciplina is not None else self.disciplina.codigo
+        nome = professor.nome if professor is not None else self.professor.user.get_full_name()
+        return f"{codigo} - {self.codigo_turma} ({nome})"
+
+    def save(self, *args, **kwargs):
+        # Os horários guardam o semestre da turma (unicidade por semestre). Numa transação só: em
+        # autocommit, os on_commit dos sinais rodariam antes de os horários receberem o semestre novo
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.horarios.exclude(semestre_id=self.semestre_id).update(semestre_id=self.semestre_id)
 
 
 class HorarioTurma(models.Model):
@@ -125,6 +168,8 @@ class HorarioTurma(models.Model):
     ]
     
     turma = models.ForeignKey(Turma, on_delete=models.CASCADE, related_name='horarios')
+    # Cópia de turma.semestre: a mesma sala e horário podem se repetir em outro semestre
+    semestre = models.ForeignKey('Semestre', on_delete=models.CASCADE, related_name='horarios', editable=False)
     sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='horarios_turma')
     dia_semana = models.IntegerField(choices=DIA_SEMANA)
     hora_inicio = models.TimeField()
@@ -134,7 +179,458 @@ class HorarioTurma(models.Model):
         verbose_name = "Horário da Turma"
         verbose_name_plural = "Horários das Turmas"
         ordering = ['turma', 'dia_semana', 'hora_inicio']
-        unique_together = ['sala', 'dia_semana', 'hora_inicio']
+        unique_together = ['semestre', 'sala', 'dia_semana', 'hora_inicio']
+        indexes = [
+            # "Quais salas estão ocupadas agora": dia + faixa de horário, já
+            # com a sala no índice para não precisar ler a tabela
+            models.Index(fields=['dia_semana', 'hora_inicio', 'hora_fim', 'sala'], name='horario_dia_faixa_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.turma} - {self.get_dia_semana_display()} {self.hora_inicio}-{self.hora_fim}"
\ No newline at end of file
+        return f"{self.turma} - {self.get_dia_semana_display()} {self.hora_inicio}-{self.hora_fim}"
+
+    def save(self, *args, **kwargs):
+        self.semestre_id = self.turma.semestre_id
+        super().save(*args, **kwargs)
+
+class Dispositivo(models.Model):
+    """Equipamento controlado de uma sala (relé de iluminação ou ar-condicionado)"""
+    TIPO_CHOICES = [
+        ('luz', 'Iluminação'),
+        ('ar', 'Ar-condicionado'),
+    ]
+
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='dispositivos')
+    tipo = models.CharField(max_length=3, choices=TIPO_CHOICES)
+    identificador = models.CharField(max_length=50, help_text="ID do relé no controlador")
+    controlador = models.CharField(max_length=200, blank=True,
+                                   help_text="host:porta do controlador do prédio (vazio = controlador padrão)")
+    ativo = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "Dispositivo"
+        verbose_name_plural = "Dispositivos"
+        ordering = ['sala', 'tipo', 'identificador']
+        unique_together = ['sala', 'tipo', 'identificador']
+
+    def __str__(self):
+        from . import referencia
+        sala = referencia.sala(self.sala_id)
+        return f"{sala.nome if sala is not None else self.sala.nome} - {self.get_tipo_display()} ({self.identificador})"
+
+
+class AgregadoTelemetria(models.Model):
+    """Somas e contagens das leituras de uma sala em um intervalo de tempo.
+
+    Guardar soma/contagem (e não a média) permite somar lotes novos a um
+    agregado existente sem reler as leituras.
+    """
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE)
+    inicio = models.DateTimeField(help_text="Início do intervalo")
+    ocupacao_soma = models.FloatField(default=0)
+    ocupacao_n = models.IntegerField(default=0)
+    corrente_soma = models.FloatField(default=0, help_text="Ampères")
+    corrente_n = models.IntegerField(default=0)
+    corrente_max = models.FloatField(null=True, blank=True)
+    temperatura_soma = models.FloatField(default=0, help_text="°C")
+    temperatura_n = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['sala', 'inicio']
+        unique_together = ['sala', 'inicio']
+
+    def _media(self, metrica):
+        n = getattr(self, f'{metrica}_n')
+        return getattr(self, f'{metrica}_soma') / n if n else None
+
+    @property
+    def ocupacao(self):
+        return self._media('ocupacao')
+
+    @property
+    def corrente(self):
+        return self._media('corrente')
+
+    @property
+    def temperatura(self):
+        return self._media('temperatura')
+
+    def __str__(self):
+        return f"{self.sala_id} @ {self.inicio:%Y-%m-%d %H:%M}"
+
+
+class TelemetriaMinuto(AgregadoTelemetria):
+    class Meta(AgregadoTelemetria.Meta):
+        verbose_name = "Telemetria por minuto"
+        verbose_name_plural = "Telemetria por minuto"
+        indexes = [models.Index(fields=['inicio'])]
+
+
+class TelemetriaHora(AgregadoTelemetria):
+    class Meta(AgregadoTelemetria.Meta):
+        verbose_name = "Telemetria por hora"
+        verbose_name_plural = "Telemetria por hora"
+        indexes = [models.Index(fields=['inicio'])]
+
+
+class TelemetriaDia(AgregadoTelemetria):
+    class Meta(AgregadoTelemetria.Meta):
+        verbose_name = "Telemetria por dia"
+        verbose_name_plural = "Telemetria por dia"
+        indexes = [models.Index(fields=['inicio'])]
+
+
+class AlertaConsumo(models.Model):
+    """Sala consumindo energia fora dos horários de aula (mais a carência)"""
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='alertas_consumo')
+    inicio = models.DateTimeField(help_text="Primeiro minuto com consumo fora da agenda")
+    fim = models.DateTimeField(help_text="Último minuto com consumo fora da agenda")
+    minutos = models.IntegerField(default=0)
+    kwh = models.FloatField(default=0, help_text="Energia estimada fora da agenda")
+    resolvido = models.BooleanField(default=False)
+    confirmado = models.BooleanField(default=True, help_text="Falso enquanto o episódio não soma "
+                                                             "LUMINOFF_ALERTA_MINUTOS_MINIMOS minutos")
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Alerta de consumo"
+        verbose_name_plural = "Alertas de consumo"
+        ordering = ['resolvido', '-kwh']
+        indexes = [models.Index(fields=['sala', 'resolvido', 'fim'])]
+
+    def __str__(self):
+        return f"{self.sala.nome}: {self.kwh:.2f} kWh fora da agenda"
+
+
+class ExecucaoAnomalias(models.Model):
+    """Janela já processada pela detecção de anomalias (cursor incremental)"""
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField()
+    leituras = models.IntegerField(default=0)
+    alertas = models.IntegerField(default=0)
+    duracao = models.FloatField(default=0, help_text="Segundos")
+    executada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Execução da detecção de anomalias"
+        verbose_name_plural = "Execuções da detecção de anomalias"
+        ordering = ['-fim']
+
+    def __str__(self):
+        return f"{self.inicio:%Y-%m-%d %H:%M} - {self.fim:%Y-%m-%d %H:%M}"
+
+
+class Feriado(models.Model):
+    """Período sem aulas regulares: feriado, recesso ou semana de provas"""
+    TIPO_CHOICES = [
+        ('feriado', 'Feriado'),
+        ('recesso', 'Recesso'),
+        ('provas', 'Semana de provas'),
+    ]
+
+    descricao = models.CharField(max_length=200)
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='feriado')
+    data_inicio = models.DateField()
+    data_fim = models.DateField(help_text="Igual ao início para um único dia")
+
+    class Meta:
+        verbose_name = "Feriado"
+        verbose_name_plural = "Feriados"
+        ordering = ['data_inicio']
+
+    def __str__(self):
+        if self.data_inicio == self.data_fim:
+            return f"{self.descricao} ({self.data_inicio:%d/%m/%Y})"
+        return f"{self.descricao} ({self.data_inicio:%d/%m/%Y} a {self.data_fim:%d/%m/%Y})"
+
+
+class CancelamentoAula(models.Model):
+    """Aula de um horário que não acontece em uma data específica"""
+    horario = models.ForeignKey('HorarioTurma', on_delete=models.CASCADE, related_name='cancelamentos')
+    data = models.DateField()
+    motivo = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        verbose_name = "Cancelamento de aula"
+        verbose_name_plural = "Cancelamentos de aula"
+        ordering = ['data']
+        unique_together = ['horario', 'data']
+
+    def __str__(self):
+        return f"{self.horario} em {self.data:%d/%m/%Y}"
+
+
+class ReservaExtra(models.Model):
+    """Uso avulso de uma sala fora da grade (reunião, defesa, evento)"""
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='reservas')
+    data = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fim = models.TimeField()
+    descricao = models.CharField(max_length=200)
+    responsavel = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='reservas')
+
+    class Meta:
+        verbose_name = "Reserva extra"
+        verbose_name_plural = "Reservas extras"
+        ordering = ['data', 'hora_inicio']
+
+    def __str__(self):
+        return f"{self.sala.nome} {self.data:%d/%m/%Y} {self.hora_inicio:%H:%M}-{self.hora_fim:%H:%M}"
+
+
+class OcupacaoDiaria(models.Model):
+    """Intervalo concreto de ocupação de uma sala em uma data (materializado).
+
+    Gerado a partir da grade semanal, do período do semestre, dos feriados,
+    cancelamentos e reservas; nunca é editado à mão.
+    """
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='ocupacoes')
+    data = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fim = models.TimeField()
+
+    class Meta:
+        verbose_name = "Ocupação diária"
+        verbose_name_plural = "Ocupações diárias"
+        ordering = ['data', 'sala', 'hora_inicio']
+        indexes = [models.Index(fields=['data', 'sala'])]
+
+    def __str__(self):
+        return f"{self.sala_id} {self.data:%d/%m/%Y} {self.hora_inicio:%H:%M}-{self.hora_fim:%H:%M}"
+
+
+class DiaMaterializado(models.Model):
+    """Datas cuja ocupação de todas as salas já está em OcupacaoDiaria"""
+    data = models.DateField(unique=True)
+    materializado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Dia materializado"
+        verbose_name_plural = "Dias materializados"
+
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y}"
+
+
+class PendenciaOcupacao(models.Model):
+    """(sala, data) materializados que precisam ser refeitos após uma alteração"""
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='+')
+    data = models.DateField()
+
+    class Meta:
+        unique_together = ['sala', 'data']
+        indexes = [models.Index(fields=['data'])]
+
+    def __str__(self):
+        return f"{self.sala_id} {self.data:%d/%m/%Y}"
+
+
+class ComandoDispositivo(models.Model):
+    """Comando liga/desliga gravado pelo agendador e entregue pelo despacho (outbox).
+
+    A linha só sai de "pendente" quando o controlador confirma; se o processo
+    cair no meio do envio, a reserva vence e outro despachante reenvia.
+    """
+    PENDENTE = 'pendente'
+    ENVIANDO = 'enviando'
+    CONFIRMADO = 'confirmado'
+    SUBSTITUIDO = 'substituido'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (ENVIANDO, 'Enviando'),
+        (CONFIRMADO, 'Confirmado'),
+        (SUBSTITUIDO, 'Substituído por um comando mais novo'),
+        (FALHOU, 'Falhou (tentativas esgotadas)'),
+    ]
+    AGENDA = 'agenda'
+    PRESENCA = 'presenca'
+    ORIGEM_CHOICES = [
+        (AGENDA, 'Agenda'),
+        (PRESENCA, 'Sensor de presença'),
+    ]
+    ACAO_CHOICES = [
+        ('ligar', 'Ligar'),
+        ('desligar', 'Desligar'),
+    ]
+
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='comandos')
+    dispositivo = models.CharField(max_length=3, choices=Dispositivo.TIPO_CHOICES)
+    acao = models.CharField(max_length=8, choices=ACAO_CHOICES)
+    agendado_para = models.DateTimeField(help_text="Momento da transição calculada pelo agendador")
+    status = models.CharField(max_length=11, choices=STATUS_CHOICES, default=PENDENTE)
+    origem = models.CharField(max_length=8, choices=ORIGEM_CHOICES, default=AGENDA)
+    tentativas = models.IntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(help_text="Não é reservado antes disso (backoff)")
+    reserva = models.UUIDField(null=True, blank=True, help_text="Lote do despachante que está enviando")
+    reservado_ate = models.DateTimeField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    confirmado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Comando de dispositivo"
+        verbose_name_plural = "Comandos de dispositivos"
+        ordering = ['-agendado_para']
+        constraints = [
+            # O agendador pode regravar a mesma transição (reinício) sem duplicar
+            models.UniqueConstraint(fields=['sala', 'dispositivo', 'acao', 'agendado_para'], name='comando_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa'], name='comando_fila_idx'),
+            models.Index(fields=['sala', 'dispositivo', 'agendado_para'], name='comando_sala_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.acao} {self.dispositivo} (sala {self.sala_id}) @ {self.agendado_para:%d/%m %H:%M}"
+
+
+class TrabalhadorAgendador(models.Model):
+    """Processo de agendamento vivo (batimento recente); a divisão dos prédios conta estes"""
+    nome = models.CharField(max_length=200, unique=True)
+    iniciado_em = models.DateTimeField(auto_now_add=True)
+    visto_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Trabalhador do agendador"
+        verbose_name_plural = "Trabalhadores do agendador"
+        ordering = ['nome']
+
+    def __str__(self):
+        return self.nome
+
+
+class ArrendamentoPredio(models.Model):
+    """Qual trabalhador agenda e despacha os comandos de um prédio, e até quando"""
+    predio = models.OneToOneField(Predio, on_delete=models.CASCADE, primary_key=True, related_name='arrendamento')
+    trabalhador = models.CharField(max_length=200, blank=True)
+    expira_em = models.DateTimeField(null=True, blank=True, help_text="Vencido = livre para outro trabalhador")
+
+    class Meta:
+        verbose_name = "Arrendamento de prédio"
+        verbose_name_plural = "Arrendamentos de prédios"
+        ordering = ['predio']
+        indexes = [models.Index(fields=['trabalhador'])]
+
+    def __str__(self):
+        return f"{self.predio_id}: {self.trabalhador or '(livre)'}"
+
+
+class CurvaResfriamento(models.Model):
+    """Quanto tempo o ar de uma sala leva para baixar a temperatura (aprendido da telemetria).
+
+    ``minutos = minutos_base + minutos_por_grau * (temperatura - alvo)``; as
+    somas da regressão ficam guardadas para o ajuste seguinte só somar os
+    dias novos.
+    """
+    sala = models.OneToOneField('Sala', on_delete=models.CASCADE, primary_key=True, related_name='curva_resfriamento')
+    amostras = models.FloatField(default=0, help_text="Peso acumulado (amostras antigas pesam menos)")
+    soma_x = models.FloatField(default=0)
+    soma_y = models.FloatField(default=0)
+    soma_xx = models.FloatField(default=0)
+    soma_xy = models.FloatField(default=0)
+    minutos_base = models.FloatField(default=0)
+    minutos_por_grau = models.FloatField(default=0)
+    episodios = models.IntegerField(default=0, help_text="Partidas do ar usadas no ajuste")
+    processado_ate = models.DateTimeField(help_text="Fim da janela do último ajuste")
+    atualizada_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Curva de resfriamento"
+        verbose_name_plural = "Curvas de resfriamento"
+        ordering = ['sala']
+
+    def __str__(self):
+        return f"{self.sala_id}: {self.minutos_base:.1f} min + {self.minutos_por_grau:.1f} min/°C"
+
+
+class DesligamentoAusencia(models.Model):
+    """Sala desligada antes do fim da janela da agenda por falta de presença.
+
+    Fica aberto (sem ``fim``) até a sala religar ou a janela terminar; os kWh
+    são o que a agenda pura teria gastado com luz e ar nesse intervalo.
+    """
+    sala = models.ForeignKey('Sala', on_delete=models.CASCADE, related_name='desligamentos_ausencia')
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField(null=True, blank=True, help_text="Religada ou fim da janela da agenda")
+    minutos = models.FloatField(default=0)
+    kwh = models.FloatField(default=0, help_text="Energia economizada em relação à agenda")
+
+    class Meta:
+        verbose_name = "Desligamento por ausência"
+        verbose_name_plural = "Desligamentos por ausência"
+        ordering = ['-inicio']
+        indexes = [models.Index(fields=['fim', 'sala'], name='desligamento_aberto_idx')]
+
+    def __str__(self):
+        return f"{self.sala_id} @ {self.inicio:%d/%m %H:%M} ({self.minutos:.0f} min)"
+
+
+class AgendaPublicada(models.Model):
+    """Intervalo da grade semanal de uma sala como os controladores já o receberam.
+
+    É o retrato sobre o qual ``AlteracaoAgenda`` registra as diferenças; sala
+    e prédio são só ids, sem chave estrangeira, para que a remoção de uma
+    sala excluída também seja publicada.
+    """
+    sala = models.IntegerField()
+    predio = models.IntegerField(null=True)
+    dia_semana = models.SmallIntegerField()
+    inicio = models.SmallIntegerField(help_text="Minutos desde 00:00")
+    fim = models.SmallIntegerField(help_text="Minutos desde 00:00")
+
+    class Meta:
+        verbose_name = "Intervalo publicado"
+        verbose_name_plural = "Agenda publicada"
+        ordering = ['sala', 'dia_semana', 'inicio']
+        indexes = [
+            models.Index(fields=['sala'], name='agenda_publicada_sala_idx'),
+            models.Index(fields=['predio'], name='agenda_publicada_predio_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sala} {self.dia_semana} {self.inicio}-{self.fim}"
+
+
+class AlteracaoAgenda(models.Model):
+    """Intervalo adicionado ou removido da grade publicada; o id é a versão do feed"""
+    sala = models.IntegerField()
+    predio = models.IntegerField(null=True)
+    dia_semana = models.SmallIntegerField()
+    inicio = models.SmallIntegerField(help_text="Minutos desde 00:00")
+    fim = models.SmallIntegerField(help_text="Minutos desde 00:00")
+    adicionado = models.BooleanField(help_text="Falso para intervalo removido")
+    criada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Alteração da agenda"
+        verbose_name_plural = "Alterações da agenda"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['predio', 'id'], name='alteracao_predio_idx'),
+            models.Index(fields=['criada_em'], name='alteracao_criada_idx'),
+        ]
+
+    def __str__(self):
+        sinal = '+' if self.adicionado else '-'
+        return f"#{self.pk} {sinal}{self.sala} {self.dia_semana} {self.inicio}-{self.fim}"
+
+
+class EstadoAlteracoes(models.Model):
+    """Linha única do feed: última versão publicada e até onde o histórico foi compactado.
+
+    Quem publica trava esta linha, então as versões são gravadas em ordem e
+    um leitor nunca pula uma alteração confirmada depois de outra mais nova.
+    """
+    ultima = models.BigIntegerField(default=0)
+    compactado_ate = models.BigIntegerField(default=0, help_text="Alterações até esta versão já foram apagadas")
+    compactado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Estado do feed de alterações"
+        verbose_name_plural = "Estado do feed de alterações"
+
+    def __str__(self):
+        return f"versão {self.ultima} (compactado até {self.compactado_ate})"
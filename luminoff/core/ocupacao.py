@@ -0,0 +1,240 @@
+"""
+Índice de ocupação das salas.
+
+Compila os HorarioTurma do semestre ativo em uma agenda semanal por sala: para
+cada dia da semana guardamos uma tupla ordenada de pontos de transição
+``(inicio0, fim0, inicio1, fim1, ...)`` em minutos desde 00:00, já com os
+intervalos sobrepostos/adjacentes mesclados. Com isso, "a sala está ocupada
+agora?" e "qual a próxima transição?" viram uma busca binária, sem acesso ao
+banco.
+"""
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from . import referencia
+from .models import HorarioTurma
+
+MINUTOS_DIA = 24 * 60
+DIAS_SEMANA = 7
+
+_DIA_VAZIO = ()
+_SEMANA_VAZIA = (_DIA_VAZIO,) * DIAS_SEMANA
+
+
+def minutos(hora):
+    """Converte um ``time`` (ou ``datetime``) em minutos desde a meia-noite."""
+    return hora.hour * 60 + hora.minute
+
+
+def mesclar_intervalos(intervalos):
+    """Mescla intervalos ``(inicio, fim)`` sobrepostos ou adjacentes.
+
+    Retorna a tupla "achatada" de pontos ``(inicio0, fim0, inicio1, fim1, ...)``.
+    """
+    pontos = []
+    for inicio, fim in sorted(intervalos):
+        if fim <= inicio:
+            continue
+        if pontos and inicio <= pontos[-1]:
+            if fim > pontos[-1]:
+                pontos[-1] = fim
+        else:
+            pontos.extend((inicio, fim))
+    return tuple(pontos)
+
+
+def pares(pontos):
+    """Pontos de transição ``(i0, f0, i1, f1, ...)`` como pares ``(inicio, fim)``."""
+    return zip(pontos[0::2], pontos[1::2])
+
+
+def _agenda(linhas):
+    """Monta a agenda de 7 dias a partir de ``(dia, inicio, fim)`` em minutos.
+
+    ``inicio``/``fim`` podem sair do intervalo 0..1440 (margens aplicadas);
+    nesse caso a sobra passa para o dia vizinho.
+    """
+    por_dia = [[] for _ in range(DIAS_SEMANA)]
+    for dia, inicio, fim in linhas:
+        if inicio < 0:
+            por_dia[(dia - 1) % DIAS_SEMANA].append((MINUTOS_DIA + inicio, MINUTOS_DIA))
+            inicio = 0
+        if fim > MINUTOS_DIA:
+            por_dia[(dia + 1) % DIAS_SEMANA].append((0, fim - MINUTOS_DIA))
+            fim = MINUTOS_DIA
+        por_dia[dia].append((inicio, fim))
+    return tuple(mesclar_intervalos(intervalos) if intervalos else _DIA_VAZIO for intervalos in por_dia)
+
+
+def compilar(linhas):
+    """Agenda de 7 dias por sala a partir de ``(sala_id, dia_semana, hora_inicio, hora_fim)``."""
+    por_sala = defaultdict(list)
+    for sala_id, dia, hora_inicio, hora_fim in linhas:
+        por_sala[sala_id].append((dia, minutos(hora_inicio), minutos(hora_fim)))
+    return {sala_id: _agenda(itens) for sala_id, itens in por_sala.items()}
+
+
+class IndiceOcupacao:
+    """Agenda semanal de ocupação por sala, pronta para consultas em O(log n)."""
+
+    def __init__(self, salas=None):
+        # sala_id -> tupla com os 7 dias, cada um com seus pontos de transição
+        self._salas = salas if salas is not None else {}
+
+    @classmethod
+    def de_linhas(cls, linhas):
+        """Monta o índice a partir de tuplas ``(sala_id, dia_semana, hora_inicio, hora_fim)``."""
+        return cls(compilar(linhas))
+
+    def __contains__(self, sala_id):
+        return sala_id in self._salas
+
+    def __len__(self):
+        return len(self._salas)
+
+    def salas(self):
+        return self._salas.keys()
+
+    def agenda(self, sala_id):
+        """Pontos de transição da sala para cada dia da semana."""
+        return self._salas.get(sala_id, _SEMANA_VAZIA)
+
+    def intervalos(self, sala_id, dia_semana):
+        """Intervalos ``(inicio, fim)`` mesclados da sala no dia, em minutos."""
+        return list(pares(self.agenda(sala_id)[dia_semana]))
+
+    def ocupada(self, sala_id, momento):
+        """Indica se a sala está ocupada no ``datetime`` informado."""
+        pontos = self.agenda(sala_id)[momento.weekday()]
+        return bisect_right(pontos, minutos(momento)) % 2 == 1
+
+    def proxima_transicao(self, sala_id, momento):
+        """Próxima mudança de estado da sala estritamente depois de ``momento``.
+
+        Retorna ``(quando, ocupada)``, onde ``ocupada`` é o estado da sala a
+        partir de ``quando``, ou ``None`` se a sala nunca muda de estado.
+        """
+        agenda = self.agenda(sala_id)
+        dia = momento.weekday()
+        meia_noite = momento.replace(hour=0, minute=0, second=0, microsecond=0)
+        minuto = minutos(momento)
+
+        # Uma semana e um dia cobrem o caso de a próxima transição ser no
+        # mesmo dia da semana, só que na semana seguinte.
+        for deslocamento in range(DIAS_SEMANA + 1):
+            atual = (dia + deslocamento) % DIAS_SEMANA
+            pontos = agenda[atual]
+            i = bisect_right(pontos, minuto) if deslocamento == 0 else 0
+            for j in range(i, len(pontos)):
+                ponto = pontos[j]
+                # Fim às 24:00 seguido de início às 00:00 não é transição real
+                if ponto == MINUTOS_DIA and agenda[(atual + 1) % DIAS_SEMANA][:1] == (0,):
+                    continue
+                if ponto == 0 and agenda[(atual - 1) % DIAS_SEMANA][-1:] == (MINUTOS_DIA,):
+                    continue
+                return meia_noite + timedelta(days=deslocamento, minutes=ponto), j % 2 == 0
+        return None
+
+    def com_margens(self, antes=0, depois=0):
+        """Novo índice com cada intervalo antecipado em ``antes`` e estendido em
+        ``depois`` minutos (ex.: pré-climatização e tolerância após a aula).
+
+        ``antes`` pode ser um inteiro ou um dicionário ``{sala_id: minutos}``.
+        """
+        salas = {}
+        for sala_id, agenda in self._salas.items():
+            antecedencia = antes.get(sala_id, 0) if isinstance(antes, dict) else antes
+            if not antecedencia and not depois:
+                salas[sala_id] = agenda
+                continue
+            salas[sala_id] = _agenda(
+                (dia, inicio - antecedencia, fim + depois)
+                for dia, pontos in enumerate(agenda)
+                for inicio, fim in pares(pontos)
+            )
+        return IndiceOcupacao(salas)
+
+    def substituir_salas(self, sala_ids, linhas):
+        """Recompila apenas as salas informadas a partir das novas linhas."""
+        novas = compilar(linhas)
+        # Copia e troca o dicionário para não afetar quem está iterando
+        salas = dict(self._salas)
+        for sala_id in sala_ids:
+            if sala_id in novas:
+                salas[sala_id] = novas[sala_id]
+            else:
+                salas.pop(sala_id, None)
+        self._salas = salas
+
+
+# ---------------------------------------------------------------------------
+# Índice do semestre ativo (um por processo)
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_indice = None
+
+
+def horarios_ativos(semestre=None):
+    """Horários das turmas e salas ativas do semestre (por padrão, o ativo)."""
+    if semestre is None:
+        semestre = referencia.semestre_ativo()
+        if semestre is None:
+            return HorarioTurma.objects.none()
+        semestre = semestre.pk
+    return HorarioTurma.objects.filter(semestre=semestre, turma__ativo=True, sala__ativa=True)
+
+
+def linhas(queryset):
+    """``(sala_id, dia_semana, hora_inicio, hora_fim)`` dos horários de ``queryset``."""
+    # Sem a ordenação padrão (turma -> disciplina), que custaria um JOIN e um sort
+    return queryset.order_by().values_list('sala_id', 'dia_semana', 'hora_inicio', 'hora_fim')
+
+
+def compilar_indice(semestre=None):
+    """Compila o índice do semestre (por padrão, o ativo) com uma única consulta."""
+    return IndiceOcupacao.de_linhas(linhas(horarios_ativos(semestre)).iterator(chunk_size=5000))
+
+
+def salas_ocupadas_no_banco(momento):
+    """Ids das salas com aula em ``momento`` (datetime local), direto no banco.
+
+    Resposta pontual sem compilar a agenda inteira (comandos, verificações);
+    o agendador continua usando o índice em memória.
+    """
+    hora = momento.time().replace(second=0, microsecond=0)
+    return set(horarios_ativos().filter(
+        dia_semana=momento.weekday(), hora_inicio__lte=hora, hora_fim__gt=hora,
+    ).order_by().values_list('sala_id', flat=True).distinct())
+
+
+def obter_indice():
+    """Índice do semestre ativo, compilado sob demanda e mantido em memória."""
+    global _indice
+    indice = _indice
+    if indice is None:
+        with _lock:
+            if _indice is None:
+                _indice = compilar_indice()
+            indice = _indice
+    return indice
+
+
+def invalidar():
+    """Descarta o índice; a próxima consulta recompila tudo."""
+    global _indice
+    with _lock:
+        _indice = None
+
+
+def atualizar_salas(sala_ids):
+    """Recompila somente as salas informadas no índice já carregado."""
+    sala_ids = {sala_id for sala_id in sala_ids if sala_id is not None}
+    if not sala_ids:
+        return
+    with _lock:
+        if _indice is None:
+            return
+        _indice.substituir_salas(sala_ids, list(linhas(horarios_ativos().filter(sala_id__in=sala_ids))))
@@ -0,0 +1,219 @@
+"""
+Painel ao vivo do estado das salas (Server-Sent Events, servido pelo ASGI).
+
+Um único ``Hub`` por processo calcula o estado de todas as salas e distribui
+só o que mudou para os painéis conectados:
+
+- a cada ``LUMINOFF_PAINEL_INTERVALO`` segundos (ou quando acordado pela
+  ingestão de telemetria) o estado é recalculado a partir da agenda da semana,
+  com as mesmas margens do agendador, da telemetria do último minuto e dos
+  desligamentos por ausência em aberto (``presenca``), que valem sobre a agenda;
+- a diferença para o estado anterior vira uma mensagem, colocada na fila de
+  cada assinante. Quem conecta recebe antes o estado completo.
+
+O custo no banco é o de um produtor (uma consulta de telemetria e uma de
+desligamentos por ciclo e a agenda quando a versão muda), qualquer que seja o
+número de painéis abertos.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.http import HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+
+from . import calendario, referencia, versao
+from .models import DesligamentoAusencia, TelemetriaMinuto
+
+logger = logging.getLogger(__name__)
+
+LIGADA = 'ligada'
+PRE_CLIMATIZACAO = 'pre_climatizacao'   # só o ar, antes da aula
+DESLIGADA = 'desligada'
+FORA_DA_AGENDA = 'fora_da_agenda'       # telemetria mostra consumo com a agenda desligada
+ESTADOS = (LIGADA, PRE_CLIMATIZACAO, DESLIGADA, FORA_DA_AGENDA)
+
+TAMANHO_FILA = 64
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class CalculadoraEstados:
+    """Estado de cada sala ativa em um instante (usada pelo produtor do hub)."""
+
+    def __init__(self):
+        self._chave = None   # (versão da agenda, data) da agenda carregada
+        self._carregada_em = 0.0
+        self._luz = self._ar = None
+        self._salas = ()
+
+    def _agenda(self, agora):
+        chave = (versao.atual(), agora.date())
+        vencida = time.monotonic() - self._carregada_em > _config('LUMINOFF_INTERVALO_RECOMPILACAO', 300)
+        if chave != self._chave or vencida:
+            tolerancia = _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10)
+            indice = calendario.indice_semana(agora.date())
+            self._luz = indice.com_margens(0, tolerancia)
+            self._ar = indice.com_margens(_config('LUMINOFF_ANTECEDENCIA_AR', 15), tolerancia)
+            self._salas = tuple(sala.pk for sala in referencia.salas_ativas())
+            self._chave, self._carregada_em = chave, time.monotonic()
+
+    def _consumindo(self, agora):
+        corrente_minima = _config('LUMINOFF_CORRENTE_MINIMA', 0.5)
+        return set(TelemetriaMinuto.objects.filter(
+            inicio__gte=agora - timedelta(minutes=2), corrente_n__gt=0,
+            corrente_soma__gte=F('corrente_n') * corrente_minima,
+        ).order_by().values_list('sala_id', flat=True).distinct())
+
+    def _desligadas(self):
+        # Salas que o monitor de presença desligou dentro da janela da agenda
+        return set(DesligamentoAusencia.objects.filter(fim__isnull=True).values_list('sala_id', flat=True))
+
+    def __call__(self, agora=None):
+        agora = timezone.localtime(agora)
+        self._agenda(agora)
+        consumindo = self._consumindo(agora)
+        desligadas = self._desligadas()
+        estados = {}
+        for sala_id in self._salas:
+            if sala_id in desligadas:
+                estados[sala_id] = DESLIGADA
+            elif self._luz.ocupada(sala_id, agora):
+                estados[sala_id] = LIGADA
+            elif self._ar.ocupada(sala_id, agora):
+                estados[sala_id] = PRE_CLIMATIZACAO
+            else:
+                estados[sala_id] = FORA_DA_AGENDA if sala_id in consumindo else DESLIGADA
+        return estados
+
+
+class Hub:
+    """Distribui as mudanças de estado para os painéis conectados neste processo."""
+
+    def __init__(self, calcular=None):
+        self.calcular = calcular or CalculadoraEstados()
+        self.estados = {}
+        self.versao = 0
+        self._assinantes = set()
+        self._loop = None
+        self._acordar = None
+        self._produtor = None
+        self._lock = threading.Lock()
+
+    def _mensagem(self, evento, salas):
+        return {'evento': evento, 'versao': self.versao, 'salas': salas}
+
+    def assinar(self):
+        """Fila de mensagens de um novo painel; a primeira é o estado completo."""
+        fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        fila.put_nowait(self._mensagem('estado', dict(self.estados)))
+        self._assinantes.add(fila)
+        return fila
+
+    def cancelar(self, fila):
+        self._assinantes.discard(fila)
+
+    def publicar(self, mudancas):
+        self.versao += 1
+        mensagem = self._mensagem('delta', mudancas)
+        for fila in list(self._assinantes):
+            try:
+                fila.put_nowait(mensagem)
+            except asyncio.QueueFull:
+                # Painel lento: descarta o atraso e recomeça do estado completo
+                while not fila.empty():
+                    fila.get_nowait()
+                fila.put_nowait(self._mensagem('estado', dict(self.estados)))
+
+    async def atualizar(self, agora=None):
+        """Recalcula os estados e publica o que mudou. Retorna as mudanças."""
+        estados = await sync_to_async(self.calcular)(agora)
+        mudancas = {sala_id: estado for sala_id, estado in estados.items() if self.estados.get(sala_id) != estado}
+        mudancas.update({sala_id: None for sala_id in self.estados.keys() - estados.keys()})   # saíram
+        self.estados = estados
+        if mudancas:
+            self.publicar(mudancas)
+        return mudancas
+
+    def acordar(self):
+        """Pede um recálculo imediato; pode ser chamado de qualquer thread."""
+        with self._lock:
+            loop, evento = self._loop, self._acordar
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(evento.set)
+
+    async def garantir_produtor(self):
+        """Inicia o produtor neste event loop, se ainda não estiver rodando.
+
+        A tarefa é criada sem nenhum await antes: painéis que conectam ao
+        mesmo tempo encontram o mesmo produtor.
+        """
+        if self._produtor is None or self._produtor.done():
+            with self._lock:
+                self._loop = asyncio.get_running_loop()
+                self._acordar = asyncio.Event()
+            self._produtor = asyncio.create_task(self._produzir())
+
+    async def _ciclo(self):
+        try:
+            await self.atualizar()
+        except Exception:
+            logger.exception("Falha ao atualizar o painel das salas")
+
+    async def _produzir(self):
+        intervalo = _config('LUMINOFF_PAINEL_INTERVALO', 15)
+        if not self.estados:
+            await self._ciclo()
+        # Sem painéis conectados não há por que continuar consultando o banco
+        while self._assinantes:
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+            await self._ciclo()
+        self.estados = {}
+
+
+hub = Hub()
+
+
+def _sse(mensagem):
+    return (f"id: {mensagem['versao']}\nevent: {mensagem['evento']}\n"
+            f"data: {json.dumps(mensagem['salas'], separators=(',', ':'))}\n\n")
+
+
+async def _eventos(hub, fila, keepalive):
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                mensagem = await asyncio.wait_for(fila.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'   # mantém proxies e o navegador sabendo que a conexão vive
+                continue
+            yield _sse(mensagem)
+    finally:
+        hub.cancelar(fila)
+
+
+async def eventos(request):
+    """``text/event-stream`` com o estado das salas (eventos ``estado`` e ``delta``)."""
+    usuario = await request.auser()
+    if not usuario.is_active or not usuario.is_staff:
+        return HttpResponseForbidden()
+    fila = hub.assinar()
+    await hub.garantir_produtor()
+    resposta = StreamingHttpResponse(
+        _eventos(hub, fila, _config('LUMINOFF_PAINEL_KEEPALIVE', 20)), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'   # nginx: não segurar os eventos em buffer
+    return resposta
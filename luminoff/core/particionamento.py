@@ -0,0 +1,128 @@
+"""
+Divisão dos prédios entre vários processos de agendamento/despacho.
+
+Cada processo (``Coordenador``) bate o ponto em ``TrabalhadorAgendador`` a
+cada ``ttl / 3`` segundos e mantém arrendamentos de prédios
+(``ArrendamentoPredio``) com prazo de ``ttl``:
+
+- a cota de cada trabalhador é ``ceil(prédios / trabalhadores vivos)``;
+- quem tem mais que a cota (entrou um trabalhador novo) devolve o excesso;
+- quem tem menos pega prédios livres ou com arrendamento vencido (o dono
+  morreu e parou de renovar). A tomada é um ``update`` condicionado ao
+  arrendamento estar livre, então dois trabalhadores nunca ficam com o
+  mesmo prédio.
+
+Com a fila de comandos (``despacho``), quem assume um prédio retoma o
+estado e os comandos pendentes do dono anterior.
+"""
+import asyncio
+import logging
+import math
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import referencia
+from .models import ArrendamentoPredio, Predio, Sala, TrabalhadorAgendador
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def vincular_salas():
+    """Liga ao prédio as salas criadas sem passar pelo ``save`` (``bulk_create``)."""
+    soltas = list(Sala.objects.filter(predio__isnull=True).exclude(localizacao='').values_list('pk', 'localizacao'))
+    if not soltas:
+        return 0
+    nomes = {localizacao.strip() for _, localizacao in soltas}
+    Predio.objects.bulk_create([Predio(nome=nome) for nome in sorted(nomes)], ignore_conflicts=True)
+    por_nome = dict(Predio.objects.filter(nome__in=nomes).values_list('nome', 'pk'))
+    for nome, predio_id in por_nome.items():
+        Sala.objects.filter(pk__in=[pk for pk, localizacao in soltas if localizacao.strip() == nome]).update(
+            predio_id=predio_id)
+    referencia.marcar_alterada()
+    return len(soltas)
+
+
+class Coordenador:
+    """Arrendamentos de prédios de um processo, renovados por batimento."""
+
+    def __init__(self, nome=None, ttl=None, ao_mudar=None):
+        self.nome = nome or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.ttl = ttl or _config('LUMINOFF_ARRENDAMENTO_TTL', 30)
+        self.ao_mudar = ao_mudar or []   # chamados com o novo conjunto de prédios
+        self.predios = frozenset()
+        self._parar = asyncio.Event()
+
+    def batimento(self, agora=None):
+        """Renova, devolve e toma prédios; retorna o conjunto de ids de prédio do trabalhador."""
+        agora = agora or timezone.now()
+        prazo = agora + timedelta(seconds=self.ttl)
+        vincular_salas()
+        with transaction.atomic():
+            TrabalhadorAgendador.objects.update_or_create(nome=self.nome, defaults={'visto_em': agora})
+            TrabalhadorAgendador.objects.filter(visto_em__lt=agora - timedelta(seconds=self.ttl)).delete()
+            vivos = TrabalhadorAgendador.objects.count()
+
+            ArrendamentoPredio.objects.bulk_create(
+                [ArrendamentoPredio(predio_id=pk) for pk in Predio.objects.filter(
+                    arrendamento__isnull=True).values_list('pk', flat=True)],
+                ignore_conflicts=True)
+            cota = math.ceil(ArrendamentoPredio.objects.count() / vivos)
+
+            meus = ArrendamentoPredio.objects.filter(trabalhador=self.nome)
+            meus.update(expira_em=prazo)
+            proprios = list(meus.order_by('predio__nome').values_list('predio_id', flat=True))
+            if len(proprios) > cota:
+                ArrendamentoPredio.objects.filter(pk__in=proprios[cota:], trabalhador=self.nome).update(
+                    trabalhador='', expira_em=None)
+                proprios = proprios[:cota]
+            elif len(proprios) < cota:
+                livres = ArrendamentoPredio.objects.filter(Q(expira_em__isnull=True) | Q(expira_em__lt=agora))
+                candidatos = list(livres.select_for_update(skip_locked=True, of=('self',)).order_by(
+                    'predio__nome').values_list('pk', flat=True)[:cota - len(proprios)])
+                livres.filter(pk__in=candidatos).update(trabalhador=self.nome, expira_em=prazo)
+                proprios = list(ArrendamentoPredio.objects.filter(trabalhador=self.nome).values_list(
+                    'predio_id', flat=True))
+        return frozenset(proprios)
+
+    def liberar(self):
+        """Devolve os prédios e sai da contagem (encerramento limpo)."""
+        with transaction.atomic():
+            ArrendamentoPredio.objects.filter(trabalhador=self.nome).update(trabalhador='', expira_em=None)
+            TrabalhadorAgendador.objects.filter(nome=self.nome).delete()
+        self.predios = frozenset()
+
+    async def atualizar(self):
+        predios = await sync_to_async(self.batimento)()
+        if predios != self.predios:
+            logger.info("Trabalhador %s: %d prédios (antes %d)", self.nome, len(predios), len(self.predios))
+            self.predios = predios
+            for callback in self.ao_mudar:
+                callback(predios)
+        return predios
+
+    async def executar(self):
+        while not self._parar.is_set():
+            try:
+                await self.atualizar()
+            except Exception:
+                logger.exception("Falha no batimento do trabalhador %s", self.nome)
+            try:
+                await asyncio.wait_for(self._parar.wait(), timeout=self.ttl / 3)
+            except asyncio.TimeoutError:
+                pass
+        await sync_to_async(self.liberar)()
+
+    def parar(self):
+        self._parar.set()
@@ -0,0 +1,224 @@
+"""
+Pré-climatização adaptativa: quanto antes ligar o ar de cada sala.
+
+Cada partida do ar (comando "ligar ar" confirmado na fila de comandos) é um
+episódio; a telemetria de temperatura da sala nos ``HORIZONTE`` minutos
+seguintes diz quanto a sala esfriou e em quanto tempo. O ajuste é uma
+regressão linear por sala::
+
+    minutos até esfriar ``x`` graus = minutos_base + minutos_por_grau * x
+
+com uma amostra para cada novo mínimo de temperatura do episódio (o trecho
+em que a temperatura já estabilizou não entra). As somas da regressão ficam
+em ``CurvaResfriamento``: o ajuste noturno (``ajustar``) lê só os episódios
+novos, multiplica as somas antigas por ``LUMINOFF_PRE_RESFRIAMENTO_ESQUECIMENTO``
+(mudanças de estação e de equipamento) e soma as novas.
+
+O agendador usa ``antecedencias``: com a temperatura atual da sala e a
+curva, o ar liga só o suficiente antes da aula para chegar ao alvo no
+início. Salas sem curva confiável usam a antecedência fixa.
+"""
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Q
+from django.utils import timezone
+
+from .anomalias import MinutoEpoch
+from .dispositivos import AR, LIGAR
+from .models import ComandoDispositivo, CurvaResfriamento, TelemetriaMinuto
+
+logger = logging.getLogger(__name__)
+
+HORIZONTE = 60          # minutos de telemetria analisados depois de o ar ligar
+QUEDA_MINIMA = 0.2      # °C; quedas menores são ruído do sensor
+EPISODIOS_POR_CONSULTA = 250
+_CHAVE = 1 << 32        # sala_id * _CHAVE + minuto epoch, para ordenar e buscar de uma vez
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _momento(minuto):
+    return datetime.fromtimestamp(int(minuto) * 60, tz=dt_timezone.utc)
+
+
+def _episodios(inicio, fim):
+    """Array ``(sala_id, minuto epoch)`` das partidas do ar na janela."""
+    return np.array(list(ComandoDispositivo.objects.filter(
+        dispositivo=AR, acao=LIGAR, status=ComandoDispositivo.CONFIRMADO,
+        agendado_para__gte=inicio, agendado_para__lt=fim,
+    ).order_by().annotate(minuto=MinutoEpoch('agendado_para')).values_list('sala_id', 'minuto')),
+        dtype=np.int64).reshape(-1, 2)
+
+
+def _temperaturas(episodios):
+    """Arrays ``(sala_id, minuto epoch, temperatura média)`` dentro dos
+    horizontes dos episódios, só as linhas necessárias (índice sala+início)."""
+    filtro = reduce(or_, (
+        Q(sala_id=int(sala_id), inicio__gte=_momento(minuto), inicio__lt=_momento(minuto + HORIZONTE))
+        for sala_id, minuto in episodios
+    ))
+    queryset = TelemetriaMinuto.objects.filter(filtro, temperatura_n__gt=0).order_by().annotate(
+        minuto=MinutoEpoch('inicio'),
+        media=ExpressionWrapper(F('temperatura_soma') / F('temperatura_n'), output_field=FloatField()),
+    ).values_list('sala_id', 'minuto', 'media')
+    sql, parametros = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        dados = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 3)
+    return dados[:, 0].astype(np.int64), dados[:, 1].astype(np.int64), dados[:, 2]
+
+
+def amostras(episodios, salas, minutos, temperaturas):
+    """Amostras ``(sala_id, queda em °C, minutos desde a partida)`` e o número
+    de episódios aproveitados por sala. Tudo vetorizado, sem laço por episódio."""
+    vazio = np.empty(0, np.int64), np.empty(0), np.empty(0), {}
+    if not len(salas):
+        return vazio
+    chaves = salas * _CHAVE + minutos
+    ordem = np.argsort(chaves, kind='stable')
+    chaves, temperaturas = chaves[ordem], temperaturas[ordem]
+    inicio_ep = episodios[:, 0] * _CHAVE + episodios[:, 1]
+    lo = np.searchsorted(chaves, inicio_ep)
+    hi = np.searchsorted(chaves, inicio_ep + HORIZONTE)
+    # Episódio útil: leitura logo na partida (temperatura inicial) e mais alguma depois
+    uteis = (hi - lo >= 2) & (chaves[np.minimum(lo, len(chaves) - 1)] - inicio_ep <= 2)
+    lo, hi, episodios, inicio_ep = lo[uteis], hi[uteis], episodios[uteis], inicio_ep[uteis]
+    tamanhos = hi - lo
+    if not tamanhos.sum():
+        return vazio
+
+    episodio = np.repeat(np.arange(len(lo)), tamanhos)
+    primeiras = np.cumsum(tamanhos) - tamanhos   # posição de cada episódio nas amostras
+    posicoes = np.arange(tamanhos.sum()) - np.repeat(primeiras, tamanhos) + np.repeat(lo, tamanhos)
+    t = (chaves[posicoes] - inicio_ep[episodio]).astype(np.float64)
+    temperatura = temperaturas[posicoes]
+    queda = temperaturas[lo][episodio] - temperatura
+
+    # Mínimo corrido por episódio: o deslocamento por episódio faz o
+    # acumulado recomeçar a cada um
+    deslocamento = episodio * 1e4
+    minimo = -(np.maximum.accumulate(deslocamento - temperatura) - deslocamento)
+    anterior = np.concatenate(([np.inf], minimo[:-1]))
+    anterior[primeiras] = np.inf
+    novo_minimo = temperatura < anterior
+
+    usar = novo_minimo & (queda >= QUEDA_MINIMA)
+    sala_das_amostras = episodios[episodio[usar], 0]
+    por_sala = {}
+    for sala_id in episodios[np.unique(episodio[usar]), 0].tolist():
+        por_sala[sala_id] = por_sala.get(sala_id, 0) + 1
+    return sala_das_amostras, queda[usar], t[usar], por_sala
+
+
+def _coeficientes(n, sx, sy, sxx, sxy):
+    denominador = n * sxx - sx * sx
+    if n <= 0 or denominador <= 1e-9:
+        return (sy / n if n > 0 else 0.0), 0.0
+    inclinacao = (n * sxy - sx * sy) / denominador
+    return (sy - inclinacao * sx) / n, inclinacao
+
+
+def ajustar(agora=None, desde=None):
+    """Soma os episódios novos às curvas das salas. Retorna ``(salas, episódios, segundos)``."""
+    relogio = time.perf_counter()
+    agora = agora or timezone.now()
+    fim = agora - timedelta(minutes=HORIZONTE)   # episódios com o horizonte completo
+    if desde is None:
+        desde = CurvaResfriamento.objects.aggregate(ultimo=Max('processado_ate'))['ultimo'] or fim - timedelta(
+            days=_config('LUMINOFF_RETENCAO_COMANDOS', 30))
+    if desde >= fim:
+        return 0, 0, time.perf_counter() - relogio
+
+    episodios = _episodios(desde, fim)
+    somas = {}   # sala -> [n, Σx, Σy, Σxx, Σxy, episódios]
+    for i in range(0, len(episodios), EPISODIOS_POR_CONSULTA):
+        bloco = episodios[i:i + EPISODIOS_POR_CONSULTA]
+        salas, x, y, por_sala = amostras(bloco, *_temperaturas(bloco))
+        if not len(salas):
+            continue
+        unicas, linhas = np.unique(salas, return_inverse=True)
+        parciais = np.stack([
+            np.bincount(linhas, weights=pesos, minlength=len(unicas))
+            for pesos in (np.ones_like(x), x, y, x * x, x * y)
+        ], axis=1)
+        for sala_id, linha in zip(unicas.tolist(), parciais.tolist()):
+            atual = somas.setdefault(sala_id, [0.0] * 5 + [0])
+            for k in range(5):
+                atual[k] += linha[k]
+            atual[5] += por_sala.get(sala_id, 0)
+
+    esquecimento = _config('LUMINOFF_PRE_RESFRIAMENTO_ESQUECIMENTO', 0.98)
+    with transaction.atomic():
+        existentes = CurvaResfriamento.objects.in_bulk(list(somas))
+        novas, alteradas = [], []
+        for sala_id, (n, sx, sy, sxx, sxy, quantos) in somas.items():
+            curva = existentes.get(sala_id)
+            if curva is None:
+                curva = CurvaResfriamento(sala_id=sala_id)
+                novas.append(curva)
+            else:
+                alteradas.append(curva)
+            curva.amostras = curva.amostras * esquecimento + n
+            curva.soma_x = curva.soma_x * esquecimento + sx
+            curva.soma_y = curva.soma_y * esquecimento + sy
+            curva.soma_xx = curva.soma_xx * esquecimento + sxx
+            curva.soma_xy = curva.soma_xy * esquecimento + sxy
+            curva.episodios += quantos
+            curva.minutos_base, curva.minutos_por_grau = _coeficientes(
+                curva.amostras, curva.soma_x, curva.soma_y, curva.soma_xx, curva.soma_xy)
+            curva.processado_ate = fim
+        CurvaResfriamento.objects.bulk_create(novas, batch_size=1000)
+        CurvaResfriamento.objects.bulk_update(alteradas, [
+            'amostras', 'soma_x', 'soma_y', 'soma_xx', 'soma_xy', 'episodios',
+            'minutos_base', 'minutos_por_grau', 'processado_ate',
+        ], batch_size=1000)
+    duracao = time.perf_counter() - relogio
+    logger.info("Curvas de resfriamento: %d salas, %d partidas do ar em %.2fs", len(somas), len(episodios), duracao)
+    return len(somas), len(episodios), duracao
+
+
+def _temperaturas_atuais(sala_ids, agora):
+    """Última temperatura média de cada sala nos últimos minutos."""
+    atuais = {}
+    for sala_id, soma, n in TelemetriaMinuto.objects.filter(
+            sala_id__in=sala_ids, temperatura_n__gt=0, inicio__gte=agora - timedelta(minutes=15),
+            inicio__lte=agora).order_by('inicio').values_list('sala_id', 'temperatura_soma', 'temperatura_n'):
+        atuais[sala_id] = soma / n
+    return atuais
+
+
+def antecedencias(sala_ids, padrao, agora=None):
+    """``{sala_id: minutos}`` de antecedência do ar para cada sala.
+
+    Usa a curva da sala e a temperatura atual; sem curva confiável ou sem
+    leitura recente, fica ``padrao``.
+    """
+    agora = agora or timezone.now()
+    alvo = _config('LUMINOFF_TEMPERATURA_ALVO', 24)
+    folga = _config('LUMINOFF_PRE_RESFRIAMENTO_FOLGA', 2)
+    maxima = _config('LUMINOFF_ANTECEDENCIA_AR_MAXIMA', 60)
+    curvas = dict((sala_id, (base, por_grau)) for sala_id, base, por_grau in CurvaResfriamento.objects.filter(
+        sala_id__in=sala_ids, amostras__gte=_config('LUMINOFF_PRE_RESFRIAMENTO_AMOSTRAS', 20),
+        minutos_por_grau__gt=0,
+    ).values_list('sala_id', 'minutos_base', 'minutos_por_grau'))
+    atuais = _temperaturas_atuais(list(curvas), agora) if curvas else {}
+
+    resultado = {}
+    for sala_id in sala_ids:
+        curva, temperatura = curvas.get(sala_id), atuais.get(sala_id)
+        if curva is None or temperatura is None:
+            resultado[sala_id] = padrao
+            continue
+        minutos = curva[0] + curva[1] * max(temperatura - alvo, 0) + folga
+        resultado[sala_id] = min(max(math.ceil(minutos), 0), maxima)
+    return resultado
@@ -0,0 +1,249 @@
+"""
+Desligamento antecipado por ausência (sensores de presença).
+
+A agenda mantém a sala ligada até o fim do horário (mais a tolerância), mesmo
+quando a aula termina cedo ou nem acontece. O ``MonitorPresenca`` acompanha,
+em um único laço, as salas que estão dentro de uma janela da agenda e a
+ocupação de cada minuto vinda da telemetria (``TelemetriaMinuto``):
+
+- com ``LUMINOFF_PRESENCA_VACANCIA`` minutos sem presença, e o sensor
+  respondendo que a sala está vazia, luz e ar são desligados;
+- com presença em ``LUMINOFF_PRESENCA_CONFIRMACAO`` minutos seguidos, voltam.
+
+O sinal é a média de ocupação do minuto comparada com
+``LUMINOFF_PRESENCA_LIMIAR``, então um sensor que oscila dentro do minuto não
+chega aos relés; religada, a sala só desliga de novo depois de outra vacância
+inteira. Sala sem sensor (sem leituras de ocupação) nunca é desligada.
+
+Só as salas dentro de uma janela têm estado em memória (uma
+``MaquinaPresenca``) e cada ciclo lê só os minutos novos, então a memória não
+cresce com o tempo nem com o volume de leituras.
+
+Os comandos vão para a fila (``despacho``) com origem "presença": o agendador
+não os considera ao retomar o próprio estado, e o fim da janela desliga a
+sala como sempre. Cada desligamento vira um ``DesligamentoAusencia``, aberto
+até a sala religar ou a janela terminar, com a energia economizada.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import calendario, despacho, referencia, versao
+from .dispositivos import DESLIGAR, DISPOSITIVOS, LIGAR, Comando
+from .energia import PERFIS_PADRAO
+from .models import ComandoDispositivo, DesligamentoAusencia, TelemetriaMinuto
+
+logger = logging.getLogger(__name__)
+
+ATRASO = 1   # minutos: o minuto corrente ainda está recebendo leituras
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class MaquinaPresenca:
+    """Estado de uma sala dentro de uma janela da agenda."""
+
+    __slots__ = ('fim_janela', 'ultima_presenca', 'presencas', 'desligada_em')
+
+    def __init__(self, fim_janela, inicio, desligada_em=None):
+        self.fim_janela = fim_janela       # quando a agenda desliga a sala
+        self.ultima_presenca = inicio
+        self.presencas = 0                 # minutos seguidos com presença enquanto desligada
+        self.desligada_em = desligada_em   # None = ligada
+
+    def leitura(self, momento, presente, vacancia, confirmacao):
+        """Aplica a ocupação de um minuto (``momento`` = fim do minuto).
+
+        Retorna ``LIGAR``, ``DESLIGAR`` ou ``None``.
+        """
+        if presente:
+            self.ultima_presenca = max(self.ultima_presenca, momento)
+            if self.desligada_em is None:
+                return None
+            self.presencas += 1
+            if self.presencas < confirmacao:
+                return None
+            self.presencas = 0
+            self.desligada_em = None
+            return LIGAR
+        self.presencas = 0
+        if self.desligada_em is None and momento - self.ultima_presenca >= vacancia:
+            self.desligada_em = momento
+            return DESLIGAR
+        return None
+
+
+class MonitorPresenca:
+    """Desliga salas vazias dentro das janelas da agenda e religa com presença."""
+
+    def __init__(self, ao_registrar=None, predios=None, intervalo=None):
+        self.ao_registrar = ao_registrar   # ex.: acordar o despachante do mesmo processo
+        self.predios = predios             # ids de Predio; None = todas as salas
+        self.intervalo = intervalo or _config('LUMINOFF_PRESENCA_INTERVALO', 60)
+        self.maquinas = {}                 # sala_id -> MaquinaPresenca (só salas dentro de uma janela)
+        self._chave = None
+        self._carregada_em = 0.0
+        self._linha = None
+        self._potencias = {}               # sala_id -> kW de luz + ar
+        self._lido_ate = None              # minutos anteriores a este já foram processados
+        self._retomado = False
+        self._parar = asyncio.Event()
+        self._acordar = asyncio.Event()
+
+    # -- agenda ---------------------------------------------------------------
+
+    def _agenda(self, agora):
+        chave = (versao.atual(), agora.date(), self.predios)
+        vencida = time.monotonic() - self._carregada_em > _config('LUMINOFF_INTERVALO_RECOMPILACAO', 300)
+        if chave == self._chave and not vencida:
+            return
+        perfis = _config('LUMINOFF_PERFIS_POTENCIA', PERFIS_PADRAO)
+        self._potencias = {
+            sala.pk: sum(perfis.get(sala.tipo, PERFIS_PADRAO['OUT'])[dispositivo] for dispositivo in DISPOSITIVOS)
+            for sala in referencia.salas_ativas(self.predios)
+        }
+        # As mesmas margens da luz no agendador: a janela começa com a aula
+        self._linha = calendario.indice_semana(agora.date()).com_margens(
+            0, _config('LUMINOFF_TOLERANCIA_DESLIGAMENTO', 10))
+        self._chave, self._carregada_em = chave, time.monotonic()
+
+    def _fim_janela(self, sala_id, momento):
+        """Fim da janela que contém ``momento``, ou ``None`` fora de uma janela."""
+        if not self._linha.ocupada(sala_id, momento):
+            return None
+        transicao = self._linha.proxima_transicao(sala_id, momento)
+        return transicao[0] if transicao else None
+
+    # -- ciclo ----------------------------------------------------------------
+
+    def _retomar(self, agora, fechar):
+        """Desligamentos abertos (processo reiniciado): continuam ou são encerrados."""
+        for sala_id, inicio in DesligamentoAusencia.objects.filter(fim__isnull=True).values_list('sala_id', 'inicio'):
+            if sala_id not in self._potencias:
+                continue   # sala de outro trabalhador
+            inicio = timezone.localtime(inicio)
+            fim_janela = self._fim_janela(sala_id, agora)
+            if fim_janela is not None and fim_janela == self._fim_janela(sala_id, inicio):
+                self.maquinas[sala_id] = MaquinaPresenca(fim_janela, inicio, desligada_em=inicio)
+            else:
+                # Sem saber quando a janela acabou, não conta economia além dela
+                fechar[sala_id] = min(self._fim_janela(sala_id, inicio) or inicio, agora)
+        self._retomado = True
+
+    def _janelas(self, agora, fechar):
+        """Cria máquinas para as salas que entraram em uma janela e encerra as que saíram."""
+        for sala_id in self._potencias:
+            fim_janela = self._fim_janela(sala_id, agora)
+            maquina = self.maquinas.get(sala_id)
+            if maquina is not None and (fim_janela is None or maquina.fim_janela <= agora):
+                # A janela acabou (ou começou outra): a agenda desligou a sala no fim dela
+                if maquina.desligada_em is not None:
+                    fechar[sala_id] = min(maquina.fim_janela, agora)
+                del self.maquinas[sala_id]
+                maquina = None
+            if fim_janela is None:
+                continue
+            if maquina is None:
+                self.maquinas[sala_id] = MaquinaPresenca(fim_janela, agora)
+            else:
+                maquina.fim_janela = fim_janela   # janela estendida por uma reserva, por exemplo
+        for sala_id in self.maquinas.keys() - self._potencias.keys():
+            if self.maquinas[sala_id].desligada_em is not None:
+                fechar[sala_id] = agora
+            del self.maquinas[sala_id]
+
+    def _leituras(self, desde, ate):
+        """``(sala_id, fim do minuto, presente)`` das salas acompanhadas, em ordem."""
+        limiar = _config('LUMINOFF_PRESENCA_LIMIAR', 0.5)
+        linhas = TelemetriaMinuto.objects.filter(inicio__gte=desde, inicio__lt=ate, ocupacao_n__gt=0).order_by(
+            'inicio').values_list('sala_id', 'inicio', 'ocupacao_soma', 'ocupacao_n')
+        for sala_id, inicio, soma, n in linhas:
+            if sala_id in self.maquinas:
+                yield sala_id, timezone.localtime(inicio) + timedelta(minutes=1), soma / n >= limiar
+
+    def processar(self, agora=None):
+        """Um ciclo: atualiza as janelas, aplica os minutos novos e grava os comandos.
+
+        Retorna os comandos gravados.
+        """
+        agora = timezone.localtime(agora)
+        self._agenda(agora)
+        vacancia = timedelta(minutes=_config('LUMINOFF_PRESENCA_VACANCIA', 15))
+        confirmacao = _config('LUMINOFF_PRESENCA_CONFIRMACAO', 1)
+        fechar = {}   # sala_id -> fim do desligamento aberto
+        abrir = []    # DesligamentoAusencia novos
+        if not self._retomado:
+            self._retomar(agora, fechar)
+        self._janelas(agora, fechar)
+
+        ate = agora.replace(second=0, microsecond=0) - timedelta(minutes=ATRASO)
+        desde = self._lido_ate or ate - timedelta(minutes=1)
+        comandos = []
+        if self.maquinas and desde < ate:
+            for sala_id, momento, presente in self._leituras(desde, ate):
+                acao = self.maquinas[sala_id].leitura(momento, presente, vacancia, confirmacao)
+                if acao is None:
+                    continue
+                if acao == DESLIGAR:
+                    abrir.append(DesligamentoAusencia(sala_id=sala_id, inicio=momento))
+                else:
+                    fechar[sala_id] = momento
+                comandos.extend(Comando(sala_id, dispositivo, acao, momento) for dispositivo in DISPOSITIVOS)
+
+        with transaction.atomic():
+            self._fechar(fechar)
+            DesligamentoAusencia.objects.bulk_create(abrir)
+            if comandos:
+                despacho.registrar(comandos, origem=ComandoDispositivo.PRESENCA)
+        # Só depois de gravar: se falhar, o próximo ciclo relê os mesmos minutos
+        self._lido_ate = max(desde, ate)
+        return comandos
+
+    def _fechar(self, fechar):
+        if not fechar:
+            return
+        abertos = list(DesligamentoAusencia.objects.filter(fim__isnull=True, sala_id__in=list(fechar)))
+        for desligamento in abertos:
+            desligamento.fim = max(fechar[desligamento.sala_id], desligamento.inicio)
+            desligamento.minutos = (desligamento.fim - desligamento.inicio).total_seconds() / 60
+            desligamento.kwh = desligamento.minutos / 60 * self._potencias.get(desligamento.sala_id, 0)
+        DesligamentoAusencia.objects.bulk_update(abertos, ['fim', 'minutos', 'kwh'])
+
+    # -- laço -----------------------------------------------------------------
+
+    async def executar(self):
+        while not self._parar.is_set():
+            try:
+                comandos = await sync_to_async(self.processar)()
+            except Exception:
+                # O estado em memória pode ter ficado à frente do banco: recomeça dele
+                logger.exception("Falha no ciclo do monitor de presença")
+                self.maquinas, self._retomado = {}, False
+                comandos = []
+            if comandos:
+                logger.info("Presença: %d comandos", len(comandos))
+                if self.ao_registrar is not None:
+                    self.ao_registrar()
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+
+    def definir_predios(self, predios):
+        """Troca o conjunto de prédios acompanhados (chamado pelo ``Coordenador``)."""
+        self.predios = predios
+        self.maquinas, self._retomado = {}, False
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
@@ -0,0 +1,201 @@
+"""
+Dados de referência em memória: semestres, salas, disciplinas e professores.
+
+Mudam poucas vezes por semestre, mas quase toda operação da agenda precisa
+deles ("o semestre ativo", as salas ativas, o código de uma disciplina, o
+nome de um professor). Cada processo carrega cada tabela uma vez, com uma
+consulta, em registros compactos (``__slots__``), e a relê quando a versão
+de referência (``versao.da_referencia``) muda. Em regime, ler daqui não vai
+ao banco.
+
+Os sinais de Semestre, Sala, Disciplina, Professor e User chamam
+``marcar_alterada``: o processo que escreveu descarta a cópia na hora e,
+depois do commit, a versão é incrementada para os outros processos. A
+versão é conferida no cache no máximo a cada
+``LUMINOFF_REFERENCIA_VERIFICACAO`` segundos. Escritas em massa
+(``bulk_create``, ``update``) não disparam sinais: quem as faz chama
+``marcar_alterada``. Como garantia (ex.: cópia lida dentro de uma transação
+desfeita), nenhuma cópia vale mais que ``LUMINOFF_REFERENCIA_VALIDADE``
+segundos.
+
+Os registros são só para leitura; para alterar, use os modelos.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import versao
+from .models import Disciplina, Professor, Sala, Semestre
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class _Registro:
+    __slots__ = ()
+
+    def __init__(self, *valores):
+        for campo, valor in zip(self.__slots__, valores):
+            setattr(self, campo, valor)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.pk}: {self}>"
+
+
+class DadosSemestre(_Registro):
+    __slots__ = ('pk', 'ano', 'semestre', 'data_inicio', 'data_fim', 'ativo')
+
+    def __str__(self):
+        return f"{self.ano}.{self.semestre}"
+
+
+class DadosSala(_Registro):
+    __slots__ = ('pk', 'nome', 'tipo', 'capacidade', 'localizacao', 'predio_id', 'andar', 'ativa')
+
+    def __str__(self):
+        return self.nome
+
+
+class DadosDisciplina(_Registro):
+    __slots__ = ('pk', 'codigo', 'nome', 'ativa')
+
+    def __str__(self):
+        return f"{self.codigo} - {self.nome}"
+
+
+class DadosProfessor(_Registro):
+    __slots__ = ('pk', 'matricula', 'nome')
+
+    def __str__(self):
+        return self.nome
+
+
+def _carregar_semestres():
+    return {linha[0]: DadosSemestre(*linha) for linha in Semestre.objects.order_by('pk').values_list(
+        *DadosSemestre.__slots__)}
+
+
+def _carregar_salas():
+    return {linha[0]: DadosSala(*linha) for linha in Sala.objects.order_by('pk').values_list(*DadosSala.__slots__)}
+
+
+def _carregar_disciplinas():
+    return {linha[0]: DadosDisciplina(*linha) for linha in Disciplina.objects.order_by('pk').values_list(
+        *DadosDisciplina.__slots__)}
+
+
+def _carregar_professores():
+    # Mesmo nome de Professor.__str__ (User.get_full_name)
+    return {
+        pk: DadosProfessor(pk, matricula, f"{nome} {sobrenome}".strip())
+        for pk, matricula, nome, sobrenome in Professor.objects.order_by('pk').values_list(
+            'pk', 'matricula', 'user__first_name', 'user__last_name')
+    }
+
+
+_CARREGAR = {
+    'semestres': _carregar_semestres,
+    'salas': _carregar_salas,
+    'disciplinas': _carregar_disciplinas,
+    'professores': _carregar_professores,
+    # Índices derivados das tabelas acima
+    'semestre_ativo': lambda: next((s for s in _tabela('semestres').values() if s.ativo), None),
+    'salas_ativas': lambda: tuple(sala for sala in _tabela('salas').values() if sala.ativa),
+    'salas_por_nome': lambda: {sala.nome: sala for sala in _tabela('salas').values()},
+    'disciplinas_por_codigo': lambda: {d.codigo: d for d in _tabela('disciplinas').values()},
+    'professores_por_matricula': lambda: {p.matricula: p for p in _tabela('professores').values()},
+}
+
+_tabelas = {}       # nome -> dados carregados (trocado inteiro ao invalidar)
+_versao = None
+_conferida_em = 0.0
+_iniciada_em = 0.0
+
+
+def _tabela(nome):
+    global _tabelas, _versao, _conferida_em, _iniciada_em
+    agora = time.monotonic()
+    if agora - _conferida_em >= _config('LUMINOFF_REFERENCIA_VERIFICACAO', 1):
+        atual = versao.da_referencia()
+        if atual != _versao or agora - _iniciada_em > _config('LUMINOFF_REFERENCIA_VALIDADE', 300):
+            _tabelas, _versao, _iniciada_em = {}, atual, agora
+        _conferida_em = agora
+    tabelas = _tabelas
+    if nome not in tabelas:
+        tabelas[nome] = _CARREGAR[nome]()
+    return tabelas[nome]
+
+
+def carregar():
+    """Carrega todas as tabelas de uma vez (ex.: ao iniciar um processo)."""
+    for nome in _CARREGAR:
+        _tabela(nome)
+
+
+def invalidar():
+    """Descarta as cópias deste processo (relidas no próximo acesso)."""
+    global _tabelas
+    _tabelas = {}
+
+
+def incrementar():
+    """Invalida as cópias de todos os processos."""
+    invalidar()
+    versao.incrementar_referencia()
+
+
+def marcar_alterada():
+    """Para quem escreveu: invalida já neste processo e, após o commit, em todos."""
+    invalidar()
+    transaction.on_commit(incrementar)
+
+
+# -- consultas ----------------------------------------------------------------
+
+def semestre_ativo():
+    """``DadosSemestre`` do semestre ativo, ou ``None``."""
+    return _tabela('semestre_ativo')
+
+
+def semestre(pk):
+    return _tabela('semestres').get(pk)
+
+
+def sala(pk):
+    return _tabela('salas').get(pk)
+
+
+def sala_por_nome(nome):
+    return _tabela('salas_por_nome').get(nome)
+
+
+def salas():
+    """``DadosSala`` de todas as salas, ativas ou não, em ordem de id."""
+    return list(_tabela('salas').values())
+
+
+def salas_ativas(predios=None):
+    """``DadosSala`` das salas ativas, em ordem de id; só dos ``predios`` (ids), se informados."""
+    salas = _tabela('salas_ativas')
+    if predios is None:
+        return list(salas)
+    predios = set(predios)
+    return [sala for sala in salas if sala.predio_id in predios]
+
+
+def disciplina(pk):
+    return _tabela('disciplinas').get(pk)
+
+
+def disciplina_por_codigo(codigo):
+    return _tabela('disciplinas_por_codigo').get(codigo)
+
+
+def professor(pk):
+    return _tabela('professores').get(pk)
+
+
+def professor_por_matricula(matricula):
+    return _tabela('professores_por_matricula').get(matricula)
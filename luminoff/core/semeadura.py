@@ -0,0 +1,148 @@
+"""
+Campus sintético para benchmarks e testes de carga.
+
+Tudo é inserido com ``bulk_create`` (sem sinais, sem validação por linha). A
+grade é montada por sorteio de vagas livres ``(sala, dia, faixa)``, então
+nenhuma sala recebe duas aulas no mesmo horário. O sorteio usa uma semente
+fixa: a mesma chamada gera sempre o mesmo campus.
+"""
+import random
+from datetime import date, time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import referencia
+from .models import Disciplina, Dispositivo, HorarioTurma, Predio, Professor, Sala, Semestre, TipoSala, Turma
+
+# Faixas de 2h das 07:00 às 21:00, segunda a sábado
+FAIXAS = [(time(hora), time(hora + 2)) for hora in range(7, 21, 2)]
+DIAS = range(6)
+
+# Proporção e capacidades de cada tipo de sala
+TIPOS = {
+    TipoSala.SALA_AULA: (0.70, (30, 40, 50, 60)),
+    TipoSala.LABORATORIO: (0.20, (20, 25, 30, 40)),
+    TipoSala.AUDITORIO: (0.05, (100, 150, 200)),
+    TipoSala.OUTROS: (0.05, (10, 15, 20)),
+}
+
+
+def dimensoes(escala=1):
+    """Parâmetros de ``semear_campus`` para uma escala (1 = campus pequeno).
+
+    A escala multiplica prédios e turmas; andares e salas por andar ficam
+    fixos, como acontece quando um campus cresce.
+    """
+    return {'predios': 2 * escala, 'andares': 3, 'salas_por_andar': 5, 'turmas': 150 * escala}
+
+
+def _tirar_vaga(livres, dias_usados):
+    """Remove e devolve uma vaga, de preferência em um dia ainda não usado."""
+    for lista in livres:
+        for posicao in range(len(lista) - 1, max(len(lista) - 8, -1), -1):
+            if lista[posicao][1] not in dias_usados:
+                return lista.pop(posicao)
+    for lista in livres:
+        if lista:
+            return lista.pop()
+    return None
+
+
+def semear_campus(predios=4, andares=3, salas_por_andar=8, turmas=600, horarios_por_turma=2,
+                  ano=2025, periodo=2, prefixo='S', semente=0):
+    """Cria salas, disciplinas, professores e a grade no semestre ``ano.periodo``
+    (criado se preciso), que passa a ser o ativo.
+
+    ``prefixo`` separa os nomes únicos (sala, disciplina, usuário), permitindo
+    semear mais de um campus no mesmo banco. Retorna o ``Semestre``.
+    """
+    sorteio = random.Random(semente)
+    tipos = list(TIPOS)
+    pesos = [TIPOS[tipo][0] for tipo in tipos]
+    n_professores = max(turmas // 4, 1)
+    n_disciplinas = max(turmas // 3, 1)
+
+    with transaction.atomic():
+        Semestre.objects.filter(ativo=True).exclude(ano=ano, semestre=periodo).update(ativo=False)
+        semestre, _ = Semestre.objects.update_or_create(
+            ano=ano, semestre=periodo, defaults={'ativo': True},
+            create_defaults={'ativo': True, 'data_inicio': date(ano, 8 if periodo == 2 else 3, 1),
+                             'data_fim': date(ano, 12 if periodo == 2 else 7, 15)},
+        )
+        nomes_predios = [f'Prédio {prefixo}{p:02d}' for p in range(predios)]
+        Predio.objects.bulk_create([Predio(nome=nome) for nome in nomes_predios], ignore_conflicts=True)
+        predio_ids = dict(Predio.objects.filter(nome__in=nomes_predios).values_list('nome', 'pk'))
+        novas = []
+        for p, nome_predio in enumerate(nomes_predios):
+            for andar in range(andares):
+                for k in range(salas_por_andar):
+                    tipo = sorteio.choices(tipos, pesos)[0]
+                    novas.append(Sala(nome=f'{prefixo}{p:02d}-{andar}{k:02d}', tipo=tipo,
+                                      capacidade=sorteio.choice(TIPOS[tipo][1]),
+                                      localizacao=nome_predio, predio_id=predio_ids[nome_predio], andar=andar))
+        salas = [(sala.pk, sala.tipo, sala.capacidade) for sala in Sala.objects.bulk_create(novas, batch_size=1000)]
+        usuarios = User.objects.bulk_create([
+            User(username=f'{prefixo.lower()}prof{i}', first_name=f'Professor {i}', last_name=prefixo,
+                 email=f'{prefixo.lower()}prof{i}@ufrpe.br', password='!')
+            for i in range(n_professores)
+        ], batch_size=1000)
+        professor_ids = [professor.pk for professor in Professor.objects.bulk_create([
+            Professor(user=usuario, matricula=f'{prefixo}{i:06d}', departamento=f'Departamento {i % 12}')
+            for i, usuario in enumerate(usuarios)
+        ], batch_size=1000)]
+        disciplina_ids = [disciplina.pk for disciplina in Disciplina.objects.bulk_create([
+            Disciplina(codigo=f'{prefixo}{i:05d}', nome=f'Disciplina {i}', carga_horaria=60)
+            for i in range(n_disciplinas)
+        ], batch_size=1000)]
+
+        # Vagas livres por tipo e capacidade, embaralhadas
+        vagas = {}
+        for sala_id, tipo, capacidade in salas:
+            vagas.setdefault(tipo, {}).setdefault(capacidade, []).extend(
+                (sala_id, dia, faixa) for dia in DIAS for faixa in range(len(FAIXAS)))
+        for por_capacidade in vagas.values():
+            for lista in por_capacidade.values():
+                sorteio.shuffle(lista)
+        tipos_turma = list(vagas)
+        pesos_turma = [TIPOS[tipo][0] for tipo in tipos_turma]
+        capacidade_maxima = {tipo: max(vagas[tipo]) for tipo in tipos_turma}
+
+        # Cada turma ocupa vagas da menor capacidade que a comporta, em dias
+        # diferentes, e fica com um professor livre nesses horários
+        novas, grades = [], []
+        ocupados = [set() for _ in professor_ids]   # professor -> {(dia, faixa)}
+        for i in range(turmas):
+            tipo = sorteio.choices(tipos_turma, pesos_turma)[0]
+            alunos = sorteio.randint(10, capacidade_maxima[tipo])
+            livres = [lista for capacidade, lista in sorted(vagas[tipo].items()) if capacidade >= alunos]
+            grade = []
+            for _ in range(horarios_por_turma):
+                vaga = _tirar_vaga(livres, {dia for _, dia, _ in grade})
+                if vaga is not None:
+                    grade.append(vaga)
+            momentos = {(dia, faixa) for _, dia, faixa in grade}
+            candidatos = [(i + k) % n_professores for k in range(min(n_professores, 20))]
+            professor = next((p for p in candidatos if not ocupados[p] & momentos), candidatos[0])
+            ocupados[professor] |= momentos
+            novas.append(Turma(
+                semestre=semestre, disciplina_id=disciplina_ids[i % n_disciplinas],
+                codigo_turma=f'T{i // n_disciplinas:02d}', professor_id=professor_ids[professor],
+                numero_alunos=alunos,
+            ))
+            grades.append(grade)
+
+        horarios = [
+            HorarioTurma(turma_id=turma.pk, semestre=semestre, sala_id=sala_id, dia_semana=dia,
+                         hora_inicio=FAIXAS[faixa][0], hora_fim=FAIXAS[faixa][1])
+            for turma, grade in zip(Turma.objects.bulk_create(novas, batch_size=1000), grades)
+            for sala_id, dia, faixa in grade
+        ]
+        HorarioTurma.objects.bulk_create(horarios, batch_size=2000)
+        Dispositivo.objects.bulk_create([
+            Dispositivo(sala_id=sala_id, tipo=tipo, identificador=f'{tipo}-{sala_id}')
+            for sala_id, _, _ in salas for tipo in ('luz', 'ar')
+        ], batch_size=2000)
+        # bulk_create não dispara sinais
+        referencia.marcar_alterada()
+    return semestre
@@ -0,0 +1,159 @@
+"""
+Sinais que mantêm as estruturas derivadas dos horários em dia.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import alteracoes, calendario, ocupacao, referencia, versao
+from .models import (
+    CancelamentoAula, Disciplina, Feriado, HorarioTurma, Professor, ReservaExtra, Sala, Semestre, Turma,
+)
+
+
+def _atualizar_salas_apos_commit(sala_ids, dias_semana=None):
+    sala_ids = set(sala_ids)
+    transaction.on_commit(lambda: ocupacao.atualizar_salas(sala_ids))
+    transaction.on_commit(lambda: calendario.marcar_salas(sala_ids, dias_semana))
+    transaction.on_commit(lambda: versao.incrementar_salas(sala_ids))
+    transaction.on_commit(lambda: alteracoes.publicar(sala_ids))
+
+
+def _marcar_datas_apos_commit(sala_ids, datas):
+    transaction.on_commit(lambda: calendario.marcar_salas(sala_ids, datas=datas))
+    transaction.on_commit(versao.incrementar)
+
+
+def _guardar_anterior(sender, instance, campos, raw):
+    # Valores antes da alteração: a sala/data antiga também precisa ser refeita
+    instance._anterior = None
+    if instance.pk and not raw:
+        instance._anterior = sender.objects.filter(pk=instance.pk).values(*campos).first()
+
+
+def _anterior(instance, campo):
+    anterior = getattr(instance, '_anterior', None)
+    return anterior.get(campo) if anterior else None
+
+
+@receiver(pre_save, sender=HorarioTurma)
+def guardar_sala_anterior(sender, instance, raw=False, **kwargs):
+    _guardar_anterior(sender, instance, ('sala_id', 'dia_semana'), raw)
+    instance._sala_anterior_id = _anterior(instance, 'sala_id')
+
+
+@receiver(post_save, sender=HorarioTurma)
+@receiver(post_delete, sender=HorarioTurma)
+def horario_alterado(sender, instance, **kwargs):
+    _atualizar_salas_apos_commit(
+        [instance.sala_id, getattr(instance, '_sala_anterior_id', None)],
+        {instance.dia_semana, _anterior(instance, 'dia_semana')},
+    )
+
+
+@receiver(post_save, sender=Turma)
+def turma_alterada(sender, instance, created=False, **kwargs):
+    # Turma nova ainda não tem horários; exclusões chegam pelos HorarioTurma
+    if not created:
+        horarios = list(instance.horarios.values_list('sala_id', 'dia_semana'))
+        _atualizar_salas_apos_commit([sala_id for sala_id, _ in horarios], {dia for _, dia in horarios})
+    else:
+        transaction.on_commit(versao.incrementar)
+
+
+@receiver(post_delete, sender=Turma)
+def turma_excluida(sender, instance, **kwargs):
+    transaction.on_commit(versao.incrementar)
+
+
+@receiver(post_save, sender=Disciplina)
+def disciplina_alterada(sender, instance, created=False, **kwargs):
+    # O código da disciplina aparece na grade das salas onde ela tem aula
+    if not created:
+        sala_ids = set(HorarioTurma.objects.filter(turma__disciplina=instance).values_list('sala_id', flat=True))
+        transaction.on_commit(lambda: versao.incrementar_salas(sala_ids))
+
+
+@receiver(post_save, sender=Professor)
+@receiver(post_save, sender=User)
+def professor_alterado(sender, instance, created=False, update_fields=None, **kwargs):
+    # O nome do professor aparece na grade das salas onde ele dá aula
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    filtro = {'turma__professor__user': instance} if sender is User else {'turma__professor': instance}
+    sala_ids = set(HorarioTurma.objects.filter(**filtro).values_list('sala_id', flat=True))
+    if sala_ids:
+        transaction.on_commit(lambda: versao.incrementar_salas(sala_ids))
+
+
+@receiver(post_save, sender=Sala)
+@receiver(post_delete, sender=Sala)
+def sala_alterada(sender, instance, **kwargs):
+    _atualizar_salas_apos_commit([instance.pk])
+
+
+@receiver(post_save, sender=Semestre)
+@receiver(post_delete, sender=Semestre)
+def semestre_alterado(sender, instance, **kwargs):
+    # Trocar o semestre ativo muda o conjunto inteiro de horários
+    transaction.on_commit(ocupacao.invalidar)
+    transaction.on_commit(calendario.invalidar_tudo)
+    transaction.on_commit(versao.incrementar_salas)
+    transaction.on_commit(alteracoes.publicar)
+
+
+@receiver(post_save, sender=Semestre)
+@receiver(post_delete, sender=Semestre)
+@receiver(post_save, sender=Sala)
+@receiver(post_delete, sender=Sala)
+@receiver(post_save, sender=Disciplina)
+@receiver(post_delete, sender=Disciplina)
+@receiver(post_save, sender=Professor)
+@receiver(post_delete, sender=Professor)
+@receiver(post_save, sender=User)
+def referencia_alterada(sender, instance, update_fields=None, **kwargs):
+    # O login só grava last_login, que não está nos dados de referência
+    if sender is User and update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    referencia.marcar_alterada()
+
+
+@receiver(pre_save, sender=Feriado)
+def guardar_feriado_anterior(sender, instance, raw=False, **kwargs):
+    _guardar_anterior(sender, instance, ('data_inicio', 'data_fim'), raw)
+
+
+@receiver(post_save, sender=Feriado)
+@receiver(post_delete, sender=Feriado)
+def feriado_alterado(sender, instance, **kwargs):
+    datas = set(calendario.periodo(instance.data_inicio, instance.data_fim))
+    if _anterior(instance, 'data_inicio'):
+        datas.update(calendario.periodo(_anterior(instance, 'data_inicio'), _anterior(instance, 'data_fim')))
+    transaction.on_commit(lambda: calendario.invalidar_datas(datas))
+    transaction.on_commit(versao.incrementar)
+
+
+@receiver(pre_save, sender=CancelamentoAula)
+def guardar_cancelamento_anterior(sender, instance, raw=False, **kwargs):
+    _guardar_anterior(sender, instance, ('horario__sala_id', 'data'), raw)
+
+
+@receiver(post_save, sender=CancelamentoAula)
+@receiver(post_delete, sender=CancelamentoAula)
+def cancelamento_alterado(sender, instance, **kwargs):
+    sala_id = HorarioTurma.objects.filter(pk=instance.horario_id).values_list('sala_id', flat=True).first()
+    _marcar_datas_apos_commit(
+        [sala_id, _anterior(instance, 'horario__sala_id')], [instance.data, _anterior(instance, 'data')])
+
+
+@receiver(pre_save, sender=ReservaExtra)
+def guardar_reserva_anterior(sender, instance, raw=False, **kwargs):
+    _guardar_anterior(sender, instance, ('sala_id', 'data'), raw)
+
+
+@receiver(post_save, sender=ReservaExtra)
+@receiver(post_delete, sender=ReservaExtra)
+def reserva_alterada(sender, instance, **kwargs):
+    _marcar_datas_apos_commit([instance.sala_id, _anterior(instance, 'sala_id')],
+                              [instance.data, _anterior(instance, 'data')])
@@ -0,0 +1,261 @@
+"""
+Ingestão da telemetria dos sensores das salas.
+
+As leituras chegam em fluxo (NDJSON ou CSV, uma leitura por linha)::
+
+    {"sala": 12, "momento": "2025-08-04T07:01:10-03:00", "ocupacao": 1, "corrente": 3.2, "temperatura": 24.5}
+
+``sala`` é o id ou o nome da sala; ``momento`` é ISO 8601 ou epoch em
+segundos (ausente = agora); as métricas são opcionais.
+
+Nada é gravado por leitura: o ``BufferTelemetria`` acumula somas e contagens
+por (sala, minuto) em memória e, a cada ``limite`` leituras, grava o lote nas
+três tabelas (minuto, hora, dia). Os agregados de hora e dia são somados de
+forma incremental ao que já está no banco (upsert com soma), então o custo de
+uma descarga é um punhado de consultas, independente do número de leituras.
+"""
+import csv
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import referencia
+from .models import TelemetriaDia, TelemetriaHora, TelemetriaMinuto
+
+METRICAS = ('ocupacao', 'corrente', 'temperatura')
+# Posições no vetor de agregados: (soma, n) de cada métrica + máximo da corrente
+_OCUPACAO, _CORRENTE, _TEMPERATURA, _CORRENTE_MAX = 0, 2, 4, 6
+_CAMPOS = ('ocupacao_soma', 'ocupacao_n', 'corrente_soma', 'corrente_n',
+           'temperatura_soma', 'temperatura_n', 'corrente_max')
+
+MAX_ERROS = 100
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class ResultadoIngestao:
+    def __init__(self):
+        self.recebidas = 0
+        self.gravadas = 0
+        self.descargas = 0
+        self.rejeitadas = 0
+        self.erros = []   # (número da linha, mensagem), no máximo MAX_ERROS
+
+    def rejeitar(self, numero, mensagem):
+        self.rejeitadas += 1
+        if len(self.erros) < MAX_ERROS:
+            self.erros.append((numero, mensagem))
+
+    def __str__(self):
+        return (f"{self.recebidas} leituras: {self.gravadas} gravadas em {self.descargas} lotes, "
+                f"{self.rejeitadas} rejeitadas")
+
+    def como_dict(self):
+        return {'recebidas': self.recebidas, 'gravadas': self.gravadas,
+                'rejeitadas': self.rejeitadas, 'erros': self.erros}
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+def _texto(linha):
+    return linha.decode('utf-8-sig') if isinstance(linha, bytes) else linha
+
+
+def ler_ndjson(linhas):
+    """``(número, registro)`` de cada linha; JSON inválido vira ``None``."""
+    for numero, linha in enumerate(linhas, start=1):
+        linha = _texto(linha).strip()
+        if not linha:
+            continue
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            registro = None
+        yield numero, registro if isinstance(registro, dict) else None
+
+
+def ler_csv(linhas):
+    """``(número, registro)`` de um CSV com cabeçalho (linha 1)."""
+    leitor = csv.DictReader(_texto(linha) for linha in linhas)
+    for numero, registro in enumerate(leitor, start=2):
+        yield numero, {chave.strip().lower(): valor for chave, valor in registro.items() if chave}
+
+
+def _momento(valor, agora):
+    if valor in (None, ''):
+        return agora
+    if isinstance(valor, (int, float)) or str(valor).replace('.', '', 1).isdigit():
+        return datetime.fromtimestamp(float(valor), tz=dt_timezone.utc)
+    momento = datetime.fromisoformat(str(valor).strip())
+    return momento if timezone.is_aware(momento) else timezone.make_aware(momento)
+
+
+def _numero(valor):
+    return None if valor in (None, '') else float(valor)
+
+
+# ---------------------------------------------------------------------------
+# Buffer e gravação
+# ---------------------------------------------------------------------------
+
+def _novo_agregado():
+    return [0.0, 0, 0.0, 0, 0.0, 0, None]
+
+
+def _somar(destino, origem):
+    for i in range(_CORRENTE_MAX):
+        destino[i] += origem[i]
+    if origem[_CORRENTE_MAX] is not None and (
+            destino[_CORRENTE_MAX] is None or origem[_CORRENTE_MAX] > destino[_CORRENTE_MAX]):
+        destino[_CORRENTE_MAX] = origem[_CORRENTE_MAX]
+
+
+def _gravar(modelo, deltas):
+    """Soma ``{(sala_id, inicio): agregado}`` à tabela ``modelo``.
+
+    Um ``INSERT ... ON CONFLICT DO UPDATE`` por lote (PostgreSQL e SQLite):
+    o banco soma ao agregado que já existir, na mesma instrução. Duas
+    descargas que criam o mesmo (sala, início) ao mesmo tempo não colidem
+    na unicidade nem perdem somas uma da outra.
+    """
+    tabela = connection.ops.quote_name(modelo._meta.db_table)
+    colunas = ('sala_id', 'inicio', *_CAMPOS)
+    atualizar = ', '.join(
+        [f'{campo} = {tabela}.{campo} + excluded.{campo}' for campo in _CAMPOS if campo != 'corrente_max']
+        + [f'corrente_max = CASE WHEN excluded.corrente_max IS NULL OR {tabela}.corrente_max >= excluded.corrente_max '
+           f'THEN {tabela}.corrente_max ELSE excluded.corrente_max END']
+    )
+    linhas = [(sala_id, connection.ops.adapt_datetimefield_value(inicio), *agregado)
+              for (sala_id, inicio), agregado in deltas.items()]
+    tamanho = min(500, (connection.features.max_query_params or 5000) // len(colunas))
+    marcador = '(' + ', '.join(['%s'] * len(colunas)) + ')'
+    with connection.cursor() as cursor:
+        for i in range(0, len(linhas), tamanho):
+            lote = linhas[i:i + tamanho]
+            cursor.execute(
+                f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES {', '.join([marcador] * len(lote))} "
+                f"ON CONFLICT (sala_id, inicio) DO UPDATE SET {atualizar}",
+                [valor for linha in lote for valor in linha],
+            )
+
+
+class BufferTelemetria:
+    """Acumula leituras por (sala, minuto) e grava em lote."""
+
+    def __init__(self, limite=None, resultado=None):
+        self.limite = limite or _config('LUMINOFF_TELEMETRIA_LOTE', 5000)
+        self.resultado = resultado if resultado is not None else ResultadoIngestao()
+        self._minutos = {}   # (sala_id, minuto epoch) -> agregado
+        self._pendentes = 0
+
+    def adicionar(self, sala_id, momento, ocupacao=None, corrente=None, temperatura=None):
+        chave = (sala_id, int(momento.timestamp()) // 60)
+        agregado = self._minutos.get(chave)
+        if agregado is None:
+            agregado = self._minutos[chave] = _novo_agregado()
+        if ocupacao is not None:
+            agregado[_OCUPACAO] += ocupacao
+            agregado[_OCUPACAO + 1] += 1
+        if corrente is not None:
+            agregado[_CORRENTE] += corrente
+            agregado[_CORRENTE + 1] += 1
+            if agregado[_CORRENTE_MAX] is None or corrente > agregado[_CORRENTE_MAX]:
+                agregado[_CORRENTE_MAX] = corrente
+        if temperatura is not None:
+            agregado[_TEMPERATURA] += temperatura
+            agregado[_TEMPERATURA + 1] += 1
+        self._pendentes += 1
+        if self._pendentes >= self.limite:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava o que estiver no buffer (minuto, hora e dia) em uma transação."""
+        if not self._minutos:
+            return
+        minutos, horas, dias = {}, {}, {}
+        locais = {}   # minuto epoch -> (minuto, hora, dia) no fuso local
+        for (sala_id, minuto), agregado in self._minutos.items():
+            if minuto not in locais:
+                local = timezone.localtime(datetime.fromtimestamp(minuto * 60, tz=dt_timezone.utc))
+                hora = local.replace(minute=0)
+                locais[minuto] = (local, hora, hora.replace(hour=0))
+            inicio_minuto, inicio_hora, inicio_dia = locais[minuto]
+            minutos[(sala_id, inicio_minuto)] = agregado
+            for destino, inicio in ((horas, inicio_hora), (dias, inicio_dia)):
+                acumulado = destino.get((sala_id, inicio))
+                if acumulado is None:
+                    destino[(sala_id, inicio)] = list(agregado)
+                else:
+                    _somar(acumulado, agregado)
+
+        with transaction.atomic():
+            _gravar(TelemetriaMinuto, minutos)
+            _gravar(TelemetriaHora, horas)
+            _gravar(TelemetriaDia, dias)
+
+        self.resultado.gravadas += self._pendentes
+        self.resultado.descargas += 1
+        self._minutos = {}
+        self._pendentes = 0
+
+
+def ingerir(registros, limite=None):
+    """Ingere ``(número, registro)`` vindos de ``ler_ndjson``/``ler_csv``."""
+    resultado = ResultadoIngestao()
+    buffer = BufferTelemetria(limite, resultado)
+    agora = timezone.now()
+
+    for numero, registro in registros:
+        resultado.recebidas += 1
+        if registro is None:
+            resultado.rejeitar(numero, "JSON inválido")
+            continue
+        # Salas resolvidas na cópia em memória, por id ou por nome
+        sala = registro.get('sala')
+        if isinstance(sala, int) or str(sala).strip().isdigit():
+            dados = referencia.sala(int(sala))
+        else:
+            dados = referencia.sala_por_nome(str(sala).strip())
+        if dados is None:
+            resultado.rejeitar(numero, f"sala {sala!r} não cadastrada")
+            continue
+        sala_id = dados.pk
+        try:
+            momento = _momento(registro.get('momento'), agora)
+            valores = {metrica: _numero(registro.get(metrica)) for metrica in METRICAS}
+        except (ValueError, TypeError, OverflowError) as erro:
+            resultado.rejeitar(numero, str(erro))
+            continue
+        buffer.adicionar(sala_id, momento, **valores)
+    buffer.descarregar()
+    return resultado
+
+
+# ---------------------------------------------------------------------------
+# Retenção
+# ---------------------------------------------------------------------------
+
+RETENCAO_PADRAO = {'minuto': 7, 'hora': 90, 'dia': None}
+
+
+def aplicar_retencao(agora=None):
+    """Apaga os agregados mais antigos que a retenção de cada tabela (dias).
+
+    Retorna ``{tabela: linhas apagadas}``; ``None`` mantém para sempre.
+    """
+    agora = agora or timezone.now()
+    retencao = {**RETENCAO_PADRAO, **_config('LUMINOFF_RETENCAO_TELEMETRIA', {})}
+    apagadas = {}
+    for nome, modelo in (('minuto', TelemetriaMinuto), ('hora', TelemetriaHora), ('dia', TelemetriaDia)):
+        dias = retencao.get(nome)
+        if dias is None:
+            continue
+        apagadas[nome], _ = modelo.objects.filter(inicio__lt=agora - timedelta(days=dias)).delete()
+    return apagadas
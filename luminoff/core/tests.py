@@ -1,3 +1,1779 @@
+import asyncio
+import io
+import json
+import tempfile
+import time as time_module
+import uuid
+from unittest import mock
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    alocacao, alteracoes, anomalias, benchmark, calendario, despacho, disponibilidade, energia, gateway, grade, importacao,
+    metricas, ocupacao, painel, particionamento, preresfriamento, presenca, referencia, semeadura, telemetria, validacao,
+    versao, virada,
+)
+from .agendador import Agendador
+from .dispositivos import AR, DESLIGAR, LIGAR, LUZ, Comando, DriverDispositivo
+from .gateway import ErroControlador
+from .models import (
+    AgendaPublicada, AlertaConsumo, ArrendamentoPredio, CancelamentoAula, ComandoDispositivo, CurvaResfriamento,
+    DesligamentoAusencia, DiaMaterializado, Disciplina, Dispositivo, ExecucaoAnomalias, Feriado, HorarioTurma,
+    OcupacaoDiaria, PendenciaOcupacao, Predio, Professor, ReservaExtra, Sala, Semestre, TelemetriaDia,
+    TelemetriaHora, TelemetriaMinuto, TrabalhadorAgendador, Turma,
+)
+
+
+def semear_dados(professores=60, salas=150, disciplinas=200, turmas=1200, horarios_por_turma=3):
+    """Cria uma massa de dados com bulk_create (milhares de linhas)."""
+    semestre = Semestre.objects.create(
+        ano=2025, semestre=2, data_inicio=date(2025, 8, 4), data_fim=date(2025, 12, 19), ativo=True,
+    )
+    usuarios = User.objects.bulk_create([
+        User(username=f'prof{i}', first_name=f'Professor{i}', last_name='Silva', email=f'prof{i}@ufrpe.br')
+        for i in range(professores)
+    ])
+    Professor.objects.bulk_create([
+        Professor(user=usuario, matricula=f'M{i:05d}', departamento=f'Departamento {i % 8}')
+        for i, usuario in enumerate(usuarios)
+    ])
+    Sala.objects.bulk_create([
+        Sala(nome=f'Sala {i:03d}', tipo='SAL', capacidade=60, localizacao=f'Prédio {i % 6}', andar=i % 4)
+        for i in range(salas)
+    ])
+    Disciplina.objects.bulk_create([
+        Disciplina(codigo=f'DISC{i:04d}', nome=f'Disciplina {i}', carga_horaria=60) for i in range(disciplinas)
+    ])
+    professor_ids = list(Professor.objects.values_list('pk', flat=True))
+    sala_ids = list(Sala.objects.values_list('pk', flat=True))
+    disciplina_ids = list(Disciplina.objects.values_list('pk', flat=True))
+
+    Turma.objects.bulk_create([
+        Turma(semestre=semestre, disciplina_id=disciplina_ids[i % disciplinas], codigo_turma=f'T{i // disciplinas:02d}',
+              professor_id=professor_ids[i % professores], numero_alunos=40)
+        for i in range(turmas)
+    ])
+    horarios = []
+    for i, turma_id in enumerate(Turma.objects.values_list('pk', flat=True)):
+        for j in range(horarios_por_turma):
+            vaga = i * horarios_por_turma + j
+            sala = vaga % salas
+            dia, faixa = divmod(vaga // salas, 7)
+            horarios.append(HorarioTurma(
+                turma_id=turma_id, semestre=semestre, sala_id=sala_ids[sala], dia_semana=dia % 7,
+                hora_inicio=time(7 + faixa * 2), hora_fim=time(9 + faixa * 2),
+            ))
+    HorarioTurma.objects.bulk_create(horarios)
+    Dispositivo.objects.bulk_create([
+        Dispositivo(sala_id=sala_id, tipo=tipo, identificador=f'{tipo}-{sala_id}')
+        for sala_id in sala_ids for tipo in ('luz', 'ar')
+    ])
+    referencia.marcar_alterada()
+    return semestre
+
+
+class OrcamentoConsultasAdminTests(TestCase):
+    """Garante um número fixo de consultas nas páginas mais usadas do admin.
+
+    Os limites não dependem da quantidade de linhas: se uma mudança voltar a
+    fazer uma consulta por linha (N+1), estes testes falham.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados()
+        cls.admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+        cls.turma = Turma.objects.filter(horarios__isnull=False).first()
+        cls.horario = HorarioTurma.objects.first()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        referencia.carregar()   # em regime, os dados de referência já estão em memória
+
+    def assertOrcamento(self, url, maximo):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        consultas = '\n'.join(consulta['sql'] for consulta in contexto.captured_queries)
+        self.assertLessEqual(len(contexto), maximo, f"{url}: {len(contexto)} consultas\n{consultas}")
+
+    def test_changelist_professor(self):
+        self.assertOrcamento(reverse('admin:core_professor_changelist'), 6)
+
+    def test_changelist_semestre(self):
+        self.assertOrcamento(reverse('admin:core_semestre_changelist'), 6)
+
+    def test_changelist_sala(self):
+        self.assertOrcamento(reverse('admin:core_sala_changelist'), 6)
+
+    def test_changelist_disciplina(self):
+        self.assertOrcamento(reverse('admin:core_disciplina_changelist'), 6)
+
+    def test_changelist_dispositivo(self):
+        self.assertOrcamento(reverse('admin:core_dispositivo_changelist'), 6)
+
+    def test_changelist_turma(self):
+        self.assertOrcamento(reverse('admin:core_turma_changelist'), 8)
+
+    def test_changelist_turma_filtrada(self):
+        url = reverse('admin:core_turma_changelist')
+        self.assertOrcamento(f'{url}?semestre__id__exact={self.semestre.pk}', 8)
+
+    def test_changelist_horarioturma(self):
+        self.assertOrcamento(reverse('admin:core_horarioturma_changelist'), 10)
+
+    def test_changelist_horarioturma_busca(self):
+        url = reverse('admin:core_horarioturma_changelist')
+        self.assertOrcamento(f'{url}?q=Professor1', 10)
+
+    def test_change_form_turma(self):
+        self.assertOrcamento(reverse('admin:core_turma_change', args=[self.turma.pk]), 10)
+
+    def test_change_form_horarioturma(self):
+        self.assertOrcamento(reverse('admin:core_horarioturma_change', args=[self.horario.pk]), 6)
+
+    def test_change_form_sala(self):
+        sala = Sala.objects.first()
+        self.assertOrcamento(reverse('admin:core_sala_change', args=[sala.pk]), 7)
+
+    def test_change_form_professor(self):
+        professor = Professor.objects.first()
+        self.assertOrcamento(reverse('admin:core_professor_change', args=[professor.pk]), 6)
+
+
+class IndiceOcupacaoTests(TestCase):
+    """Agenda semanal em pontos de transição: mesclagem, consultas, margens e recompilação por sala."""
+
+    # Segunda-feira; 2025-08-03 é domingo
+    SEGUNDA = datetime(2025, 8, 4)
+
+    def setUp(self):
+        self.linhas = [
+            (1, 0, time(8), time(10)), (1, 0, time(10), time(12)), (1, 0, time(14), time(16)),
+            (1, 0, time(15), time(15, 30)),
+            (2, 6, time(22), time(23, 50)),
+        ]
+        self.indice = ocupacao.IndiceOcupacao.de_linhas(self.linhas)
+        ocupacao.invalidar()
+        self.addCleanup(ocupacao.invalidar)
+
+    def momento(self, hora, minuto=0, dias=0):
+        return self.SEGUNDA + timedelta(days=dias, hours=hora, minutes=minuto)
+
+    def test_mesclar_intervalos(self):
+        self.assertEqual(ocupacao.mesclar_intervalos([(600, 660), (540, 600), (700, 720), (710, 730), (800, 800)]),
+                         (540, 660, 700, 730))
+        self.assertEqual(ocupacao.mesclar_intervalos([]), ())
+        self.assertEqual(self.indice.intervalos(1, 0), [(480, 720), (840, 960)])
+
+    def test_ocupada_igual_a_varredura(self):
+        for minuto in range(ocupacao.MINUTOS_DIA):
+            esperado = any(dia == 0 and ocupacao.minutos(inicio) <= minuto < ocupacao.minutos(fim)
+                           for sala, dia, inicio, fim in self.linhas if sala == 1)
+            self.assertEqual(self.indice.ocupada(1, self.momento(0, minuto)), esperado, minuto)
+        self.assertFalse(self.indice.ocupada(99, self.momento(9)))
+
+    def test_proxima_transicao(self):
+        self.assertEqual(self.indice.proxima_transicao(1, self.momento(7)), (self.momento(8), True))
+        # Estritamente depois; aulas encostadas não geram transição às 10:00
+        self.assertEqual(self.indice.proxima_transicao(1, self.momento(8)), (self.momento(12), False))
+        self.assertEqual(self.indice.proxima_transicao(1, self.momento(16)), (self.momento(8, dias=7), True))
+        self.assertIsNone(self.indice.proxima_transicao(99, self.momento(8)))
+
+    def test_margens_atravessam_a_meia_noite(self):
+        indice = self.indice.com_margens(antes={1: 15}, depois=30)
+        self.assertEqual(indice.intervalos(1, 0), [(465, 750), (825, 990)])
+        # Domingo 22:00-23:50 + 30 minutos termina segunda 00:20
+        self.assertEqual(indice.intervalos(2, 6), [(1320, ocupacao.MINUTOS_DIA)])
+        self.assertEqual(indice.intervalos(2, 0), [(0, 20)])
+        self.assertTrue(indice.ocupada(2, self.momento(0, 10)))
+        self.assertEqual(indice.proxima_transicao(2, self.momento(23, dias=-1)), (self.momento(0, 20), False))
+
+        antecipado = ocupacao.IndiceOcupacao.de_linhas([(3, 0, time(0, 10), time(1))]).com_margens(antes=20)
+        self.assertEqual(antecipado.intervalos(3, 6), [(1430, ocupacao.MINUTOS_DIA)])
+        self.assertEqual(antecipado.proxima_transicao(3, self.momento(23, dias=-1)),
+                         (self.momento(23, 50, dias=-1), True))
+        self.assertIs(self.indice.com_margens().agenda(1), self.indice.agenda(1))
+
+    def test_substituir_salas(self):
+        anterior = self.indice._salas
+        self.indice.substituir_salas({1, 2, 3}, [(1, 2, time(9), time(11))])
+        self.assertEqual(self.indice.intervalos(1, 0), [])
+        self.assertEqual(self.indice.intervalos(1, 2), [(540, 660)])
+        self.assertNotIn(2, self.indice)
+        self.assertEqual(len(anterior), 2)   # quem estava iterando não vê a troca
+
+    def test_atualizar_salas_do_indice_carregado(self):
+        semestre = semear_dados(professores=1, salas=2, disciplinas=1, turmas=0)
+        sala, outra = Sala.objects.order_by('pk')
+        turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        horario = HorarioTurma.objects.create(turma=turma, sala=sala, dia_semana=0,
+                                              hora_inicio=time(8), hora_fim=time(10))
+        indice = ocupacao.obter_indice()
+        self.assertEqual(indice.intervalos(sala.pk, 0), [(480, 600)])
+
+        # update() não dispara sinais: só atualizar_salas muda o índice
+        HorarioTurma.objects.filter(pk=horario.pk).update(sala=outra)
+        self.assertEqual(ocupacao.obter_indice().intervalos(sala.pk, 0), [(480, 600)])
+        ocupacao.atualizar_salas([sala.pk, outra.pk, None])
+        self.assertIs(ocupacao.obter_indice(), indice)
+        self.assertNotIn(sala.pk, indice)
+        self.assertEqual(indice.intervalos(outra.pk, 0), [(480, 600)])
+
+
+class AgendadorTests(TestCase):
+    """Transições liga/desliga a partir do índice, sem reenviar estado e regravando após falha."""
+
+    def setUp(self):
+        # Segunda-feira, 08:00-10:00; ar 15 minutos antes, tolerância de 10 depois
+        self.agendador = Agendador(antecedencia_ar=15, tolerancia=10)
+        self.agendador.carregar(ocupacao.IndiceOcupacao.de_linhas([(1, 0, time(8), time(10))]), [1])
+
+    def momento(self, hora, minuto=0, dias=0):
+        return timezone.make_aware(datetime(2025, 8, 4, hora, minuto)) + timedelta(days=dias)
+
+    def transicoes(self, comandos):
+        return sorted((comando.quando, comando.dispositivo, comando.acao) for comando in comandos)
+
+    def test_sincronizar_e_vencidos_ao_longo_da_janela(self):
+        # Sem estado conhecido, a sincronização fixa o estado atual dos dois dispositivos
+        self.assertEqual(self.transicoes(self.agendador.sincronizar(self.momento(7))), [
+            (self.momento(7), AR, DESLIGAR), (self.momento(7), LUZ, DESLIGAR)])
+        self.assertEqual(self.agendador.proximo_vencimento(), self.momento(7, 45))
+        self.assertEqual(self.agendador.vencidos(self.momento(7, 44)), [])
+
+        self.assertEqual(self.transicoes(self.agendador.vencidos(self.momento(11))), [
+            (self.momento(7, 45), AR, LIGAR), (self.momento(8), LUZ, LIGAR),
+            (self.momento(10, 10), AR, DESLIGAR), (self.momento(10, 10), LUZ, DESLIGAR),
+        ])
+        self.assertEqual(self.agendador.vencidos(self.momento(11)), [])
+        self.assertEqual(self.agendador.proximo_vencimento(), self.momento(7, 45, dias=7))
+
+        # Estado igual ao já enviado (ex.: lido da fila após um reinício) não gera comando
+        self.assertEqual(self.agendador.sincronizar(self.momento(12)), [])
+        self.agendador._estado[(1, LUZ)] = True
+        self.assertEqual(self.transicoes(self.agendador.sincronizar(self.momento(9))), [
+            (self.momento(9), AR, LIGAR)])
+
+    async def test_falha_ao_gravar_e_regravada_na_sincronizacao(self):
+        comandos = self.agendador.sincronizar(self.momento(9))
+        self.assertEqual(len(comandos), 2)
+        with mock.patch.object(despacho, 'registrar', side_effect=RuntimeError('banco fora')), \
+                self.assertLogs('core.agendador', 'ERROR'):
+            await self.agendador._enviar(comandos)
+        self.assertEqual(self.agendador._estado, {})
+
+        comandos = self.agendador.sincronizar(self.momento(9, 5))
+        self.assertEqual(self.transicoes(comandos), [
+            (self.momento(9, 5), AR, LIGAR), (self.momento(9, 5), LUZ, LIGAR)])
+        with mock.patch.object(despacho, 'registrar') as registrar:
+            await self.agendador._enviar(comandos)
+        registrar.assert_called_once_with(comandos)
+        self.assertEqual(self.agendador.sincronizar(self.momento(9, 10)), [])
+
+
+class GatewayTests(TestCase):
+    """Entrega aos controladores: IDs idempotentes, keep-alive, repetição com jitter e limite por prédio."""
+
+    def comandos(self, acao=LIGAR):
+        quando = timezone.make_aware(datetime(2025, 8, 4, 8))
+        return [Comando(sala_id, LUZ, acao, quando) for sala_id in (1, 2, 3)]
+
+    def gateway(self, controlador, **opcoes):
+        gateway_ = gateway.GatewayDispositivos(controlador_padrao=controlador.endereco, **opcoes)
+        gateway_.definir_mapa({}, {1: 'Prédio A', 2: 'Prédio A', 3: 'Prédio B'})
+        return gateway_
+
+    def test_id_idempotente(self):
+        comando, desligar = self.comandos()[0], self.comandos(DESLIGAR)[0]
+        self.assertEqual(gateway.id_comando(comando, 'rele-1'), gateway.id_comando(self.comandos()[0], 'rele-1'))
+        self.assertNotEqual(gateway.id_comando(comando, 'rele-1'), gateway.id_comando(comando, 'rele-2'))
+        self.assertNotEqual(gateway.id_comando(comando, 'rele-1'), gateway.id_comando(desligar, 'rele-1'))
+        self.assertEqual(uuid.UUID(gateway.id_comando(comando, 'rele-1')).version, 5)
+
+    async def test_conexao_reaproveitada_e_repeticao_sem_efeito(self):
+        async with gateway.ControladorFalso() as controlador:
+            gateway_ = self.gateway(controlador)
+            try:
+                self.assertEqual(await gateway_.enviar(self.comandos()), 3)
+                self.assertEqual(await gateway_.enviar(self.comandos()), 3)
+                await gateway_.enviar(self.comandos(DESLIGAR))
+            finally:
+                await gateway_.fechar()
+        # Um POST por prédio e por envio; o repetido é reconhecido pelo ID
+        self.assertEqual(controlador.requisicoes, 6)
+        self.assertEqual(controlador.duplicados, 3)
+        self.assertEqual(set(controlador.estados.values()), {DESLIGAR})
+        self.assertEqual(len(controlador.estados), 3)
+
+    async def test_conexoes_por_controlador(self):
+        async with gateway.ControladorFalso() as controlador:
+            gateway_ = self.gateway(controlador)
+            try:
+                for _ in range(3):
+                    await gateway_.enviar(self.comandos()[:1])
+                self.assertEqual(len(controlador._conexoes), 1)
+            finally:
+                await gateway_.fechar()
+
+    async def test_repeticao_com_backoff_e_jitter(self):
+        async with gateway.ControladorFalso(taxa_falhas=1.0) as controlador:
+            gateway_ = self.gateway(controlador, tentativas=3)
+            try:
+                with mock.patch.object(gateway.random, 'uniform', return_value=0) as uniform, \
+                        self.assertLogs('core.gateway', 'WARNING'), self.assertRaises(ErroControlador):
+                    await gateway_.enviar(self.comandos()[:1])
+                self.assertEqual(controlador.requisicoes, 3)
+                self.assertEqual([chamada.args for chamada in uniform.call_args_list], [(0, 0.1), (0, 0.2)])
+
+                # O controlador volta depois da primeira falha
+                def voltar(*faixa):
+                    controlador.taxa_falhas = 0.0
+                    return 0
+                with mock.patch.object(gateway.random, 'uniform', side_effect=voltar), \
+                        self.assertLogs('core.gateway', 'WARNING'):
+                    self.assertEqual(await gateway_.enviar(self.comandos()[:1]), 1)
+                self.assertEqual(controlador.requisicoes, 5)
+            finally:
+                await gateway_.fechar()
+
+    async def test_limitador_de_taxa(self):
+        limitador = gateway.LimitadorTaxa(100)
+        await limitador.consumir(60)
+        inicio = time_module.monotonic()
+        # Quem espera por um lote grande não segura um pequeno que já cabe
+        grande = asyncio.ensure_future(limitador.consumir(100))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(limitador.consumir(10), 0.1)
+        self.assertFalse(grande.done())
+        await grande
+        # 160 comandos de uma vez acima da rajada de 100: ~0,7s
+        self.assertGreaterEqual(time_module.monotonic() - inicio, 0.6)
+
+    async def test_lote_maior_que_a_taxa_paga_inteiro(self):
+        class Relogio:
+            agora = 0.0
+
+            def monotonic(self):
+                return self.agora
+
+            async def sleep(self, segundos):
+                self.agora += segundos
+
+        relogio = Relogio()
+        with mock.patch.object(gateway, 'time', relogio), mock.patch.object(gateway, 'asyncio', relogio):
+            limitador = gateway.LimitadorTaxa(200)
+            # Rajada de 200, depois 200 por segundo: 500 comandos levam 1,5s
+            await limitador.consumir(500)
+            self.assertAlmostEqual(relogio.agora, 1.5)
+            await limitador.consumir(200)
+            self.assertAlmostEqual(relogio.agora, 2.5)
+
+
+class ApiAgendaTests(TestCase):
+    """A API dos controladores responde do cache e revalida por ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados(professores=5, salas=12, disciplinas=10, turmas=30)
+        cls.sala = Sala.objects.first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_payload_da_sala(self):
+        resposta = self.client.get(reverse('core:api_agenda_sala', args=[self.sala.pk]))
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual(dados['sala']['id'], self.sala.pk)
+        self.assertEqual(set(dados['sala']['dispositivos']), {'luz', 'ar'})
+
+    def test_304_sem_consultas(self):
+        url = reverse('core:api_agenda_campus')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_cache_sem_consultas(self):
+        self.client.get(reverse('core:api_agenda_campus'))
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('core:api_agenda_predio', args=['Prédio 1']))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(all(sala['predio'] == 'Prédio 1' for sala in resposta.json()['salas']))
+
+    def test_escrita_troca_a_versao(self):
+        url = reverse('core:api_agenda_sala', args=[self.sala.pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sala.capacidade += 1
+            self.sala.save()
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_sala_inexistente(self):
+        resposta = self.client.get(reverse('core:api_agenda_sala', args=[0]))
+        self.assertEqual(resposta.status_code, 404)
+
+
+class TelemetriaTests(TestCase):
+    """Ingestão em lote com agregados incrementais por minuto, hora e dia."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(nome='Sala T', tipo='SAL', capacidade=40, localizacao='Prédio T')
+
+    def leituras(self, quantidade, inicio='2025-08-04T10:00:00-03:00'):
+        base = datetime.fromisoformat(inicio)
+        return [
+            json.dumps({'sala': self.sala.pk, 'momento': (base + timedelta(seconds=i * 10)).isoformat(),
+                        'ocupacao': i % 2, 'corrente': float(i % 5), 'temperatura': 24})
+            for i in range(quantidade)
+        ]
+
+    def test_agregados_incrementais(self):
+        # 2 ingestões de 30 min cada, com lotes pequenos, caindo na mesma hora
+        telemetria.ingerir(telemetria.ler_ndjson(self.leituras(180)), limite=50)
+        resultado = telemetria.ingerir(
+            telemetria.ler_ndjson(self.leituras(180, '2025-08-04T10:30:00-03:00')), limite=50)
+        self.assertEqual(resultado.gravadas, 180)
+        self.assertEqual(TelemetriaMinuto.objects.count(), 60)
+        hora = TelemetriaHora.objects.get()
+        self.assertEqual(hora.corrente_n, 360)
+        self.assertEqual(hora.corrente_max, 4)
+        self.assertEqual(hora.ocupacao, 0.5)
+        self.assertEqual(TelemetriaDia.objects.get().temperatura, 24)
+
+    def test_descargas_que_criam_o_mesmo_agregado_somam(self):
+        # Dois buffers (processos) com leituras do mesmo minuto ainda sem linha no banco
+        momento = datetime.fromisoformat('2025-08-04T10:00:05-03:00')
+        primeiro, segundo = telemetria.BufferTelemetria(), telemetria.BufferTelemetria()
+        primeiro.adicionar(self.sala.pk, momento, corrente=2.0)
+        segundo.adicionar(self.sala.pk, momento, corrente=5.0, ocupacao=1)
+        primeiro.descarregar()
+        segundo.descarregar()
+        for modelo in (TelemetriaMinuto, TelemetriaHora, TelemetriaDia):
+            agregado = modelo.objects.get()
+            self.assertEqual((agregado.corrente_soma, agregado.corrente_n, agregado.corrente_max), (7.0, 2, 5.0))
+            self.assertEqual((agregado.ocupacao_soma, agregado.ocupacao_n), (1.0, 1))
+
+    def test_consultas_por_lote(self):
+        with CaptureQueriesContext(connection) as contexto:
+            telemetria.ingerir(telemetria.ler_ndjson(self.leituras(2000)), limite=1000)
+        self.assertLessEqual(len(contexto), 25)
+
+    def test_endpoint_csv_com_rejeicoes(self):
+        corpo = ("sala,momento,ocupacao,corrente,temperatura\n"
+                 "Sala T,2025-08-04T10:00:00-03:00,1,2.5,23\n"
+                 "Sala X,2025-08-04T10:00:00-03:00,1,2.5,23\n")
+        url = reverse('core:api_telemetria')
+        # Sem token configurado, a escrita fica fechada
+        self.assertEqual(self.client.post(url, corpo, content_type='text/csv').status_code, 401)
+        with self.settings(LUMINOFF_API_TOKEN='segredo'):
+            self.assertEqual(self.client.post(url, corpo, content_type='text/csv').status_code, 401)
+            resposta = self.client.post(url, corpo, content_type='text/csv', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(resposta.status_code, 207)
+        self.assertEqual(resposta.json()['gravadas'], 1)
+        self.assertEqual(resposta.json()['rejeitadas'], 1)
+
+    def test_retencao(self):
+        telemetria.ingerir(telemetria.ler_ndjson(self.leituras(10)))
+        apagadas = telemetria.aplicar_retencao(agora=datetime.fromisoformat('2025-09-01T00:00:00-03:00'))
+        self.assertEqual(apagadas['minuto'], 2)
+        self.assertEqual(TelemetriaHora.objects.count(), 1)
+
+
+class AnomaliasTests(TestCase):
+    """Consumo fora da agenda (com margens) vira alerta, processado incrementalmente."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semestre = semear_dados(professores=1, salas=1, disciplinas=1, turmas=0)
+        cls.sala = Sala.objects.get()
+        turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        # Segunda-feira, 08:00-10:00
+        HorarioTurma.objects.create(turma=turma, sala=cls.sala, dia_semana=0,
+                                    hora_inicio=time(8), hora_fim=time(10))
+
+    def ligar(self, inicio, minutos):
+        base = datetime.fromisoformat(inicio)
+        telemetria.ingerir(telemetria.ler_ndjson(
+            json.dumps({'sala': self.sala.pk, 'momento': (base + timedelta(minutes=i)).isoformat(), 'corrente': 5})
+            for i in range(minutos)
+        ))
+
+    def test_desperdicio_e_alerta_incremental(self):
+        self.ligar('2025-08-04T06:00:00-03:00', 360)
+        with self.assertLogs('core.anomalias', 'WARNING'):
+            execucao, desperdicios = anomalias.detectar(
+                agora=datetime.fromisoformat('2025-08-04T12:05:00-03:00'),
+                desde=datetime.fromisoformat('2025-08-04T06:00:00-03:00'))
+        # Agenda com margens: 07:40-10:15 (ar 15 + carência 5 antes; 10 + 5 depois)
+        self.assertEqual(desperdicios[0].minutos, 100 + 105)
+        self.assertAlmostEqual(desperdicios[0].kwh, 205 * 5 * 0.22 / 60)
+        self.assertEqual(execucao.alertas, 1)
+
+        # A próxima execução só lê o que veio depois e estende o mesmo alerta
+        self.ligar('2025-08-04T12:00:00-03:00', 30)
+        with self.assertLogs('core.anomalias', 'WARNING'):
+            execucao, _ = anomalias.detectar(agora=datetime.fromisoformat('2025-08-04T12:35:00-03:00'))
+        self.assertEqual(execucao.leituras, 30)
+        alerta = AlertaConsumo.objects.get()
+        self.assertEqual(alerta.minutos, 235)
+        self.assertEqual(timezone.localtime(alerta.inicio).hour, 6)
+
+    def test_minimo_vale_para_o_episodio(self):
+        # Dez minutos por janela: nenhuma sozinha chega aos 15, o episódio chega
+        self.ligar('2025-08-04T12:00:00-03:00', 10)
+        with self.assertNoLogs('core.anomalias', 'WARNING'):
+            execucao, _ = anomalias.detectar(agora=datetime.fromisoformat('2025-08-04T12:20:00-03:00'),
+                                             desde=datetime.fromisoformat('2025-08-04T12:00:00-03:00'))
+        self.assertEqual(execucao.alertas, 0)
+        self.assertFalse(AlertaConsumo.objects.get().confirmado)
+
+        self.ligar('2025-08-04T12:15:00-03:00', 10)
+        with self.assertLogs('core.anomalias', 'WARNING'):
+            execucao, _ = anomalias.detectar(agora=datetime.fromisoformat('2025-08-04T12:35:00-03:00'))
+        self.assertEqual(execucao.alertas, 1)
+        alerta = AlertaConsumo.objects.get()
+        self.assertTrue(alerta.confirmado)
+        self.assertEqual(alerta.minutos, 20)
+
+    def test_continuidade_por_sala(self):
+        outra = Sala.objects.create(nome='Outra', tipo='SAL', capacidade=30, localizacao='Prédio 1')
+        base = datetime.fromisoformat('2025-08-04T00:00:00-03:00')
+        AlertaConsumo.objects.create(sala=self.sala, inicio=base + timedelta(hours=10),
+                                     fim=base + timedelta(hours=11), minutos=60, kwh=1)
+        # A janela começa às 09:00 por causa da outra sala; o alerta das 11:00
+        # não continua no desperdício das 13:00
+        anomalias._registrar_alertas([
+            anomalias.Desperdicio(outra.pk, 20, 1, base + timedelta(hours=9), base + timedelta(hours=9, minutes=19)),
+            anomalias.Desperdicio(self.sala.pk, 20, 1, base + timedelta(hours=13), base + timedelta(hours=13, minutes=19)),
+        ])
+        self.assertEqual(sorted(AlertaConsumo.objects.filter(sala=self.sala).values_list('minutos', flat=True)),
+                         [20, 60])
+
+    def test_reprocessar_nao_soma_de_novo(self):
+        self.ligar('2025-08-04T06:00:00-03:00', 360)
+        agora = datetime.fromisoformat('2025-08-04T12:05:00-03:00')
+        with self.assertLogs('core.anomalias', 'WARNING'):
+            anomalias.detectar(agora=agora, desde=datetime.fromisoformat('2025-08-04T06:00:00-03:00'))
+            anomalias.detectar(agora=agora, desde=datetime.fromisoformat('2025-08-04T06:00:00-03:00'))
+            anomalias.detectar(agora=agora, desde=datetime.fromisoformat('2025-08-04T10:30:00-03:00'))
+        alerta = AlertaConsumo.objects.get()
+        self.assertEqual(alerta.minutos, 205)
+        self.assertAlmostEqual(alerta.kwh, 205 * 5 * 0.22 / 60)
+        execucoes = list(ExecucaoAnomalias.objects.order_by('inicio').values_list('inicio', 'fim'))
+        self.assertEqual(len(execucoes), 2)
+        self.assertEqual(execucoes[0][1], execucoes[1][0])
+
+
+class CalendarioTests(TestCase):
+    """Grade semanal expandida por data, com exceções e rematerialização parcial."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semestre = semear_dados(professores=1, salas=2, disciplinas=1, turmas=0)
+        cls.sala, cls.outra = Sala.objects.order_by('pk')
+        turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        # Segunda-feira, 08:00-10:00, nas duas salas
+        cls.horario = HorarioTurma.objects.create(turma=turma, sala=cls.sala, dia_semana=0,
+                                                  hora_inicio=time(8), hora_fim=time(10))
+        HorarioTurma.objects.create(turma=turma, sala=cls.outra, dia_semana=0,
+                                    hora_inicio=time(8), hora_fim=time(10))
+        cls.segunda = date(2025, 8, 11)
+
+    def intervalos(self, data, sala=None):
+        return sorted((inicio, fim) for sala_id, _, inicio, fim in calendario.ocupacao_do_dia(data)
+                      if sala_id == (sala or self.sala).pk)
+
+    def test_expansao_e_limites_do_semestre(self):
+        self.assertEqual(self.intervalos(self.segunda), [(time(8), time(10))])
+        self.assertEqual(self.intervalos(self.segunda + timedelta(days=1)), [])
+        self.assertEqual(self.intervalos(date(2026, 3, 2)), [])  # segunda fora do semestre
+
+    def test_excecoes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Feriado.objects.create(descricao='Feriado', data_inicio=self.segunda, data_fim=self.segunda)
+            ReservaExtra.objects.create(sala=self.sala, data=self.segunda, hora_inicio=time(14),
+                                        hora_fim=time(16), descricao='Defesa')
+            CancelamentoAula.objects.create(horario=self.horario, data=self.segunda + timedelta(days=7))
+        self.assertEqual(self.intervalos(self.segunda), [(time(14), time(16))])
+        self.assertEqual(self.intervalos(self.segunda + timedelta(days=7)), [])
+        self.assertEqual(self.intervalos(self.segunda + timedelta(days=7), self.outra), [(time(8), time(10))])
+
+    def test_rematerializa_so_o_afetado(self):
+        calendario.garantir(calendario.periodo(self.segunda, self.segunda + timedelta(days=13)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.horario.hora_fim = time(11)
+            self.horario.save()
+        # Só a sala alterada, só nas segundas já materializadas
+        self.assertEqual(set(PendenciaOcupacao.objects.values_list('sala_id', 'data')),
+                         {(self.sala.pk, self.segunda), (self.sala.pk, self.segunda + timedelta(days=7))})
+        self.assertEqual(self.intervalos(self.segunda), [(time(8), time(11))])
+        self.assertFalse(PendenciaOcupacao.objects.filter(data=self.segunda).exists())
+
+    def test_data_materializada_por_outra_consulta(self):
+        calendario.garantir([self.segunda])
+        # Outra consulta viu a data faltando antes do commit da primeira
+        with mock.patch.object(DiaMaterializado.objects, 'filter', return_value=DiaMaterializado.objects.none()), \
+                mock.patch.object(calendario, '_expandir', wraps=calendario._expandir) as expandir:
+            calendario.garantir([self.segunda])
+        expandir.assert_not_called()
+        self.assertEqual(OcupacaoDiaria.objects.filter(data=self.segunda).count(), 2)
+
+    def test_salas_ocupadas_no_banco(self):
+        self.assertEqual(ocupacao.salas_ocupadas_no_banco(datetime(2025, 8, 11, 9, 59)), {self.sala.pk, self.outra.pk})
+        self.assertEqual(ocupacao.salas_ocupadas_no_banco(datetime(2025, 8, 11, 10, 0)), set())
+
+    def test_consulta_de_dia_materializado(self):
+        calendario.garantir([self.segunda])
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(calendario.ocupacao_do_dia(self.segunda))), 2)
+
+
+class AlocacaoTests(TestCase):
+    """Alocação automática concentra as aulas e respeita capacidade e tipo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados(professores=4, salas=0, disciplinas=4, turmas=0)
+        salas = Sala.objects.bulk_create([
+            Sala(nome='A1', tipo='SAL', capacidade=40, localizacao='Prédio A', andar=1),
+            Sala(nome='A2', tipo='SAL', capacidade=80, localizacao='Prédio A', andar=1),
+            Sala(nome='A3', tipo='LAB', capacidade=40, localizacao='Prédio A', andar=1),
+            Sala(nome='B1', tipo='SAL', capacidade=40, localizacao='Prédio B', andar=2),
+            Sala(nome='B2', tipo='LAB', capacidade=40, localizacao='Prédio B', andar=2),
+        ])
+        referencia.marcar_alterada()
+        cls.salas = {sala.nome: Sala.objects.get(nome=sala.nome) for sala in salas}
+        professores = list(Professor.objects.all())
+        cls.horarios = {}
+        # Prédio B só é ligado por estas duas aulas, que cabem no prédio A
+        aulas = [('A1', 30, 10), ('B1', 30, 8), ('B2', 20, 8), ('A2', 70, 8)]
+        for i, (sala, alunos, hora) in enumerate(aulas):
+            turma = Turma.objects.create(semestre=cls.semestre, disciplina=Disciplina.objects.all()[i],
+                                         professor=professores[i], codigo_turma='T01', numero_alunos=alunos)
+            cls.horarios[sala] = HorarioTurma.objects.create(
+                turma=turma, sala=cls.salas[sala], dia_semana=0, hora_inicio=time(hora), hora_fim=time(hora + 2))
+
+    def test_proposta_concentra_e_respeita_restricoes(self):
+        proposta = alocacao.propor(self.semestre)
+        salas = {sala.pk: sala for sala in self.salas.values()}
+        destino = {nome: salas[proposta.atribuicao[horario.pk]] for nome, horario in self.horarios.items()}
+        self.assertEqual({sala.localizacao for sala in destino.values()}, {'Prédio A'})
+        self.assertEqual(destino['B2'].tipo, 'LAB')
+        self.assertEqual(destino['A2'].nome, 'A2')  # 70 alunos: só a A2 comporta
+        self.assertLess(proposta.depois['predio_minutos'], proposta.antes['predio_minutos'])
+
+    def test_aplicar_pelo_admin(self):
+        admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+        self.client.force_login(admin)
+        url = reverse('admin:core_semestre_alocacao', args=[self.semestre.pk])
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        # A confirmação grava a prévia assinada, sem rodar a otimização de novo
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch.object(alocacao, 'propor', side_effect=AssertionError) as propor:
+            self.client.post(url, {'proposta': resposta.context['assinatura']})
+        propor.assert_not_called()
+        self.assertFalse(HorarioTurma.objects.filter(sala__localizacao='Prédio B').exists())
+        self.assertEqual(validacao.verificar_semestre(self.semestre), [])
+        self.assertEqual(alocacao.propor(self.semestre).mudancas, [])
+
+    def test_proposta_desatualizada_nao_e_gravada(self):
+        proposta = alocacao.propor(self.semestre)
+        assinatura = alocacao.assinar(proposta)
+        with self.assertRaises(alocacao.ErroAlocacao):
+            alocacao.carregar(self.semestre, assinatura[:-2] + 'xx')
+
+        # Outra aula ocupa o destino proposto para a turma da B1 depois da prévia
+        pk, _, destino = next(mudanca for mudanca in proposta.mudancas if mudanca[0] == self.horarios['B1'].pk)
+        horario = self.horarios['B1']
+        turma = Turma.objects.create(semestre=self.semestre, disciplina=Disciplina.objects.all()[0],
+                                     professor=Professor.objects.all()[0], codigo_turma='T09', numero_alunos=10)
+        HorarioTurma.objects.create(turma=turma, sala_id=destino, dia_semana=horario.dia_semana,
+                                    hora_inicio=horario.hora_inicio, hora_fim=horario.hora_fim)
+        with self.assertRaises(alocacao.ErroAlocacao):
+            alocacao.carregar(self.semestre, assinatura)
+
+        # Horário movido à mão desde a prévia
+        HorarioTurma.objects.filter(turma=turma).delete()
+        HorarioTurma.objects.filter(pk=pk).update(sala=self.salas['A3'])
+        with self.assertRaises(alocacao.ErroAlocacao):
+            alocacao.carregar(self.semestre, assinatura)
+
+
+class SemeaduraBenchmarkTests(TestCase):
+    """Campus sintético consistente e suíte de benchmark que não deixa rastro."""
+
+    def test_campus_sem_conflitos(self):
+        semestre = semeadura.semear_campus(**semeadura.dimensoes(1))
+        self.assertEqual(HorarioTurma.objects.filter(turma__semestre=semestre).count(), 300)
+        self.assertEqual(validacao.verificar_semestre(semestre), [])
+
+    def test_benchmark_desfaz_o_campus(self):
+        resultado = benchmark.medir_escala(1, repeticoes=1)
+        self.assertEqual(resultado['contagens']['horarios'], 300)
+        self.assertIn('importação: simulação da grade', resultado['operacoes'])
+        self.assertFalse(Sala.objects.exists())
+        lento = {'escalas': [{'escala': 1, 'operacoes': {'x': {'mediana_ms': 30.0}, 'y': {'mediana_ms': 1.5}}}]}
+        rapido = {'escalas': [{'escala': 1, 'operacoes': {'x': {'mediana_ms': 10.0}, 'y': {'mediana_ms': 0.5}}}]}
+        self.assertEqual([nome for _, nome, *_ in benchmark.comparar(lento, rapido)], ['x'])
+
+
+class GradeTests(TestCase):
+    """Grade semanal por sala/prédio com fragmentos invalidados por sala."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados(professores=2, salas=6, disciplinas=4, turmas=4, horarios_por_turma=1)
+
+    def setUp(self):
+        cache.clear()
+        self.salas = grade.salas_do_local('Prédio 0')
+
+    def test_fragmentos_em_cache_por_sala(self):
+        horario = HorarioTurma.objects.filter(sala__localizacao='Prédio 0').select_related('turma__disciplina').first()
+        primeira = grade.fragmentos(self.salas, self.semestre)
+        self.assertIn(horario.turma.disciplina.codigo, primeira[horario.sala_id])
+        self.assertIn('rowspan="4"', primeira[horario.sala_id])   # 2h em faixas de 30 min
+        with self.assertNumQueries(0):
+            grade.fragmentos(self.salas, self.semestre)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            horario.hora_fim = time(horario.hora_fim.hour + 1)
+            horario.save()
+        with mock.patch.object(grade, '_montar', wraps=grade._montar) as montar:
+            segunda = grade.fragmentos(self.salas, self.semestre)
+        self.assertEqual([sala['pk'] for sala in montar.call_args.args[0]], [horario.sala_id])
+        self.assertIn('rowspan="6"', segunda[horario.sala_id])
+
+    def test_nome_do_professor_troca_os_fragmentos_das_salas_dele(self):
+        horario = HorarioTurma.objects.filter(sala__localizacao='Prédio 0').select_related(
+            'turma__professor__user').first()
+        grade.fragmentos(self.salas, self.semestre)
+        user = horario.turma.professor.user
+        with self.captureOnCommitCallbacks(execute=True):
+            user.first_name = 'Renomeado'
+            user.save()
+        with mock.patch.object(grade, '_montar', wraps=grade._montar) as montar:
+            fragmentos = grade.fragmentos(self.salas, self.semestre)
+        salas_do_professor = set(HorarioTurma.objects.filter(
+            turma__professor=horario.turma.professor, sala__in=[sala['pk'] for sala in self.salas],
+        ).values_list('sala_id', flat=True))
+        self.assertEqual({sala['pk'] for sala in montar.call_args.args[0]}, salas_do_professor)
+        self.assertIn('Renomeado', fragmentos[horario.sala_id])
+
+        # O login (só last_login) não invalida nada
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+    def test_paginas_do_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha'))
+        self.assertContains(self.client.get(reverse('admin:core_sala_grade')), 'Prédio 0')
+        resposta = self.client.get(reverse('admin:core_sala_grade'), {'predio': 'Prédio 0'})
+        self.assertContains(resposta, 'class="grade-sala"', count=len(self.salas))
+        sala = Sala.objects.first()
+        self.assertContains(self.client.get(reverse('admin:core_sala_grade_sala', args=[sala.pk])), sala.nome)
+
+
+class EnergiaTests(TestCase):
+    """Simulação do semestre contra valores calculados à mão."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semear_dados(professores=1, salas=1, disciplinas=1, turmas=0)
+        # Duas semanas (02/03 a 15/03/2026) com feriado na segunda 09/03
+        cls.semestre = Semestre.objects.create(ano=2026, semestre=1, data_inicio=date(2026, 3, 2),
+                                               data_fim=date(2026, 3, 15))
+        turma = Turma.objects.create(semestre=cls.semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        HorarioTurma.objects.create(turma=turma, sala=Sala.objects.get(), dia_semana=0,
+                                    hora_inicio=time(8), hora_fim=time(10))
+        Feriado.objects.create(descricao='Feriado', data_inicio=date(2026, 3, 9), data_fim=date(2026, 3, 9))
+
+    def test_dias_por_semana(self):
+        self.assertEqual(energia.dias_por_semana(date(2026, 3, 2), date(2026, 3, 15)).tolist(), [2] * 7)
+        self.assertEqual(energia.dias_por_semana(date(2026, 3, 4), date(2026, 3, 9),
+                                                 excluir=[date(2026, 3, 9), date(2026, 4, 1)]).tolist(),
+                         [0, 0, 1, 1, 1, 1, 1])
+        self.assertEqual(energia.dias_por_semana(date(2026, 3, 9), date(2026, 3, 8)).tolist(), [0] * 7)
+
+    def test_mascara_semanal(self):
+        indice = ocupacao.IndiceOcupacao.de_linhas([(1, 0, time(8), time(10)), (1, 6, time(23), time(23, 59))])
+        mascara = energia.mascara_semanal(indice, [1, 2])
+        self.assertEqual(mascara.shape, (2, 7, ocupacao.MINUTOS_DIA))
+        self.assertEqual(mascara.sum(axis=2).tolist(), [[120, 0, 0, 0, 0, 0, 59], [0] * 7])
+        self.assertTrue(mascara[0, 0, 480] and mascara[0, 0, 599])
+        self.assertFalse(mascara[0, 0, 479] or mascara[0, 0, 600])
+
+    def test_semestre_com_resultado_conhecido(self):
+        with self.settings(LUMINOFF_ANTECEDENCIA_AR=15, LUMINOFF_TOLERANCIA_DESLIGAMENTO=10,
+                           LUMINOFF_TARIFA_KWH=0.85, LUMINOFF_EXPEDIENTE_PREDIO=('07:00', '22:00'),
+                           LUMINOFF_DIAS_EXPEDIENTE=(0, 1, 2, 3, 4, 5)):
+            relatorio = energia.simular_semestre(self.semestre)
+        self.assertEqual(relatorio.dias.tolist(), [1, 2, 2, 2, 2, 2, 2])
+        # Uma segunda letiva: luz 08:00-10:10 (130 min a 0,6 kW), ar 07:45-10:10 (145 min a 2,6 kW)
+        agenda = (130 * 0.6 + 145 * 2.6) / 60
+        # Expediente: 900 min em 11 dias de segunda a sábado, luz e ar
+        sempre = 900 * 11 * (0.6 + 2.6) / 60
+        self.assertEqual(relatorio.total, {
+            'kwh_agenda': round(agenda, 2),
+            'kwh_sempre_ligado': round(sempre, 2),
+            'kwh_economia': round(sempre - agenda, 2),
+            'custo_economia': round((sempre - agenda) * 0.85, 2),
+        })
+        self.assertEqual(relatorio.total['kwh_agenda'], 7.58)
+        self.assertEqual(relatorio.salas[0]['kwh_agenda'], 7.58)
+        self.assertEqual(relatorio.predios[0]['kwh_sempre_ligado'], 528.0)
+
+
+class PainelTests(TestCase):
+    """Estado ao vivo das salas: agenda com margens, telemetria e distribuição só das mudanças."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semestre = semear_dados(professores=1, salas=2, disciplinas=1, turmas=0)
+        cls.sala, cls.outra = Sala.objects.order_by('pk')
+        turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        # Segunda-feira, 08:00-10:00, nas duas salas
+        for sala in (cls.sala, cls.outra):
+            HorarioTurma.objects.create(turma=turma, sala=sala, dia_semana=0, hora_inicio=time(8), hora_fim=time(10))
+
+    def momento(self, hora, minuto=0):
+        return timezone.make_aware(datetime(2025, 8, 11, hora, minuto))
+
+    def test_estados_da_agenda_e_telemetria(self):
+        calcular = painel.CalculadoraEstados()
+        self.assertEqual(set(calcular(self.momento(7, 50)).values()), {painel.PRE_CLIMATIZACAO})
+        self.assertEqual(set(calcular(self.momento(9)).values()), {painel.LIGADA})
+        self.assertEqual(set(calcular(self.momento(10, 5)).values()), {painel.LIGADA})   # tolerância
+        self.assertEqual(set(calcular(self.momento(12)).values()), {painel.DESLIGADA})
+
+        telemetria.ingerir(telemetria.ler_ndjson([json.dumps(
+            {'sala': self.sala.pk, 'momento': self.momento(11, 59).isoformat(), 'corrente': 5})]))
+        with self.assertNumQueries(2):   # agenda já carregada: telemetria recente e desligamentos abertos
+            estados = calcular(self.momento(12))
+        self.assertEqual(estados, {self.sala.pk: painel.FORA_DA_AGENDA, self.outra.pk: painel.DESLIGADA})
+
+        # Desligada pelo monitor de presença no meio da aula
+        DesligamentoAusencia.objects.create(sala=self.outra, inicio=self.momento(8, 30))
+        self.assertEqual(calcular(self.momento(9)), {self.sala.pk: painel.LIGADA, self.outra.pk: painel.DESLIGADA})
+
+    async def test_um_produtor_para_conexoes_simultaneas(self):
+        chamadas = []
+
+        def calcular(agora):
+            chamadas.append(agora)
+            return {1: painel.LIGADA}
+
+        hub = painel.Hub(calcular=calcular)
+        filas = [hub.assinar() for _ in range(5)]
+        await asyncio.gather(*(hub.garantir_produtor() for _ in filas))
+        produtor = hub._produtor
+        await asyncio.gather(*(hub.garantir_produtor() for _ in filas))
+        self.assertIs(hub._produtor, produtor)
+        produtores = [tarefa for tarefa in asyncio.all_tasks() if tarefa.get_coro().__qualname__ == 'Hub._produzir']
+        self.assertEqual(produtores, [produtor])
+        self.assertEqual((await filas[0].get())['evento'], 'estado')
+        self.assertEqual(await filas[0].get(), {'evento': 'delta', 'versao': 1, 'salas': {1: painel.LIGADA}})
+        self.assertEqual(len(chamadas), 1)
+        for fila in filas:
+            hub.cancelar(fila)
+        hub.acordar()
+        await produtor
+
+    async def test_hub_distribui_so_as_mudancas(self):
+        estados = iter([{1: painel.DESLIGADA, 2: painel.DESLIGADA}, {1: painel.LIGADA, 2: painel.DESLIGADA}])
+        hub = painel.Hub(calcular=lambda agora: next(estados))
+        await hub.atualizar()
+        filas = [hub.assinar() for _ in range(3)]
+        await hub.atualizar()
+        for fila in filas:
+            self.assertEqual(fila.get_nowait()['evento'], 'estado')
+            self.assertEqual(fila.get_nowait(), {'evento': 'delta', 'versao': 2, 'salas': {1: painel.LIGADA}})
+
+        # Painel lento: em vez de acumular atraso, recomeça do estado completo
+        lenta = filas[0]
+        for _ in range(painel.TAMANHO_FILA + 1):
+            hub.publicar({1: painel.LIGADA})
+        self.assertEqual(lenta.get_nowait()['evento'], 'estado')
+
+        hub.cancelar(lenta)
+        hub.publicar({2: painel.LIGADA})
+        self.assertTrue(lenta.empty())
+
+    async def test_stream_sse(self):
+        hub = painel.Hub(calcular=lambda agora: {1: painel.LIGADA})
+        await hub.atualizar()
+        fila = hub.assinar()
+        eventos = painel._eventos(hub, fila, keepalive=0.01)
+        self.assertEqual(await anext(eventos), 'retry: 5000\n\n')
+        self.assertEqual(await anext(eventos), 'id: 1\nevent: estado\ndata: {"1":"ligada"}\n\n')
+        self.assertEqual(await anext(eventos), ': ping\n\n')
+        await eventos.aclose()
+        self.assertNotIn(fila, hub._assinantes)
+
+    def test_acesso_e_pagina(self):
+        self.assertEqual(self.client.get(reverse('core:api_painel_eventos')).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha'))
+        self.assertContains(self.client.get(reverse('admin:core_sala_painel')), f'id="sala-{self.sala.pk}"')
+
+
+class DriverTeste(DriverDispositivo):
+    def __init__(self, falhar=False):
+        self.falhar = falhar
+        self.recebidos = []
+
+    async def enviar(self, comandos):
+        if self.falhar:
+            raise ErroControlador('controlador fora do ar')
+        self.recebidos.extend(comandos)
+
+
+class DespachoTests(TestCase):
+    """Fila de comandos: reserva sem duplicidade, retomada após queda, backoff e substituição."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semear_dados(professores=1, salas=3, disciplinas=1, turmas=0)
+        cls.salas = list(Sala.objects.order_by('pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.agora = timezone.now()
+        self.comandos = [Comando(sala_id, LUZ, DESLIGAR, self.agora) for sala_id in self.salas]
+        despacho.registrar(self.comandos)
+
+    def status(self):
+        return sorted(ComandoDispositivo.objects.values_list('status', flat=True))
+
+    def test_reservas_nao_se_sobrepoem_e_regravar_nao_duplica(self):
+        despacho.registrar(self.comandos)
+        self.assertEqual(ComandoDispositivo.objects.count(), 3)
+        _, primeiro = despacho.reservar(limite=2)
+        _, segundo = despacho.reservar(limite=2)
+        self.assertEqual(len(primeiro), 2)
+        self.assertEqual(len(segundo), 1)
+        self.assertFalse({c.pk for c in primeiro} & {c.pk for c in segundo})
+        self.assertEqual(despacho.reservar()[1], [])
+
+        # O processo "caiu" com o lote reservado: vencida a reserva, outro despachante retoma
+        depois = self.agora + timedelta(seconds=61)
+        token, retomados = despacho.reservar(agora=depois)
+        self.assertEqual(len(retomados), 3)
+        despacho.confirmar(token, retomados)
+        self.assertEqual(self.status(), [ComandoDispositivo.CONFIRMADO] * 3)
+
+    async def test_despachante_entrega_e_adia_com_backoff(self):
+        despachante = despacho.Despachante(DriverTeste(falhar=True))
+        with self.assertLogs('core.despacho', 'ERROR'):
+            self.assertEqual(await despachante.processar_lote(), 3)
+        comando = await ComandoDispositivo.objects.afirst()
+        self.assertEqual((comando.status, comando.tentativas), (ComandoDispositivo.PENDENTE, 1))
+        self.assertGreater(comando.proxima_tentativa, timezone.now())   # backoff: ainda não reservável
+        self.assertEqual(await despachante.processar_lote(), 0)
+
+        await ComandoDispositivo.objects.aupdate(proxima_tentativa=self.agora)
+        despachante.driver = DriverTeste()
+        self.assertEqual(await despachante.processar_lote(), 3)
+        self.assertEqual(sorted(c.sala_id for c in despachante.driver.recebidos), self.salas)
+        self.assertEqual(await ComandoDispositivo.objects.filter(status=ComandoDispositivo.CONFIRMADO).acount(), 3)
+
+    def test_tentativas_esgotadas(self):
+        with self.settings(LUMINOFF_DESPACHO_TENTATIVAS=1), self.assertLogs('core.despacho', 'ERROR'):
+            despacho.adiar(*despacho.reservar(), 'timeout')
+        self.assertEqual(self.status(), [ComandoDispositivo.FALHOU] * 3)
+
+    def test_comando_novo_substitui_o_antigo_e_agendador_retoma(self):
+        sala = self.salas[0]
+        despacho.registrar([Comando(sala, LUZ, LIGAR, self.agora + timedelta(minutes=1))])
+        token, reservados = despacho.reservar(agora=self.agora + timedelta(minutes=1))
+        # No mesmo lote, só o mais novo da sala é enviado
+        self.assertEqual(len(reservados), 3)
+        self.assertEqual(next(c.acao for c in reservados if c.sala_id == sala), LIGAR)
+        self.assertEqual(ComandoDispositivo.objects.get(sala=sala, acao=DESLIGAR).status,
+                         ComandoDispositivo.SUBSTITUIDO)
+        despacho.confirmar(token, reservados)
+        self.assertEqual(despacho.ultimo_estado()[(sala, LUZ)], True)
+        self.assertEqual(despacho.ultimo_estado()[(self.salas[1], LUZ)], False)
+
+    def test_par_em_envio_espera_e_substituido_nao_volta(self):
+        sala, inicio = self.salas[0], timezone.now()
+        token_a, lote_a = despacho.reservar(agora=inicio)
+        self.assertEqual(len(lote_a), 3)
+        # Um comando mais novo da sala chega enquanto o lote de A está em envio
+        despacho.registrar([Comando(sala, LUZ, LIGAR, self.agora + timedelta(minutes=1))], agora=inicio)
+        _, lote_b = despacho.reservar(agora=inicio + timedelta(seconds=30))
+        self.assertEqual(lote_b, [])
+
+        # A falha: o comando antigo volta à fila e é substituído na reserva seguinte
+        despacho.adiar(token_a, lote_a, 'timeout', agora=inicio)
+        token_b, lote_b = despacho.reservar(agora=inicio + timedelta(hours=1))
+        self.assertEqual([(c.sala_id, c.acao) for c in lote_b if c.sala_id == sala], [(sala, LIGAR)])
+        self.assertEqual(ComandoDispositivo.objects.get(sala=sala, acao=DESLIGAR).status,
+                         ComandoDispositivo.SUBSTITUIDO)
+
+        # Substituído durante o envio: nem a falha nem a confirmação o devolvem à fila
+        ComandoDispositivo.objects.filter(reserva=token_b).update(status=ComandoDispositivo.SUBSTITUIDO)
+        despacho.adiar(token_b, lote_b, 'timeout', agora=inicio)
+        despacho.confirmar(token_b, lote_b)
+        self.assertEqual(set(ComandoDispositivo.objects.filter(reserva=token_b).values_list('status', flat=True)),
+                         {ComandoDispositivo.SUBSTITUIDO})
+        self.assertEqual(despacho.reservar(agora=inicio + timedelta(days=1))[1], [])
+
+
+class ParticionamentoTests(TestCase):
+    """Prédios divididos entre trabalhadores por arrendamentos com batimento."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semear_dados(professores=1, salas=12, disciplinas=1, turmas=0)   # 6 prédios, salas sem prédio (bulk)
+
+    def test_sala_salva_ganha_predio(self):
+        sala = Sala.objects.create(nome='Nova', tipo='SAL', capacidade=30, localizacao=' Bloco X ')
+        self.assertEqual(sala.predio.nome, 'Bloco X')
+        sala.localizacao = 'Bloco Y'
+        sala.save()
+        self.assertEqual(Sala.objects.get(pk=sala.pk).predio.nome, 'Bloco Y')
+
+    def test_divisao_rebalanceamento_e_morte(self):
+        agora = timezone.now()
+        a, b = particionamento.Coordenador('a'), particionamento.Coordenador('b')
+        self.assertEqual(len(a.batimento(agora)), 6)
+        self.assertFalse(Sala.objects.filter(predio__isnull=True).exists())
+        self.assertEqual(b.batimento(agora), frozenset())   # tudo arrendado a "a"
+        self.assertEqual(len(a.batimento(agora)), 3)        # devolve o excesso
+        dos_dois = [a.batimento(agora), b.batimento(agora)]
+        self.assertEqual([len(predios) for predios in dos_dois], [3, 3])
+        self.assertFalse(dos_dois[0] & dos_dois[1])
+
+        # "b" parou de bater: depois do ttl, "a" assume tudo
+        depois = agora + timedelta(seconds=a.ttl + 1)
+        self.assertEqual(len(a.batimento(depois)), 6)
+        self.assertFalse(TrabalhadorAgendador.objects.filter(nome='b').exists())
+        a.liberar()
+        self.assertFalse(ArrendamentoPredio.objects.exclude(trabalhador='').exists())
+
+    def test_agendador_e_despacho_so_dos_predios_arrendados(self):
+        predios = particionamento.Coordenador('a').batimento()
+        predio = min(predios)
+        salas = set(Sala.objects.filter(predio_id=predio).values_list('pk', flat=True))
+        agendador = Agendador(predios={predio})
+        agendador._carregar_do_banco()
+        self.assertEqual(set(agendador._salas), salas)
+
+        despacho.registrar([Comando(sala_id, LUZ, DESLIGAR, timezone.now())
+                            for sala_id in Sala.objects.values_list('pk', flat=True)])
+        _, reservados = despacho.reservar(predios={predio})
+        self.assertEqual({comando.sala_id for comando in reservados}, salas)
+
+
+class PreResfriamentoTests(TestCase):
+    """Curvas de resfriamento por sala aprendidas da telemetria e usadas na antecedência do ar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semear_dados(professores=1, salas=2, disciplinas=1, turmas=0)
+        cls.sala, cls.outra = Sala.objects.order_by('pk')
+        # Três partidas do ar às 07:00; a sala cai 0,25 °C/min de 30 °C até estabilizar em 24 °C
+        leituras = []
+        for dia in (4, 5, 6):
+            partida = timezone.make_aware(datetime(2025, 8, dia, 7))
+            ComandoDispositivo.objects.create(sala=cls.sala, dispositivo=AR, acao=LIGAR, agendado_para=partida,
+                                              proxima_tentativa=partida, status=ComandoDispositivo.CONFIRMADO)
+            leituras += [json.dumps({'sala': cls.sala.pk, 'momento': (partida + timedelta(minutes=t)).isoformat(),
+                                     'temperatura': max(30 - 0.25 * t, 24)}) for t in range(60)]
+        telemetria.ingerir(telemetria.ler_ndjson(leituras))
+        cls.agora = timezone.make_aware(datetime(2025, 8, 7))
+
+    def test_ajuste_incremental_e_antecedencia(self):
+        desde = timezone.make_aware(datetime(2025, 8, 1))
+        self.assertEqual(preresfriamento.ajustar(self.agora, desde)[:2], (1, 3))
+        curva = CurvaResfriamento.objects.get()
+        self.assertAlmostEqual(curva.minutos_base, 0, places=6)
+        self.assertAlmostEqual(curva.minutos_por_grau, 4, places=6)   # 1 °C a cada 4 min
+        self.assertEqual(curva.amostras, 72)
+
+        # Nada novo desde o último ajuste: só a janela nova é lida e a curva não muda
+        self.assertEqual(preresfriamento.ajustar(self.agora + timedelta(hours=2))[:2], (0, 0))
+        self.assertEqual(CurvaResfriamento.objects.get().amostras, 72)
+
+        # Sala a 27 °C: 3 °C x 4 min + 2 de folga; sem curva ou sem leitura recente, a antecedência fixa
+        self.assertEqual(preresfriamento.antecedencias([self.sala.pk, self.outra.pk], 15, self.agora),
+                         {self.sala.pk: 15, self.outra.pk: 15})
+        telemetria.ingerir(telemetria.ler_ndjson([json.dumps(
+            {'sala': self.sala.pk, 'momento': (self.agora - timedelta(minutes=1)).isoformat(), 'temperatura': 27})]))
+        self.assertEqual(preresfriamento.antecedencias([self.sala.pk, self.outra.pk], 15, self.agora),
+                         {self.sala.pk: 14, self.outra.pk: 15})
+
+
+class PresencaTests(TestCase):
+    """Desligamento antecipado de salas vazias dentro da janela da agenda."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semestre = semear_dados(professores=1, salas=2, disciplinas=1, turmas=0)
+        cls.sala, cls.sem_sensor = Sala.objects.order_by('pk')
+        turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        # Segunda-feira, 08:00-10:00 (a agenda desliga às 10:10)
+        for sala in (cls.sala, cls.sem_sensor):
+            HorarioTurma.objects.create(turma=turma, sala=sala, dia_semana=0, hora_inicio=time(8), hora_fim=time(10))
+
+    def momento(self, hora, minuto=0):
+        return timezone.make_aware(datetime(2025, 8, 11, hora, minuto))
+
+    def ocupacao(self, inicio, fim, valor):
+        """Uma leitura de ocupação por minuto da sala com sensor."""
+        minutos = int((fim - inicio).total_seconds() // 60)
+        telemetria.ingerir(telemetria.ler_ndjson([json.dumps({
+            'sala': self.sala.pk, 'momento': (inicio + timedelta(minutes=m)).isoformat(), 'ocupacao': valor,
+        }) for m in range(minutos)]))
+
+    def rodar(self, monitor, inicio, fim):
+        """Um ciclo por minuto (no segundo 30) de ``inicio`` até ``fim``; retorna ``[(momento, sala, ação)]``."""
+        acoes = []
+        agora = inicio + timedelta(seconds=30)
+        while agora < fim:
+            acoes += sorted({(c.quando.time(), c.sala_id, c.acao) for c in monitor.processar(agora)})
+            agora += timedelta(minutes=1)
+        return acoes
+
+    def test_maquina_com_sensor_oscilando(self):
+        maquina = presenca.MaquinaPresenca(self.momento(10, 10), self.momento(8))
+        vacancia = timedelta(minutes=15)
+        leituras = [(self.momento(8, m), False) for m in range(1, 16)]
+        self.assertEqual([maquina.leitura(m, p, vacancia, 2) for m, p in leituras][-1], DESLIGAR)
+        # Presença isolada não religa (confirmação de 2 minutos); duas seguidas, sim
+        oscilando = [(8, 16, True), (8, 17, False), (8, 18, True), (8, 19, True)]
+        self.assertEqual([maquina.leitura(self.momento(h, m), p, vacancia, 2) for h, m, p in oscilando],
+                         [None, None, None, LIGAR])
+        # Religada, só desliga de novo depois de outra vacância inteira
+        self.assertIsNone(maquina.leitura(self.momento(8, 30), False, vacancia, 2))
+        self.assertEqual(maquina.leitura(self.momento(8, 34), False, vacancia, 2), DESLIGAR)
+
+    def test_desliga_vazia_religa_com_presenca_e_registra_economia(self):
+        self.ocupacao(self.momento(8), self.momento(8, 30), 0)
+        self.ocupacao(self.momento(8, 30), self.momento(8, 40), 1)
+        self.ocupacao(self.momento(8, 40), self.momento(10, 30), 0)
+        monitor = presenca.MonitorPresenca()
+        acoes = self.rodar(monitor, self.momento(8), self.momento(9))
+        # Sala sem sensor nunca é desligada; a outra desliga 15 min depois do início, religa com presença
+        # e desliga de novo 15 min depois da última presença
+        self.assertEqual(acoes, [
+            (time(8, 16), self.sala.pk, DESLIGAR), (time(8, 31), self.sala.pk, LIGAR),
+            (time(8, 55), self.sala.pk, DESLIGAR),
+        ])
+        self.assertEqual(ComandoDispositivo.objects.filter(origem=ComandoDispositivo.PRESENCA).count(), 6)
+        self.assertEqual(despacho.ultimo_estado(self.momento(7)), {})   # o agendador não os vê
+
+        fechado = DesligamentoAusencia.objects.get(fim__isnull=False)
+        self.assertEqual((fechado.inicio, fechado.fim, fechado.minutos), (self.momento(8, 16), self.momento(8, 31), 15))
+        perfil = energia.PERFIS_PADRAO[self.sala.tipo]
+        self.assertAlmostEqual(fechado.kwh, 15 / 60 * (perfil[LUZ] + perfil[AR]))
+
+        # Processo reiniciado com a sala desligada: retoma o desligamento e o encerra no fim da janela
+        reiniciado = presenca.MonitorPresenca()
+        self.assertEqual(self.rodar(reiniciado, self.momento(9), self.momento(10, 20)), [])
+        aberto = DesligamentoAusencia.objects.order_by('inicio').last()
+        self.assertEqual((aberto.inicio, aberto.fim), (self.momento(8, 55), self.momento(10, 10)))
+        self.assertFalse(reiniciado.maquinas)
+
+    def test_falha_ao_gravar_nao_perde_os_minutos_lidos(self):
+        # Um único minuto de presença com a sala desligada
+        self.ocupacao(self.momento(8), self.momento(8, 30), 0)
+        self.ocupacao(self.momento(8, 30), self.momento(8, 31), 1)
+        self.ocupacao(self.momento(8, 31), self.momento(9), 0)
+        monitor = presenca.MonitorPresenca()
+        self.assertEqual(self.rodar(monitor, self.momento(8), self.momento(8, 20)),
+                         [(time(8, 16), self.sala.pk, DESLIGAR)])
+
+        agora = self.momento(8, 20) + timedelta(seconds=30)
+        with mock.patch.object(despacho, 'registrar', side_effect=RuntimeError('banco fora')):
+            while True:
+                try:
+                    monitor.processar(agora)
+                except RuntimeError:
+                    break
+                agora += timedelta(minutes=1)
+        # Como em executar: recomeça do banco
+        monitor.maquinas, monitor._retomado = {}, False
+        comandos = monitor.processar(agora + timedelta(minutes=1))
+        self.assertEqual({(c.quando, c.acao) for c in comandos}, {(self.momento(8, 31), LIGAR)})
+        self.assertEqual(DesligamentoAusencia.objects.get().fim, self.momento(8, 31))
+
+
+class ViradaSemestreTests(TestCase):
+    """Cópia das turmas e horários de um semestre para outro, em lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Um professor e um horário por turma: a origem não tem conflitos
+        cls.origem = semear_dados(professores=120, salas=20, disciplinas=30, turmas=120, horarios_por_turma=1)
+        cls.destino = Semestre.objects.create(ano=2026, semestre=1, data_inicio=date(2026, 2, 2),
+                                              data_fim=date(2026, 6, 26))
+        cls.admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+
+    def test_copia_tudo_com_poucas_consultas_e_trocas(self):
+        horario = HorarioTurma.objects.filter(semestre=self.origem).select_related('turma').first()
+        professor_antigo = horario.turma.professor_id
+        professor_novo = Professor.objects.create(user=User.objects.create(username='novo'), matricula='N1').pk
+        sala_nova = Sala.objects.create(nome='Sala nova', tipo='SAL', capacidade=60, localizacao='Prédio 9')
+        with self.assertNumQueries(9):   # 5 leituras, savepoint, 2 INSERT ... SELECT, release
+            resultado = virada.virar_semestre(self.origem, self.destino, {professor_antigo: professor_novo},
+                                              {horario.sala_id: sala_nova.pk})
+        self.assertTrue(resultado.gravado, resultado.conflitos)
+        self.assertEqual((resultado.turmas_copiadas, resultado.horarios_copiados), (120, 120))
+
+        # Mesmas salas e horários no outro semestre (unicidade por semestre), com as trocas aplicadas
+        copia = HorarioTurma.objects.get(semestre=self.destino, turma__disciplina=horario.turma.disciplina,
+                                         turma__codigo_turma=horario.turma.codigo_turma,
+                                         dia_semana=horario.dia_semana, hora_inicio=horario.hora_inicio)
+        self.assertEqual((copia.sala_id, copia.turma.professor_id), (sala_nova.pk, professor_novo))
+        self.assertFalse(Turma.objects.filter(semestre=self.destino, professor_id=professor_antigo).exists())
+        self.assertEqual(HorarioTurma.objects.filter(semestre=self.origem).count(), 120)
+
+        # De novo: as turmas já existem no destino e nada é duplicado
+        resultado = virada.virar_semestre(self.origem, self.destino)
+        self.assertEqual((resultado.turmas_existentes, resultado.turmas_copiadas), (120, 0))
+
+    def test_conflitos_simulacao_e_trocas_invalidas(self):
+        horario = HorarioTurma.objects.filter(semestre=self.origem).select_related('turma').first()
+        turma = Turma.objects.create(semestre=self.destino, disciplina=horario.turma.disciplina,
+                                     professor=horario.turma.professor, codigo_turma='X99')
+        HorarioTurma.objects.create(turma=turma, sala=horario.sala, dia_semana=horario.dia_semana,
+                                    hora_inicio=horario.hora_inicio, hora_fim=horario.hora_fim)
+
+        resultado = virada.virar_semestre(self.origem, self.destino)
+        self.assertFalse(resultado.gravado)
+        self.assertEqual({conflito.tipo for conflito in resultado.conflitos}, {validacao.SALA, validacao.PROFESSOR})
+        self.assertEqual(Turma.objects.filter(semestre=self.destino).count(), 1)
+
+        resultado = virada.virar_semestre(self.origem, self.destino, simular=True, ignorar_conflitos=True)
+        self.assertEqual((resultado.gravado, resultado.horarios_copiados, resultado.horarios_ignorados),
+                         (False, 119, 1))
+        self.assertEqual(Turma.objects.filter(semestre=self.destino).count(), 1)
+
+        with self.assertRaisesMessage(virada.ErroVirada, "sala 'Sala inexistente' não cadastrado"):
+            virada.ler_trocas(['tipo,de,para', 'sala,Sala 000,Sala inexistente'])
+        self.assertEqual(virada.ler_trocas(['professor,M00001,M00002']),
+                         ({Professor.objects.get(matricula='M00001').pk: Professor.objects.get(matricula='M00002').pk},
+                          {}))
+
+    def test_trocar_o_semestre_da_turma_e_uma_gravacao_so(self):
+        turma = Turma.objects.filter(semestre=self.origem).first()
+        turma.semestre = self.destino
+        # Falhando a atualização dos horários, a troca é desfeita e os sinais não publicam nada
+        with self.captureOnCommitCallbacks() as callbacks, \
+                mock.patch('django.db.models.QuerySet.update', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                turma.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(Turma.objects.get(pk=turma.pk).semestre_id, self.origem.pk)
+
+        # Com sucesso, os callbacks veem os horários já no semestre novo
+        vistos = []
+        with mock.patch.object(alteracoes, 'publicar', side_effect=lambda sala_ids: vistos.extend(
+                turma.horarios.values_list('semestre_id', flat=True))):
+            with self.captureOnCommitCallbacks(execute=True):
+                turma.save()
+        self.assertEqual(set(vistos), {self.destino.pk})
+
+    def test_acao_e_pagina_do_admin(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:core_semestre_virada', args=[self.origem.pk])
+        resposta = self.client.post(reverse('admin:core_semestre_changelist'), {
+            'action': 'copiar_para_outro_semestre', '_selected_action': [self.origem.pk]})
+        self.assertRedirects(resposta, url)
+        resposta = self.client.post(url, {'destino': self.destino.pk, 'trocas': 'sala,Sala 000,Sala 001'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.context['resultado'].gravado or resposta.context['resultado'].conflitos)
+
+
+class ReferenciaTests(TestCase):
+    """Semestre ativo, salas, disciplinas e professores lidos da memória do processo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados(professores=10, salas=10, disciplinas=10, turmas=20, horarios_por_turma=1)
+        cls.turmas = list(Turma.objects.all())
+
+    def setUp(self):
+        referencia.carregar()
+
+    def test_regime_sem_consultas(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(referencia.semestre_ativo().pk, self.semestre.pk)
+            self.assertEqual(len(referencia.salas_ativas()), 10)
+            self.assertEqual(referencia.sala_por_nome('Sala 003').nome, 'Sala 003')
+            self.assertEqual(referencia.disciplina_por_codigo('DISC0001').nome, 'Disciplina 1')
+            self.assertEqual(str(self.turmas[0]), 'DISC0000 - T00 (Professor0 Silva)')
+            self.assertEqual(str(referencia.professor_por_matricula('M00001')), 'Professor1 Silva')
+            self.assertEqual(referencia.salas_ativas(predios=[]), [])
+        with self.assertNumQueries(1):   # só os horários: o semestre ativo vem da memória
+            ocupacao.compilar_indice()
+
+    def test_sinais_invalidam(self):
+        sala = Sala.objects.get(nome='Sala 003')
+        sala.nome, sala.ativa = 'Sala 303', False
+        sala.save()
+        self.assertIsNone(referencia.sala_por_nome('Sala 003'))
+        self.assertEqual(len(referencia.salas_ativas()), 9)
+
+        usuario = self.turmas[0].professor.user
+        usuario.first_name = 'Ana'
+        usuario.save()
+        self.assertEqual(str(self.turmas[0]), 'DISC0000 - T00 (Ana Silva)')
+
+        # Login grava só last_login: a cópia continua valendo
+        usuario.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            referencia.professor(self.turmas[0].professor_id)
+
+        self.semestre.ativo = False
+        self.semestre.save()
+        self.assertIsNone(referencia.semestre_ativo())
+        self.assertEqual(len(ocupacao.compilar_indice()), 0)
+
+    def test_versao_alcanca_outros_processos(self):
+        # Outro processo alterou a disciplina: aqui, só a versão no cache muda
+        Disciplina.objects.filter(codigo='DISC0001').update(nome='Renomeada')
+        versao.incrementar_referencia()
+        with self.settings(LUMINOFF_REFERENCIA_VERIFICACAO=3600):
+            self.assertEqual(referencia.disciplina_por_codigo('DISC0001').nome, 'Disciplina 1')
+        with self.settings(LUMINOFF_REFERENCIA_VERIFICACAO=0):
+            self.assertEqual(referencia.disciplina_por_codigo('DISC0001').nome, 'Renomeada')
+
+
+class MetricasTests(TestCase):
+    """Latência e consultas por view, consultas lentas, agendador/despacho e exportação Prometheus."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semear_dados(professores=2, salas=3, disciplinas=2, turmas=2, horarios_por_turma=1)
+        cls.admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+
+    def setUp(self):
+        metricas.limpar()
+        self.client.force_login(self.admin)
+
+    def test_requisicao_instrumentada_e_exportada(self):
+        self.client.get(reverse('admin:core_sala_changelist'))
+        self.client.get('/nao-existe/')
+        view = 'admin:core_sala_changelist'
+        self.assertEqual(metricas.REQUISICOES.total((view, 'GET', '2xx')), 1)
+        self.assertEqual(metricas.REQUISICOES.total(('-', 'GET', '4xx')), 1)
+        self.assertEqual(metricas.CONSULTAS.total((view,)), 1)
+        self.assertGreater(metricas.TEMPO_BANCO.valor((view,)), 0)
+
+        resposta = self.client.get(reverse('core:metricas'))
+        self.assertEqual(resposta['Content-Type'], metricas.CONTENT_TYPE)
+        texto = resposta.content.decode()
+        self.assertIn('# TYPE luminoff_http_requisicao_segundos histogram', texto)
+        self.assertIn(f'luminoff_http_requisicao_segundos_count{{view="{view}",metodo="GET",status="2xx"}} 1',
+                      texto)
+        self.assertIn(f'luminoff_db_consultas_por_requisicao_bucket{{view="{view}",le="+Inf"}} 1', texto)
+
+        self.assertEqual(self.client.get(reverse('core:metricas'), REMOTE_ADDR='10.0.0.9').status_code, 403)
+        with self.settings(LUMINOFF_API_TOKEN='segredo'):
+            resposta = self.client.get(reverse('core:metricas'), REMOTE_ADDR='10.0.0.9',
+                                       HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(resposta.status_code, 200)
+
+    async def test_consultas_medidas_sob_asgi(self):
+        await self.async_client.aforce_login(self.admin)
+        resposta = await self.async_client.get(reverse('admin:core_sala_changelist'))
+        self.assertEqual(resposta.status_code, 200)
+        view = 'admin:core_sala_changelist'
+        self.assertEqual(metricas.CONSULTAS.total((view,)), 1)
+        self.assertGreater(metricas.TEMPO_BANCO.valor((view,)), 0)
+
+    def test_consulta_lenta_vai_para_o_log_com_a_view(self):
+        with self.settings(LUMINOFF_METRICAS_CONSULTA_LENTA=0), self.assertLogs('core.middleware', 'WARNING') as log:
+            self.client.get(reverse('admin:core_sala_changelist'))
+        self.assertIn('admin:core_sala_changelist', log.output[-1])
+        self.assertGreater(metricas.CONSULTAS_LENTAS.valor(('admin:core_sala_changelist',)), 0)
+
+    def test_histograma_acumula_faixas(self):
+        histograma = metricas.Histograma('teste_segundos', "Teste", ('rota',), limites=(1, 5))
+        histograma.observar(0.5, ('a"b',))
+        histograma.observar_varios([3, 10], ('a"b',))
+        self.assertEqual(list(histograma.linhas())[2:], [
+            'teste_segundos_bucket{rota="a\\"b",le="1"} 1',
+            'teste_segundos_bucket{rota="a\\"b",le="5"} 2',
+            'teste_segundos_bucket{rota="a\\"b",le="+Inf"} 3',
+            'teste_segundos_sum{rota="a\\"b"} 13.5',
+            'teste_segundos_count{rota="a\\"b"} 3',
+        ])
+
+    async def test_agendador_e_despacho(self):
+        agora = timezone.now()
+        salas = [sala.pk async for sala in Sala.objects.all()]
+        agendador = Agendador()
+        await agendador._enviar([Comando(sala_id, LUZ, LIGAR, agora - timedelta(seconds=2)) for sala_id in salas])
+        self.assertEqual(metricas.TRANSICOES.valor((LUZ, LIGAR)), 3)
+        self.assertEqual(metricas.ATRASO_TRANSICAO.total(), 3)
+
+        despachante = despacho.Despachante(DriverTeste(falhar=True))
+        with self.assertLogs('core.despacho', 'ERROR'):
+            await despachante.processar_lote()
+        self.assertEqual(metricas.COMANDOS.valor(('adiado',)), 3)
+        await ComandoDispositivo.objects.aupdate(proxima_tentativa=agora)
+        despachante.driver = DriverTeste()
+        await despachante.processar_lote()
+        self.assertEqual(metricas.COMANDOS.valor(('entregue',)), 3)
+        self.assertEqual(metricas.LATENCIA_COMANDO.total(), 3)
+        self.assertEqual(metricas.ENVIO_LOTE.total(), 2)
+
+
+class DisponibilidadeTests(TestCase):
+    """Salas livres por faixas de 5 minutos, ordenadas pelo impacto na energia."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semestre = semear_dados(professores=1, salas=0, disciplinas=1, turmas=0)
+        criar = lambda nome, predio, andar, capacidade, tipo='SAL': Sala.objects.create(
+            nome=nome, tipo=tipo, capacidade=capacidade, localizacao=predio, andar=andar)
+        cls.a1, cls.a2 = criar('A1', 'Prédio A', 1, 40), criar('A2', 'Prédio A', 1, 80)
+        cls.a3, cls.b1 = criar('A3', 'Prédio A', 2, 40), criar('B1', 'Prédio B', 1, 40)
+        criar('L1', 'Prédio B', 1, 40, tipo='LAB')
+        turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                     professor=Professor.objects.get(), codigo_turma='T01')
+        # Segunda-feira, 08:00-10:00, só na A1
+        HorarioTurma.objects.create(turma=turma, sala=cls.a1, dia_semana=0, hora_inicio=time(8), hora_fim=time(10))
+        cls.segunda = date(2025, 8, 11)
+        cls.admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+
+    def setUp(self):
+        cache.clear()
+
+    def nomes(self, inicio, fim, **filtros):
+        return [livre.sala.nome for livre in disponibilidade.buscar(inicio, fim, **filtros)]
+
+    def test_busca_por_dia_da_semana(self):
+        self.assertEqual(self.nomes(time(8), time(10), dia_semana=0, tipo='SAL'), ['A2', 'A3', 'B1'])
+        impactos = [livre.impacto for livre in disponibilidade.buscar(time(8), time(10), dia_semana=0, tipo='SAL')]
+        self.assertEqual(impactos, [disponibilidade.ANDAR_LIGADO, disponibilidade.PREDIO_LIGADO,
+                                    disponibilidade.PREDIO_DESLIGADO])
+        self.assertEqual(self.nomes(time(8), time(10), dia_semana=0, alunos=50), ['A2'])
+        self.assertEqual(self.nomes(time(8), time(10), dia_semana=0, predio='Prédio B', tipo='LAB'), ['L1'])
+        self.assertNotIn('A1', self.nomes(time(9, 55), time(11), dia_semana=0))
+        # Sem ninguém em aula, a menor sala do prédio apagado vem antes da maior
+        self.assertEqual(self.nomes(time(10), time(11), dia_semana=0, andar=1, tipo='SAL'), ['A1', 'B1', 'A2'])
+        self.assertEqual(len(self.nomes(time(8), time(10), dia_semana=1)), 5)
+
+        # Mapa e salas em memória: a próxima busca não vai ao banco
+        with self.assertNumQueries(0):
+            self.nomes(time(14), time(16), dia_semana=0, alunos=30)
+
+    def test_busca_por_data_considera_feriados(self):
+        self.assertNotIn('A1', self.nomes(time(8), time(10), data=self.segunda))
+        with self.captureOnCommitCallbacks(execute=True):
+            Feriado.objects.create(descricao='Feriado', data_inicio=self.segunda, data_fim=self.segunda)
+        self.assertIn('A1', self.nomes(time(8), time(10), data=self.segunda))
+
+    def test_mascara(self):
+        self.assertEqual(disponibilidade.mascara(0, 5), 0b1)
+        self.assertEqual(disponibilidade.mascara(3, 12), 0b111)   # faixas parciais contam inteiras
+        self.assertEqual(disponibilidade.mascara(60, 60), 0)
+        self.assertEqual(disponibilidade.mascara(0, 24 * 60).bit_length(), disponibilidade.FAIXAS_DIA)
+
+    def test_api_e_admin(self):
+        url = reverse('core:api_salas_livres')
+        resposta = self.client.get(url, {'data': '2025-08-11', 'inicio': '08:00', 'fim': '10:00', 'alunos': 50})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([(sala['nome'], sala['impacto']) for sala in resposta.json()['salas']],
+                         [('A2', disponibilidade.ANDAR_LIGADO)])
+        resposta = self.client.get(url, {'inicio': '08:00', 'fim': '10:00'})
+        self.assertEqual(resposta.status_code, 400)
+
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('admin:core_sala_disponibilidade'),
+                                   {'dia_semana': 0, 'inicio': '08:00', 'fim': '10:00', 'tipo': 'SAL'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([livre.sala.nome for livre in resposta.context['livres']], ['A2', 'A3', 'B1'])
+
+
+class AlteracoesAgendaTests(TestCase):
+    """Feed de alterações: deltas por sala desde uma versão, com compactação."""
+
+    @classmethod
+    def setUpTestData(cls):
+        semestre = semear_dados(professores=1, salas=0, disciplinas=1, turmas=0)
+        cls.a1 = Sala.objects.create(nome='A1', tipo='SAL', capacidade=40, localizacao='Prédio A')
+        cls.b1 = Sala.objects.create(nome='B1', tipo='SAL', capacidade=40, localizacao='Prédio B')
+        cls.turma = Turma.objects.create(semestre=semestre, disciplina=Disciplina.objects.get(),
+                                         professor=Professor.objects.get(), codigo_turma='T01')
+        cls.horario = HorarioTurma.objects.create(turma=cls.turma, sala=cls.a1, dia_semana=0,
+                                                  hora_inicio=time(8), hora_fim=time(10))
+        HorarioTurma.objects.create(turma=cls.turma, sala=cls.b1, dia_semana=2, hora_inicio=time(14),
+                                    hora_fim=time(16))
+
+    def setUp(self):
+        cache.clear()
+        referencia.invalidar()
+        self.assertEqual(alteracoes.publicar(), 2)
+        self.versao = alteracoes.alteracoes_desde()['versao']
+
+    def test_delta_liquido_por_sala(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.horario.hora_fim = time(11)
+            self.horario.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = HorarioTurma.objects.create(turma=self.turma, sala=self.b1, dia_semana=4,
+                                                hora_inicio=time(7), hora_fim=time(9))
+        with self.captureOnCommitCallbacks(execute=True):
+            extra.delete()
+
+        with self.assertNumQueries(2):
+            delta = alteracoes.alteracoes_desde(self.versao)
+        self.assertFalse(delta['completo'])
+        # O horário incluído e excluído em B1 se anula
+        self.assertEqual(delta['salas'], {
+            self.a1.pk: {'adicionados': [[0, 480, 660]], 'removidos': [[0, 480, 600]]},
+        })
+        with self.assertNumQueries(1):
+            self.assertEqual(alteracoes.alteracoes_desde(delta['versao'])['salas'], {})
+        self.assertEqual(alteracoes.publicar(), 0)
+
+        # Em lotes: a primeira resposta pede continuação a partir da versão recebida
+        parcial = alteracoes.alteracoes_desde(self.versao, limite=1)
+        self.assertTrue(parcial['mais'])
+        self.assertLess(parcial['versao'], delta['versao'])
+
+    def test_por_predio_e_sala_que_muda_de_predio(self):
+        predio_a, predio_b = (Predio.objects.get(nome=nome).pk for nome in ('Prédio A', 'Prédio B'))
+        self.assertEqual(set(alteracoes.alteracoes_desde(predio=predio_b)['salas']), {self.b1.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b1.localizacao = 'Prédio A'
+            self.b1.save()
+        self.assertEqual(alteracoes.alteracoes_desde(self.versao, predio_b)['salas'],
+                         {self.b1.pk: {'adicionados': [], 'removidos': [[2, 840, 960]]}})
+        self.assertEqual(alteracoes.alteracoes_desde(self.versao, predio_a)['salas'],
+                         {self.b1.pk: {'adicionados': [[2, 840, 960]], 'removidos': []}})
+
+    def test_compactacao_devolve_o_retrato(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b1.ativa = False
+            self.b1.save()
+        self.assertEqual(alteracoes.compactar(dias=0, agora=timezone.now() + timedelta(seconds=1)), 3)
+        retrato = alteracoes.alteracoes_desde(self.versao)
+        self.assertTrue(retrato['completo'])
+        self.assertEqual(retrato['salas'], {self.a1.pk: {'intervalos': [[0, 480, 600]]}})
+        self.assertEqual(AgendaPublicada.objects.count(), 1)
+        self.assertEqual(alteracoes.alteracoes_desde(retrato['versao'])['salas'], {})
+
+    def test_api(self):
+        url = reverse('core:api_alteracoes_agenda')
+        dados = self.client.get(url, {'predio': 'Prédio A'}).json()
+        self.assertTrue(dados['completo'])
+        self.assertEqual(dados['salas'], {str(self.a1.pk): {'intervalos': [[0, 480, 600]]}})
+        self.assertEqual(dados['margens']['ar'][0], 15)
+        dados = self.client.get(url, {'desde': dados['versao']}).json()
+        self.assertEqual((dados['completo'], dados['salas']), (False, {}))
+        self.assertEqual(self.client.get(url, {'desde': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'predio': 'Prédio Z'}).status_code, 404)
+
+
+class ImportacaoTests(TestCase):
+    """Importação da planilha: leitura, simulação, conflitos e gravação em lote."""
+
+    CABECALHO = 'disciplina,turma,professor,alunos,sala,dia,inicio,fim'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados(professores=2, salas=0, disciplinas=2, turmas=0)
+        cls.sala_a = Sala.objects.create(nome='A', tipo='SAL', capacidade=40, localizacao='Prédio A')
+        cls.sala_b = Sala.objects.create(nome='B', tipo='SAL', capacidade=20, localizacao='Prédio A')
+        cls.admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+
+    def arquivo(self, *linhas, cabecalho=CABECALHO, codificacao='utf-8'):
+        return io.BytesIO('\n'.join((cabecalho, *linhas)).encode(codificacao))
+
+    def importar(self, *linhas, **opcoes):
+        return importacao.importar_horarios(importacao.ler_csv(self.arquivo(*linhas)), self.semestre, **opcoes)
+
+    def test_leitura(self):
+        arquivo = self.arquivo('DISC0000;T01;M00000;30;A;Terça-feira;8h;10:00',
+                               cabecalho='Disciplina;Turma;Professor;Alunos;Sala;Dia;Início;Fim')
+        linha, = importacao.ler_csv(arquivo)
+        self.assertEqual((linha['dia'], linha['inicio'], linha['fim']), ('Terça-feira', '8h', '10:00'))
+        self.assertEqual(importacao._dia('Sáb'), 5)
+        self.assertEqual(importacao._hora('8h30'), time(8, 30))
+        with self.assertRaises(ValueError):
+            importacao._dia('feriado')
+
+        with self.assertRaisesMessage(importacao.ErroImportacao, 'Colunas ausentes: dia'):
+            list(importacao.ler_csv(self.arquivo(cabecalho='disciplina,turma,professor,sala,inicio,fim')))
+        with self.assertRaisesMessage(importacao.ErroImportacao, 'UTF-8'):
+            importacao.ler_csv(self.arquivo(cabecalho='Disciplina;Início', codificacao='cp1252'))
+        with self.assertRaisesMessage(importacao.ErroImportacao, 'separador'):
+            importacao.ler_csv(io.BytesIO(b'disciplina|turma\nDISC0000|T01\n'))
+        # Byte inválido depois da amostra: o erro sai durante a importação, e nada é gravado
+        linhas = ['DISC0000,T01,M00000,30,A,0,08:00,10:00'] * 150
+        arquivo = io.BytesIO(self.arquivo(*linhas).getvalue() + '\nDISC0001,T01,M00001,,B,Sáb,8:00,9:00'.encode('cp1252'))
+        with self.assertRaisesMessage(importacao.ErroImportacao, 'UTF-8'):
+            importacao.importar_horarios(importacao.ler_csv(arquivo), self.semestre)
+        self.assertFalse(Turma.objects.exists())
+
+    def test_simulacao_nao_grava(self):
+        resultado = self.importar('DISC0000,T01,M00000,30,A,0,08:00,10:00', 'DISC0000,T01,M00000,30,A,2,08:00,10:00',
+                                  simular=True)
+        self.assertEqual((resultado.linhas, resultado.turmas_criadas, resultado.horarios_criados), (2, 1, 2))
+        self.assertFalse(resultado.gravado)
+        self.assertFalse(Turma.objects.exists())
+
+    def test_conflitos_e_linhas_com_erro(self):
+        linhas = (
+            'DISC0000,T01,M00000,30,A,0,08:00,10:00',
+            'DISC0001,T01,M00000,10,B,0,09:00,11:00',   # professor em duas salas ao mesmo tempo
+            'DISC0001,T02,M00001,10,A,0,08:00,09:00',   # mesmo início na mesma sala: linha ignorada
+            'DISC0001,T03,M00001,10,Z,1,08:00,09:00',   # sala inexistente
+        )
+        resultado = self.importar(*linhas)
+        self.assertEqual([numero for numero, _ in resultado.erros], [5, 4])
+        self.assertEqual({conflito.tipo for conflito in resultado.conflitos}, {validacao.PROFESSOR})
+        self.assertFalse(resultado.gravado)
+        self.assertFalse(HorarioTurma.objects.exists())
+
+        resultado = self.importar(*linhas, ignorar_conflitos=True)
+        self.assertTrue(resultado.gravado)
+        self.assertEqual(HorarioTurma.objects.count(), 2)
+
+    def test_gravacao_em_lote(self):
+        resultado = self.importar('DISC0000,T01,M00000,30,A,0,08:00,10:00', 'DISC0001,T01,M00001,15,B,1,08:00,10:00')
+        self.assertTrue(resultado.gravado)
+        self.assertEqual(set(Turma.objects.values_list('numero_alunos', flat=True)), {30, 15})
+
+        # Reimportar atualiza a turma e não duplica os horários
+        resultado = self.importar('DISC0000,T01,M00001,35,A,0,08:00,10:00')
+        self.assertEqual((resultado.turmas_atualizadas, resultado.horarios_existentes), (1, 1))
+        self.assertEqual(Turma.objects.get(codigo_turma='T01', disciplina__codigo='DISC0000').numero_alunos, 35)
+
+        # O número de consultas não cresce com o número de linhas
+        def consultas(quantidade):
+            linhas = [f'DISC0000,T{i:02d},M00000,,A,{i % 6},{7 + i // 6}:00,{8 + i // 6}:00' for i in range(quantidade)]
+            with CaptureQueriesContext(connection) as capturadas:
+                self.importar(*linhas, simular=True)
+            return len(capturadas)
+        self.assertEqual(consultas(5), consultas(60))
+
+    def test_arquivo_invalido_no_admin_e_no_comando(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.post(reverse('admin:core_turma_importar'), {
+            'arquivo': SimpleUploadedFile('horarios.csv', 'Disciplina;Início\n'.encode('cp1252')),
+            'semestre': self.semestre.pk, 'simular': 'on',
+        }, follow=True)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('UTF-8', ' '.join(str(mensagem) for mensagem in resposta.context['messages']))
+
+        with tempfile.NamedTemporaryFile(suffix='.csv') as arquivo:
+            arquivo.write(b'disciplina|turma\n')
+            arquivo.flush()
+            with self.assertRaisesMessage(CommandError, 'separador'):
+                call_command('import_schedule', arquivo.name, semestre=str(self.semestre))
+
+
+class ValidacaoTests(TestCase):
+    """Conflitos de sala, professor e capacidade, no relatório e no formulário da turma."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semestre = semear_dados(professores=2, salas=0, disciplinas=2, turmas=0)
+        cls.sala = Sala.objects.create(nome='A', tipo='SAL', capacidade=40, localizacao='Prédio A')
+        cls.outra_sala = Sala.objects.create(nome='B', tipo='SAL', capacidade=20, localizacao='Prédio A')
+        cls.professor, cls.outro_professor = Professor.objects.order_by('pk')
+        cls.disciplina, cls.outra_disciplina = Disciplina.objects.order_by('pk')
+        cls.turma = Turma.objects.create(semestre=cls.semestre, disciplina=cls.disciplina, professor=cls.professor,
+                                         codigo_turma='T01', numero_alunos=30)
+        HorarioTurma.objects.create(turma=cls.turma, sala=cls.sala, dia_semana=0, hora_inicio=time(8),
+                                    hora_fim=time(10))
+        cls.admin = User.objects.create_superuser('admin', 'admin@ufrpe.br', 'senha')
+
+    def horario(self, pk, sala_id, professor_id, inicio, fim, alunos=10, capacidade=40, dia=0):
+        return validacao.Horario(pk, pk, sala_id, professor_id, dia, inicio, fim, alunos, capacidade,
+                                 f'T{pk}', f'Sala {sala_id}', f'Professor {professor_id}')
+
+    def tipos(self, conflitos):
+        return sorted(conflito.tipo for conflito in conflitos)
+
+    def test_verificar_horarios(self):
+        horarios = [
+            self.horario(1, 1, 1, 480, 600),
+            self.horario(2, 1, 2, 540, 660),               # mesma sala, sobrepõe
+            self.horario(3, 2, 1, 590, 700),               # mesmo professor, sobrepõe
+            self.horario(4, 3, 3, 600, 700, alunos=50),    # acima da capacidade
+            self.horario(5, 3, 4, 700, 760),               # encosta no anterior: sem conflito
+            self.horario(6, 4, 5, 600, 600),               # intervalo vazio
+            self.horario(7, 1, 1, 480, 600, dia=1),        # outro dia
+        ]
+        self.assertEqual(self.tipos(validacao.verificar_horarios(horarios)), [
+            validacao.CAPACIDADE, validacao.INTERVALO, validacao.PROFESSOR, validacao.SALA])
+        self.assertEqual(self.tipos(validacao.verificar_horarios(horarios, individuais=False)),
+                         [validacao.PROFESSOR, validacao.SALA])
+
+        indice = validacao.IndiceConflitos(horarios[:1])
+        self.assertEqual(self.tipos(indice.conflitos_de(self.horario(8, 1, 9, 570, 630))), [validacao.SALA])
+        self.assertEqual(self.tipos(indice.conflitos_de(self.horario(8, 9, 1, 300, 481))), [validacao.PROFESSOR])
+        self.assertEqual(indice.conflitos_de(self.horario(8, 1, 1, 600, 660)), [])
+
+    def test_verificar_semestre(self):
+        self.assertEqual(validacao.verificar_semestre(self.semestre), [])
+        turma = Turma.objects.create(semestre=self.semestre, disciplina=self.outra_disciplina,
+                                     professor=self.professor, codigo_turma='T01', numero_alunos=30)
+        HorarioTurma.objects.create(turma=turma, sala=self.outra_sala, dia_semana=0, hora_inicio=time(9),
+                                    hora_fim=time(11))
+        self.assertEqual(self.tipos(validacao.verificar_semestre(self.semestre)),
+                         [validacao.CAPACIDADE, validacao.PROFESSOR])
+
+    def enviar_turma(self, **turma):
+        dados = {
+            'semestre': self.semestre.pk, 'codigo_turma': 'T02', 'numero_alunos': 30, 'ativo': 'on',
+            'horarios-TOTAL_FORMS': 1, 'horarios-INITIAL_FORMS': 0,
+            'horarios-0-sala': self.sala.pk, 'horarios-0-dia_semana': 0,
+            'horarios-0-hora_inicio': '09:00', 'horarios-0-hora_fim': '11:00',
+            **turma,
+        }
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('admin:core_turma_add'), dados)
+
+    def test_formulario_da_turma(self):
+        # Sem disciplina: o erro é do formulário principal, sem 500
+        resposta = self.enviar_turma(professor=self.outro_professor.pk)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('disciplina', resposta.context['adminform'].form.errors)
+
+        # Sala já ocupada
+        resposta = self.enviar_turma(disciplina=self.outra_disciplina.pk, professor=self.outro_professor.pk)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('se sobrepõe', str(resposta.context['inline_admin_formsets'][0].formset.non_form_errors()))
+
+        # Professor em outra aula e sala pequena demais
+        resposta = self.enviar_turma(disciplina=self.outra_disciplina.pk, professor=self.professor.pk,
+                                     **{'horarios-0-sala': self.outra_sala.pk})
+        erros = str(resposta.context['inline_admin_formsets'][0].formset.non_form_errors())
+        self.assertIn(f'Professor {self.professor}', erros)
+        self.assertIn('capacidade 20', erros)
 
-# Create your tests here.
+        # Sem conflitos, a turma é criada
+        resposta = self.enviar_turma(disciplina=self.outra_disciplina.pk, professor=self.outro_professor.pk,
+                                     **{'horarios-0-hora_inicio': '10:00', 'horarios-0-hora_fim': '12:00'})
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(HorarioTurma.objects.count(), 2)
@@ -1,9 +1,25 @@
 from django.urls import path
-from . import views
+from . import api, metricas, painel, views
 
 app_name = 'core'
 
 urlpatterns = [
     path('login/', views.login, name='login'),
     path('semestre/criar/', views.criar_semestre, name='criar_semestre'),
-]
\ No newline at end of file
+
+    # API de leitura para os controladores
+    path('api/campus/agenda/', api.agenda_campus, name='api_agenda_campus'),
+    path('api/salas/<int:sala_id>/agenda/', api.agenda_sala, name='api_agenda_sala'),
+    path('api/agenda/alteracoes/', api.alteracoes_agenda, name='api_alteracoes_agenda'),
+    path('api/salas/livres/', api.salas_livres, name='api_salas_livres'),
+    path('api/predios/<str:predio>/agenda/', api.agenda_predio, name='api_agenda_predio'),
+    path('api/predios/<str:predio>/andares/<int:andar>/agenda/', api.agenda_predio,
+         name='api_agenda_andar'),
+    path('api/telemetria/', api.receber_telemetria, name='api_telemetria'),
+
+    # Estado das salas ao vivo (SSE; exige servidor ASGI)
+    path('api/painel/eventos/', painel.eventos, name='api_painel_eventos'),
+
+    # Métricas do processo (Prometheus)
+    path('metricas/', metricas.expor, name='metricas'),
+]
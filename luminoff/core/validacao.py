@@ -0,0 +1,151 @@
+"""
+Detecção de conflitos de horário.
+
+O ``unique_together`` de HorarioTurma só impede dois horários com o mesmo
+início na mesma sala. Aqui tratamos sobreposição de intervalos na mesma sala e
+no mesmo dia, professor com duas aulas ao mesmo tempo e turma com mais alunos
+que a capacidade da sala.
+
+- ``verificar_horarios`` faz uma varredura (sweep line) por grupo
+  (sala, dia) e (professor, dia): O(n log n) para um semestre inteiro.
+- ``IndiceConflitos`` mantém cada grupo ordenado por início com o máximo
+  acumulado dos fins, e responde se um novo horário colide em O(log n).
+"""
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from .models import HorarioTurma
+from .ocupacao import minutos
+
+SALA = 'sala'
+PROFESSOR = 'professor'
+CAPACIDADE = 'capacidade'
+INTERVALO = 'intervalo'
+
+DIAS = dict(HorarioTurma.DIA_SEMANA)
+
+Horario = namedtuple('Horario', [
+    'id', 'turma_id', 'sala_id', 'professor_id', 'dia_semana', 'inicio', 'fim',
+    'numero_alunos', 'capacidade', 'rotulo', 'sala', 'professor',
+])
+
+Conflito = namedtuple('Conflito', ['tipo', 'mensagem', 'horarios'])
+
+
+def _hora(minuto):
+    return f"{minuto // 60:02d}:{minuto % 60:02d}"
+
+
+def descrever(horario):
+    return f"{horario.rotulo} ({DIAS.get(horario.dia_semana, horario.dia_semana)} {_hora(horario.inicio)}-{_hora(horario.fim)})"
+
+
+def _chaves(horario):
+    yield (SALA, horario.sala_id, horario.dia_semana)
+    if horario.professor_id is not None:
+        yield (PROFESSOR, horario.professor_id, horario.dia_semana)
+
+
+def _conflito_sobreposicao(chave, a, b):
+    tipo = chave[0]
+    if tipo == SALA:
+        mensagem = f"Sala {a.sala}: {descrever(a)} se sobrepõe a {descrever(b)}"
+    else:
+        mensagem = f"Professor {a.professor}: {descrever(a)} se sobrepõe a {descrever(b)}"
+    return Conflito(tipo, mensagem, (a, b))
+
+
+def conflitos_individuais(horario):
+    """Problemas que não dependem de outros horários."""
+    conflitos = []
+    if horario.fim <= horario.inicio:
+        conflitos.append(Conflito(INTERVALO, f"{descrever(horario)}: o fim deve ser depois do início", (horario,)))
+    if horario.capacidade is not None and horario.numero_alunos > horario.capacidade:
+        conflitos.append(Conflito(
+            CAPACIDADE,
+            f"{descrever(horario)}: {horario.numero_alunos} alunos na sala {horario.sala} "
+            f"(capacidade {horario.capacidade})",
+            (horario,),
+        ))
+    return conflitos
+
+
+def verificar_horarios(horarios, individuais=True):
+    """Todos os conflitos de um conjunto de horários, em O(n log n)."""
+    conflitos = []
+    grupos = defaultdict(list)
+    for horario in horarios:
+        if individuais:
+            conflitos.extend(conflitos_individuais(horario))
+        for chave in _chaves(horario):
+            grupos[chave].append(horario)
+
+    for chave, itens in grupos.items():
+        itens.sort(key=lambda h: (h.inicio, h.fim))
+        # Varredura: guarda o horário que termina mais tarde até aqui
+        mais_longo = None
+        for horario in itens:
+            if mais_longo is not None and horario.inicio < mais_longo.fim:
+                conflitos.append(_conflito_sobreposicao(chave, horario, mais_longo))
+            if mais_longo is None or horario.fim > mais_longo.fim:
+                mais_longo = horario
+    return conflitos
+
+
+class IndiceConflitos:
+    """Índice dos horários existentes para validar inclusões em O(log n)."""
+
+    def __init__(self, horarios):
+        grupos = defaultdict(list)
+        for horario in horarios:
+            for chave in _chaves(horario):
+                grupos[chave].append(horario)
+
+        self._grupos = {}
+        for chave, itens in grupos.items():
+            itens.sort(key=lambda h: h.inicio)
+            # maior[i] é o horário com maior fim entre itens[0..i]
+            maior = []
+            for horario in itens:
+                maior.append(horario if not maior or horario.fim > maior[-1].fim else maior[-1])
+            self._grupos[chave] = ([h.inicio for h in itens], maior)
+
+    def conflitos_de(self, horario):
+        """Conflitos de ``horario`` com os horários do índice."""
+        conflitos = conflitos_individuais(horario)
+        for chave in _chaves(horario):
+            if chave not in self._grupos:
+                continue
+            inicios, maior = self._grupos[chave]
+            # Candidatos são os que começam antes do fim do novo horário
+            i = bisect_left(inicios, horario.fim)
+            if i and maior[i - 1].fim > horario.inicio:
+                conflitos.append(_conflito_sobreposicao(chave, horario, maior[i - 1]))
+        return conflitos
+
+
+# ---------------------------------------------------------------------------
+# Carregamento a partir do banco
+# ---------------------------------------------------------------------------
+
+_CAMPOS = (
+    'id', 'turma_id', 'sala_id', 'turma__professor_id', 'dia_semana', 'hora_inicio', 'hora_fim',
+    'turma__numero_alunos', 'sala__capacidade', 'turma__disciplina__codigo', 'turma__codigo_turma',
+    'sala__nome', 'turma__professor__user__first_name', 'turma__professor__user__last_name',
+)
+
+
+def horarios_do_banco(queryset):
+    """Converte um queryset de HorarioTurma em ``Horario`` com uma consulta."""
+    for (pk, turma_id, sala_id, professor_id, dia, inicio, fim, alunos, capacidade,
+         disciplina, codigo_turma, sala, nome, sobrenome) in queryset.values_list(*_CAMPOS).iterator(chunk_size=5000):
+        yield Horario(
+            pk, turma_id, sala_id, professor_id, dia, minutos(inicio), minutos(fim), alunos, capacidade,
+            f"{disciplina} - {codigo_turma}", sala, f"{nome} {sobrenome}".strip(),
+        )
+
+
+def verificar_semestre(semestre):
+    """Relatório de conflitos de todas as turmas ativas do semestre."""
+    queryset = HorarioTurma.objects.filter(turma__semestre=semestre, turma__ativo=True)
+    return verificar_horarios(horarios_do_banco(queryset))
@@ -0,0 +1,90 @@
+"""
+Versão da agenda.
+
+Um contador no cache do Django que muda a cada escrita em Turma,
+HorarioTurma, Sala ou Semestre. Tudo que é derivado da agenda (payloads da
+API, ETags) usa a versão na chave: escrever não precisa apagar nada, as
+chaves antigas simplesmente deixam de ser usadas e expiram.
+
+Cada sala tem também a sua versão (``das_salas``), para o que é derivado de
+uma sala só (fragmentos da grade): alterar um horário troca a versão da sala
+dele e deixa as outras intactas. Operações em massa trocam a geração comum a
+todas as salas.
+
+Os dados de referência (semestres, salas, disciplinas, professores) têm uma
+versão própria (``da_referencia``), que invalida as cópias em memória de
+``referencia`` em todos os processos.
+"""
+import time
+
+from django.core.cache import cache
+
+CHAVE = 'luminoff:versao_agenda'
+CHAVE_SALAS = 'luminoff:versao_salas'
+CHAVE_REFERENCIA = 'luminoff:versao_referencia'
+
+
+def _semear(chave):
+    # Semente pelo relógio: se o cache for limpo, a versão nova não repete
+    # uma antiga e ETags já distribuídos não voltam a valer por engano.
+    cache.add(chave, int(time.time() * 1000), timeout=None)
+    return cache.get(chave)
+
+
+def atual():
+    """Versão corrente da agenda (uma leitura do cache, sem banco)."""
+    versao = cache.get(CHAVE)
+    if versao is None:
+        versao = _semear(CHAVE)
+    return versao
+
+
+def incrementar():
+    """Marca a agenda como alterada."""
+    try:
+        return cache.incr(CHAVE)
+    except ValueError:
+        # Chave ausente (cache reiniciado): a semente já é uma versão nova
+        return atual()
+
+
+def das_salas(sala_ids):
+    """``{sala_id: versão}`` das salas, em uma leitura do cache.
+
+    A versão combina a geração comum e o contador da sala, então muda quando
+    os horários da sala mudam ou numa troca geral.
+    """
+    chaves = {sala_id: f'{CHAVE_SALAS}:{sala_id}' for sala_id in sala_ids}
+    valores = cache.get_many([CHAVE_SALAS, *chaves.values()])
+    geracao = valores.get(CHAVE_SALAS) or _semear(CHAVE_SALAS)
+    return {sala_id: f'{geracao}.{valores.get(chave) or _semear(chave)}' for sala_id, chave in chaves.items()}
+
+
+def incrementar_salas(sala_ids=None):
+    """Marca as salas informadas (todas, se ``None``) e a agenda como alteradas."""
+    if sala_ids is None:
+        chaves = [CHAVE_SALAS]
+    else:
+        chaves = [f'{CHAVE_SALAS}:{sala_id}' for sala_id in set(sala_ids) if sala_id is not None]
+    for chave in chaves:
+        try:
+            cache.incr(chave)
+        except ValueError:
+            _semear(chave)
+    return incrementar()
+
+
+def da_referencia():
+    """Versão corrente dos dados de referência (uma leitura do cache)."""
+    versao = cache.get(CHAVE_REFERENCIA)
+    if versao is None:
+        versao = _semear(CHAVE_REFERENCIA)
+    return versao
+
+
+def incrementar_referencia():
+    """Marca os dados de referência como alterados."""
+    try:
+        return cache.incr(CHAVE_REFERENCIA)
+    except ValueError:
+        return da_referencia()
@@ -0,0 +1,200 @@
+"""
+Virada de semestre: copia as turmas e horários de um semestre para outro.
+
+A cópia é feita no banco, com ``INSERT ... SELECT`` montado a partir de
+querysets: uma instrução para as turmas e outra para os horários, qualquer
+que seja o tamanho do semestre. Professores e salas podem ser trocados na
+cópia (``professores``/``salas``: ``{id antigo: id novo}``), o que vira um
+``CASE`` dentro do próprio ``SELECT``.
+
+Antes de gravar, os horários copiados (já com as trocas) são validados junto
+com os que o semestre destino já tem (``validacao``). Como na importação, em
+simulação ou com conflitos (sem ``ignorar_conflitos``) nada é gravado; com
+``ignorar_conflitos``, horários com sala, dia e início já usados no destino
+ficam de fora.
+
+A tabela de trocas pode vir em CSV (``ler_trocas``), com chaves naturais::
+
+    tipo,de,para
+    professor,2019001,2023042
+    sala,Sala 101,Sala 204
+
+Só turmas ativas são copiadas; turmas que já existem no destino (mesma
+disciplina e código) ficam como estão, sem os horários da origem.
+"""
+import csv
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, DateField, Exists, F, IntegerField, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from . import alteracoes, calendario, ocupacao, validacao, versao
+from .models import HorarioTurma, Professor, Sala, Turma
+
+
+class ErroVirada(Exception):
+    """Cópia impossível (ex.: dois horários trocados para a mesma sala e início)."""
+
+
+class _Desfazer(Exception):
+    """Usada internamente para desfazer a transação (simulação ou conflitos)."""
+
+
+class ResultadoVirada:
+    def __init__(self, origem, destino):
+        self.origem = origem
+        self.destino = destino
+        self.turmas_copiadas = 0
+        self.horarios_copiados = 0
+        self.turmas_existentes = 0   # já estavam no destino
+        self.horarios_ignorados = 0  # mesma sala, dia e início de um horário do destino
+        self.conflitos = []          # validacao.Conflito
+        self.gravado = False
+
+    def __str__(self):
+        return (
+            f"{self.origem} -> {self.destino}: {self.turmas_copiadas} turmas e {self.horarios_copiados} horários "
+            f"copiados, {self.turmas_existentes} turmas já existentes, {self.horarios_ignorados} horários "
+            f"ignorados, {len(self.conflitos)} conflitos"
+        )
+
+
+def ler_trocas(linhas):
+    """``(professores, salas)`` em ids a partir das linhas de um CSV ``tipo,de,para``.
+
+    Professores pela matrícula, salas pelo nome. Levanta ``ErroVirada`` com
+    todas as linhas inválidas.
+    """
+    registros = [
+        (numero, [campo.strip() for campo in campos])
+        for numero, campos in enumerate(csv.reader(linhas), start=1) if any(campo.strip() for campo in campos)
+    ]
+    if registros and [campo.lower() for campo in registros[0][1]] == ['tipo', 'de', 'para']:
+        registros = registros[1:]
+    chaves = {
+        'professor': dict(Professor.objects.values_list('matricula', 'pk')),
+        'sala': dict(Sala.objects.values_list('nome', 'pk')),
+    }
+    trocas = {'professor': {}, 'sala': {}}
+    erros = []
+    for numero, campos in registros:
+        if len(campos) != 3 or campos[0].lower() not in chaves:
+            erros.append(f"linha {numero}: esperado 'professor' ou 'sala', de, para")
+            continue
+        tipo, de, para = campos[0].lower(), *campos[1:]
+        ids = [chaves[tipo].get(valor) for valor in (de, para)]
+        if None in ids:
+            erros.append(f"linha {numero}: {tipo} {de if ids[0] is None else para!r} não cadastrado")
+            continue
+        trocas[tipo][ids[0]] = ids[1]
+    if erros:
+        raise ErroVirada("; ".join(erros))
+    return trocas['professor'], trocas['sala']
+
+
+def _trocar(campo, mapa):
+    """``CASE`` que troca os ids de ``campo`` conforme ``mapa``."""
+    if not mapa:
+        return F(campo)
+    return Case(*(When(**{campo: antigo}, then=Value(novo)) for antigo, novo in mapa.items()),
+                default=F(campo), output_field=IntegerField())
+
+
+def _inserir(modelo, colunas):
+    """``INSERT INTO modelo (colunas) SELECT ...`` com o SQL de um queryset.
+
+    ``colunas`` é ``{campo do modelo: expressão}``; o queryset ``values_list``
+    das expressões, na mesma ordem, é o ``SELECT``.
+    """
+    def executar(queryset):
+        apelidos = {f'_{campo}': expressao for campo, expressao in colunas.items()}
+        sql, parametros = queryset.order_by().annotate(**apelidos).values_list(*apelidos).query.sql_with_params()
+        nomes = ', '.join(connection.ops.quote_name(modelo._meta.get_field(campo).column) for campo in colunas)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {connection.ops.quote_name(modelo._meta.db_table)} ({nomes}) {sql}",
+                           parametros)
+            return cursor.rowcount
+    return executar
+
+
+def _horarios_copiados(horarios, professores, salas):
+    """Os ``horarios`` da origem como ``validacao.Horario``, já com as trocas."""
+    nomes_salas, capacidades = {}, {}
+    for pk, nome, capacidade in Sala.objects.filter(pk__in=salas.values()).values_list('pk', 'nome', 'capacidade'):
+        nomes_salas[pk], capacidades[pk] = nome, capacidade
+    nomes_professores = {
+        pk: f"{nome} {sobrenome}".strip()
+        for pk, nome, sobrenome in Professor.objects.filter(pk__in=professores.values()).values_list(
+            'pk', 'user__first_name', 'user__last_name')
+    }
+    for horario in validacao.horarios_do_banco(horarios):
+        sala_id = salas.get(horario.sala_id, horario.sala_id)
+        professor_id = professores.get(horario.professor_id, horario.professor_id)
+        yield horario._replace(
+            id=None, sala_id=sala_id, professor_id=professor_id,
+            sala=nomes_salas.get(sala_id, horario.sala), capacidade=capacidades.get(sala_id, horario.capacidade),
+            professor=nomes_professores.get(professor_id, horario.professor),
+        )
+
+
+def virar_semestre(origem, destino, professores=None, salas=None, simular=False, ignorar_conflitos=False):
+    """Copia as turmas ativas da ``origem`` e seus horários para o ``destino``.
+
+    Tudo em uma transação. Retorna um ``ResultadoVirada``; ``gravado`` diz se
+    a cópia ficou no banco.
+    """
+    if origem.pk == destino.pk:
+        raise ErroVirada("origem e destino são o mesmo semestre")
+    professores, salas = professores or {}, salas or {}
+    resultado = ResultadoVirada(origem, destino)
+    turmas = Turma.objects.filter(semestre=origem, ativo=True)
+    existentes = list(turmas.filter(Exists(Turma.objects.filter(
+        semestre=destino, disciplina_id=OuterRef('disciplina_id'), codigo_turma=OuterRef('codigo_turma'),
+    ))).order_by().values_list('pk', flat=True))
+    resultado.turmas_existentes = len(existentes)
+    horarios = HorarioTurma.objects.filter(semestre=origem, turma__ativo=True).exclude(turma_id__in=existentes)
+
+    copiados = list(_horarios_copiados(horarios, professores, salas))
+    resultado.conflitos = validacao.verificar_horarios([
+        *validacao.horarios_do_banco(HorarioTurma.objects.filter(semestre=destino, turma__ativo=True)),
+        *copiados,
+    ])
+    if resultado.conflitos and not ignorar_conflitos:
+        return resultado
+
+    try:
+        with transaction.atomic():
+            resultado.turmas_copiadas = _inserir(Turma, {
+                'semestre': Value(destino.pk), 'disciplina': F('disciplina_id'),
+                'professor': _trocar('professor_id', professores), 'codigo_turma': F('codigo_turma'),
+                'numero_alunos': F('numero_alunos'), 'ativo': Value(True),
+                'criada_em': Value(timezone.localdate(), output_field=DateField()),
+            })(turmas.exclude(pk__in=existentes))
+
+            horarios = horarios.annotate(nova_sala=_trocar('sala_id', salas))
+            # Com ``ignorar_conflitos``, o que bate com o unique_together do destino fica de fora
+            ocupado = HorarioTurma.objects.filter(
+                semestre=destino, sala_id=OuterRef('nova_sala'), dia_semana=OuterRef('dia_semana'),
+                hora_inicio=OuterRef('hora_inicio'))
+            resultado.horarios_copiados = _inserir(HorarioTurma, {
+                'turma': Subquery(Turma.objects.filter(
+                    semestre=destino, disciplina_id=OuterRef('turma__disciplina_id'),
+                    codigo_turma=OuterRef('turma__codigo_turma'),
+                ).values('pk')[:1]),
+                'semestre': Value(destino.pk), 'sala': F('nova_sala'), 'dia_semana': F('dia_semana'),
+                'hora_inicio': F('hora_inicio'), 'hora_fim': F('hora_fim'),
+            })(horarios.exclude(Exists(ocupado)))
+            resultado.horarios_ignorados = len(copiados) - resultado.horarios_copiados
+            if simular:
+                raise _Desfazer
+            # INSERT direto não dispara sinais: as estruturas derivadas são refeitas
+            transaction.on_commit(ocupacao.invalidar)
+            transaction.on_commit(calendario.invalidar_tudo)
+            transaction.on_commit(versao.incrementar_salas)
+            transaction.on_commit(alteracoes.publicar)
+            resultado.gravado = True
+    except _Desfazer:
+        pass
+    except IntegrityError as erro:
+        raise ErroVirada(f"a cópia viola uma restrição do banco: {erro}") from erro
+    return resultado
@@ -3,6 +3,10 @@ ASGI config for luminoff project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+O painel ao vivo das salas (``core.painel``) é um stream SSE assíncrono e
+precisa ser servido por aqui (ex.: ``uvicorn luminoff.asgi:application``);
+no ``runserver``/WSGI a resposta nunca termina de ser montada.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricasMiddleware',   # primeiro: mede também o tempo dos outros middlewares
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,12 +75,35 @@ WSGI_APPLICATION = 'luminoff.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# SQLite no desenvolvimento. Em produção (agendador, telemetria e admin
+# gravando ao mesmo tempo) use PostgreSQL, configurado pelo ambiente:
+#   LUMINOFF_DB_ENGINE=postgresql LUMINOFF_DB_NOME=luminoff LUMINOFF_DB_USUARIO=...
+#   LUMINOFF_DB_SENHA=... LUMINOFF_DB_HOST=... LUMINOFF_DB_PORTA=5432
+#   LUMINOFF_DB_CONN_MAX_AGE=60 (segundos de conexão persistente; 0 = uma por requisição)
+
+if os.environ.get('LUMINOFF_DB_ENGINE', 'sqlite3') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('LUMINOFF_DB_NOME', 'luminoff'),
+            'USER': os.environ.get('LUMINOFF_DB_USUARIO', 'luminoff'),
+            'PASSWORD': os.environ.get('LUMINOFF_DB_SENHA', ''),
+            'HOST': os.environ.get('LUMINOFF_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('LUMINOFF_DB_PORTA', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('LUMINOFF_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,  # descarta conexões persistentes que caíram
+            'OPTIONS': {'connect_timeout': 5},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('LUMINOFF_DB_NOME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {'timeout': 20},  # espera o lock de escrita em vez de falhar na hora
+        }
     }
-}
 
 
 # Password validation
@@ -125,3 +150,100 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Auth settings
 LOGIN_URL = 'core:login'
 LOGIN_REDIRECT_URL = 'core:criar_semestre'
+
+# Agendador de comandos das salas
+LUMINOFF_DRIVER_DISPOSITIVOS = 'core.dispositivos.DriverLog'
+LUMINOFF_ANTECEDENCIA_AR = 15          # minutos antes da aula para ligar o ar
+LUMINOFF_TOLERANCIA_DESLIGAMENTO = 10  # minutos após a aula antes de desligar
+LUMINOFF_INTERVALO_RECOMPILACAO = 300  # segundos entre recompilações da agenda
+LUMINOFF_TAMANHO_LOTE = 500            # comandos por lote enviado ao driver
+
+# Gateway dos controladores (driver: 'core.gateway.GatewayDispositivos')
+LUMINOFF_CONTROLADOR_PADRAO = '127.0.0.1:8765'  # usado por salas sem dispositivos cadastrados
+LUMINOFF_GATEWAY_CONEXOES = 4        # conexões keep-alive por controlador
+LUMINOFF_GATEWAY_CONCORRENCIA = 32   # requisições simultâneas no total
+LUMINOFF_GATEWAY_TAXA_PREDIO = 200   # comandos por segundo por prédio
+LUMINOFF_GATEWAY_TENTATIVAS = 4
+LUMINOFF_GATEWAY_TIMEOUT = 5         # segundos
+
+# Estimativa de energia
+LUMINOFF_PERFIS_POTENCIA = {  # kW por tipo de sala
+    'LAB': {'luz': 0.8, 'ar': 3.5},
+    'SAL': {'luz': 0.6, 'ar': 2.6},
+    'AUD': {'luz': 2.0, 'ar': 10.5},
+    'OUT': {'luz': 0.4, 'ar': 1.8},
+}
+LUMINOFF_TARIFA_KWH = 0.85                       # R$/kWh
+LUMINOFF_EXPEDIENTE_PREDIO = ('07:00', '22:00')  # cenário "sempre ligado"
+LUMINOFF_DIAS_EXPEDIENTE = (0, 1, 2, 3, 4, 5)    # segunda a sábado
+
+# Cache: guarda a versão da agenda e os payloads da API dos controladores.
+# Em produção, com vários processos, use um cache compartilhado (Redis ou
+# Memcached) para que a troca de versão chegue a todos eles.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'luminoff',
+    }
+}
+
+# API de leitura dos controladores
+# Sem token a leitura fica aberta, mas POST /api/telemetria/ recusa tudo
+LUMINOFF_API_TOKEN = None          # se definido, exige "Authorization: Bearer <token>"
+LUMINOFF_API_CACHE_TIMEOUT = 7200  # segundos; as chaves já mudam a cada versão/hora
+LUMINOFF_ALTERACOES_LOTE = 5000    # alterações por resposta do feed (o resto vem com "mais")
+LUMINOFF_ALTERACOES_RETENCAO = 7     # dias de alterações no feed antes da compactação (compactar_alteracoes)
+
+# Telemetria dos sensores
+LUMINOFF_TELEMETRIA_LOTE = 5000  # leituras acumuladas em memória antes de gravar
+LUMINOFF_RETENCAO_TELEMETRIA = {'minuto': 7, 'hora': 90, 'dia': None}  # dias (None = sempre)
+
+# Detecção de consumo fora da agenda
+LUMINOFF_CORRENTE_MINIMA = 0.5              # ampères; abaixo disso a sala está desligada
+LUMINOFF_TENSAO = 220                       # volts, para estimar kWh a partir da corrente
+LUMINOFF_CARENCIA_ANOMALIA = 5              # minutos extras além das margens do agendador
+LUMINOFF_ATRASO_ANOMALIA = 5                # minutos recentes ainda não analisados (buffer)
+LUMINOFF_ALERTA_MINUTOS_MINIMOS = 15        # minutos fora da agenda para gerar alerta
+LUMINOFF_ALERTA_INTERVALO_CONTINUIDADE = 30 # minutos para estender um alerta aberto
+
+# Grade semanal (admin > Salas > Grade semanal)
+LUMINOFF_GRADE_INICIO = '07:00'
+LUMINOFF_GRADE_FIM = '23:00'
+LUMINOFF_GRADE_FAIXA = 30              # minutos por linha
+LUMINOFF_GRADE_CACHE_TIMEOUT = 86400   # segundos; a chave já muda com a versão da sala
+
+# Painel ao vivo (admin > Salas > Painel ao vivo; SSE, exige servidor ASGI)
+LUMINOFF_PAINEL_INTERVALO = 15   # segundos entre recálculos do estado das salas
+LUMINOFF_PAINEL_KEEPALIVE = 20   # segundos sem eventos antes de mandar um comentário de keep-alive
+
+# Fila de comandos (agendador -> despachantes -> controladores)
+LUMINOFF_DESPACHO_RESERVA = 60      # segundos até um lote reservado voltar à fila (processo caiu)
+LUMINOFF_DESPACHO_TENTATIVAS = 8    # entregas antes de marcar o comando como falho
+LUMINOFF_DESPACHO_BACKOFF = 5       # segundos; dobra a cada tentativa (máx. 1h)
+LUMINOFF_DESPACHO_INTERVALO = 1     # segundos entre consultas com a fila vazia
+LUMINOFF_RETENCAO_COMANDOS = 30     # dias de comandos entregues guardados
+LUMINOFF_ARRENDAMENTO_TTL = 30      # segundos sem batimento até os prédios de um trabalhador serem redistribuídos
+
+# Pré-climatização adaptativa (sem curva confiável, vale LUMINOFF_ANTECEDENCIA_AR)
+LUMINOFF_PRE_RESFRIAMENTO_ADAPTATIVO = True    # antecedência do ar por sala, aprendida (ajustar_resfriamento)
+LUMINOFF_TEMPERATURA_ALVO = 24                 # °C no início da aula
+LUMINOFF_ANTECEDENCIA_AR_MAXIMA = 60           # minutos
+LUMINOFF_PRE_RESFRIAMENTO_FOLGA = 2            # minutos somados à previsão da curva
+LUMINOFF_PRE_RESFRIAMENTO_AMOSTRAS = 20        # amostras mínimas para confiar na curva da sala
+LUMINOFF_PRE_RESFRIAMENTO_ESQUECIMENTO = 0.98  # peso das somas antigas a cada ajuste
+
+# Desligamento antecipado por ausência (sensores de presença; salas sem sensor não são afetadas)
+LUMINOFF_PRESENCA_ATIVA = True        # roda junto com o executar_agendador (--sem-presenca desliga)
+LUMINOFF_PRESENCA_VACANCIA = 15       # minutos sem presença dentro da janela da agenda para desligar
+LUMINOFF_PRESENCA_CONFIRMACAO = 1     # minutos seguidos com presença para religar
+LUMINOFF_PRESENCA_LIMIAR = 0.5        # ocupação média do minuto a partir da qual há presença
+LUMINOFF_PRESENCA_INTERVALO = 60      # segundos entre ciclos do monitor
+
+# Dados de referência em memória (semestre ativo, salas, disciplinas, professores)
+LUMINOFF_REFERENCIA_VERIFICACAO = 1   # segundos entre conferências da versão no cache
+LUMINOFF_REFERENCIA_VALIDADE = 300    # segundos até a cópia de um processo ser relida mesmo sem mudança
+
+# Métricas (GET /metricas/, formato Prometheus; agendador e despachante: --metricas-porta)
+LUMINOFF_METRICAS_ATIVAS = True                # latência, consultas e tempo de banco por view
+LUMINOFF_METRICAS_CONSULTA_LENTA = 500         # milissegundos; acima disso a consulta vai para o log
+LUMINOFF_METRICAS_IPS = ('127.0.0.1', '::1')   # quem acessa /metricas/ sem o token da API